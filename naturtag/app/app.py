@@ -34,6 +34,8 @@ from naturtag.constants import (
 )
 from naturtag.controllers import ImageController, ObservationController, TaxonController
 from naturtag.storage import ImageFetcher, Settings, iNatDbClient, setup
+from naturtag.storage.db import close_all, get_db
+from naturtag.storage.network import NetworkPolicy
 from naturtag.utils import check_for_update, get_version
 from naturtag.widgets import (
     ResetDbDialog,
@@ -75,9 +77,12 @@ class NaturtagApp(QApplication):
         self.state = setup(self.settings.db_path)
 
         # Globally available application objects
-        self.client = iNatDbClient(self.settings.db_path)
-        self.img_fetcher = ImageFetcher(cache_path=self.settings.image_cache_path)
+        self.client = iNatDbClient.from_settings(self.settings)
+        self.img_fetcher = ImageFetcher(
+            cache_path=self.settings.image_cache_path, network_policy=self.settings.network_policy
+        )
         self.threadpool = ThreadPool(num_workers=self.settings.num_workers)
+        self.client.set_scheduler(self.threadpool.schedule_background)
         self.user_dirs = UserDirs(self.settings)
         install_excepthook()
 
@@ -167,6 +172,11 @@ class MainWindow(QMainWindow):
         )
         self.observation_controller.obs_info.on_view_taxon_by_id.connect(self.switch_tab_taxa)
 
+        # Observations tab: Update observed taxa after syncing observations
+        self.observation_controller.on_sync_finished.connect(
+            self.taxon_controller.tabs.load_observed_taxa
+        )
+
         # Observations tab: Select observation for tagging and switch to Photos tab
         self.observation_controller.obs_info.on_select.connect(
             self.image_controller.select_observation
@@ -232,6 +242,8 @@ class MainWindow(QMainWindow):
         self.app.threadpool.waitForDone(5000)
         self.app.settings.write()
         self.app.state.write()
+        logger.debug(f'Database usage: {get_db(self.app.settings.db_path).stats}')
+        close_all()
 
     def info(self, message: str, timeout: int = 3000):
         """Show a message both in the status bar and in the logs"""
@@ -346,6 +358,8 @@ class MainWindow(QMainWindow):
         self.settings_menu.dark_mode.on_click.connect(set_theme)
         self.settings_menu.show_logs.on_click.connect(self.toggle_log_tab)
         self.settings_menu.precache_thumbnails.on_click.connect(self._on_precache_thumbnails_toggle)
+        self.settings_menu.taxonomy_index.on_click.connect(self._on_taxonomy_index_toggle)
+        self.settings_menu.network_policy.on_select.connect(self._on_network_policy_select)
 
     def show_settings(self):
         """Re-read settings from disk, rebuild the settings menu, and show it."""
@@ -358,6 +372,17 @@ class MainWindow(QMainWindow):
         if checked:
             self.observation_controller.start_precache_when_ready()
 
+    def _on_taxonomy_index_toggle(self, checked: bool):
+        """Enable or disable the taxonomy index; when disabled, free up its memory"""
+        self.app.client.taxa.use_index = checked
+        if not checked:
+            self.app.client.taxa.reset_index()
+
+    def _on_network_policy_select(self, network_policy: str):
+        """Apply a new network policy to the API client and image fetcher"""
+        self.app.client.set_network_policy(NetworkPolicy(network_policy))
+        self.app.img_fetcher.network_policy = NetworkPolicy(network_policy)
+
     def switch_tab_observations(self):
         self.tabs.setCurrentWidget(self.observation_controller)
 
@@ -17,6 +17,7 @@ from PySide6.QtWidgets import (
 
 from naturtag.controllers import BaseController
 from naturtag.storage import Settings
+from naturtag.storage.network import NetworkPolicy
 from naturtag.utils import read_display_locales
 from naturtag.widgets import FAIcon, HorizontalLayout, ToggleSwitch, VerticalLayout
 
@@ -87,6 +88,40 @@ class SettingsMenu(BaseController):
             setting_attr='all_ranks',
         )
         inat.addLayout(self.all_ranks)
+        self.taxonomy_index = ToggleSetting(
+            self.app.settings,
+            icon_str='mdi.file-tree-outline',
+            setting_attr='taxonomy_index',
+        )
+        inat.addLayout(self.taxonomy_index)
+        inat.addLayout(
+            IntSetting(
+                self.app.settings,
+                icon_str='mdi.update',
+                setting_attr='observation_ttl',
+            )
+        )
+        inat.addLayout(
+            IntSetting(
+                self.app.settings,
+                icon_str='mdi.history',
+                setting_attr='taxon_ttl',
+            )
+        )
+        self.network_policy = ChoiceSetting(
+            self.app.settings,
+            icon_str='mdi.wifi-off',
+            setting_attr='network_policy',
+            choices=[policy.value for policy in NetworkPolicy],
+        )
+        inat.addLayout(self.network_policy)
+        inat.addLayout(
+            ToggleSetting(
+                self.app.settings,
+                icon_str='mdi.call-split',
+                setting_attr='parallel_sync',
+            )
+        )
 
         # Metadata settings
         metadata = self.add_group('Metadata', self.settings_layout)
@@ -241,6 +276,8 @@ class SettingContainer(HorizontalLayout):
 
 
 class ChoiceSetting(SettingContainer):
+    on_select = Signal(str)
+
     def __init__(
         self,
         settings: Settings,
@@ -258,6 +295,7 @@ class ChoiceSetting(SettingContainer):
         widget.addItems(choices or [])
         widget.setCurrentText(str(getattr(settings, setting_attr)))
         widget.currentTextChanged.connect(set_text)
+        widget.currentTextChanged.connect(lambda text: self.on_select.emit(text))
         self.addWidget(widget)
 
 
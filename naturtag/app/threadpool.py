@@ -1,9 +1,11 @@
 """Adapted from examples in Python & Qt6 by Martin Fitzpatrick"""
 
 from collections import defaultdict
+from inspect import signature
 from logging import getLogger
-from threading import RLock
-from typing import Callable, Optional
+from threading import Lock, RLock
+from time import monotonic
+from typing import Callable, Hashable, NamedTuple, Optional
 
 from PySide6.QtCore import (
     QEasingCurve,
@@ -19,25 +21,58 @@ from PySide6.QtCore import (
 from PySide6.QtWidgets import QGraphicsOpacityEffect, QProgressBar
 from shiboken6 import isValid
 
+from naturtag.constants import THREADPOOL_AGING_INTERVAL, THREADPOOL_LIMITS, Resource
+from naturtag.utils import CancelToken, TaskCancelled
+
 logger = getLogger(__name__)
 
 
+class QueuedTask(NamedTuple):
+    """A task waiting for a free slot for its resource type"""
+
+    worker: 'BaseWorker'
+    priority: int
+    queued_at: float
+
+    def effective_priority(self, now: float) -> int:
+        """Get priority adjusted for time spent waiting, so low-priority tasks aren't starved"""
+        aging = int((now - self.queued_at) / THREADPOOL_AGING_INTERVAL)
+        return min(self.priority + aging, QThread.HighestPriority.value)
+
+
 # TODO: For loading taxa, set/increase progress bar max once up front, instead of once per taxon
 class ThreadPool(QThreadPool):
     """Thread pool that enqueues jobs to ber run from separate thread(s), and updates a progress
     bar.
+
+    Tasks may optionally specify:
+
+    * A resource type (network, disk, or CPU). Each has a limit on concurrent tasks, and any
+      additional tasks wait in a queue ordered by priority. Priority increases the longer a task
+      waits.
+    * A key to deduplicate identical tasks. If a task with the same key and group is already
+      queued or running, its signals are returned instead of scheduling a new task. Tasks in
+      different groups are never shared, so cancelling one group can't drop another's results.
+    * A timeout, in seconds. See :py:class:`BaseWorker` for details on cancellation and timeouts.
     """
 
     def __init__(self, num_workers: int = 0, **kwargs):
         super().__init__(**kwargs)
         self.progress = ProgressBar()
-        self._group_workers: dict[str, list[QRunnable]] = defaultdict(list)
+        self._group_workers: dict[str, list[BaseWorker]] = defaultdict(list)
         self._group_lock = RLock()
         # Keep worker references to prevent premature python GC while queued signals are still live
         self._live_workers: set[BaseWorker] = set()
         if num_workers:
             self.setMaxThreadCount(num_workers)
 
+        # Tasks waiting for a resource slot, tasks using a resource slot, and tasks by key
+        self.resource_limits = {Resource.CPU: self.maxThreadCount(), **THREADPOOL_LIMITS}
+        self._queued_tasks: dict[Resource, list[QueuedTask]] = defaultdict(list)
+        self._resource_workers: dict[Resource, set[BaseWorker]] = defaultdict(set)
+        self._keyed_workers: dict[tuple[str | None, Hashable], BaseWorker] = {}
+        self._scheduler_lock = RLock()
+
     def schedule(
         self,
         callback: Callable,
@@ -45,14 +80,40 @@ class ThreadPool(QThreadPool):
         total_results: Optional[int] = None,
         increment_length: bool = False,
         group: str | None = None,
+        resource: Optional[Resource] = None,
+        key: Optional[Hashable] = None,
+        timeout: Optional[float] = None,
         **kwargs,
     ) -> 'WorkerSignals':
         """Schedule a task to be run by the next available worker thread"""
+        if existing := self._get_keyed_worker(key, group):
+            return existing.signals
         self.progress.add(total_results or 1)
-        worker = Worker(callback, increment_length=increment_length, **kwargs)
+        worker = Worker(callback, increment_length=increment_length, timeout=timeout, **kwargs)
         worker.signals.on_progress.connect(self.progress.advance)
-        self._register_worker(worker, group)
-        self.start(worker, priority.value)
+        self._register_worker(worker, group, key)
+        self._submit(worker, priority, resource)
+        return worker.signals
+
+    def schedule_background(
+        self,
+        callback: Callable,
+        priority: QThread.Priority = QThread.LowPriority,
+        group: str | None = None,
+        resource: Optional[Resource] = Resource.NETWORK,
+        key: Optional[Hashable] = None,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> 'WorkerSignals':
+        """Schedule a low-priority task that doesn't update the progress bar, for example a
+        background refresh of stale data. Unlike :py:meth:`schedule`, this is safe to call from
+        worker threads.
+        """
+        if existing := self._get_keyed_worker(key, group):
+            return existing.signals
+        worker = Worker(callback, timeout=timeout, **kwargs)
+        self._register_worker(worker, group, key)
+        self._submit(worker, priority, resource)
         return worker.signals
 
     def schedule_paginator(
@@ -61,18 +122,40 @@ class ThreadPool(QThreadPool):
         priority: QThread.Priority = QThread.NormalPriority,
         total_results: Optional[int] = None,
         group: str | None = None,
+        resource: Optional[Resource] = None,
+        timeout: Optional[float] = None,
         **kwargs,
     ) -> 'WorkerSignals':
-        """Schedule a task to be run by the next available worker thread"""
+        """Schedule a task to be run by the next available worker thread. Paginated tasks can't be
+        deduplicated, since results are emitted as they arrive.
+        """
         self.progress.add(total_results or 1)
-        worker = PaginatedWorker(callback, **kwargs)
+        worker = PaginatedWorker(callback, timeout=timeout, **kwargs)
         worker.signals.on_progress.connect(self.progress.advance)
         self._register_worker(worker, group)
-        self.start(worker, priority.value)
+        self._submit(worker, priority, resource)
         return worker.signals
 
-    def _register_worker(self, worker: 'BaseWorker', group: str | None):
-        """Pin worker to prevent GC, and track group membership."""
+    def _get_keyed_worker(
+        self, key: Optional[Hashable], group: str | None = None
+    ) -> Optional['BaseWorker']:
+        """Get a queued or running task with the same key and group, if any. A task that has been
+        cancelled but hasn't stopped yet won't emit results, so it's replaced instead of reused.
+        """
+        if key is None:
+            return None
+        with self._scheduler_lock:
+            worker = self._keyed_workers.get((group, key))
+            if worker and worker.token.cancelled:
+                return None
+            if worker:
+                logger.debug(f'Task {key!r} already scheduled; reusing')
+            return worker
+
+    def _register_worker(
+        self, worker: 'BaseWorker', group: str | None, key: Optional[Hashable] = None
+    ):
+        """Pin worker to prevent GC, and track group and key membership."""
         self._live_workers.add(worker)
         worker.signals.on_finished.connect(
             lambda w=worker: self._live_workers.discard(w) if isValid(self) else None
@@ -83,8 +166,53 @@ class ThreadPool(QThreadPool):
             worker.signals.on_finished.connect(
                 lambda g=group, w=worker: self._remove_worker(g, w) if isValid(self) else None
             )
+        # Release the key from the worker thread before results are emitted, so a new task with
+        # the same key is never attached after the results it's waiting for
+        if key is not None:
+            with self._scheduler_lock:
+                self._keyed_workers[(group, key)] = worker
+            worker.add_release_callback(lambda k=(group, key), w=worker: self._release_key(k, w))
+
+    def _release_key(self, key: tuple[str | None, Hashable], worker: 'BaseWorker'):
+        with self._scheduler_lock:
+            if self._keyed_workers.get(key) is worker:
+                del self._keyed_workers[key]
+
+    def _submit(
+        self, worker: 'BaseWorker', priority: QThread.Priority, resource: Optional[Resource]
+    ):
+        """Start a task, or queue it if its resource type is at its limit"""
+        if resource is None:
+            self.start(worker, priority.value)
+            return
+        with self._scheduler_lock:
+            self._queued_tasks[resource].append(QueuedTask(worker, priority.value, monotonic()))
+            self._start_queued(resource)
 
-    def _remove_worker(self, group: str, worker: QRunnable):
+    def _start_queued(self, resource: Resource):
+        """Start queued tasks for a resource type while there are free slots, highest (aged)
+        priority first
+        """
+        with self._scheduler_lock:
+            queue = self._queued_tasks[resource]
+            running = self._resource_workers[resource]
+            now = monotonic()
+            while queue and len(running) < self.resource_limits[resource]:
+                task = max(queue, key=lambda t: t.effective_priority(now))
+                queue.remove(task)
+                running.add(task.worker)
+                task.worker.add_release_callback(
+                    lambda r=resource, w=task.worker: self._release_resource(r, w)
+                )
+                self.start(task.worker, task.effective_priority(now))
+
+    def _release_resource(self, resource: Resource, worker: 'BaseWorker'):
+        """Free a resource slot when a task finishes, and start the next queued task"""
+        with self._scheduler_lock:
+            self._resource_workers[resource].discard(worker)
+            self._start_queued(resource)
+
+    def _remove_worker(self, group: str, worker: 'BaseWorker'):
         """Remove a completed worker from group tracking. No-op if already removed by cancel()."""
         with self._group_lock:
             try:
@@ -104,37 +232,99 @@ class ThreadPool(QThreadPool):
         if (active_threads := self.activeThreadCount()) > 0:
             logger.debug(f'Cancelling {active_threads} active threads')
         self.clear()
+        with self._scheduler_lock:
+            self._queued_tasks.clear()
+            self._resource_workers.clear()
+            self._keyed_workers.clear()
         for worker in self._live_workers:
             worker.cancel()
         self._live_workers.clear()
         self.progress.reset()
 
     def _cancel_group(self, group: str):
-        """Cancel only queued tasks belonging to a specific group."""
+        """Cancel only tasks belonging to a specific group. Queued tasks are removed, and running
+        tasks are signaled to stop.
+        """
         with self._group_lock:
             workers = self._group_workers.pop(group, [])
-        cancelled = sum(1 for w in workers if self.tryTake(w))
+        cancelled = 0
+        for worker in workers:
+            if self._take(worker):
+                cancelled += 1
+            # Running tasks will stop at their next cancellation check
+            else:
+                worker.cancel()
         if cancelled:
             logger.debug(f'Cancelled {cancelled}/{len(workers)} queued tasks in group {group!r}')
             self.progress.remove(cancelled)
 
+    def _take(self, worker: 'BaseWorker') -> bool:
+        """Remove a task that hasn't started yet, either from a resource queue or the pool queue.
+        A removed task will never run, so its ``on_finished`` signal is emitted here instead.
+        """
+        with self._scheduler_lock:
+            taken = self._take_queued(worker)
+        if not taken and not self.tryTake(worker):
+            return False
+        worker.release()
+        if isValid(worker.signals):
+            worker.signals.on_finished.emit()
+        return True
+
+    def _take_queued(self, worker: 'BaseWorker') -> bool:
+        for queue in self._queued_tasks.values():
+            for task in queue:
+                if task.worker is worker:
+                    queue.remove(task)
+                    return True
+        return False
+
 
 class BaseWorker(QRunnable):
     """Base for all worker types. Subclasses must emit ``on_finished`` as their
     very last signal emission in ``run()``.
+
+    Each worker has a :py:class:`.CancelToken`, which is passed to callbacks that accept a
+    ``cancel_token`` argument, and can also be checked by any function the callback calls with
+    :py:func:`.check_cancelled`. A cancelled task stops at its next check without emitting a result
+    or error, and a task that exceeds its timeout emits a :py:exc:`.TaskTimeout` error.
     """
 
-    def __init__(self, callback: Callable, **kwargs):
+    def __init__(self, callback: Callable, timeout: Optional[float] = None, **kwargs):
         super().__init__()
         self.setAutoDelete(False)
         self.callback = callback
         self.kwargs = kwargs
         self.signals = WorkerSignals()
-        self._cancelled = False
+        self.token = CancelToken(timeout)
+        self._release_callbacks: list[Callable] = []
+        self._release_lock = Lock()
 
     def cancel(self):
-        """Request cancellation. A running PaginatedWorker will stop between pages."""
-        self._cancelled = True
+        """Request cancellation. A running task will stop at its next cancellation check."""
+        self.token.cancel()
+
+    def add_release_callback(self, callback: Callable):
+        """Add a callback to run (once) as soon as the task is done or removed from the queue,
+        before any results are emitted
+        """
+        with self._release_lock:
+            self._release_callbacks.append(callback)
+
+    def release(self):
+        """Run and clear release callbacks"""
+        with self._release_lock:
+            callbacks, self._release_callbacks = self._release_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _get_kwargs(self) -> dict:
+        """Get callback kwargs, plus the cancellation token if the callback accepts it"""
+        try:
+            accepts_token = 'cancel_token' in signature(self.callback).parameters
+        except (TypeError, ValueError):
+            accepts_token = False
+        return {**self.kwargs, 'cancel_token': self.token} if accepts_token else self.kwargs
 
 
 class Worker(BaseWorker):
@@ -148,18 +338,29 @@ class Worker(BaseWorker):
 
     def run(self):
         try:
-            result = self.callback(**self.kwargs)
+            with self.token.activate():
+                # Skip tasks that were cancelled before they started
+                self.token.check()
+                result = self.callback(**self._get_kwargs())
+        except TaskCancelled:
+            logger.debug(f'Worker cancelled: {self.callback}')
+            self.release()
+            if isValid(self.signals):
+                self.signals.on_progress.emit(1)
         except Exception as e:
             logger.warning('Worker error:', exc_info=True)
+            self.release()
             if isValid(self.signals):
                 self.signals.on_error.emit(e)
                 self.signals.on_progress.emit(1)
         else:
+            self.release()
             if isValid(self.signals):
                 self.signals.on_result.emit(result)
                 increment = len(result) if self.increment_length and isinstance(result, list) else 1
                 self.signals.on_progress.emit(increment)
         finally:
+            self.release()
             if isValid(self.signals):
                 self.signals.on_finished.emit()
 
@@ -169,11 +370,15 @@ class PaginatedWorker(BaseWorker):
 
     def run(self):
         try:
-            for next_page in self.callback(**self.kwargs):
-                if self._cancelled or not isValid(self.signals):
-                    return
-                self.signals.on_result.emit(next_page)
-                self.signals.on_progress.emit(len(next_page))
+            with self.token.activate():
+                for next_page in self.callback(**self._get_kwargs()):
+                    if not isValid(self.signals):
+                        return
+                    self.token.check()
+                    self.signals.on_result.emit(next_page)
+                    self.signals.on_progress.emit(len(next_page))
+        except TaskCancelled:
+            logger.debug(f'Worker cancelled: {self.callback}')
         except Exception as e:
             logger.warning('Worker error:', exc_info=True)
             if isValid(self.signals):
@@ -184,6 +389,7 @@ class PaginatedWorker(BaseWorker):
         # Always consume the reserved progress slot. If pages were yielded, their advances may
         # already have exceeded the reservation, so this extra '1' just caps at max.
         finally:
+            self.release()
             if isValid(self.signals):
                 self.signals.on_progress.emit(1)
                 self.signals.on_finished.emit()
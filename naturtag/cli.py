@@ -1,10 +1,12 @@
 # TODO: Show all matched taxon names if more than one match per taxon ID
 # TODO: Bash doesn't support completion help text, so currently only shows IDs
 # TODO: Use table formatting from pyinaturalist if format_taxa
+import json
 from collections import defaultdict
 from logging import basicConfig, getLogger
 from pathlib import Path
 from shutil import copyfile
+from time import sleep
 from typing import Optional
 
 import click
@@ -12,17 +14,28 @@ import pyexiv2
 from click.shell_completion import CompletionItem
 from platformdirs import user_config_dir
 from pyinaturalist import ICONIC_EMOJI, get_taxa_autocomplete
-from pyinaturalist_convert.fts import TaxonAutocompleter
+from requests import RequestException
 from rich import print as rprint
 from rich.box import SIMPLE_HEAVY
 from rich.logging import RichHandler
-from rich.progress import track
+from rich.progress import (
+    BarColumn,
+    Progress,
+    TaskID,
+    TaskProgressColumn,
+    TextColumn,
+    TimeRemainingColumn,
+    track,
+)
 from rich.table import Column, Table
 
 from naturtag.constants import CLI_COMPLETE_DIR
 from naturtag.metadata import DerivedMetadata, KeywordMetadata
 from naturtag.metadata.tagger import _refresh_tags_iter, _tag_images_iter
-from naturtag.storage import Settings, setup
+from naturtag.storage import AppState, Settings, setup, sync_observations
+from naturtag.storage.network import NetworkPolicy
+from naturtag.storage.taxon_fts import TaxonAutocompleter, search_taxa_local
+from naturtag.storage.taxonomy_loader import LoadProgress
 from naturtag.utils import HelpColorsGroup, get_valid_image_paths, get_version, strip_url
 
 
@@ -59,8 +72,15 @@ def _strip_url_or_name(ctx, param, value):
 @click.pass_context
 @click.option('-v', '--verbose', count=True, help='Show verbose output (up to 3 times)')
 @click.option('--version', is_flag=True, help='Show version')
-def main(ctx, verbose, version):
+@click.option(
+    '-n',
+    '--network',
+    type=click.Choice([policy.value for policy in NetworkPolicy]),
+    help='When to use the network (default: from settings)',
+)
+def main(ctx, verbose, version, network):
     ctx.meta['verbose'] = verbose
+    ctx.meta['network_policy'] = network
     if verbose == 0:
         enable_logging(level='WARNING', external_level='ERROR')
     else:
@@ -152,8 +172,9 @@ def tag(
     elif print_tags and not image_paths:
         click.secho('Specify images', fg='red')
         ctx.exit()
-    elif isinstance(taxon, str):
-        taxon = search_taxa_by_name(taxon, verbose=ctx.meta['verbose'])
+    settings = _read_settings(ctx)
+    if isinstance(taxon, str):
+        taxon = search_taxa_by_name(taxon, verbose=ctx.meta['verbose'], settings=settings)
         if not taxon:
             ctx.exit()
 
@@ -170,6 +191,7 @@ def tag(
         observation_id=observation,
         taxon_id=taxon,
         include_sidecars=True,
+        settings=settings,
     )
     if image_paths:
         metadata_objs = list(
@@ -196,9 +218,10 @@ def tag(
 
 
 @main.command()
+@click.pass_context
 @click.option('-r', '--recursive', is_flag=True, help='Recursively search subdirectories')
 @click.argument('image_paths', nargs=-1)
-def refresh(recursive, image_paths):
+def refresh(ctx, recursive, image_paths):
     """Refresh metadata for previously tagged images.
 
     Use this command for images that have been previously tagged images with at least a taxon or
@@ -218,7 +241,7 @@ def refresh(recursive, image_paths):
     # Run first-time setup if necessary
     setup()
 
-    result_iter = _refresh_tags_iter(image_paths, recursive=recursive)
+    result_iter = _refresh_tags_iter(image_paths, recursive=recursive, settings=_read_settings(ctx))
     metadata_objs = list(
         track(
             result_iter,
@@ -230,6 +253,95 @@ def refresh(recursive, image_paths):
     click.echo(f'{len(metadata_objs)} Images refreshed')
 
 
+@main.command()
+@click.pass_context
+@click.option('-u', '--username', help='iNaturalist username (default: from settings)')
+@click.option(
+    '-t',
+    '--thumbnails/--no-thumbnails',
+    default=None,
+    help='Also download observation thumbnails (default: from settings)',
+)
+@click.option(
+    '-w', '--watch', is_flag=True, help='Keep running, and sync again after each interval'
+)
+@click.option(
+    '-i',
+    '--interval',
+    default=60,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='Minutes between syncs, with --watch',
+)
+@click.option('-j', '--json', 'json_output', is_flag=True, help='Output progress as JSON lines')
+def sync(ctx, username, thumbnails, watch, interval, json_output):
+    """Download your observations to Naturtag's local database.
+
+    The first sync downloads all of your observations, and later syncs download only new and
+    updated observations. This is the same sync that runs in the background when the app starts,
+    and makes observation and taxonomy data available for tagging without waiting on the API.
+
+    \b
+    ### Examples
+    Sync once, using the username from your settings:
+    ```
+    nt sync
+    ```
+
+    \b
+    Sync every 30 minutes for a specific user, with progress as JSON lines:
+    ```
+    nt sync -u my_username -w -i 30 -j
+    ```
+    """
+    settings = _read_settings(ctx)
+    if username:
+        settings.username = username
+    if not settings.username:
+        click.secho('Specify a username, or set one in settings', fg='red')
+        ctx.exit(1)
+
+    while True:
+        try:
+            progress = None
+            for progress in sync_observations(settings, precache_thumbnails=thumbnails):
+                _print_sync_event('page', json_output, **progress._asdict())
+            _print_sync_event(
+                'complete',
+                json_output,
+                total=progress.total if progress else 0,
+                elapsed=progress.elapsed if progress else 0,
+            )
+        except Exception as e:
+            _print_sync_event('error', json_output, message=str(e))
+            # In watch mode, try again on the next interval instead of exiting
+            if not watch:
+                ctx.exit(1)
+        if not watch:
+            break
+        sleep(interval * 60)
+
+
+def _read_settings(ctx) -> Settings:
+    """Read settings, with any overrides from global options"""
+    settings = Settings.read()
+    if network_policy := ctx.meta.get('network_policy'):
+        settings.network_policy = network_policy
+    return settings
+
+
+def _print_sync_event(event: str, json_output: bool = False, **kwargs):
+    """Print sync progress, either as a JSON line or as human-readable text"""
+    if json_output:
+        click.echo(json.dumps({'event': event, **kwargs}))
+    elif event == 'page':
+        click.echo(f'Page {kwargs["page"]}: {kwargs["page_size"]} observations')
+    elif event == 'complete':
+        click.echo(f'{kwargs["total"]} observations synced in {kwargs["elapsed"]:.2f}s')
+    elif event == 'error':
+        click.secho(f'Sync failed: {kwargs["message"]}', fg='red', err=True)
+
+
 @main.group(name='setup')
 def setup_group():
     """Setup commands"""
@@ -248,7 +360,14 @@ def setup_group():
     is_flag=True,
     help='Reset database if it already exists',
 )
-def db(download, force):
+@click.option(
+    '-l',
+    '--language',
+    'languages',
+    multiple=True,
+    help='Only keep common names for these languages in taxon text search (can be repeated)',
+)
+def db(download, force, languages):
     """Set up Naturtag's local database.
 
     Naturtag uses a SQLite database to store observation and taxonomy data. This command can
@@ -259,8 +378,34 @@ def db(download, force):
     ```
     nt -vv setup db -f -d
     ```
+
+    \b
+    Example: Only keep English and French common names, to make searches faster:
+    ```
+    nt setup db -l en -l fr
+    ```
     """
-    setup(overwrite=force, download=download)
+    with Progress(
+        TextColumn('{task.description}'),
+        BarColumn(),
+        TaskProgressColumn(),
+        TimeRemainingColumn(),
+    ) as progress:
+        tasks: dict[str, TaskID] = {}
+
+        def on_progress(load_progress: LoadProgress):
+            if load_progress.table not in tasks:
+                tasks[load_progress.table] = progress.add_task(
+                    f'Loading {load_progress.table}', total=load_progress.total_bytes
+                )
+            progress.update(tasks[load_progress.table], completed=load_progress.bytes_read)
+
+        setup(
+            overwrite=force,
+            download=download,
+            progress=on_progress,
+            languages=list(languages) if languages else None,
+        )
 
 
 @setup_group.command()
@@ -343,13 +488,34 @@ def print_metadata(
             rprint(kw.replace('"', ''))
 
 
-def search_taxa_by_name(taxon: str, verbose: bool = False) -> Optional[int]:
-    """Search for a taxon by name.
+def search_taxa_by_name(
+    taxon: str, verbose: bool = False, settings: Optional[Settings] = None
+) -> Optional[int]:
+    """Search for a taxon by name, using the local text search index first. Results are ranked by
+    exact name matches, then by how often each taxon has been viewed or observed.
+
+    The API is only used if local results are empty or ambiguous (``online``), or only if they are
+    empty (``prefer-cache``), or never (``offline``).
     If there's a single unambiguous result, return its ID; otherwise prompt with choices.
     """
-    response = get_taxa_autocomplete(q=taxon)
-    results = response.get('results', [])[:10]
-    # results = TaxonAutocompleter(DB_PATH).search(taxon)
+    settings = settings or Settings.read()
+    state = AppState.read(settings.db_path)
+    results = search_taxa_local(
+        taxon,
+        db_path=settings.db_path,
+        language=settings.locale if settings.search_locale else None,
+        priority=lambda taxon_id: state.view_count(taxon_id) + state.observed.get(taxon_id, 0),
+    )
+    if match := _get_unambiguous_match(results):
+        return match['id']
+
+    policy = settings.network_policy
+    if policy == NetworkPolicy.ONLINE or (policy == NetworkPolicy.PREFER_CACHE and not results):
+        try:
+            response = get_taxa_autocomplete(q=taxon)
+            results = response.get('results', [])[:10] or results
+        except RequestException as e:
+            click.secho(f'Taxon search failed; using local results only: {e}', fg='yellow')
 
     # No results
     if not results:
@@ -369,6 +535,18 @@ def search_taxa_by_name(taxon: str, verbose: bool = False) -> Optional[int]:
     return results[int(taxon_index)]['id']
 
 
+def _get_unambiguous_match(results: list[dict]) -> Optional[dict]:
+    """Get a single best local search result, if there is one: either the only exact name match,
+    the only exact match the user has viewed or observed before, or the only result
+    """
+    exact = [r for r in results if r['exact_match']]
+    if len(exact) > 1:
+        exact = [r for r in exact if r['priority'] > 0]
+    if exact:
+        return exact[0] if len(exact) == 1 else None
+    return results[0] if len(results) == 1 else None
+
+
 def format_taxa(results, verbose: bool = False) -> Table:
     """Format taxon autocomplete results into a table"""
     table = Table(
@@ -1,4 +1,5 @@
 # ruff: noqa: F401
+from enum import Enum
 from pathlib import Path
 from typing import Optional, Union
 
@@ -17,6 +18,8 @@ ICONS_DIR = ASSETS_DIR / 'icons'
 # Packaged asset files
 CLI_COMPLETE_DIR = ASSETS_DIR / 'autocomplete'
 PACKAGED_TAXON_DB = DATA_DIR / 'taxonomy.tar.gz'
+PACKAGED_TAXON_SQLITE = DATA_DIR / 'taxonomy.db.gz'  # Optional prebuilt SQLite db
+TAXON_DELTA_PATTERN = 'taxonomy-delta-*.tar.gz'  # Incremental updates to packaged taxonomy
 LOCALES_PATH = DATA_DIR / 'locales.json'
 APP_ICON = ICONS_DIR / 'logo.ico'
 APP_LOGO = ICONS_DIR / 'logo.png'
@@ -33,6 +36,7 @@ DOCS_URL = 'https://naturtag.readthedocs.io/en/stable/app.html'
 REPO_URL = 'https://github.com/pyinat/naturtag'
 RELEASES_API_URL = 'https://api.github.com/repos/pyinat/naturtag/releases/latest'
 TAXON_DB_URL = f'{REPO_URL}/raw/main/assets/data/taxonomy.tar.gz'
+TAXON_DB_CHECKSUM_URL = f'{TAXON_DB_URL}.sha256'
 BUG_REPORT_URL = f'{REPO_URL}/issues/new?template=bug_report.md'
 
 # Thumnbnail settings
@@ -65,6 +69,35 @@ N_DISPLAY_TAXON_THUMBNAILS = 10
 
 DEFAULT_DISPLAY_PAGE_SIZE = 50
 PAGE_CACHE_MAX = 20
+OBJECT_CACHE_MAX_ITEMS = 5000  # Max number of taxa or observations to keep in memory
+OBJECT_CACHE_MAX_SIZE = 100000  # Max total number of records, including ancestors, children, etc.
+TAXONOMY_INDEX_MAX_STALE = (
+    10000  # Max number of taxa saved since the index was built, before rebuild
+)
+SYNC_WORKERS = 4  # Max number of concurrent requests for a parallel observation sync
+
+
+class Resource(str, Enum):
+    """Resource types used by background tasks, each with its own concurrency limit"""
+
+    NETWORK = 'network'
+    DISK = 'disk'
+    CPU = 'cpu'
+
+
+# Thread pool scheduling; max concurrent tasks per resource type (CPU tasks default to thread count)
+THREADPOOL_LIMITS = {Resource.NETWORK: 4, Resource.DISK: 4}
+THREADPOOL_AGING_INTERVAL = 5  # Raise priority of queued tasks by one level per this many seconds
+
+# SQLite connection settings
+DB_POOL_SIZE = 8  # Number of idle connections to keep open per database
+DB_CACHE_SIZE = 32 * 1024  # Page cache size per connection, in KiB
+DB_MMAP_SIZE = 256 * 1024 * 1024  # Max size of memory-mapped I/O, in bytes
+DB_SLOW_QUERY_TIME = 0.5  # Log queries that take longer than this, in seconds
+TAXON_LOAD_BATCH_SIZE = 10000  # Rows per insert when loading packaged taxonomy data
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_RETRIES = 3  # Max attempts to resume an interrupted download
+DOWNLOAD_RETRY_DELAY = 1  # Delay before the first retry, in seconds; doubled after each retry
 
 # Relevant groups of image metadata tags
 EXIF_HIDE_PREFIXES = [
@@ -100,6 +133,17 @@ HIER_KEYWORD_TAGS = [
     'Xmp.lr.hierarchicalSubject',
 ]
 DIGIKAM_LIST_TAG = 'Xmp.digiKam.TagsList'
+GPS_TAGS = [
+    'Exif.GPSInfo.GPSLatitude',
+    'Exif.GPSInfo.GPSLatitudeRef',
+    'Exif.GPSInfo.GPSLongitude',
+    'Exif.GPSInfo.GPSLongitudeRef',
+    'Xmp.exif.GPSLatitude',
+    'Xmp.exif.GPSLongitude',
+    'Xmp.dwc.decimalLatitude',
+    'Xmp.dwc.decimalLongitude',
+]
+METADATA_PREFIXES = ('Exif.', 'Iptc.', 'Xmp.')
 
 # Theme/window/display settings
 DEFAULT_WINDOW_SIZE = (1500, 1024)
@@ -130,6 +174,8 @@ COMMON_RANKS = [
     'phylum',
     'kingdom',
 ]
+# Precomputed rank order, from lowest (most specific) to highest
+RANK_IDX = {rank: idx for idx, rank in enumerate(RANKS)}
 ROOT_TAXON_ID = 48460
 
 # Type aliases
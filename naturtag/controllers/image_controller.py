@@ -6,6 +6,7 @@ from pyinaturalist import Observation, Taxon
 from PySide6.QtCore import Qt, QThread, Signal, Slot
 from PySide6.QtWidgets import QApplication, QGroupBox, QLabel, QSizePolicy
 
+from naturtag.constants import Resource
 from naturtag.controllers import BaseController, ImageGallery, get_app
 from naturtag.metadata import DerivedMetadata, _refresh_tags, tag_images
 from naturtag.utils import get_ids_from_url
@@ -168,9 +169,12 @@ class ImageController(BaseController):
 
         app = get_app()
         logger.info(f'Loading taxon {taxon_id}')
+        locale = app.settings.locale
         future = app.threadpool.schedule(
-            lambda: app.client.taxa(taxon_id, locale=app.settings.locale),
+            lambda: app.client.taxa(taxon_id, locale=locale),
             priority=QThread.HighPriority,
+            resource=Resource.NETWORK,
+            key=('taxon', taxon_id, locale),
         )
         future.on_result.connect(self.select_taxon)
 
@@ -184,6 +188,7 @@ class ImageController(BaseController):
         future = app.threadpool.schedule(
             lambda: app.client.observations(observation_id, taxonomy=True),
             priority=QThread.HighPriority,
+            resource=Resource.NETWORK,
         )
         future.on_result.connect(self.select_observation)
 
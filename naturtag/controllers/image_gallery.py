@@ -27,7 +27,14 @@ from PySide6.QtWidgets import (
 )
 from shiboken6 import isValid
 
-from naturtag.constants import IMAGE_FILETYPES, RAW_FILETYPES, SIZE_DEFAULT, Dimensions, PathOrStr
+from naturtag.constants import (
+    IMAGE_FILETYPES,
+    RAW_FILETYPES,
+    SIZE_DEFAULT,
+    Dimensions,
+    PathOrStr,
+    Resource,
+)
 from naturtag.controllers import BaseController
 from naturtag.metadata import DerivedMetadata
 from naturtag.utils import generate_thumbnail, get_valid_image_paths
@@ -379,7 +386,9 @@ class MetaThumbnail(HoverMixin, PixmapLabel):
         """Generate a photo thumbnail and read its metadata from a separate thread, and render it
         in the main thread when complete
         """
-        future = threadpool.schedule(self.get_pixmap_meta, path=path)
+        future = threadpool.schedule(
+            self.get_pixmap_meta, path=path, resource=Resource.DISK, key=('thumbnail', path)
+        )
         future.on_result.connect(self.set_pixmap_meta)
 
     def set_pixmap_meta(self, image_meta: tuple[QImage | None, DerivedMetadata, str | None]):
@@ -1,15 +1,17 @@
 import math
 from collections import OrderedDict
 from logging import getLogger
-from typing import Iterable, Iterator
+from typing import Iterable, Iterator, Optional
 
 from attr import define
 from pyinaturalist import Observation, Taxon
 from PySide6.QtCore import Qt, QThread, QTimer, Signal, Slot
 from PySide6.QtWidgets import QLabel, QPushButton
 
-from naturtag.constants import DEFAULT_DISPLAY_PAGE_SIZE, N_DISPLAY_TAXON_THUMBNAILS, PAGE_CACHE_MAX
-from naturtag.controllers import BaseController, ObservationInfoSection
+from naturtag.constants import DEFAULT_DISPLAY_PAGE_SIZE, PAGE_CACHE_MAX, Resource
+from naturtag.controllers import BaseController, ObservationInfoSection, ObservationSearch
+from naturtag.storage import ObservationCursor, ObservationFilters
+from naturtag.storage.sync import get_obs_image_urls, get_sync_pages
 from naturtag.widgets import HorizontalLayout, ObservationInfoCard, ObservationList
 from naturtag.widgets.style import fa_icon
 
@@ -23,6 +25,8 @@ class DbPageResult:
     observations: list[Observation]
     total_results: int
     is_empty: bool
+    next_cursor: Optional[ObservationCursor] = None
+    filters: Optional[ObservationFilters] = None
 
 
 class ObservationController(BaseController):
@@ -36,11 +40,12 @@ class ObservationController(BaseController):
         self.displayed_observation: Observation = None
 
         # Search inputs
-        # self.search = ObservationSearch(self.app.settings)
-        # self.search.autocomplete.on_select.connect(self.select_taxon)
-        # self.search.on_results.connect(self.set_search_results)
-        # self.on_select.connect(self.search.set_taxon)
-        # self.root.addLayout(self.search)
+        self.search = ObservationSearch()
+        self.search.on_search.connect(self.search_observations)
+        self.search.on_reset.connect(lambda: self.search_observations(None))
+        self.root.addWidget(self.search)
+        # Local search filters, if a search is active; otherwise all user observations are shown
+        self.filters: Optional[ObservationFilters] = None
 
         # Pagination
         self.page = 1
@@ -49,6 +54,8 @@ class ObservationController(BaseController):
         self.loaded_pages = 0
         self.loaded_obs = 0  # running count of observations received from API during sync
         self._page_cache: OrderedDict[int, list[Observation]] = OrderedDict()
+        # Cursor for the start of each page after page 1, for keyset pagination
+        self._page_cursors: dict[int, ObservationCursor] = {}
         self._sync_in_progress: bool = False
         self._precache_in_progress: bool = False
 
@@ -89,6 +96,8 @@ class ObservationController(BaseController):
         # Navigation keyboard shortcuts
         self.add_shortcut('Ctrl+Left', self.prev_page)
         self.add_shortcut('Ctrl+Right', self.next_page)
+        self.add_shortcut('Ctrl+Shift+Enter', self.search.search)
+        self.add_shortcut('Ctrl+Shift+X', self.search.reset)
 
         # On startup: display from DB first, then sync in background
         self._is_cold_start = False
@@ -100,6 +109,9 @@ class ObservationController(BaseController):
             logger.info('Unknown user; skipping observation load')
             return
         self.load_observations_from_db()
+        if self.app.client.offline:
+            logger.info('Offline; skipping observation sync')
+            return
         self.start_background_sync()
 
     # Actions triggered directly by UI
@@ -111,23 +123,49 @@ class ObservationController(BaseController):
         if self.displayed_observation and self.displayed_observation.id == observation_id:
             return
 
+        # Stop loading any previously selected observation
         logger.info(f'Loading observation {observation_id}')
+        self.app.threadpool.cancel(group='observation')
         future = self.app.threadpool.schedule(
             lambda: self.app.client.observations(observation_id, taxonomy=True, ident_taxa=True),
             priority=QThread.HighPriority,
+            group='observation',
+            resource=Resource.NETWORK,
+            key=('observation', observation_id),
         )
         future.on_result.connect(self.display_observation)
 
     def load_observations_from_db(self):
-        """Read the current page of observations from the local DB and display them"""
+        """Read the current page of observations (or search results) from the local DB and display
+        them
+        """
         cached = self._page_cache.get(self.page)
         if cached is not None:
             self._page_cache.move_to_end(self.page)
             self.display_user_observations(cached)
             return
         logger.debug(f'Loading observations from DB (page {self.page})')
-        future = self.app.threadpool.schedule(self._get_db_page, priority=QThread.NormalPriority)
-        future.on_result.connect(self.on_db_page_loaded)
+        if self.filters:
+            future = self.app.threadpool.schedule(
+                self._get_search_page, priority=QThread.HighPriority
+            )
+            future.on_result.connect(self.on_search_page_loaded)
+        else:
+            future = self.app.threadpool.schedule(
+                self._get_db_page, priority=QThread.NormalPriority
+            )
+            future.on_result.connect(self.on_db_page_loaded)
+
+    @Slot(object)
+    def search_observations(self, filters: Optional[ObservationFilters]):
+        """Search observations in the local DB, and display the first page of results. With no
+        filters, go back to displaying all user observations.
+        """
+        self.filters = filters
+        self.page = 1
+        self._page_cache.clear()
+        self._page_cursors.clear()
+        self.load_observations_from_db()
 
     def start_background_sync(self):
         """Kick off a background worker to fetch all new/updated observations from the API"""
@@ -137,6 +175,7 @@ class ObservationController(BaseController):
             self._sync_observations,
             priority=QThread.LowPriority,
             total_results=self.total_results or None,
+            resource=Resource.NETWORK,
         )
         future.on_result.connect(self.on_sync_page_received)
         future.on_finished.connect(self.on_sync_complete_common)
@@ -144,7 +183,7 @@ class ObservationController(BaseController):
         future.on_error.connect(self.on_sync_error_received)
 
     def next_page(self):
-        if self.page < min(self.total_pages, self.loaded_pages):
+        if self.has_next_page:
             self.page += 1
             self.load_observations_from_db()
 
@@ -161,6 +200,7 @@ class ObservationController(BaseController):
         self.loaded_pages = 0
         self.loaded_obs = 0
         self._page_cache.clear()
+        self._page_cursors.clear()
         self.app.state.sync_resume_id = None
         self.load_observations_from_db()
         self.start_background_sync()
@@ -172,6 +212,7 @@ class ObservationController(BaseController):
             self.app.threadpool.schedule(
                 lambda: self.app.img_fetcher.precache_image(urls),
                 priority=QThread.LowPriority,
+                resource=Resource.NETWORK,
             )
 
     def _start_precache_all_thumbnails(self):
@@ -183,12 +224,15 @@ class ObservationController(BaseController):
             logger.debug('Thumbnail pre-cache already in progress; skipping')
             return
         self._precache_in_progress = True
-        total = self.total_results or self.app.client.observations.count_db()
+        total = self.total_results or self.app.client.observations.count_db(
+            username=self.app.settings.username
+        )
         logger.info(f'Starting thumbnail pre-cache for {total} observations')
         future = self.app.threadpool.schedule_paginator(
             self._precache_thumbnails,
             priority=QThread.LowPriority,
             total_results=total or None,
+            resource=Resource.NETWORK,
         )
         future.on_finished.connect(self._on_precache_finished)
 
@@ -219,16 +263,23 @@ class ObservationController(BaseController):
         self.user_observations.set_observations(observations)
         self.bind_selection(self.user_observations.cards)
         self.update_pagination_buttons()
-        if self.total_results:
+        if self.filters:
+            self.user_obs_group_box.set_title('Search Results')
+        elif self.total_results:
             self.user_obs_group_box.set_title(f'My Observations ({self.total_results})')
         self.info('')
 
     @Slot(object)
     def on_db_page_loaded(self, result: DbPageResult):
         """Handle DB page result on the main thread"""
+        # Skip results that finished loading after a search was started
+        if result.filters != self.filters:
+            return
         self._page_cache[self.page] = result.observations
         if len(self._page_cache) > PAGE_CACHE_MAX:
             self._page_cache.popitem(last=False)
+        if result.next_cursor:
+            self._page_cursors[self.page + 1] = result.next_cursor
         # Use the DB count only if it's higher than previous count; the DB count grows during
         # download and must not overwrite the API-fetched total.
         if result.total_results > self.total_results:
@@ -246,15 +297,25 @@ class ObservationController(BaseController):
 
         self.display_user_observations(result.observations)
 
+    @Slot(object)
+    def on_search_page_loaded(self, result: DbPageResult):
+        """Handle search results page on the main thread"""
+        # Skip results from a previous search
+        if result.filters != self.filters:
+            return
+        self._page_cache[self.page] = result.observations
+        if len(self._page_cache) > PAGE_CACHE_MAX:
+            self._page_cache.popitem(last=False)
+        if result.next_cursor:
+            self._page_cursors[self.page + 1] = result.next_cursor
+        self.display_user_observations(result.observations)
+
     @Slot(object)
     def on_sync_page_received(self, observations: list[Observation]):
         """Called each time the background sync saves a page to the DB"""
         self.loaded_pages += 1
+        # Note: the resume checkpoint was already saved along with this page
         logger.debug(f'Sync page {self.loaded_pages} received ({len(observations)} observations)')
-        if observations:
-            max_id = max(obs.id for obs in observations)
-            self.app.state.sync_resume_id = max_id
-            self.app.state.write()
         self.loaded_obs += len(observations)
         self.update_pagination_buttons()
         self.on_sync_progress.emit(min(self.loaded_obs, self.total_results), self.total_results)
@@ -263,7 +324,7 @@ class ObservationController(BaseController):
 
         # On cold start, display page 1 once the first sync page arrives.
         # Delay _update_db_counts() until after sync, since DB count is not yet accurate.
-        if self._is_cold_start and self.loaded_pages == 1:
+        if self._is_cold_start and self.loaded_pages == 1 and not self.filters:
             self.load_observations_from_db()
 
     @Slot(Exception)
@@ -313,11 +374,23 @@ class ObservationController(BaseController):
         for obs_card in obs_cards:
             obs_card.on_click.connect(self.display_observation_by_id)
 
+    @property
+    def has_next_page(self) -> bool:
+        """Search results have a next page if there's a cursor for it. Otherwise, gate on pages that
+        have been loaded.
+        """
+        if self.filters:
+            return self.page + 1 in self._page_cursors
+        return self.page < min(self.total_pages, self.loaded_pages)
+
     def update_pagination_buttons(self):
-        """Update pagination buttons, gating 'next' on pages that have been loaded"""
+        """Update pagination buttons"""
         self.prev_button.setEnabled(self.page > 1)
-        self.next_button.setEnabled(self.page < min(self.total_pages, self.loaded_pages))
-        self.page_label.setText(f'Page {self.page} / {self.total_pages}')
+        self.next_button.setEnabled(self.has_next_page)
+        if self.filters:
+            self.page_label.setText(f'Page {self.page}')
+        else:
+            self.page_label.setText(f'Page {self.page} / {self.total_pages}')
 
     # I/O bound functions run from worker threads
     # ----------------------------------------
@@ -325,46 +398,45 @@ class ObservationController(BaseController):
     # TODO: Handle casual_observations setting?
     def _get_db_page(self) -> DbPageResult:
         """Read a single page of observations from the local DB"""
-        total_results = self.app.client.observations.count_db()
+        total_results = self.app.client.observations.count_db(username=self.app.settings.username)
         if total_results == 0:
             return DbPageResult([], total_results=0, is_empty=True)
-        obs = self.app.client.observations.search_user_db(
+        # Use a cursor from the previous page if available, otherwise fall back to page number
+        obs, next_cursor = self.app.client.observations.search_user_db(
             username=self.app.settings.username,
+            after=self._page_cursors.get(self.page),
             page=self.page,
         )
-        return DbPageResult(obs, total_results=total_results, is_empty=False)
+        return DbPageResult(
+            obs, total_results=total_results, is_empty=False, next_cursor=next_cursor
+        )
+
+    def _get_search_page(self) -> DbPageResult:
+        """Read a single page of search results from the local DB"""
+        filters = self.filters
+        obs, next_cursor = self.app.client.observations.search_db(
+            filters, after=self._page_cursors.get(self.page)
+        )
+        return DbPageResult(
+            obs, total_results=0, is_empty=not obs, next_cursor=next_cursor, filters=filters
+        )
 
     def _update_db_counts(self):
         """Update total_results and total_pages from the DB"""
-        self.total_results = self.app.client.observations.count_db()
+        self.total_results = self.app.client.observations.count_db(
+            username=self.app.settings.username
+        )
         self.total_pages = (
             math.ceil(self.total_results / DEFAULT_DISPLAY_PAGE_SIZE) if self.total_results else 0
         )
 
     def _sync_observations(self) -> Iterator[list[Observation]]:
         """Fetch all new/updated observations from the API, yielding one page at a time"""
-        yield from self.app.client.observations.search_user_paginated(
-            username=self.app.settings.username,
-            updated_since=self.app.state.last_obs_check,
-            id_above=self.app.state.sync_resume_id,
-        )
+        yield from get_sync_pages(self.app.client, self.app.settings, self.app.state)
 
     def _get_obs_image_urls(self, obs: Observation) -> list[str]:
-        """Return all thumbnail URLs to precache for a single observation.
-
-        Includes the observation default photo at medium size, all observation photos at square
-        size, the taxon default photo at medium size, and taxon grid photos at square size.
-        """
-        urls = []
-        if obs.photos:
-            urls.append(obs.default_photo.url_size('medium'))
-            for photo in obs.photos:
-                urls.append(photo.url_size('square'))
-        if obs.taxon and obs.taxon.taxon_photos:
-            urls.append(obs.taxon.default_photo.url_size('medium'))
-            for photo in obs.taxon.taxon_photos[: N_DISPLAY_TAXON_THUMBNAILS + 1]:
-                urls.append(photo.url_size('square'))
-        return urls
+        """Return all thumbnail URLs to precache for a single observation"""
+        return get_obs_image_urls(obs)
 
     def _precache_thumbnails(self):
         """Fetch and cache thumbnails for all observations in the DB. Yields after each page.
@@ -1,17 +1,157 @@
 """Components for searching for observations"""
 
+from datetime import date
 from logging import getLogger
+from typing import Optional
 
-from pyinaturalist import Observation
-from PySide6.QtCore import Qt
+from PySide6.QtCore import QDate, Qt, Signal, Slot
+from PySide6.QtWidgets import QComboBox, QDateEdit, QLabel, QLineEdit, QPushButton
 
-from naturtag.widgets import VerticalLayout
+from naturtag.controllers import get_app
+from naturtag.storage import ObservationFilters
+from naturtag.widgets import CollapsiblePanel, HorizontalLayout, TaxonAutocomplete
+from naturtag.widgets.images import FAIcon
+from naturtag.widgets.style import fa_icon
 
 logger = getLogger(__name__)
 
+CONTENT_WIDTH = 400
+QUALITY_GRADES = ['research', 'needs_id', 'casual']
+#: Minimum date for date inputs, which is displayed as an empty value
+NO_DATE = QDate(1900, 1, 1)
+
+
+class ObservationSearch(CollapsiblePanel):
+    """Search for observations in the local database, by text and other filters"""
+
+    on_search = Signal(object)  #: Search filters were submitted
+    on_reset = Signal()  #: Input fields were reset
 
-class ObservationSearch(VerticalLayout):
     def __init__(self):
+        super().__init__(content_width=CONTENT_WIDTH)
+        self.taxon_id: Optional[int] = None
+
+        # Text search on descriptions, comments, and places
+        self.text_input = QLineEdit()
+        self.text_input.setClearButtonEnabled(True)
+        self.text_input.setPlaceholderText('Descriptions, comments, places')
+        self.text_input.returnPressed.connect(self.search)
+        search_group = self.add_group('Search', self.content_layout, width=CONTENT_WIDTH)
+        search_group.addWidget(self.text_input)
+
+        # Taxon filter, which includes all descendants of the selected taxon
+        self.autocomplete = TaxonAutocomplete()
+        self.autocomplete.on_select.connect(self.set_taxon_id)
+        self.autocomplete.textEdited.connect(self._clear_taxon_id)
+        self.autocomplete.returnPressed.connect(self.search)
+        taxon_group = self.add_group('Taxon', self.content_layout, width=CONTENT_WIDTH)
+        taxon_group.addWidget(self.autocomplete)
+
+        # Other filters
+        filters = self.add_group('Filters', self.content_layout, width=CONTENT_WIDTH)
+        self.d1 = DateFilter('Observed after', 'fa5s.calendar-plus')
+        self.d2 = DateFilter('Observed before', 'fa5s.calendar-minus')
+        filters.addLayout(self.d1)
+        filters.addLayout(self.d2)
+
+        place_layout = HorizontalLayout()
+        place_layout.addWidget(FAIcon('fa5s.map-marker-alt', size=20))
+        place_layout.addWidget(QLabel('Place'))
+        self.place_input = QLineEdit()
+        self.place_input.setClearButtonEnabled(True)
+        self.place_input.returnPressed.connect(self.search)
+        place_layout.addWidget(self.place_input)
+        filters.addLayout(place_layout)
+
+        grade_layout = HorizontalLayout()
+        grade_layout.addWidget(FAIcon('fa5s.check-circle', size=20))
+        grade_layout.addWidget(QLabel('Quality grade'))
+        grade_layout.addStretch()
+        self.quality_grade = QComboBox()
+        self.quality_grade.addItems([''] + QUALITY_GRADES)
+        grade_layout.addWidget(self.quality_grade)
+        filters.addLayout(grade_layout)
+
+        # Search/reset buttons
+        button_layout = HorizontalLayout()
+        search_button = QPushButton('Search')
+        search_button.setMaximumWidth(200)
+        search_button.setIcon(fa_icon('fa5s.search'))
+        search_button.clicked.connect(self.search)
+        button_layout.addWidget(search_button)
+
+        reset_button = QPushButton('Reset')
+        reset_button.setMaximumWidth(200)
+        reset_button.setIcon(fa_icon('mdi.backspace'))
+        reset_button.clicked.connect(self.reset)
+        button_layout.addWidget(reset_button)
+        self.content_layout.addLayout(button_layout)
+
+    @property
+    def filters(self) -> ObservationFilters:
+        """Get search filters from the current input values"""
+        return ObservationFilters(
+            q=self.text_input.text().strip() or None,
+            username=get_app().settings.username or None,
+            taxon_id=self.taxon_id,
+            d1=self.d1.date,
+            d2=self.d2.date,
+            place=self.place_input.text().strip() or None,
+            quality_grade=self.quality_grade.currentText() or None,
+        )
+
+    def search(self):
+        """Search for observations with the currently selected filters"""
+        filters = self.filters
+        logger.debug(f'Searching observations: {filters}')
+        self.on_search.emit(filters)
+
+    def reset(self):
+        """Reset all search filters"""
+        self.text_input.setText('')
+        self.autocomplete.setText('')
+        self.taxon_id = None
+        self.d1.reset()
+        self.d2.reset()
+        self.place_input.setText('')
+        self.quality_grade.setCurrentIndex(0)
+        self.on_reset.emit()
+
+    @Slot(int)
+    def set_taxon_id(self, taxon_id: int):
+        self.taxon_id = taxon_id
+
+    @Slot(str)
+    def _clear_taxon_id(self, text: str):
+        """Clear the taxon filter when its name is edited, until a new taxon is selected"""
+        self.taxon_id = None
+
+
+class DateFilter(HorizontalLayout):
+    """Optional date input, which is empty until a date is selected"""
+
+    def __init__(self, label: str, icon_str: str):
         super().__init__()
-        self.selected_observation: Observation = None
-        self.setAlignment(Qt.AlignTop)
+        self.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        self.addWidget(FAIcon(icon_str, size=20))
+        self.addWidget(QLabel(label))
+        self.addStretch()
+
+        self.input = QDateEdit()
+        self.input.setCalendarPopup(True)
+        self.input.setDisplayFormat('yyyy-MM-dd')
+        self.input.setMinimumDate(NO_DATE)
+        self.input.setSpecialValueText(' ')
+        self.addWidget(self.input)
+        self.reset()
+
+    def reset(self):
+        self.input.setDate(NO_DATE)
+
+    def set_date(self, value: date):
+        self.input.setDate(QDate(value.year, value.month, value.day))
+
+    @property
+    def date(self) -> Optional[date]:
+        value = self.input.date()
+        return None if value == NO_DATE else date(value.year(), value.month(), value.day())
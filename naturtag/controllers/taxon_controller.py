@@ -5,7 +5,7 @@ from pyinaturalist import Taxon, TaxonCount, TaxonCounts
 from PySide6.QtCore import QSize, Qt, QThread, QTimer, Signal, Slot
 from PySide6.QtWidgets import QTabWidget, QWidget
 
-from naturtag.constants import MAX_DISPLAY_OBSERVED
+from naturtag.constants import MAX_DISPLAY_OBSERVED, Resource
 from naturtag.controllers import (
     BaseController,
     TaxonInfoSection,
@@ -80,10 +80,13 @@ class TaxonController(BaseController):
         client = self.app.client
         if self.tabs._init_complete:
             self.app.threadpool.cancel(group='taxonomy')
+        locale = self.app.settings.locale
         future = self.app.threadpool.schedule(
-            lambda: client.taxa(taxon_id, locale=self.app.settings.locale),
+            lambda: client.taxa(taxon_id, locale=locale),
             priority=QThread.HighPriority,
             group='taxonomy',
+            resource=Resource.NETWORK,
+            key=('taxon', taxon_id, locale),
         )
         future.on_result.connect(self.display_taxon)
 
@@ -191,6 +194,14 @@ class TaxonTabs(QTabWidget):
         future.on_result.connect(self.display_observed)
         future.on_finished.connect(lambda: self._on_init_task_finished('observed'))
 
+    @Slot()
+    def load_observed_taxa(self):
+        """Reload user-observed taxa, for example after new observations have been synced"""
+        future = get_app().threadpool.schedule(
+            self.get_user_observed_taxa, priority=QThread.LowPriority, group='taxonomy'
+        )
+        future.on_result.connect(self.display_observed)
+
     @Slot(str)
     def _on_init_task_finished(self, task_name: str):
         """Mark initial user taxa load complete after all startup tasks finish."""
@@ -205,13 +216,20 @@ class TaxonTabs(QTabWidget):
         if not app.settings.username:
             return []
 
-        # False will return *only* casual observations
-        verifiable = None if app.settings.casual_observations else True
-
-        taxon_counts = app.client.observations.species_counts(
-            user_login=app.settings.username,
-            verifiable=verifiable,
-        )
+        # Use synced observations if available, otherwise fall back to the API
+        if app.client.observations.count_db(username=app.settings.username):
+            taxon_counts = app.client.observations.species_counts_db(
+                app.settings.username,
+                casual=app.settings.casual_observations,
+                locale=app.settings.locale,
+            )
+        else:
+            # False will return *only* casual observations
+            verifiable = None if app.settings.casual_observations else True
+            taxon_counts = app.client.observations.species_counts(
+                user_login=app.settings.username,
+                verifiable=verifiable,
+            )
         logger.info(f'{len(taxon_counts)} user-observed taxa found')
         return sorted(taxon_counts, key=lambda x: x.count, reverse=True)
 
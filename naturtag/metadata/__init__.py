@@ -8,6 +8,7 @@ from naturtag.metadata.keywords import KeywordMetadata
 from naturtag.metadata.derived import DerivedMetadata
 from naturtag.metadata.tagger import (
     observation_to_metadata,
+    observations_to_metadata,
     _refresh_tags,
     refresh_tags,
     tag_images,
@@ -27,6 +27,8 @@ logger = getLogger().getChild(__name__)
 class BaseMetadata:
     """Wrapper class for reading & writing basic image metadata with exiv2"""
 
+    __slots__ = ('image_path', 'exif', 'iptc', 'xmp')
+
     def __init__(self, image_path: PathOrStr = ''):
         self.image_path = Path(image_path)
         self.exif, self.iptc, self.xmp = self.read_metadata()
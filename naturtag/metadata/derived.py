@@ -2,7 +2,7 @@ from itertools import accumulate
 from logging import getLogger
 from typing import Any, Optional
 
-from pyinaturalist import INAT_BASE_URL, RANKS, Coordinates, Observation, Taxon
+from pyinaturalist import INAT_BASE_URL, Coordinates, Observation, Taxon
 from pyinaturalist_convert import dwc_record_to_observation, to_dwc
 
 from naturtag.constants import (
@@ -10,9 +10,12 @@ from naturtag.constants import (
     COMMON_RANKS,
     DATE_TAGS,
     DIGIKAM_LIST_TAG,
+    GPS_TAGS,
     HIER_KEYWORD_TAGS,
     KEYWORD_TAGS,
+    METADATA_PREFIXES,
     OBSERVATION_KEYS,
+    RANK_IDX,
     TAXON_KEYS,
     IntTuple,
     StrTuple,
@@ -30,6 +33,11 @@ from naturtag.utils import quote
 
 NULL_COORDS = (0, 0)
 DWC_NAMESPACES = ['dcterms', 'dwc']
+
+# Tags that each cached property depends on, for selective invalidation
+DATE_TAG_SET = frozenset(DATE_TAGS)
+GPS_TAG_SET = frozenset(GPS_TAGS)
+KEYWORD_TAG_SET = frozenset(KEYWORD_TAGS + HIER_KEYWORD_TAGS + [DIGIKAM_LIST_TAG])
 logger = getLogger().getChild(__name__)
 
 
@@ -45,32 +53,68 @@ class DerivedMetadata(BaseMetadata):
         >>> print(meta.to_observation())
     """
 
+    __slots__ = (
+        '_combined',
+        '_coordinates',
+        '_date',
+        '_inaturalist_ids',
+        '_keyword_meta',
+        '_min_rank',
+        '_observation',
+        '_simplified',
+        '_summary',
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Define lazy-loaded properties
-        self._coordinates = None
-        self.inaturalist_ids = None
-        self._min_rank = None
+        self._reset_derived_properties()
+
+    def _reset_derived_properties(self):
+        """Reset all secondary properties derived from base metadata formats"""
+        self._combined: Optional[dict[str, Any]] = None
+        self._coordinates: Optional[Coordinates] = None
+        self._date: Optional[str] = None
+        self._inaturalist_ids: Optional[IntTuple] = None
+        self._keyword_meta: Optional[KeywordMetadata] = None
+        self._min_rank: Optional[tuple] = None
+        self._observation: Optional[Observation] = None
+        self._simplified: Optional[dict[str, str]] = None
+        self._summary: Optional[str] = None
+
+    def _update_derived_properties(self, changed_tags: dict[str, Any]):
+        """Patch cached combined tags with changed values, and reset only the derived properties
+        that depend on them. Tag names are unique across formats (by prefix), so the combined view
+        can be updated in place instead of rebuilt.
+        """
+        changed_tags = {k: v for k, v in changed_tags.items() if k.startswith(METADATA_PREFIXES)}
+        if not changed_tags:
+            return
+        if self._combined is not None:
+            self._combined.update(changed_tags)
+
+        # Depends on all tags
         self._simplified = None
-        self._summary = None
-        self._observation: Observation = None
-        self._keyword_meta = None
-        self._update_derived_properties()
-
-    def _update_derived_properties(self):
-        """Reset/ update all secondary properties derived from base metadata formats"""
-        self._coordinates = None
-        self.inaturalist_ids = None
+        self._inaturalist_ids = None
         self._min_rank = None
-        self._simplified = None
         self._summary = None
-        self._observation = None
-        self._keyword_meta = None
-        self.inaturalist_ids = get_inaturalist_ids(self.simplified)
+
+        # Depends on specific tags or formats
+        changed_keys = changed_tags.keys()
+        if not KEYWORD_TAG_SET.isdisjoint(changed_keys):
+            self._keyword_meta = None
+        if not DATE_TAG_SET.isdisjoint(changed_keys):
+            self._date = None
+        if not GPS_TAG_SET.isdisjoint(changed_keys):
+            self._coordinates = None
+        if any(k.startswith('Xmp.') for k in changed_keys):
+            self._observation = None
 
     @property
     def combined(self) -> dict[str, Any]:
-        return {**self.exif, **self.iptc, **self.xmp}
+        if self._combined is None:
+            self._combined = {**self.exif, **self.iptc, **self.xmp}
+        return self._combined
 
     @property
     def keyword_meta(self) -> KeywordMetadata:
@@ -93,7 +137,9 @@ class DerivedMetadata(BaseMetadata):
     @property
     def date(self) -> Optional[str]:
         """Date taken or created, as a string"""
-        return _first_match(self.combined, DATE_TAGS)
+        if self._date is None:
+            self._date = _first_match(self.combined, DATE_TAGS) or ''
+        return self._date or None
 
     @property
     def has_any_tags(self) -> bool:
@@ -111,6 +157,13 @@ class DerivedMetadata(BaseMetadata):
     def has_taxon(self) -> bool:
         return bool(self.taxon_id)
 
+    @property
+    def inaturalist_ids(self) -> IntTuple:
+        """Get ``(taxon_id, observation_id)`` from metadata, if available"""
+        if self._inaturalist_ids is None:
+            self._inaturalist_ids = get_inaturalist_ids(self.simplified)
+        return self._inaturalist_ids
+
     @property
     def observation_id(self) -> Optional[int]:
         return self.inaturalist_ids[1]
@@ -135,12 +188,9 @@ class DerivedMetadata(BaseMetadata):
             ``(rank, name)``
         """
         if self._min_rank is None:
-            for rank in RANKS:
-                if name := self.simplified.get(rank):
-                    self._min_rank = (rank, name)
-                    break
-            else:
-                self._min_rank = ()
+            ranks = [k for k, v in self.simplified.items() if v and k in RANK_IDX]
+            rank = min(ranks, key=RANK_IDX.__getitem__, default=None)
+            self._min_rank = (rank, self.simplified[rank]) if rank else ()
         return self._min_rank or None
 
     @property
@@ -189,7 +239,7 @@ class DerivedMetadata(BaseMetadata):
         self.exif.update(other.exif)
         self.xmp.update(other.xmp)
         self.iptc.update(other.iptc)
-        self._update_derived_properties()
+        self._update_derived_properties(other.combined)
         return self
 
     def update(self, new_metadata: dict):
@@ -197,16 +247,25 @@ class DerivedMetadata(BaseMetadata):
         if not new_metadata:
             return
         super().update(new_metadata)
-        self._update_derived_properties()
+        self._update_derived_properties(new_metadata)
 
-    def update_coordinates(self, coordinates: Coordinates, accuracy: Optional[int] = None):
+    def update_coordinates(
+        self,
+        coordinates: Coordinates,
+        accuracy: Optional[int] = None,
+        coordinate_tags: Optional[dict[str, str]] = None,
+    ):
+        """Update EXIF and XMP coordinates. For multiple images, tags may be converted ahead of time
+        with :py:func:`.to_coords_batch`.
+        """
         if not coordinates:
             self._coordinates = NULL_COORDS
             return
 
-        self.exif.update(to_exif_coords(coordinates, accuracy))
-        self.xmp.update(to_xmp_coords(coordinates, accuracy))
-        self._update_derived_properties()
+        self.update(
+            coordinate_tags
+            or {**to_exif_coords(coordinates, accuracy), **to_xmp_coords(coordinates, accuracy)}
+        )
         self._coordinates = coordinates
 
     def update_keywords(self, keywords):
@@ -223,6 +282,7 @@ class DerivedMetadata(BaseMetadata):
         observation: Observation,
         common_names: bool = False,
         hierarchical: bool = False,
+        coordinate_tags: Optional[dict[str, str]] = None,
     ) -> 'DerivedMetadata':
         """Update metadata from an iNaturalist Observation"""
         # Get all specified keyword categories
@@ -241,7 +301,9 @@ class DerivedMetadata(BaseMetadata):
 
         # Convert and add coordinates
         # TODO: Add other metadata like title, description, tags, etc.
-        self.update_coordinates(observation.location, observation.positional_accuracy)
+        self.update_coordinates(
+            observation.location, observation.positional_accuracy, coordinate_tags
+        )
 
         def _format_key(k):
             """Get DwC terms as XMP tags.
@@ -258,6 +320,17 @@ class DerivedMetadata(BaseMetadata):
 
         return self
 
+    def _fix_xmp(self):
+        """Fix invalid XMP tags, and reset any derived properties affected by the fixes"""
+        prev_xmp = dict(self.xmp)
+        fixed_xmp = super()._fix_xmp()
+        changed_keys = [k for k, v in prev_xmp.items() if fixed_xmp.get(k) is not v]
+        if changed_keys:
+            # Removed tags can't be patched in place, so rebuild combined tags on next access
+            self._combined = None
+            self._update_derived_properties({k: fixed_xmp.get(k) for k in changed_keys})
+        return fixed_xmp
+
     def to_observation(self) -> Observation:
         """Convert DwC metadata to an observation object, if possible"""
         if not self._observation:
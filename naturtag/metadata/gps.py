@@ -1,10 +1,21 @@
 """Utilities for converting GPS coordinates to/from EXIF and XMP image metadata"""
 
 import re
-from typing import Optional
+from typing import Optional, Sequence
 
+import numpy as np
 from pyinaturalist.constants import Coordinates
 
+CoordsArray = np.ndarray  # Array of shape (n, 2) with (latitude, longitude) in decimal degrees
+EXIF_COORD_TAGS = (
+    'Exif.GPSInfo.GPSLatitudeRef',
+    'Exif.GPSInfo.GPSLatitude',
+    'Exif.GPSInfo.GPSLongitudeRef',
+    'Exif.GPSInfo.GPSLongitude',
+)
+XMP_COORD_TAGS = ('Xmp.exif.GPSLatitude', 'Xmp.exif.GPSLongitude')
+ACCURACY_TAGS = ('Exif.GPSInfo.GPSHPositioningError', 'Xmp.exif.GPSHPositioningError')
+
 
 def convert_exif_coords(metadata: dict) -> Optional[Coordinates]:
     """Translate Exif.GPSInfo into decimal degrees, if available"""
@@ -125,3 +136,274 @@ def _get_xmp_coord(value: str) -> Optional[float]:
 
     groups = match.groups()
     return _ddm_to_decimal(int(groups[0]), float(groups[1]), groups[2])
+
+
+# Batch conversions
+# ----------------------------------------
+
+
+def convert_coords_batch(metadata: Sequence[dict]) -> CoordsArray:
+    """Get coordinates as decimal degrees from metadata for multiple images, with the same
+    precedence as a single image: DwC, then EXIF, then XMP.
+
+    Returns:
+        Array of shape ``(n, 2)``. Rows without valid coordinates are ``NaN``.
+    """
+    coords = convert_dwc_coords_batch(
+        [m.get('Xmp.dwc.decimalLatitude') for m in metadata],
+        [m.get('Xmp.dwc.decimalLongitude') for m in metadata],
+    )
+
+    if (idx := _missing_rows(coords)).size:
+        subset = [metadata[i] for i in idx]
+        coords[idx] = convert_exif_coords_batch(
+            [m.get('Exif.GPSInfo.GPSLatitude') for m in subset],
+            [m.get('Exif.GPSInfo.GPSLatitudeRef', 'N') for m in subset],
+            [m.get('Exif.GPSInfo.GPSLongitude') for m in subset],
+            [m.get('Exif.GPSInfo.GPSLongitudeRef', 'W') for m in subset],
+        )
+
+    if (idx := _missing_rows(coords)).size:
+        subset = [metadata[i] for i in idx]
+        coords[idx] = convert_xmp_coords_batch(
+            [m.get('Xmp.exif.GPSLatitude') for m in subset],
+            [m.get('Xmp.exif.GPSLongitude') for m in subset],
+        )
+    return coords
+
+
+def convert_dwc_coords_batch(
+    latitudes: Sequence[Optional[str]], longitudes: Sequence[Optional[str]]
+) -> CoordsArray:
+    """Translate XMP-formatted DwC coordinates (decimal degrees) for multiple images"""
+    coords = np.column_stack([_parse_floats(latitudes), _parse_floats(longitudes)])
+    coords[_missing_rows(coords)] = np.nan
+    return coords
+
+
+def convert_exif_coords_batch(
+    latitudes: Sequence[Optional[str]],
+    latitude_refs: Sequence[Optional[str]],
+    longitudes: Sequence[Optional[str]],
+    longitude_refs: Sequence[Optional[str]],
+) -> CoordsArray:
+    """Translate Exif.GPSInfo coordinates (DMS as rationals) for multiple images.
+    Example: ``'41/1 32/1 251889/10000'``
+    """
+    coords = np.column_stack(
+        [
+            _get_exif_coords_batch(latitudes, latitude_refs),
+            _get_exif_coords_batch(longitudes, longitude_refs),
+        ]
+    )
+    coords[_missing_rows(coords)] = np.nan
+    return coords
+
+
+def convert_xmp_coords_batch(
+    latitudes: Sequence[Optional[str]], longitudes: Sequence[Optional[str]]
+) -> CoordsArray:
+    """Translate XMP-formatted EXIF GPSInfo coordinates (DDM) for multiple images.
+    Example: ``'41,37.10N'``
+    """
+    coords = np.column_stack([_get_xmp_coords_batch(latitudes), _get_xmp_coords_batch(longitudes)])
+    coords[_missing_rows(coords)] = np.nan
+    return coords
+
+
+def to_coords_batch(
+    coords: Sequence[Optional[Coordinates]] | CoordsArray,
+    accuracy: Optional[Sequence[Optional[int]]] = None,
+) -> list[dict[str, str]]:
+    """Convert decimal degrees for multiple images to both EXIF and XMP coordinate tags.
+    Missing coordinates will result in an empty dict.
+    """
+    coords = _to_coords_array(coords)
+    values = [
+        e + x for e, x in zip(_format_exif_coords(coords), _format_xmp_coords(coords), strict=True)
+    ]
+    return _format_rows(coords, EXIF_COORD_TAGS + XMP_COORD_TAGS, values, accuracy, ACCURACY_TAGS)
+
+
+def to_exif_coords_batch(
+    coords: Sequence[Optional[Coordinates]] | CoordsArray,
+    accuracy: Optional[Sequence[Optional[int]]] = None,
+) -> list[dict[str, str]]:
+    """Convert decimal degrees for multiple images to Exif.GPSInfo coordinates (DMS).
+    Missing coordinates will result in an empty dict.
+    """
+    coords = _to_coords_array(coords)
+    values = _format_exif_coords(coords)
+    return _format_rows(coords, EXIF_COORD_TAGS, values, accuracy, ACCURACY_TAGS[:1])
+
+
+def to_xmp_coords_batch(
+    coords: Sequence[Optional[Coordinates]] | CoordsArray,
+    accuracy: Optional[Sequence[Optional[int]]] = None,
+) -> list[dict[str, str]]:
+    """Convert decimal degrees for multiple images to XMP-formatted GPS coordinates (DDM).
+    Missing coordinates will result in an empty dict.
+    """
+    coords = _to_coords_array(coords)
+    values = _format_xmp_coords(coords)
+    return _format_rows(coords, XMP_COORD_TAGS, values, accuracy, ACCURACY_TAGS[1:])
+
+
+def _decimal_to_ddm_batch(coords: CoordsArray) -> tuple[np.ndarray, np.ndarray]:
+    """Convert decimal degrees to (degrees, decimal minutes)"""
+    return np.divmod(np.abs(coords) * 60, 60)
+
+
+def _decimal_to_dms_batch(coords: CoordsArray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Convert decimal degrees to (degrees, minutes, seconds)"""
+    degrees, minutes = np.divmod(np.abs(coords) * 60, 60)
+    minutes, seconds = np.divmod(minutes * 60, 60)
+    return degrees, minutes, seconds
+
+
+def _get_exif_coords_batch(
+    values: Sequence[Optional[str]], directions: Sequence[Optional[str]]
+) -> np.ndarray:
+    """Translate values from Exif.GPSInfo into decimal degrees; invalid values will be ``NaN``"""
+    result = np.full(len(values), np.nan)
+    values_arr = _to_str_array(values)
+    # Valid values have exactly 3 rationals: 'd/d d/d d/d'
+    valid = np.flatnonzero(np.char.count(values_arr, '/') == 3)
+    if not valid.size:
+        return result
+
+    tokens = ' '.join(np.char.replace(values_arr[valid], '/', ' ')).split()
+    try:
+        rationals = np.array(tokens, dtype=np.float64).reshape(-1, 6)
+    # One or more malformed values; fall back to parsing individually
+    except ValueError:
+        rationals = np.array([_parse_rationals(v) for v in values_arr[valid]])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dms = rationals[:, 0::2] / rationals[:, 1::2]
+    decimal = dms[:, 0] + (dms[:, 1] / 60) + (dms[:, 2] / 3600)
+    decimal[~np.isfinite(decimal)] = np.nan
+    result[valid] = decimal * _direction_signs(_to_str_array(directions)[valid])
+    return result
+
+
+def _get_xmp_coords_batch(values: Sequence[Optional[str]]) -> np.ndarray:
+    """Translate values from XMP-formatted EXIF GPSInfo into decimal degrees; invalid values will
+    be ``NaN``
+    """
+    values_arr = _to_str_array(values)
+    degrees, sep, minutes = np.char.partition(np.char.rstrip(values_arr, 'NSEW'), ',').T
+    degrees = _parse_floats(degrees)
+    minutes = _parse_floats(minutes)
+    decimal = degrees + (minutes / 60)
+    decimal[(sep != ',') | (minutes < 0) | (degrees < 0)] = np.nan
+    return decimal * _direction_signs(values_arr, endswith=True)
+
+
+def _direction_signs(directions: np.ndarray, endswith: bool = False) -> np.ndarray:
+    """Get a sign for each direction: -1 for South or West, otherwise +1"""
+    if endswith:
+        negative = np.char.endswith(directions, 'S') | np.char.endswith(directions, 'W')
+    else:
+        negative = (directions == 'S') | (directions == 'W')
+    return np.where(negative, -1.0, 1.0)
+
+
+def _format_exif_coords(coords: CoordsArray) -> list[tuple[str, str, str, str]]:
+    """Format tag values for Exif.GPSInfo coordinates: (lat ref, lat, lon ref, lon)"""
+    # Missing rows are skipped later, but need placeholder values for integer conversion
+    degrees, minutes, seconds = _decimal_to_dms_batch(np.nan_to_num(coords))
+    dms = np.stack([degrees, minutes, np.trunc(seconds * 10000)], axis=-1).astype(np.int64)
+    return [
+        (
+            'S' if lat_neg else 'N',
+            f'{lat_d}/1 {lat_m}/1 {lat_s}/10000',
+            'W' if lon_neg else 'E',
+            f'{lon_d}/1 {lon_m}/1 {lon_s}/10000',
+        )
+        for ((lat_d, lat_m, lat_s), (lon_d, lon_m, lon_s)), (lat_neg, lon_neg) in zip(
+            dms.tolist(), (coords < 0).tolist(), strict=True
+        )
+    ]
+
+
+def _format_xmp_coords(coords: CoordsArray) -> list[tuple[str, str]]:
+    """Format tag values for XMP coordinates: (lat, lon)"""
+    degrees, minutes = _decimal_to_ddm_batch(np.nan_to_num(coords))
+    # Note: python floats (via tolist()) keep the same shortest round-trip repr as single values
+    return [
+        (f'{lat_d},{lat_m}{"S" if lat_neg else "N"}', f'{lon_d},{lon_m}{"W" if lon_neg else "E"}')
+        for (lat_d, lon_d), (lat_m, lon_m), (lat_neg, lon_neg) in zip(
+            degrees.astype(np.int64).tolist(), minutes.tolist(), (coords < 0).tolist(), strict=True
+        )
+    ]
+
+
+def _format_rows(
+    coords: CoordsArray,
+    keys: tuple[str, ...],
+    values: Sequence[tuple[str, ...]],
+    accuracy: Optional[Sequence[Optional[int]]],
+    accuracy_tags: tuple[str, ...],
+) -> list[dict[str, str]]:
+    """Build a dict of tags for each row with valid coordinates, plus accuracy (if available)
+
+    Raises:
+        ValueError: If ``accuracy`` has a different length than ``coords``
+    """
+    missing = np.isnan(coords).any(axis=1).tolist()
+    accuracy_values = accuracy if accuracy is not None else [None] * len(missing)
+    results: list[dict[str, str]] = []
+    for is_missing, row, acc in zip(missing, values, accuracy_values, strict=True):
+        if is_missing:
+            results.append({})
+            continue
+        tags = dict(zip(keys, row, strict=True))
+        if acc is not None:
+            tags.update(dict.fromkeys(accuracy_tags, str(acc)))
+        results.append(tags)
+    return results
+
+
+def _missing_rows(coords: CoordsArray) -> np.ndarray:
+    """Get indices of rows missing either latitude or longitude"""
+    return np.flatnonzero(np.isnan(coords).any(axis=1))
+
+
+def _parse_floats(values: Sequence[Optional[str]] | np.ndarray) -> np.ndarray:
+    """Parse strings into floats; missing or invalid values will be ``NaN``"""
+    values_arr = np.where(_to_str_array(values) == '', 'nan', _to_str_array(values))
+    try:
+        return values_arr.astype(np.float64)
+    # One or more invalid values; fall back to parsing individually
+    except ValueError:
+        return np.array([_safe_float(v) for v in values_arr], dtype=np.float64)
+
+
+def _parse_rationals(value: str) -> list[float]:
+    try:
+        tokens = [float(n) for n in re.split(r'[/\s]+', value.strip())]
+    except ValueError:
+        tokens = []
+    return tokens if len(tokens) == 6 else [np.nan] * 6
+
+
+def _safe_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def _to_coords_array(coords: Sequence[Optional[Coordinates]] | CoordsArray) -> CoordsArray:
+    """Convert a sequence of coordinates to an array of shape (n, 2), with None as ``NaN``"""
+    if isinstance(coords, np.ndarray):
+        return coords.astype(np.float64).reshape(-1, 2)
+    return np.array([c if c else (np.nan, np.nan) for c in coords], dtype=np.float64).reshape(-1, 2)
+
+
+def _to_str_array(values: Sequence[Optional[str]] | np.ndarray) -> np.ndarray:
+    """Convert values to a numpy string array, with None as an empty string"""
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'U':
+        return values.copy()
+    return np.array(['' if v is None else str(v).strip() for v in values], dtype=str)
@@ -1,11 +1,13 @@
 from itertools import chain
 from logging import getLogger
+from operator import itemgetter
 from typing import Any, Optional
 
-from naturtag.constants import DIGIKAM_LIST_TAG, HIER_KEYWORD_TAGS, KEYWORD_TAGS, RANKS
+from naturtag.constants import DIGIKAM_LIST_TAG, HIER_KEYWORD_TAGS, KEYWORD_TAGS, RANK_IDX
 from naturtag.utils.parsing import quote
 
 # All tags that support regular and hierarchical keyword lists
+KEYWORD_LIST_TAGS = KEYWORD_TAGS + HIER_KEYWORD_TAGS
 
 logger = getLogger().getChild(__name__)
 
@@ -15,65 +17,72 @@ class KeywordMetadata:
     Container for combining, parsing, and organizing keyword metadata into relevant categories
     """
 
+    __slots__ = ('keywords', 'kv_keywords', 'hier_keywords', 'normal_keywords')
+
     def __init__(
         self, metadata: Optional[dict[str, Any]] = None, keywords: Optional[list[str]] = None
     ):
         """Initialize with full metadata or keywords only"""
         self.keywords = keywords or self._get_combined_keywords(metadata)
-        self.kv_keywords = self._get_kv_keywords()
-        self.hier_keywords = self._get_hierarchical_keywords()
-        self.normal_keywords = self._get_normal_keywords()
+        self.kv_keywords, self.hier_keywords, self.normal_keywords = self._parse_keywords()
 
     def _get_combined_keywords(self, metadata: Optional[dict[str, Any]] = None) -> list[str]:
         """Get keywords from all metadata formats"""
         if not metadata:
             return []
 
-        # Split comma-separated keywords into a list, if not already a list
-        def get_keyword_list(tag):
-            keywords = metadata.get(tag, [])
-            if isinstance(keywords, list):
-                return keywords
-            elif ',' in keywords:
-                return [kw.strip() for kw in keywords.split(',')]
-            else:
-                return [keywords.strip()] if keywords.strip() else []
-
         # Combine and re-sort all keywords, to account for invalid tags created by other apps
-        keywords = [get_keyword_list(tag) for tag in KEYWORD_TAGS + HIER_KEYWORD_TAGS]
+        keywords = chain.from_iterable(
+            _split_keywords(metadata.get(tag)) for tag in KEYWORD_LIST_TAGS
+        )
 
         # digiKam's native hierarchical tag field uses '/' instead of '|' as a separator
-        digikam_tags = [
-            kw.lstrip('/').replace('/', '|') for kw in get_keyword_list(DIGIKAM_LIST_TAG)
-        ]
-        keywords.append(digikam_tags)
-
-        unique_keywords = [
-            k.replace('"', '') for k in set(chain.from_iterable(keywords)) if k != ','
-        ]
-
+        digikam_tags = (
+            kw.lstrip('/').replace('/', '|')
+            for kw in _split_keywords(metadata.get(DIGIKAM_LIST_TAG))
+        )
+
+        # Most keywords are repeated across formats, so deduplicate before any per-keyword cleanup.
+        # dict.fromkeys preserves order.
+        raw_keywords = dict.fromkeys(chain(keywords, digikam_tags))
+        raw_keywords.pop(',', None)
+        unique_keywords = list(dict.fromkeys([k.replace('"', '') for k in raw_keywords]))
         logger.debug(f'{len(unique_keywords)} unique keywords found')
         return unique_keywords
 
-    def _get_kv_keywords(self) -> dict[str, str]:
-        """Get all keywords that contain key-value pairs"""
-        kv_keywords = [kw for kw in self.keywords if kw.count('=') == 1 and kw.split('=')[1]]
-        kv_keywords = sort_taxonomy_keywords(kv_keywords)
-        logger.debug(f'{len(kv_keywords)} unique key-value pairs found in keywords')
-        return dict([kw.split('=') for kw in kv_keywords])
+    def _parse_keywords(self) -> tuple[dict[str, str], list[str], list[str]]:
+        """Classify all keywords in a single pass:
 
-    def _get_hierarchical_keywords(self) -> list[str]:
-        """Get all hierarchical keywords as flat strings.
-        Also account for root nodes (single values that are the root of a hierarchical chain).
+        * Key-value pairs, sorted by taxonomic rank (where applicable)
+        * Hierarchical keywords as flat strings, including root nodes (single values that are the
+          root of a hierarchical chain)
+        * Normal single-value keywords that are neither a key-value pair nor hierarchical
         """
-        hier_keywords = [kw for kw in self.keywords if '|' in kw]
-        # Prepend each chain's root before its first entry; dict.fromkeys preserves order and deduplicates
-        entries = (item for kw in hier_keywords for item in (kw.split('|')[0], kw))
-        return list(dict.fromkeys(entries))
-
-    def _get_normal_keywords(self) -> list[str]:
-        """Get all single-value keywords that are neither a key-value pair nor hierarchical"""
-        return sorted({k for k in self.keywords if '=' not in k and '|' not in k})
+        kv_keywords: list[tuple[int, str, str]] = []
+        hier_keywords: dict[str, None] = {}
+        normal_keywords: set[str] = set()
+
+        for kw in self.keywords:
+            is_hier = '|' in kw
+            if is_hier:
+                # Add each chain's root before its first entry
+                hier_keywords.setdefault(kw.partition('|')[0])
+                hier_keywords.setdefault(kw)
+            if '=' in kw:
+                key, _, value = kw.partition('=')
+                if value and '=' not in value:
+                    kv_keywords.append((_get_rank_idx(key), key, value))
+            elif not is_hier:
+                normal_keywords.add(kw)
+
+        # Sort is stable, so keywords with the same (or no) rank keep their original order
+        kv_keywords.sort(key=itemgetter(0), reverse=True)
+        logger.debug(f'{len(kv_keywords)} unique key-value pairs found in keywords')
+        return (
+            {key: value for _, key, value in kv_keywords},
+            list(hier_keywords),
+            sorted(normal_keywords),
+        )
 
     @property
     def flickr_tags(self):
@@ -132,9 +141,21 @@ class KeywordMetadata:
 
 def sort_taxonomy_keywords(keywords: list[str]) -> list[str]:
     """Sort keywords by taxonomic rank, where applicable"""
+    return sorted(keywords, key=lambda kw: _get_rank_idx(kw.partition('=')[0]), reverse=True)
+
+
+def _get_rank_idx(key: str) -> int:
+    """Get the rank index for a taxonomy keyword key (like ``taxonomy:genus``), if any"""
+    return RANK_IDX.get(key.rpartition(':')[2], 0)
 
-    def get_rank_idx(tag: str) -> int:
-        rank = tag.split(':')[-1].split('=')[0]
-        return RANKS.index(rank) if rank in RANKS else 0
 
-    return sorted(keywords, key=get_rank_idx, reverse=True)
+def _split_keywords(keywords: Any) -> list[str]:
+    """Split comma-separated keywords into a list, if not already a list"""
+    if not keywords:
+        return []
+    elif isinstance(keywords, list):
+        return keywords
+    elif ',' in keywords:
+        return [kw.strip() for kw in keywords.split(',')]
+    else:
+        return [keywords.strip()] if keywords.strip() else []
@@ -5,18 +5,22 @@
 # TODO: Handle observation with no taxon ID?
 # TODO: Include eol:dataObject info (metadata for an individual observation photo)
 from collections.abc import Iterator
+from itertools import islice
 from logging import getLogger
-from typing import Iterable, Optional
+from typing import Iterable, Optional, Sequence
 
 from pyinaturalist import Observation
 
 from naturtag.constants import PathOrStr
-from naturtag.metadata import DerivedMetadata
+from naturtag.metadata import DerivedMetadata, to_coords_batch
 from naturtag.storage import Settings, iNatDbClient
 from naturtag.utils import get_valid_image_paths
 
 logger = getLogger().getChild(__name__)
 
+# Number of images to refresh at once, with coordinates converted for each batch
+REFRESH_BATCH_SIZE = 100
+
 
 def tag_images(
     image_paths: Iterable[PathOrStr],
@@ -72,7 +76,7 @@ def _tag_images_iter(
 ) -> Iterator[DerivedMetadata]:
     """Same as :py:func:`tag_images`, but returns an iterator"""
     settings = settings or Settings.read()
-    client = client or iNatDbClient(settings.db_path)
+    client = client or iNatDbClient.from_settings(settings)
 
     observation = client.from_id(observation_id, taxon_id)
     if not observation:
@@ -140,13 +144,55 @@ def _refresh_tags_iter(
     client: Optional[iNatDbClient] = None,
     settings: Optional[Settings] = None,
 ) -> Iterator[DerivedMetadata | None]:
-    """Same as :py:func:`refresh_tags`, but returns an iterator"""
+    """Same as :py:func:`refresh_tags`, but returns an iterator. Images are refreshed in batches,
+    so coordinates can be converted for a whole batch at once.
+    """
     settings = settings or Settings.read()
-    client = client or iNatDbClient(settings.db_path)
-    for image_path in get_valid_image_paths(
-        image_paths, recursive, create_sidecars=settings.sidecar, include_raw=True
-    ):
-        yield _refresh_tags(DerivedMetadata(image_path), client, settings)
+    client = client or iNatDbClient.from_settings(settings)
+    image_paths = iter(
+        get_valid_image_paths(
+            image_paths, recursive, create_sidecars=settings.sidecar, include_raw=True
+        )
+    )
+    while batch := list(islice(image_paths, REFRESH_BATCH_SIZE)):
+        yield from _refresh_tags_batch([DerivedMetadata(path) for path in batch], client, settings)
+
+
+def _refresh_tags_batch(
+    metadata: list[DerivedMetadata], client: iNatDbClient, settings: Settings
+) -> list[Optional[DerivedMetadata]]:
+    """Refresh existing metadata for multiple images
+
+    Returns:
+        Updated metadata for each image, or ``None`` for images without existing IDs
+    """
+    results: list[Optional[DerivedMetadata]] = [None] * len(metadata)
+    to_refresh: list[tuple[int, DerivedMetadata, Observation]] = []
+    for i, img_metadata in enumerate(metadata):
+        if not img_metadata.has_observation and not img_metadata.has_taxon:
+            logger.debug(f'No IDs found in {img_metadata.image_path}')
+        elif observation := client.from_id(img_metadata.observation_id, img_metadata.taxon_id):
+            to_refresh.append((i, img_metadata, observation))
+    if not to_refresh:
+        return results
+
+    indexes, refresh_metadata, observations = zip(*to_refresh, strict=True)
+    updated = observations_to_metadata(
+        observations,
+        metadata=refresh_metadata,
+        common_names=settings.common_names,
+        hierarchical=settings.hierarchical,
+    )
+    for i, img_metadata in zip(indexes, updated, strict=True):
+        logger.debug(f'Refreshing tags for {img_metadata.image_path}')
+        img_metadata.write(
+            write_exif=settings.exif,
+            write_iptc=settings.iptc,
+            write_xmp=settings.xmp,
+            write_sidecar=settings.sidecar,
+        )
+        results[i] = img_metadata
+    return results
 
 
 def _refresh_tags(
@@ -190,3 +236,29 @@ def observation_to_metadata(
     return metadata.from_observation(
         observation, common_names=common_names, hierarchical=hierarchical
     )
+
+
+def observations_to_metadata(
+    observations: Sequence[Observation],
+    metadata: Optional[Sequence[DerivedMetadata]] = None,
+    common_names: bool = False,
+    hierarchical: bool = False,
+) -> list[DerivedMetadata]:
+    """Get image metadata from multiple Observation objects, with coordinates converted in a single
+    batch. If existing metadata is provided, it must have one item per observation.
+    """
+    if metadata is None:
+        metadata = [DerivedMetadata() for _ in observations]
+    coordinate_tags = to_coords_batch(
+        [obs.location for obs in observations],
+        [obs.positional_accuracy for obs in observations],
+    )
+    return [
+        img_metadata.from_observation(
+            obs,
+            common_names=common_names,
+            hierarchical=hierarchical,
+            coordinate_tags=tags,
+        )
+        for img_metadata, obs, tags in zip(metadata, observations, coordinate_tags, strict=True)
+    ]
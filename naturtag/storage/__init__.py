@@ -1,6 +1,7 @@
 # ruff: noqa: F401
 from naturtag.storage.app_state import AppState
-from naturtag.storage.client import iNatDbClient
+from naturtag.storage.client import ObservationCursor, ObservationFilters, iNatDbClient
 from naturtag.storage.remote_images import ImageFetcher
 from naturtag.storage.settings import Settings
 from naturtag.storage.setup import setup
+from naturtag.storage.sync import SyncProgress, sync_observations
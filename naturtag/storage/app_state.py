@@ -10,11 +10,8 @@ from attr import define, field
 from cattrs.preconf import json
 from pyinaturalist import TaxonCounts
 from pyinaturalist_convert._models import Base
-from pyinaturalist_convert.db import create_table
-from sqlalchemy import Column, Integer, create_engine, delete, select, types
+from sqlalchemy import Column, Integer, select, types
 from sqlalchemy.exc import OperationalError
-from sqlalchemy.orm import Session
-from sqlalchemy.pool import NullPool
 
 from naturtag.constants import (
     DB_PATH,
@@ -22,6 +19,16 @@ from naturtag.constants import (
     MAX_DISPLAY_HISTORY,
     MAX_DISPLAY_OBSERVED,
 )
+from naturtag.storage.checkpoints import SYNC_CHECKPOINT, get_checkpoint, set_checkpoint
+from naturtag.storage.db import get_db, get_session
+from naturtag.storage.taxon_history import (
+    add_view,
+    get_frequent,
+    get_history_count,
+    get_recent,
+    get_view_count,
+    import_history,
+)
 
 JsonConverter = json.make_converter()
 logger = getLogger(__name__)
@@ -31,26 +38,30 @@ logger = getLogger(__name__)
 class AppState:
     """Container for persistent application state info. This includes values that don't need to be
     human-readable/editable, so they are persisted in SQLite instead of ``settings.yml``.
+
+    Taxon view history is stored separately in an append-only table (see
+    :py:mod:`naturtag.storage.taxon_history`), and only the top recent and frequent taxa are kept
+    in memory.
     """
 
     db_path: Path = None  # type: ignore
     _version: str | None = None
 
     # Taxonomy browser data
-    history: list[int] = field(factory=list)
     starred: list[int] = field(factory=list)
     observed: dict[int, int] = field(factory=dict)
+    recent: list[int] = None  # type: ignore
     frequent: Counter[int] = None  # type: ignore
 
     # Misc state info
     setup_complete: bool = field(default=False)
     last_obs_check: Optional[datetime] = field(default=None)
-    sync_resume_id: Optional[int] = field(default=None)
     prev_version: str = field(default='N/A')
     window_size: tuple[int, int] = field(default=DEFAULT_WINDOW_SIZE)
 
     def __attrs_post_init__(self):
-        self.frequent = Counter(self.history)
+        self.recent = []
+        self.frequent = Counter()
 
     @property
     def display_ids(self) -> set[int]:
@@ -63,7 +74,7 @@ class AppState:
     @property
     def top_history(self) -> list[int]:
         """Get the most recently viewed unique taxa"""
-        return _top_unique_ids(self.history[::-1])
+        return self.recent[:MAX_DISPLAY_HISTORY]
 
     @property
     def top_frequent(self) -> list[int]:
@@ -75,6 +86,17 @@ class AppState:
         """Get the most commonly observed taxa"""
         return _top_unique_ids(self.observed.keys(), MAX_DISPLAY_OBSERVED)
 
+    @property
+    def sync_resume_id(self) -> Optional[int]:
+        """ID to resume an interrupted observation sync from. This is stored separately so it can be
+        updated in the same transaction as each page of synced observations.
+        """
+        return get_checkpoint(SYNC_CHECKPOINT, self.db_path or DB_PATH)
+
+    @sync_resume_id.setter
+    def sync_resume_id(self, resume_id: Optional[int]):
+        set_checkpoint(resume_id, SYNC_CHECKPOINT, self.db_path or DB_PATH)
+
     @property
     def version(self) -> str:
         """Get the current app version from package metadata"""
@@ -102,21 +124,33 @@ class AppState:
         self.last_obs_check = datetime.now(timezone.utc).replace(microsecond=0)
         self.write()
 
+    def load_history(self):
+        """Load the top recent and frequent taxa from the history table"""
+        db_path = self.db_path or DB_PATH
+        self.recent = get_recent(db_path=db_path)
+        self.frequent = Counter(get_frequent(db_path=db_path))
+
     def update_history(self, taxon_id: int):
-        """Update history and frequent with a new or existing taxon ID"""
-        self.history.append(taxon_id)
-        self.frequent.update([taxon_id])
+        """Save a taxon view, and update recent and frequent with a new or existing taxon ID"""
+        count = add_view(taxon_id, self.db_path or DB_PATH)
+        self.recent = _top_unique_ids([taxon_id, *self.recent])
+        self.frequent[taxon_id] = count
+        # Counts only ever increase, so the top frequent taxa can be maintained incrementally
+        if len(self.frequent) > MAX_DISPLAY_HISTORY:
+            self.frequent = Counter(dict(self.frequent.most_common(MAX_DISPLAY_HISTORY)))
 
     def update_observed(self, taxon_counts: TaxonCounts):
         self.observed = {t.id: t.count for t in taxon_counts}
 
     def view_count(self, taxon_id: int) -> int:
         """Return the number of times this taxon has been viewed"""
-        return self.frequent.get(taxon_id, 0)
+        if taxon_id in self.frequent:
+            return self.frequent[taxon_id]
+        return get_view_count(taxon_id, self.db_path or DB_PATH)
 
     def __str__(self):
         sizes = [
-            f'History: {len(self.history)}',
+            f'History: {get_history_count(self.db_path or DB_PATH)}',
             f'Starred: {len(self.starred)}',
             f'Frequent: {len(self.frequent)}',
             f'Observed: {len(self.observed)}',
@@ -129,25 +163,29 @@ class AppState:
         logger.debug(f'Reading app state from {db_path}')
 
         try:
-            with _get_session(db_path) as session:
+            with get_session(db_path) as session:
                 state_json = session.execute(select(DbAppState)).first()[0].content
         except (TypeError, OperationalError):
             new_state = AppState()
             new_state.db_path = db_path
             return new_state
 
+        # Migrate history from older versions that stored it in the state JSON
+        if legacy_history := state_json.pop('history', None):
+            import_history(legacy_history, db_path)
+
         obj = JsonConverter.structure(state_json, cl=cls)
         obj.db_path = db_path
+        obj.load_history()
         return obj
 
     def write(self):
         """Write app state to SQLite database. Table will be created if it doesn't exist."""
         logger.debug(f'Writing app state to {self.db_path}')
-        create_table(DbAppState, self.db_path)
+        DbAppState.__table__.create(get_db(self.db_path).engine, checkfirst=True)
         state_json = JsonConverter.unstructure(self)
-        with _get_session(self.db_path) as session:
-            session.execute(delete(DbAppState))
-            session.add(DbAppState(content=state_json))
+        with get_session(self.db_path) as session:
+            session.merge(DbAppState(id=0, content=state_json))
             session.commit()
 
 
@@ -161,12 +199,6 @@ class DbAppState:
     content = Column(types.JSON)
 
 
-def _get_session(db_path: Path) -> Session:
-    """Create a SQLAlchemy session with NullPoo, so connections are closed immediately"""
-    engine = create_engine(f'sqlite:///{db_path}', poolclass=NullPool)
-    return Session(engine)
-
-
 def _top_unique_ids(ids: Iterable[int], n: int = MAX_DISPLAY_HISTORY) -> list[int]:
     """Get the top unique IDs from a list, preserving order"""
     return list(dict.fromkeys(ids))[:n]
@@ -0,0 +1,67 @@
+"""Resume checkpoints for observation sync. These are stored in their own table (instead of
+:py:class:`.AppState`) so they can be updated in the same transaction as each page of observations.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from naturtag.constants import DB_PATH
+from naturtag.storage.db import Connection, connect
+
+#: Checkpoint name for the main user observation sync
+SYNC_CHECKPOINT = 'observations'
+
+CREATE_CHECKPOINT_TABLE = (
+    'CREATE TABLE IF NOT EXISTS sync_checkpoint (name TEXT PRIMARY KEY, resume_id INTEGER NOT NULL)'
+)
+
+
+def get_checkpoint(name: str = SYNC_CHECKPOINT, db_path: Path = DB_PATH) -> Optional[int]:
+    """Get the ID to resume a sync from, if it was interrupted"""
+    try:
+        with connect(db_path) as conn:
+            row = conn.execute(
+                'SELECT resume_id FROM sync_checkpoint WHERE name = ?', (name,)
+            ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def get_checkpoints(prefix: str, db_path: Path = DB_PATH) -> dict[str, int]:
+    """Get all sync checkpoints with names starting with the given prefix"""
+    try:
+        with connect(db_path) as conn:
+            rows = conn.execute(
+                'SELECT name, resume_id FROM sync_checkpoint WHERE substr(name, 1, ?) = ?',
+                (len(prefix), prefix),
+            )
+            return dict(rows.fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+def set_checkpoints(checkpoints: dict[str, int], db_path: Path = DB_PATH):
+    """Set multiple sync checkpoints in a single transaction"""
+    with connect(db_path) as conn:
+        for name, resume_id in checkpoints.items():
+            write_checkpoint(conn, resume_id, name)
+
+
+def set_checkpoint(resume_id: Optional[int], name: str = SYNC_CHECKPOINT, db_path: Path = DB_PATH):
+    """Set or clear (with ``resume_id=None``) a sync checkpoint"""
+    with connect(db_path) as conn:
+        write_checkpoint(conn, resume_id, name)
+
+
+def write_checkpoint(conn: Connection, resume_id: Optional[int], name: str = SYNC_CHECKPOINT):
+    """Set or clear a sync checkpoint using an existing connection, without committing"""
+    conn.execute(CREATE_CHECKPOINT_TABLE)
+    if resume_id is None:
+        conn.execute('DELETE FROM sync_checkpoint WHERE name = ?', (name,))
+    else:
+        conn.execute(
+            'INSERT OR REPLACE INTO sync_checkpoint (name, resume_id) VALUES (?, ?)',
+            (name, resume_id),
+        )
@@ -1,41 +1,219 @@
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
 from itertools import chain
 from logging import getLogger
 from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Event, Lock
 from time import time
-from typing import Iterator, Optional
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+from urllib.parse import unquote
 
-from pyinaturalist import Identification, Observation, Taxon, WrapperPaginator, iNatClient
-from pyinaturalist.constants import MultiInt
+from pyinaturalist import (
+    Identification,
+    Observation,
+    Photo,
+    Taxon,
+    TaxonCount,
+    WrapperPaginator,
+    iNatClient,
+)
+from pyinaturalist.constants import PER_PAGE_RESULTS, RANK_LEVELS, MultiInt
 from pyinaturalist.controllers import ObservationController, TaxonController
 from pyinaturalist.converters import ensure_list
-from pyinaturalist_convert import index_observation_text
-from pyinaturalist_convert._models import DbObservation
-from pyinaturalist_convert.db import (
-    get_db_observations,
-    get_db_taxa,
-    get_session,
-    save_observations,
-    save_taxa,
+from pyinaturalist_convert._models import DbObservation, DbTaxon, DbUser
+from pyinaturalist_convert.fts import OBS_FTS_TABLE, TextField, _get_obs_strs
+from sqlalchemy import (
+    ColumnElement,
+    Integer,
+    Select,
+    TextualSelect,
+    and_,
+    column,
+    func,
+    select,
+    text,
+    tuple_,
 )
-from sqlalchemy import func, select
+from sqlalchemy.orm import Session
 
-from naturtag.constants import DB_PATH, DEFAULT_DISPLAY_PAGE_SIZE, ROOT_TAXON_ID
-from naturtag.utils import get_version
+from naturtag.constants import (
+    DB_PATH,
+    DEFAULT_DISPLAY_PAGE_SIZE,
+    ROOT_TAXON_ID,
+    SYNC_WORKERS,
+    TAXONOMY_INDEX_MAX_STALE,
+)
+from naturtag.storage.checkpoints import (
+    SYNC_CHECKPOINT,
+    get_checkpoints,
+    set_checkpoint,
+    set_checkpoints,
+    write_checkpoint,
+)
+from naturtag.storage.db import get_db, get_session
+from naturtag.storage.freshness import FreshnessPolicy, write_fetched
+from naturtag.storage.network import NetworkPolicy, set_session_offline
+from naturtag.storage.object_cache import ObjectCache
+from naturtag.storage.observation_counts import (
+    get_observation_count,
+    get_taxon_observation_counts,
+)
+from naturtag.storage.settings import Settings
+from naturtag.storage.taxon_fts import INVALID_FTS5_CHARS
+from naturtag.storage.taxon_tree import (
+    add_untracked_taxa,
+    descendant_ids_stmt,
+    get_descendant_ids,
+)
+from naturtag.storage.taxonomy_index import TaxonomyIndex
+from naturtag.utils import check_cancelled, get_version
 
 logger = getLogger(__name__)
 
+# In-memory caches of records loaded from the db or API, shared by all clients in this process
+TAXON_CACHE: ObjectCache[Taxon] = ObjectCache()
+OBSERVATION_CACHE: ObjectCache[Observation] = ObjectCache()
+
+
+class ObservationCursor(NamedTuple):
+    """Position of an observation when sorted by creation date (newest first), for keyset
+    pagination. ``created_at`` is the raw value stored in the database.
+    """
+
+    created_at: Optional[str]
+    id: int
+
+    def where_after(self) -> ColumnElement[bool]:
+        """Get a SQL condition for observations that come after this position"""
+        created_at, obs_id = DbObservation.created_at, DbObservation.id
+        if self.created_at is None:
+            return and_(created_at.is_(None), obs_id < self.id)  # type: ignore
+        return tuple_(created_at, obs_id) < (self.created_at, self.id)
+
+
+class ObservationFilters(NamedTuple):
+    """Filters for searching observations in the local database. Text searches use the observation
+    text index (descriptions, comments, identification comments, and place names), and all other
+    filters use indexed columns.
+    """
+
+    q: Optional[str] = None  #: Text search query
+    username: Optional[str] = None  #: Only include observations by this user
+    taxon_id: Optional[int] = None  #: Only include this taxon and its descendants
+    d1: Optional[date] = None  #: Only include observations on or after this date
+    d2: Optional[date] = None  #: Only include observations on or before this date
+    place: Optional[str] = None  #: Text search query for place names only
+    quality_grade: Optional[str] = None  #: Only include observations with this quality grade
+
+    def where(self) -> list[ColumnElement[bool]]:
+        """Get SQL conditions for all specified filters"""
+        conditions = []
+        if self.q and (query := _fts_query(self.q)):
+            conditions.append(DbObservation.id.in_(_text_search_stmt('q', query)))  # type: ignore
+        if self.place and (query := _fts_query(self.place)):
+            stmt = _text_search_stmt('place', query, TextField.PLACE)
+            conditions.append(DbObservation.id.in_(stmt))  # type: ignore
+        if self.username:
+            user_id = select(DbUser.id).where(DbUser.login == self.username).limit(1)
+            conditions.append(DbObservation.user_id == user_id.scalar_subquery())
+        if self.taxon_id:
+            taxon_ids = descendant_ids_stmt(self.taxon_id, include_self=True)
+            conditions.append(DbObservation.taxon_id.in_(taxon_ids))  # type: ignore
+        # Dates are stored as ISO 8601 strings, which can be compared directly
+        if self.d1:
+            conditions.append(DbObservation.observed_on >= self.d1.isoformat())
+        if self.d2:
+            next_day = self.d2 + timedelta(days=1)
+            conditions.append(DbObservation.observed_on < next_day.isoformat())
+        if self.quality_grade:
+            conditions.append(DbObservation.quality_grade == self.quality_grade)
+        return conditions
+
+
+class SyncPartition(NamedTuple):
+    """An ID range of observations to fetch in a parallel sync, with a checkpoint of the same name.
+    Bounds are exclusive, as in the API's ``id_above`` and ``id_below`` params.
+    """
+
+    name: str
+    id_above: int
+    id_below: int
+
+    @classmethod
+    def from_checkpoint(cls, name: str, resume_id: int) -> 'SyncPartition':
+        """Get a partition from its checkpoint, starting after its most recently saved ID"""
+        last_id = int(name.rsplit('-', 1)[-1])
+        return cls(name, resume_id, last_id + 1)
+
 
 class iNatDbClient(iNatClient):
     """API client class that uses a local SQLite database to cache observations and taxa (when searched by ID)"""
 
-    def __init__(self, db_path: Path = DB_PATH, **kwargs):
+    db_path: Path
+    network_policy: NetworkPolicy
+    observations: 'ObservationDbController'
+    taxa: 'TaxonDbController'
+
+    def __init__(
+        self,
+        db_path: Path = DB_PATH,
+        taxonomy_index: bool = False,
+        observation_ttl: Optional[timedelta] = None,
+        taxon_ttl: Optional[timedelta] = None,
+        network_policy: NetworkPolicy = NetworkPolicy.ONLINE,
+        **kwargs,
+    ):
         kwargs.setdefault('cache_control', False)
         kwargs.setdefault('user_agent', f'naturtag/{get_version()}')
         super().__init__(**kwargs)
         self.db_path = db_path
-        self.taxa = TaxonDbController(self)
-        self.observations = ObservationDbController(self, taxon_controller=self.taxa)
+        self.network_policy = NetworkPolicy.ONLINE
+        self.set_network_policy(network_policy)
+        self.taxa = TaxonDbController(self, use_index=taxonomy_index, ttl=taxon_ttl)
+        self.observations = ObservationDbController(
+            self, taxon_controller=self.taxa, ttl=observation_ttl
+        )
+
+    @classmethod
+    def from_settings(cls, settings: Settings, **kwargs) -> 'iNatDbClient':
+        """Initialize a client with database path, taxonomy index, and TTLs from user settings"""
+        return cls(
+            settings.db_path,
+            taxonomy_index=settings.taxonomy_index,
+            observation_ttl=timedelta(days=settings.observation_ttl)
+            if settings.observation_ttl
+            else None,
+            taxon_ttl=timedelta(days=settings.taxon_ttl) if settings.taxon_ttl else None,
+            network_policy=NetworkPolicy(settings.network_policy),
+            **kwargs,
+        )
+
+    @property
+    def offline(self) -> bool:
+        return self.network_policy == NetworkPolicy.OFFLINE
+
+    def set_network_policy(self, network_policy: NetworkPolicy):
+        """Set when to use the network for records that aren't available locally. In offline mode,
+        any requests that are still made (like searches) will fail immediately with an
+        :py:exc:`.OfflineError`.
+        """
+        self.network_policy = NetworkPolicy(network_policy)
+        set_session_offline(self.session, self.offline)
+
+    def set_scheduler(self, scheduler: Optional[Callable[..., Any]]):
+        """Set a function to refresh stale records in the background. If not set, stale records
+        will be refreshed before they are returned.
+        """
+        self.taxa.freshness.scheduler = scheduler
+        self.observations.freshness.scheduler = scheduler
+
+    @property
+    def cache_stats(self) -> dict[str, dict]:
+        """Usage stats for in-memory taxon and observation caches"""
+        return {'taxa': TAXON_CACHE.stats, 'observations': OBSERVATION_CACHE.stats}
 
     def from_id(
         self, observation_id: Optional[int] = None, taxon_id: Optional[int] = None
@@ -68,12 +246,22 @@ class iNatDbClient(iNatClient):
         return observation
 
 
-# TODO: cache expiration?
 class ObservationDbController(ObservationController):
-    def __init__(self, *args, taxon_controller: 'TaxonDbController', **kwargs):
-        """Need a reference to taxon controller to get full taxon ancestry"""
+    client: iNatDbClient
+
+    def __init__(
+        self,
+        *args,
+        taxon_controller: 'TaxonDbController',
+        ttl: Optional[timedelta] = None,
+        **kwargs,
+    ):
+        """Need a reference to taxon controller to get full taxon ancestry. Saved observations
+        older than ``ttl`` will be refreshed from the API.
+        """
         super().__init__(*args, **kwargs)
         self.taxon_controller = taxon_controller
+        self.freshness = FreshnessPolicy('observation', ttl=ttl)
 
     def from_ids(
         self,
@@ -83,35 +271,75 @@ class ObservationDbController(ObservationController):
         taxonomy: bool = False,
         **params,
     ) -> WrapperPaginator[Observation]:
-        """Get observations by ID; first from the database, then from the API"""
-        # Get any observations saved in the database (unless refreshing)
+        """Get observations by ID; first from the in-memory cache, then the database, then the API
+        (depending on network policy)
+        """
         start = time()
+        db_path = self.client.db_path
         observation_ids = ensure_list(observation_ids)
+        refresh = _check_refresh(refresh, self.client.network_policy)
+        online = self.client.network_policy == NetworkPolicy.ONLINE
+        cached: list[Observation] = []
         if refresh:
-            observations = []
+            OBSERVATION_CACHE.invalidate(db_path, observation_ids)
         else:
-            observations = list(get_db_observations(self.client.db_path, ids=observation_ids))
-        logger.debug(f'{len(observations)} observations found in database')
+            cached = list(
+                OBSERVATION_CACHE.get_many(
+                    db_path,
+                    observation_ids,
+                    min_fetched_at=self.freshness.min_fetched_at if online else None,
+                ).values()
+            )
+            logger.debug(f'{len(cached)} observations found in cache')
+
+        # Get any other observations saved in the database (unless refreshing)
+        remaining_ids = set(observation_ids) - {obs.id for obs in cached}
+        observations: list[Observation] = []
+        fetched: dict[int, float] = {}
+        if remaining_ids and not refresh:
+            observations = _get_db_observations(db_path, remaining_ids)
+            logger.debug(f'{len(observations)} observations found in database')
+            remaining_ids -= {obs.id for obs in observations}
+            fetched = self.freshness.get_fetched([obs.id for obs in observations], db_path)
+
+        # Check saved observations for staleness; either refresh them in the background, or fetch
+        # them below. Cached observations are already known to be fresh.
+        if online and (
+            stale_ids := self.freshness.revalidate(
+                [obs.id for obs in observations], self._refresh, db_path, fetched
+            )
+        ):
+            observations = [obs for obs in observations if obs.id not in stale_ids]
+            remaining_ids |= stale_ids
 
         # Get remaining observations from the API and save to the database
-        remaining_ids = set(observation_ids) - {obs.id for obs in observations}
-        if remaining_ids:
+        if remaining_ids and self.client.offline:
+            logger.warning(f'Offline; skipping {len(remaining_ids)} observations not saved locally')
+        elif remaining_ids:
+            check_cancelled()
             logger.debug(f'Fetching remaining {len(remaining_ids)} observations from API')
             api_results = super().from_ids(remaining_ids, **params).all()
             observations.extend(api_results)
             self.save(api_results)
+            fetched.update(dict.fromkeys([obs.id for obs in api_results], time()))
 
-        # Add full taxonomy to observations, if specified
+        # Add full taxonomy to observations, if specified (cached observations already have it)
         if taxonomy:
-            self.taxon_controller._add_taxonomy([obs.taxon for obs in observations])
+            check_cancelled()
+            self.taxon_controller._add_taxonomy([obs.taxon for obs in observations if obs.taxon])
 
         # Populate identification taxa
         if ident_taxa:
+            check_cancelled()
             all_idents = list(
                 chain.from_iterable(obs.identifications or [] for obs in observations)
             )
             self.taxon_controller._add_identification_taxa(all_idents)
 
+        # Only cache fully populated observations
+        if taxonomy and ident_taxa:
+            OBSERVATION_CACHE.set_many(db_path, observations, fetched_at=fetched)
+        observations = cached + observations
         logger.debug(f'Finished in {time() - start:.2f} seconds')
         return WrapperPaginator(observations)
 
@@ -119,12 +347,90 @@ class ObservationDbController(ObservationController):
         """Get the total number of observations matching the specified criteria from the API"""
         return super().search(user_login=username, refresh=True, **params).count()
 
-    def count_db(self) -> int:
-        """Get the total number of observations in the local database"""
-        stmt = select(func.count()).select_from(DbObservation)
+    def count_db(self, taxon_id: Optional[int] = None, username: Optional[str] = None) -> int:
+        """Get the total number of observations in the local database, optionally filtered by user
+        and/or by a taxon and its descendants.
+
+        Without a taxon filter, this uses precomputed counts instead of counting observations.
+        """
+        if not taxon_id:
+            return get_observation_count(self.client.db_path, username)
+
+        taxon_ids = descendant_ids_stmt(taxon_id, include_self=True)
+        stmt = (
+            select(func.count())
+            .select_from(DbObservation)
+            .where(DbObservation.taxon_id.in_(taxon_ids))  # type: ignore
+        )
+        if username:
+            user_ids = select(DbUser.id).where(DbUser.login == username)
+            stmt = stmt.where(DbObservation.user_id.in_(user_ids))  # type: ignore
         with get_session(self.client.db_path) as session:
             return session.execute(stmt).scalar() or 0
 
+    def species_counts_db(
+        self, username: str, casual: bool = False, locale: Optional[str] = None
+    ) -> list[TaxonCount]:
+        """Get counts of taxa observed by a user from the local database, similar to
+        :py:meth:`.species_counts`. Taxa below species are counted as their species, and taxa above
+        species are only included if none of their descendants have been observed.
+
+        Args:
+            username: iNaturalist username
+            casual: Include casual observations
+            locale: Locale preference for taxon common names
+        """
+        obs_counts = get_taxon_observation_counts(username, self.client.db_path, casual)
+        if not obs_counts:
+            return []
+
+        # Get ranks and ancestors of observed taxa, and species ancestors of any taxa below species
+        with get_session(self.client.db_path) as session:
+            stmt = select(DbTaxon.id, DbTaxon.rank, DbTaxon.ancestor_ids).where(
+                DbTaxon.id.in_(obs_counts.keys())  # type: ignore
+            )
+            taxa = {
+                id: (rank, _split_ids(ancestor_ids))
+                for id, rank, ancestor_ids in session.execute(stmt)
+            }
+            sub_species_ancestor_ids = set(
+                chain.from_iterable(
+                    ancestor_ids
+                    for rank, ancestor_ids in taxa.values()
+                    if RANK_LEVELS.get(rank, 100) < RANK_LEVELS['species']
+                )
+            )
+            stmt = select(DbTaxon.id).where(
+                DbTaxon.id.in_(sub_species_ancestor_ids),  # type: ignore
+                DbTaxon.rank == 'species',
+            )
+            species_ids = set(session.execute(stmt).scalars())
+
+        # Roll up counts of taxa below species
+        species_counts: Counter[int] = Counter()
+        for taxon_id, count in obs_counts.items():
+            _, ancestor_ids = taxa.get(taxon_id, (None, []))
+            species_id = next((id for id in ancestor_ids if id in species_ids), taxon_id)
+            species_counts[species_id] += count
+
+        # Exclude any taxa above species with observed descendants. This includes ancestors of taxa
+        # below species, since their species may not have been observed directly.
+        observed_ancestor_ids = (
+            set(chain.from_iterable(ancestor_ids for _, ancestor_ids in taxa.values()))
+            - species_ids
+        )
+        for taxon_id in observed_ancestor_ids & species_counts.keys():
+            del species_counts[taxon_id]
+
+        taxon_counts = []
+        for taxon in self.taxon_controller.from_ids(
+            list(species_counts), locale=locale, accept_partial=True
+        ):
+            taxon_count = TaxonCount.copy(taxon)
+            taxon_count.count = species_counts[taxon.id]
+            taxon_counts.append(taxon_count)
+        return sorted(taxon_counts, key=lambda t: t.count, reverse=True)
+
     def search(self, **params) -> WrapperPaginator[Observation]:
         """Search observations, and save results to the database (for future reference by ID)"""
         results = []
@@ -133,16 +439,25 @@ class ObservationDbController(ObservationController):
         return WrapperPaginator(results)
 
     def _search_paginated(
+        self, id_above: Optional[int] = None, checkpoint: Optional[str] = None, **params
+    ) -> Iterator[list[Observation]]:
+        """Search observations, saving and yielding results one page at a time. Optionally update a
+        sync checkpoint as each page is saved.
+        """
+        for obs_page in self._fetch_paginated(id_above=id_above, **params):
+            self.save(obs_page, checkpoint=checkpoint)
+            yield obs_page
+
+    def _fetch_paginated(
         self, id_above: Optional[int] = None, **params
     ) -> Iterator[list[Observation]]:
-        """Search observations, saving and yielding results one page at a time"""
+        """Search observations, yielding results one page at a time without saving"""
         query = super().search(**params)
         if id_above is not None:
             query.last_id = id_above
         while not query.exhausted:
-            obs_page = query.next_page()
-            self.save(obs_page)
-            yield obs_page
+            check_cancelled()
+            yield query.next_page()
 
     def search_user(
         self,
@@ -178,40 +493,86 @@ class ObservationDbController(ObservationController):
         # Otherwise get up to `limit` most recent saved observations from the db.
         # This includes obs we just fetched and saved; a minor inefficiency, but we can't accurately
         # sort a mix of API results and db results by created date within a single query.
-        obs = get_db_observations(
-            self.client.db_path,
-            username=username,
-            limit=limit,
-            page=page,
-            order_by_created=True,
-        )
-        return list(obs)
+        return self.search_user_db(username, limit=limit, page=page)[0]
 
     def search_user_db(
-        self, username: str, limit: int = DEFAULT_DISPLAY_PAGE_SIZE, page: int = 1
-    ) -> list[Observation]:
-        """Read a single page of observations from the local DB, ordered by creation date"""
-        return list(
-            get_db_observations(
-                self.client.db_path,
-                username=username,
-                limit=limit,
-                page=page,
-                order_by_created=True,
-            )
-        )
+        self,
+        username: str,
+        limit: int = DEFAULT_DISPLAY_PAGE_SIZE,
+        after: Optional[ObservationCursor] = None,
+        page: int = 1,
+    ) -> tuple[list[Observation], Optional[ObservationCursor]]:
+        """Read a single page of observations from the local DB, ordered by creation date (newest
+        first).
+
+        Pages are selected by a cursor from the previous page, which takes constant time regardless
+        of page number. If a cursor isn't available, ``page`` can be used instead, which is slower
+        for later pages.
+
+        Returns:
+            Observations, and a cursor for the next page (if there may be more results)
+        """
+        stmt = _observation_stmt().where(*ObservationFilters(username=username).where())
+        return self._get_db_page(stmt, limit, after, page)
+
+    def search_db(
+        self,
+        filters: ObservationFilters,
+        limit: int = DEFAULT_DISPLAY_PAGE_SIZE,
+        after: Optional[ObservationCursor] = None,
+    ) -> tuple[list[Observation], Optional[ObservationCursor]]:
+        """Search observations in the local DB by text and/or other filters, ordered by creation
+        date (newest first). This never uses the API, so it works the same offline.
+
+        Returns:
+            Observations, and a cursor for the next page (if there may be more results)
+        """
+        stmt = _observation_stmt().where(*filters.where())
+        return self._get_db_page(stmt, limit, after)
+
+    def _get_db_page(
+        self,
+        stmt: Select,
+        limit: int,
+        after: Optional[ObservationCursor] = None,
+        page: int = 1,
+    ) -> tuple[list[Observation], Optional[ObservationCursor]]:
+        """Get a single page of results for an observation query, using either a cursor or a page
+        number
+        """
+        if after is not None:
+            page_stmt = stmt.where(after.where_after())
+        else:
+            page_stmt = stmt.offset((page - 1) * limit) if page > 1 else stmt
+
+        with get_session(self.client.db_path) as session:
+            db_observations = list(session.execute(page_stmt.limit(limit)).scalars())
+            # Observations with no creation date are sorted last, but aren't matched by a cursor
+            # with a creation date
+            if after is not None and after.created_at is not None and len(db_observations) < limit:
+                null_stmt = stmt.where(DbObservation.created_at.is_(None))  # type: ignore
+                db_observations += session.execute(
+                    null_stmt.limit(limit - len(db_observations))
+                ).scalars()
+            observations = [db_obs.to_model() for db_obs in db_observations]
+
+        next_cursor = None
+        if len(db_observations) == limit:
+            last = db_observations[-1]
+            next_cursor = ObservationCursor(last.created_at, last.id)  # type: ignore
+        return observations, next_cursor
 
     def search_user_db_paginated(
         self, username: str, limit: int = DEFAULT_DISPLAY_PAGE_SIZE
     ) -> Iterator[list[Observation]]:
         """Yield pages of observations from the local DB until exhausted"""
-        page = 1
+        cursor = None
         while True:
-            obs_page = self.search_user_db(username=username, limit=limit, page=page)
-            if not obs_page:
+            obs_page, cursor = self.search_user_db(username=username, limit=limit, after=cursor)
+            if obs_page:
+                yield obs_page
+            if not cursor:
                 break
-            yield obs_page
-            page += 1
 
     # TODO/WIP: paginated version of get_user_observations
     def search_user_paginated(
@@ -227,6 +588,7 @@ class ObservationDbController(ObservationController):
         total = 0
         for page in self._search_paginated(
             id_above=id_above,
+            checkpoint=SYNC_CHECKPOINT,
             user_login=username,
             updated_since=updated_since,
             refresh=True,
@@ -235,13 +597,184 @@ class ObservationDbController(ObservationController):
             total += len(page)
         logger.debug(f'{total} new observations found')
 
-    def save(self, observations: list[Observation]):
-        """Save observations to the database (full records + text search index)"""
-        save_observations(observations, self.client.db_path)
-        index_observation_text(observations, self.client.db_path)
+    def search_user_parallel(
+        self,
+        username: str,
+        updated_since: Optional[datetime] = None,
+        workers: int = SYNC_WORKERS,
+    ) -> Iterator[list[Observation]]:
+        """Fetch observations from the API using multiple concurrent requests, saving and yielding a
+        single page at a time. This is mainly useful for the first full sync of a large account.
+
+        Observations are split into ID range partitions, each of which is fetched in order by a
+        separate thread (sharing the client's rate limiter). Pages are saved from the calling
+        thread, along with a resume checkpoint for each partition. If a previous sync was
+        interrupted, only its unfinished partitions are fetched.
+        """
+        partitions = self._get_sync_partitions(username, updated_since, workers * 2)
+        if not partitions:
+            return
+        logger.debug(f'Fetching user observations in {len(partitions)} partitions')
+        pages: Queue[tuple[SyncPartition, Any]] = Queue(maxsize=workers * 2)
+        stop = Event()
+        params = {'user_login': username, 'updated_since': updated_since, 'refresh': True}
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sync') as executor:
+            for partition in partitions:
+                executor.submit(self._fetch_partition, partition, pages, stop, **params)
+            try:
+                remaining = len(partitions)
+                while remaining:
+                    partition, result = _get_unless_cancelled(pages)
+                    if isinstance(result, Exception):
+                        raise result
+                    elif result is None:
+                        set_checkpoint(None, partition.name, self.client.db_path)
+                        remaining -= 1
+                    else:
+                        self.save(result, checkpoint=partition.name)
+                        yield result
+            # Stop any remaining workers on error, or if the caller stops iterating
+            finally:
+                stop.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_sync_partitions(
+        self, username: str, updated_since: Optional[datetime], n_partitions: int
+    ) -> list['SyncPartition']:
+        """Get unfinished partitions from a previous sync, if any; otherwise, plan partitions of
+        roughly equal ID ranges for a new sync. The number of partitions is limited by the total
+        number of observations, so each partition has at least one full page.
+        """
+        prefix = f'{SYNC_CHECKPOINT}:'
+        if checkpoints := get_checkpoints(prefix, self.client.db_path):
+            logger.debug(f'Resuming {len(checkpoints)} unfinished sync partitions')
+            return sorted(SyncPartition.from_checkpoint(k, v) for k, v in checkpoints.items())
+
+        params = {'user_login': username, 'updated_since': updated_since, 'refresh': True}
+        query = super().search(**params)
+        first_obs = query.limit(1)
+        if not first_obs:
+            return []
+        last_obs = super().search(order='desc', **params).limit(1)
+        total = query.total_results or 0
+        min_id, max_id = first_obs[0].id, last_obs[0].id
+
+        n_partitions = max(1, min(n_partitions, total // PER_PAGE_RESULTS))
+        step = (max_id - min_id) // n_partitions + 1
+        partitions = [
+            SyncPartition(f'{prefix}{start}-{start + step - 1}', start - 1, start + step)
+            for start in range(min_id, max_id + 1, step)
+        ]
+        set_checkpoints({p.name: p.id_above for p in partitions}, self.client.db_path)
+        return partitions
+
+    def _fetch_partition(
+        self,
+        partition: 'SyncPartition',
+        pages: Queue,
+        stop: Event,
+        **params,
+    ):
+        """Fetch all pages of a single partition, and add them to a queue to be saved"""
+        try:
+            for page in self._fetch_paginated(
+                id_above=partition.id_above, id_below=partition.id_below, **params
+            ):
+                if not _put_unless_stopped(pages, (partition, page), stop):
+                    return
+            _put_unless_stopped(pages, (partition, None), stop)
+        except Exception as e:
+            _put_unless_stopped(pages, (partition, e), stop)
+
+    def save(self, observations: list[Observation], checkpoint: Optional[str] = None):
+        """Save observations to the database, including taxa, photos, users, text search index, and
+        fetch times. All of these are written in a single transaction.
+
+        Args:
+            observations: Observations to save
+            checkpoint: Sync checkpoint name to update with the highest saved observation ID, in the
+                same transaction
+        """
+        if not observations:
+            return
+        obs_ids = [obs.id for obs in observations]
+        db = get_db(self.client.db_path)
+        with db.session() as session:
+            for obs in observations:
+                session.merge(DbObservation.from_model(obs, skip_taxon=True))
+            _merge_taxa(session, [obs.taxon for obs in observations if obs.taxon])
+            session.flush()
+
+            # Use the same underlying connection (and transaction) for non-ORM tables
+            conn = db.instrument(session.connection().connection.dbapi_connection)
+            placeholders = ','.join(['?'] * len(obs_ids))
+            conn.execute(
+                f'DELETE FROM {OBS_FTS_TABLE} WHERE observation_id IN ({placeholders})', obs_ids
+            )
+            conn.executemany(
+                f'INSERT INTO {OBS_FTS_TABLE} (observation_id, text, field) VALUES (?, ?, ?)',
+                chain.from_iterable(_get_obs_strs(obs) for obs in observations),
+            )
+            write_fetched(conn, 'observation', obs_ids)
+            if checkpoint:
+                write_checkpoint(conn, max(obs_ids), checkpoint)
+            session.commit()
+
+        OBSERVATION_CACHE.invalidate(self.client.db_path, obs_ids)
+        updated_taxon_ids = _get_updated_taxon_ids([obs.taxon for obs in observations if obs.taxon])
+        TAXON_CACHE.invalidate(self.client.db_path, updated_taxon_ids)
+        self.taxon_controller.invalidate_index(updated_taxon_ids)
+
+    def _refresh(self, observation_ids: list[int]):
+        """Fetch and save updated observations from the API"""
+        self.save(super().from_ids(observation_ids).all())
 
 
 class TaxonDbController(TaxonController):
+    client: iNatDbClient
+
+    def __init__(self, *args, use_index: bool = False, ttl: Optional[timedelta] = None, **kwargs):
+        """Optionally use an in-memory taxonomy index to get ancestors and children. Saved taxa
+        older than ``ttl`` will be refreshed from the API.
+        """
+        super().__init__(*args, **kwargs)
+        self.use_index = use_index
+        self.freshness = FreshnessPolicy('taxon', ttl=ttl)
+        self._index: Optional[TaxonomyIndex] = None
+        self._index_lock = Lock()
+        # Taxa saved since the index was built, to be read from the database instead
+        self._index_stale_ids: set[int] = set()
+
+    @property
+    def index(self) -> Optional[TaxonomyIndex]:
+        """In-memory taxonomy index, if enabled. Built from the database on first use."""
+        if not self.use_index:
+            return None
+        with self._index_lock:
+            if self._index is None:
+                self._index = TaxonomyIndex.from_db(self.client.db_path)
+        return self._index
+
+    def reset_index(self):
+        """Clear the taxonomy index (if any), to be rebuilt on next use"""
+        with self._index_lock:
+            self._index = None
+            self._index_stale_ids.clear()
+
+    def invalidate_index(self, taxon_ids: Iterable[int]):
+        """Mark taxa as updated since the index was built, so they're read from the database
+        instead. If too many taxa have been updated, the index is rebuilt on next use.
+        """
+        with self._index_lock:
+            if self._index is None:
+                return
+            self._index_stale_ids.update(taxon_ids)
+            if len(self._index_stale_ids) > TAXONOMY_INDEX_MAX_STALE:
+                logger.debug('Taxonomy index is outdated; rebuilding on next use')
+                self._index = None
+                self._index_stale_ids.clear()
+
     def from_ids(
         self,
         taxon_ids: MultiInt,
@@ -249,29 +782,85 @@ class TaxonDbController(TaxonController):
         refresh: bool = False,
         **params,
     ) -> WrapperPaginator[Taxon]:
-        """Get taxa by ID; first from the database, then from the API"""
-        # Get any taxa saved in the database (unless refreshing)
+        """Get taxa by ID; first from the in-memory cache, then the database, then the API
+        (depending on network policy). If offline, partial taxa will be returned if full records
+        aren't available, with ``Taxon._partial`` set.
+        """
         start = time()
+        db_path = self.client.db_path
+        locale = params.get('locale')
         taxon_ids = ensure_list(taxon_ids)
-        taxa = [] if refresh else self._get_db_taxa(taxon_ids, accept_partial)
-        logger.debug(f'{len(taxa)} taxa found in database')
+        refresh = _check_refresh(refresh, self.client.network_policy)
+        # Partial records (like ancestors and children) are only refreshed when requested in full
+        revalidate = self.client.network_policy == NetworkPolicy.ONLINE and not accept_partial
+        taxa = []
+        if refresh:
+            TAXON_CACHE.invalidate(db_path, taxon_ids)
+        else:
+            min_fetched_at = self.freshness.min_fetched_at if revalidate else None
+            taxa = list(
+                TAXON_CACHE.get_many(
+                    db_path, taxon_ids, locale, accept_partial, min_fetched_at
+                ).values()
+            )
+            logger.debug(f'{len(taxa)} taxa found in cache')
 
-        # Get remaining taxa from the API and save to the database
+        # Get any other taxa saved in the database (unless refreshing)
         remaining_ids = set(taxon_ids) - {taxon.id for taxon in taxa}
-        if remaining_ids:
+        db_ids: list[int] = []
+        fetched: dict[int, float] = {}
+        if remaining_ids and not refresh:
+            db_results = self._get_db_taxa(list(remaining_ids), accept_partial)
+            logger.debug(f'{len(db_results)} taxa found in database')
+            db_ids = [taxon.id for taxon in db_results]
+            fetched = self.freshness.get_fetched(db_ids, db_path)
+            TAXON_CACHE.set_many(
+                db_path, db_results, locale, partial=accept_partial, fetched_at=fetched
+            )
+            taxa.extend(db_results)
+            remaining_ids -= set(db_ids)
+
+        # If offline, use partial records if that's all that's available
+        if remaining_ids and self.client.offline and not accept_partial:
+            db_results = self._add_taxonomy(self._get_db_taxa(list(remaining_ids), True))
+            if db_results:
+                logger.warning(f'Offline; using partial records for {len(db_results)} taxa')
+            TAXON_CACHE.set_many(db_path, db_results, locale, partial=True, fetched_at={})
+            taxa.extend(db_results)
+            remaining_ids -= {taxon.id for taxon in db_results}
+
+        # Check saved taxa for staleness; either refresh them in the background, or fetch them
+        # below. Cached taxa are already known to be fresh.
+        if revalidate and (
+            stale_ids := self.freshness.revalidate(
+                db_ids, partial(self._refresh, **params), db_path, fetched
+            )
+        ):
+            taxa = [taxon for taxon in taxa if taxon.id not in stale_ids]
+            remaining_ids |= stale_ids
+
+        # Get remaining taxa from the API and save to the database
+        if remaining_ids and self.client.offline:
+            logger.warning(f'Offline; skipping {len(remaining_ids)} taxa not saved locally')
+        elif remaining_ids:
+            check_cancelled()
             logger.debug(f'Fetching remaining {len(remaining_ids)} taxa from API')
-            api_results = super().from_ids(remaining_ids, **params).all() if remaining_ids else []
+            api_results = super().from_ids(remaining_ids, **params).all()
             taxa.extend(api_results)
-            save_taxa(api_results, self.client.db_path)
+            self._save(api_results)
+            check_cancelled()
             api_results = self._add_db_taxonomy(api_results)
+            TAXON_CACHE.set_many(db_path, api_results, locale)
 
         logger.debug(f'Finished in {time() - start:.2f} seconds')
         return WrapperPaginator(taxa)
 
+    def get_descendant_ids(self, taxon_id: int) -> list[int]:
+        """Get IDs of all descendants of a taxon from the local database"""
+        return get_descendant_ids(taxon_id, self.client.db_path)
+
     def _get_db_taxa(self, taxon_ids: list[int], accept_partial: bool = False):
-        db_results = list(
-            get_db_taxa(self.client.db_path, ids=taxon_ids, accept_partial=accept_partial)
-        )
+        db_results = _get_db_taxa(self.client.db_path, taxon_ids, accept_partial)
         if not accept_partial:
             db_results = self._add_taxonomy(db_results)
         return db_results
@@ -298,19 +887,26 @@ class TaxonDbController(TaxonController):
         DB records only contain ancestor/child IDs, so we need another query to fetch full records.
         This could be done in SQL, but a many-to-many relationship with ancestors would get messy.
         Besides, some may be missing and need to be fetched from the API.
+
+        If the taxonomy index is enabled, any indexed taxa will be used instead of a db query.
         """
-        fetch_ids = chain.from_iterable([t.ancestor_ids + t.child_ids for t in taxa])
-        extended_taxa = {t.id: t for t in self.from_ids(set(fetch_ids), accept_partial=True)}
+        fetch_ids = set(chain.from_iterable([t.ancestor_ids + t.child_ids for t in taxa]))
+        extended_taxa = self._get_index_taxa(fetch_ids)
+        if remaining_ids := fetch_ids - extended_taxa.keys():
+            extended_taxa.update(
+                {t.id: t for t in self.from_ids(remaining_ids, accept_partial=True)}
+            )
 
         for taxon in taxa:
             # Depending on data source, the taxon itself may have already been added to ancestry
             # TODO: Fix in pyinaturalist.Taxon and/or pyinaturalist_convert.db
+            # Some may be missing if offline
             taxon.ancestors = [
                 extended_taxa[id]
                 for id in taxon.ancestor_ids
-                if id not in [ROOT_TAXON_ID, taxon.id]
+                if id not in [ROOT_TAXON_ID, taxon.id] and id in extended_taxa
             ]
-            taxon.children = [extended_taxa[id] for id in taxon.child_ids]
+            taxon.children = [extended_taxa[id] for id in taxon.child_ids if id in extended_taxa]
         return taxa
 
     def _add_db_taxonomy(self, taxa: list[Taxon]) -> list[Taxon]:
@@ -320,12 +916,12 @@ class TaxonDbController(TaxonController):
         """
         api_taxa = chain.from_iterable([t.ancestors + t.children for t in taxa])
         partial_taxa = {t.id: t for t in api_taxa}
-        full_taxa = {
-            t.id: t
-            for t in get_db_taxa(
-                self.client.db_path, ids=list(partial_taxa.keys()), accept_partial=True
-            )
-        }
+        full_taxa = self._get_indexed(partial_taxa.keys())
+        # Keep photos from API results, since the index doesn't contain them
+        for taxon_id, taxon in full_taxa.items():
+            taxon.default_photo = partial_taxa[taxon_id].default_photo
+        if remaining_ids := partial_taxa.keys() - full_taxa.keys():
+            full_taxa.update({t.id: t for t in _get_db_taxa(self.client.db_path, remaining_ids)})
         for taxon in taxa:
             taxon.ancestors = [
                 full_taxa.get(id) or partial_taxa[id]
@@ -335,9 +931,161 @@ class TaxonDbController(TaxonController):
             taxon.children = [full_taxa.get(id) or partial_taxa[id] for id in taxon.child_ids]
         return taxa
 
+    def _get_indexed(self, taxon_ids: Iterable[int]) -> dict[int, Taxon]:
+        """Get any indexed taxa by ID, except those updated since the index was built"""
+        index = self.index
+        if index is None:
+            return {}
+        with self._index_lock:
+            taxon_ids = set(taxon_ids) - self._index_stale_ids
+        return {t.id: t for t in index.get_taxa(taxon_ids)} if taxon_ids else {}
+
+    def _get_index_taxa(self, taxon_ids: set[int]) -> dict[int, Taxon]:
+        """Get any indexed taxa by ID, plus their photos. The index doesn't contain photo URLs (to
+        keep memory usage down), so those are looked up separately by primary key.
+        """
+        taxa = self._get_indexed(taxon_ids)
+        if not taxa:
+            return {}
+
+        stmt = select(DbTaxon.id, DbTaxon.photo_urls).where(
+            DbTaxon.id.in_(taxa.keys()),  # type: ignore
+            DbTaxon.photo_urls != '',
+        )
+        with get_session(self.client.db_path) as session:
+            for taxon_id, photo_urls in session.execute(stmt):
+                taxa[taxon_id].default_photo = Photo(url=unquote(photo_urls.split(',')[0]))
+        return taxa
+
     # TODO: Save one page at a time
     def search(self, **params) -> WrapperPaginator[Taxon]:
         """Search taxa, and save results to the database (for future reference by ID)"""
         results = super().search(**params).all()
-        save_taxa(results, self.client.db_path)
+        self._save(results)
         return WrapperPaginator(results)
+
+    def _save(self, taxa: list[Taxon]):
+        """Save taxa to the database, and invalidate any cached copies of them and their
+        ancestors/children (which may have been updated)
+        """
+        with get_session(self.client.db_path) as session:
+            _merge_taxa(session, taxa)
+            session.commit()
+        updated_ids = _get_updated_taxon_ids(taxa)
+        TAXON_CACHE.invalidate(self.client.db_path, updated_ids)
+        self.invalidate_index(updated_ids)
+        self.freshness.mark_fetched([t.id for t in taxa], self.client.db_path)
+
+    def _refresh(self, taxon_ids: list[int], **params):
+        """Fetch and save updated taxa from the API"""
+        self._save(super().from_ids(taxon_ids, **params).all())
+
+
+def _observation_stmt() -> Select:
+    """Get a query for observations ordered by creation date (newest first)"""
+    return (
+        select(DbObservation)
+        .join(DbObservation.taxon, isouter=True)
+        .order_by(DbObservation.created_at.desc(), DbObservation.id.desc())  # type: ignore
+    )
+
+
+def _fts_query(q: str) -> str:
+    """Convert user input into an FTS5 query that matches all words by prefix"""
+    words = INVALID_FTS5_CHARS.sub('', q).split()
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _text_search_stmt(param: str, query: str, field: Optional[TextField] = None) -> TextualSelect:
+    """Get a query for IDs of observations matching a text search query. Each query needs a unique
+    parameter name, so text search and place filters can be combined.
+    """
+    sql = f'SELECT observation_id FROM {OBS_FTS_TABLE} WHERE text MATCH :{param}'
+    params: dict[str, Any] = {param: query}
+    if field:
+        sql += f' AND field = :{param}_field'
+        params[f'{param}_field'] = field.value
+    return text(sql).bindparams(**params).columns(column('observation_id', Integer))
+
+
+def _get_db_observations(db_path: Path, observation_ids: Iterable[int]) -> list[Observation]:
+    """Get observations and their taxa and users from the database by ID"""
+    stmt = (
+        select(DbObservation)
+        .join(DbObservation.taxon, isouter=True)
+        .join(DbObservation.user, isouter=True)
+        .where(DbObservation.id.in_(list(observation_ids)))  # type: ignore
+    )
+    with get_session(db_path) as session:
+        return [db_obs.to_model() for db_obs in session.execute(stmt).scalars()]
+
+
+def _get_db_taxa(
+    db_path: Path, taxon_ids: Iterable[int], accept_partial: bool = True
+) -> list[Taxon]:
+    """Get taxa from the database by ID, optionally only full (non-partial) records"""
+    stmt = select(DbTaxon).where(DbTaxon.id.in_(list(taxon_ids)))  # type: ignore
+    if not accept_partial:
+        stmt = stmt.where(DbTaxon.partial == False)  # noqa: E712
+    with get_session(db_path) as session:
+        return [db_taxon.to_model() for db_taxon in session.execute(stmt).scalars()]
+
+
+def _get_updated_taxon_ids(taxa: list[Taxon]) -> set[int]:
+    """Get IDs of taxa updated by :py:func:`_merge_taxa`, including ancestors and children"""
+    updated_ids = set(chain.from_iterable([t.ancestor_ids + t.child_ids for t in taxa]))
+    return updated_ids | {t.id for t in taxa}
+
+
+def _merge_taxa(session: Session, taxa: list[Taxon]):
+    """Merge taxa (plus ancestors and children) into the database within an existing session.
+    Same as :py:func:`pyinaturalist_convert.db.save_taxa`, but without committing, and also adds
+    new taxa to the subtree index.
+    """
+    taxa_by_id = {t.id: t for t in chain.from_iterable([t.ancestors + t.children for t in taxa])}
+    taxa_by_id.update({t.id: t for t in taxa})
+    if not taxa_by_id:
+        return
+
+    stmt = select(DbTaxon).where(DbTaxon.id.in_(taxa_by_id.keys()))  # type: ignore
+    existing_taxa = {db_taxon.id: db_taxon for db_taxon in session.execute(stmt).scalars()}
+    for taxon in taxa_by_id.values():
+        if db_taxon := existing_taxa.get(taxon.id):
+            db_taxon.update(taxon)
+        else:
+            session.add(DbTaxon.from_model(taxon))
+    add_untracked_taxa(session, taxa_by_id.keys() - existing_taxa.keys())
+
+
+def _put_unless_stopped(queue: Queue, item: Any, stop: Event) -> bool:
+    """Add an item to a bounded queue, unless stopped while waiting. Returns False if stopped."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def _get_unless_cancelled(queue: Queue) -> Any:
+    """Get an item from a queue, checking for cancellation of the current task while waiting"""
+    while True:
+        check_cancelled()
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            pass
+
+
+def _split_ids(ids_str: Optional[str]) -> list[int]:
+    """Split a comma-separated string of IDs, as stored in the taxon table"""
+    return [int(id) for id in ids_str.split(',')] if ids_str else []
+
+
+def _check_refresh(refresh: bool, network_policy: NetworkPolicy) -> bool:
+    """Only refresh saved records from the API if in online mode"""
+    if refresh and network_policy != NetworkPolicy.ONLINE:
+        logger.debug(f'Skipping refresh ({network_policy.value} mode)')
+        return False
+    return refresh
@@ -0,0 +1,212 @@
+"""Pooled SQLite connections, shared by all storage modules.
+
+Each database path gets a single :py:class:`ConnectionManager`, which keeps a pool of open
+connections (with tuned PRAGMAs) instead of paying connection and setup costs on every query.
+Connections can be used either through SQLAlchemy sessions or as raw ``sqlite3`` connections, and
+both record query counts and latencies.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Iterator, Union
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+from naturtag.constants import (
+    DB_CACHE_SIZE,
+    DB_MMAP_SIZE,
+    DB_PATH,
+    DB_POOL_SIZE,
+    DB_SLOW_QUERY_TIME,
+    PathOrStr,
+)
+
+logger = getLogger().getChild(__name__)
+
+_MANAGERS: dict[Path, 'ConnectionManager'] = {}
+_MANAGERS_LOCK = Lock()
+
+
+class QueryStats:
+    """Thread-safe query counts and latencies for a single database"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def avg_time(self) -> float:
+        return self.total_time / self.count if self.count else 0.0
+
+    def record(self, statement: str, elapsed: float):
+        with self._lock:
+            self.count += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+        if elapsed >= DB_SLOW_QUERY_TIME:
+            logger.debug(f'Slow query ({elapsed:.2f}s): {statement[:200]}')
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total_time = 0.0
+            self.max_time = 0.0
+
+    def __str__(self):
+        return (
+            f'{self.count} queries in {self.total_time:.2f}s '
+            f'(avg: {self.avg_time * 1000:.2f}ms, max: {self.max_time * 1000:.2f}ms)'
+        )
+
+
+class InstrumentedConnection:
+    """Wrapper for a raw ``sqlite3`` connection that records query counts and latencies. All other
+    attributes are passed through to the wrapped connection.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, stats: QueryStats):
+        self._conn = conn
+        self._stats = stats
+
+    def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:
+        return self._timed(self._conn.execute, sql, parameters)
+
+    def executemany(self, sql: str, parameters: Any) -> sqlite3.Cursor:
+        return self._timed(self._conn.executemany, sql, parameters)
+
+    def executescript(self, sql: str) -> sqlite3.Cursor:
+        return self._timed(self._conn.executescript, sql)
+
+    def _timed(self, method: Callable, sql: str, *args) -> sqlite3.Cursor:
+        start = perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            self._stats.record(sql, perf_counter() - start)
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+
+#: Either a plain or instrumented connection, for functions that use an existing connection
+Connection = Union[sqlite3.Connection, InstrumentedConnection]
+
+
+class ConnectionManager:
+    """Connection pool for a single SQLite database. Use :py:func:`get_db` to get the shared
+    instance for a database path instead of creating a new one.
+
+    Connections are checked out of the pool by one thread at a time, for the duration of a session
+    or :py:meth:`connect` block, and returned to the pool afterward.
+    """
+
+    def __init__(self, db_path: PathOrStr = DB_PATH):
+        self.db_path = Path(db_path)
+        self.stats = QueryStats()
+        self.engine = create_engine(
+            f'sqlite:///{self.db_path}',
+            poolclass=QueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=-1,
+            connect_args={'check_same_thread': False},
+        )
+        event.listen(self.engine, 'connect', _set_pragmas)
+        event.listen(self.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def session(self) -> Session:
+        """Get a SQLAlchemy session using a pooled connection"""
+        return Session(self.engine, future=True)
+
+    @contextmanager
+    def connect(self) -> Iterator[InstrumentedConnection]:
+        """Get a raw ``sqlite3`` connection from the pool. Like ``sqlite3.connect()`` used as a
+        context manager, this commits on success and rolls back on error.
+        """
+        pooled_conn = self.engine.raw_connection()
+        conn = self.instrument(pooled_conn.dbapi_connection)  # type: ignore
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            pooled_conn.close()
+
+    def instrument(self, conn: sqlite3.Connection) -> InstrumentedConnection:
+        """Record query stats for a raw connection, for example one used by an existing session"""
+        return InstrumentedConnection(conn, self.stats)
+
+    def dispose(self):
+        """Close all idle pooled connections"""
+        self.engine.dispose()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop('query_start', None)
+        if start is not None:
+            self.stats.record(statement, perf_counter() - start)
+
+
+def get_db(db_path: PathOrStr = DB_PATH) -> ConnectionManager:
+    """Get the shared connection manager for a database path"""
+    db_path = Path(db_path).absolute()
+    with _MANAGERS_LOCK:
+        if (manager := _MANAGERS.get(db_path)) is None:
+            manager = _MANAGERS[db_path] = ConnectionManager(db_path)
+    return manager
+
+
+def get_session(db_path: PathOrStr = DB_PATH) -> Session:
+    """Get a SQLAlchemy session using a pooled connection"""
+    return get_db(db_path).session()
+
+
+def connect(db_path: PathOrStr = DB_PATH):
+    """Get a raw ``sqlite3`` connection from the pool, as a context manager. See
+    :py:meth:`ConnectionManager.connect`.
+    """
+    return get_db(db_path).connect()
+
+
+def close_db(db_path: PathOrStr = DB_PATH):
+    """Close all pooled connections for a single database, and remove its connection manager"""
+    with _MANAGERS_LOCK:
+        manager = _MANAGERS.pop(Path(db_path).absolute(), None)
+    if manager:
+        manager.dispose()
+
+
+def close_all():
+    """Close all pooled connections for all databases, for example before replacing a database
+    file
+    """
+    with _MANAGERS_LOCK:
+        for manager in _MANAGERS.values():
+            manager.dispose()
+        _MANAGERS.clear()
+
+
+def _set_pragmas(dbapi_connection: sqlite3.Connection, connection_record):
+    """Settings for each new connection. With WAL enabled, ``synchronous=NORMAL`` is still safe from
+    corruption, and avoids an fsync on every commit.
+    """
+    journal_mode = dbapi_connection.execute('PRAGMA journal_mode').fetchone()[0]
+    if journal_mode != 'wal':
+        dbapi_connection.execute('PRAGMA journal_mode = WAL')
+    dbapi_connection.execute('PRAGMA synchronous = NORMAL')
+    dbapi_connection.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE}')
+    dbapi_connection.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    dbapi_connection.execute('PRAGMA temp_store = MEMORY')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = perf_counter()
@@ -0,0 +1,198 @@
+"""Tracking of when records were last fetched from the API, for refreshing stale records"""
+
+import sqlite3
+from datetime import timedelta
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Any, Callable, Iterable, Optional
+
+from naturtag.constants import DB_PATH
+from naturtag.storage.db import Connection, connect
+
+logger = getLogger().getChild(__name__)
+
+# Max number of IDs per query, to stay under SQLite's variable limit
+BATCH_SIZE = 500
+
+
+def save_fetched(
+    record_type: str,
+    ids: Iterable[int],
+    db_path: Path = DB_PATH,
+    fetched_at: Optional[float] = None,
+):
+    """Record when the given records were last fetched from the API (default: now)"""
+    with connect(db_path) as conn:
+        write_fetched(conn, record_type, ids, fetched_at)
+
+
+def write_fetched(
+    conn: Connection,
+    record_type: str,
+    ids: Iterable[int],
+    fetched_at: Optional[float] = None,
+):
+    """Record fetch times using an existing connection, without committing"""
+    fetched_at = fetched_at or time()
+    rows = [(record_type, id, fetched_at) for id in ids]
+    if not rows:
+        return
+    _create_table(conn)
+    conn.executemany(
+        'INSERT OR REPLACE INTO record_fetched (record_type, id, fetched_at) VALUES (?, ?, ?)',
+        rows,
+    )
+
+
+def backfill_fetched(db_path: Path = DB_PATH, fetched_at: Optional[float] = None):
+    """Create the fetch time table if it doesn't exist yet, and record all observations and full
+    taxa already saved in the database as fetched now (default). This is so existing records in a
+    database created before fetch times were tracked aren't all considered stale at once.
+    """
+    fetched_at = fetched_at or time()
+    with connect(db_path) as conn:
+        if _table_exists(conn):
+            return
+        _create_table(conn)
+        conn.execute(
+            'INSERT INTO record_fetched (record_type, id, fetched_at) '
+            "SELECT 'observation', id, ? FROM observation",
+            (fetched_at,),
+        )
+        conn.execute(
+            'INSERT INTO record_fetched (record_type, id, fetched_at) '
+            "SELECT 'taxon', id, ? FROM taxon WHERE NOT partial",
+            (fetched_at,),
+        )
+        n_rows = conn.execute('SELECT COUNT(*) FROM record_fetched').fetchone()[0]
+    logger.info(f'Recorded fetch times for {n_rows} existing records')
+
+
+def _create_table(conn: Connection):
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS record_fetched ('
+        'record_type TEXT NOT NULL, id INTEGER NOT NULL, fetched_at REAL NOT NULL, '
+        'PRIMARY KEY (record_type, id))'
+    )
+
+
+def _table_exists(conn: Connection) -> bool:
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'record_fetched'"
+        ).fetchone()
+        is not None
+    )
+
+
+def get_fetched(record_type: str, ids: Iterable[int], db_path: Path = DB_PATH) -> dict[int, float]:
+    """Get when the given records were last fetched, as Unix timestamps. Records saved before
+    fetch times were tracked won't be included.
+    """
+    ids = list(ids)
+    fetched: dict[int, float] = {}
+    try:
+        with connect(db_path) as conn:
+            for i in range(0, len(ids), BATCH_SIZE):
+                batch = ids[i : i + BATCH_SIZE]
+                placeholders = ','.join(['?'] * len(batch))
+                rows = conn.execute(
+                    'SELECT id, fetched_at FROM record_fetched '
+                    f'WHERE record_type = ? AND id IN ({placeholders})',
+                    [record_type, *batch],
+                )
+                fetched.update(rows)
+    except sqlite3.OperationalError:
+        pass  # Table doesn't exist yet
+    return fetched
+
+
+class FreshnessPolicy:
+    """Stale-while-revalidate policy for records of one type saved in the local database.
+
+    Records last fetched longer than ``ttl`` ago (or with an unknown fetch time) are stale. Records
+    saved before fetch times were tracked are recorded as fetched when the database is upgraded
+    (see :py:func:`backfill_fetched`), so they're only considered stale once the TTL has passed
+    after that. If a ``scheduler`` is set, stale records can be used as-is while they're refreshed in the
+    background. Otherwise, they need to be refreshed before use.
+
+    Args:
+        record_type: Record type, for example ``'observation'``
+        ttl: Max age before a record is stale, or ``None`` to never expire
+        scheduler: Function that runs a callback with keyword args in the background, for example
+            :py:meth:`.ThreadPool.schedule_background`
+    """
+
+    def __init__(
+        self,
+        record_type: str,
+        ttl: Optional[timedelta] = None,
+        scheduler: Optional[Callable[..., Any]] = None,
+    ):
+        self.record_type = record_type
+        self.ttl = ttl
+        self.scheduler = scheduler
+        self._pending: set[int] = set()
+        self._lock = Lock()
+
+    @property
+    def min_fetched_at(self) -> Optional[float]:
+        """Oldest fetch time (as a Unix timestamp) of records that aren't stale yet, if any expire"""
+        return None if self.ttl is None else time() - self.ttl.total_seconds()
+
+    def get_fetched(self, ids: Iterable[int], db_path: Path = DB_PATH) -> dict[int, float]:
+        """Get when the given records were last fetched, if they can expire"""
+        return {} if self.ttl is None else get_fetched(self.record_type, ids, db_path)
+
+    def get_stale_ids(
+        self,
+        ids: Iterable[int],
+        db_path: Path = DB_PATH,
+        fetched: Optional[dict[int, float]] = None,
+    ) -> set[int]:
+        """Get IDs of any records that are older than the TTL. Fetch times are looked up in the
+        database unless already known (``fetched``).
+        """
+        ids = set(ids)
+        if (min_fetched_at := self.min_fetched_at) is None or not ids:
+            return set()
+        if fetched is None:
+            fetched = get_fetched(self.record_type, ids, db_path)
+        return {id for id in ids if fetched.get(id, 0) < min_fetched_at}
+
+    def revalidate(
+        self,
+        ids: Iterable[int],
+        refresh: Callable[[list[int]], Any],
+        db_path: Path = DB_PATH,
+        fetched: Optional[dict[int, float]] = None,
+    ) -> set[int]:
+        """Check the given records for staleness, and schedule a background refresh for any stale
+        records (that aren't already being refreshed).
+
+        Returns:
+            IDs of stale records that need to be refreshed before use, if there is no scheduler
+        """
+        stale_ids = self.get_stale_ids(ids, db_path, fetched)
+        if not stale_ids or self.scheduler is None:
+            return stale_ids
+
+        with self._lock:
+            stale_ids -= self._pending
+            self._pending |= stale_ids
+        if stale_ids:
+            logger.debug(f'Refreshing {len(stale_ids)} stale {self.record_type} records')
+            self.scheduler(self._refresh, refresh=refresh, ids=sorted(stale_ids))
+        return set()
+
+    def mark_fetched(self, ids: Iterable[int], db_path: Path = DB_PATH):
+        save_fetched(self.record_type, ids, db_path)
+
+    def _refresh(self, refresh: Callable[[list[int]], Any], ids: list[int]):
+        try:
+            return refresh(ids)
+        finally:
+            with self._lock:
+                self._pending -= set(ids)
@@ -0,0 +1,54 @@
+"""Network access policy for the API client and image fetcher"""
+
+from enum import Enum
+from logging import getLogger
+from weakref import WeakKeyDictionary
+
+from requests import PreparedRequest, Session
+from requests.adapters import BaseAdapter
+
+logger = getLogger(__name__)
+
+# Original adapters for sessions that have been switched to offline mode, so they can be restored
+_ONLINE_ADAPTERS: WeakKeyDictionary[Session, dict[str, BaseAdapter]] = WeakKeyDictionary()
+
+
+class NetworkPolicy(str, Enum):
+    """When to use the network to get records that aren't available locally:
+
+    * ``online``: Use local records if they are complete and up to date; otherwise use the API
+    * ``prefer-cache``: Use any local records, even if outdated; only use the API for missing
+      records
+    * ``offline``: Never use the network. Partial records will be used if that's all that's
+      available locally, and missing records will be skipped.
+    """
+
+    ONLINE = 'online'
+    PREFER_CACHE = 'prefer-cache'
+    OFFLINE = 'offline'
+
+
+class OfflineError(ConnectionError):
+    """A network request was made while in offline mode"""
+
+
+class OfflineAdapter(BaseAdapter):
+    """Transport adapter that fails immediately instead of sending a request"""
+
+    def send(self, request: PreparedRequest, *args, **kwargs):
+        raise OfflineError(f'Network access is disabled: {request.method} {request.url}')
+
+    def close(self):
+        pass
+
+
+def set_session_offline(session: Session, offline: bool = True):
+    """Make all requests from a session either fail immediately (offline), or send normally.
+    Responses already in the session's HTTP cache (if any) may still be returned while offline.
+    """
+    if offline and session not in _ONLINE_ADAPTERS:
+        _ONLINE_ADAPTERS[session] = dict(session.adapters)
+        for prefix in list(session.adapters):
+            session.mount(prefix, OfflineAdapter())
+    elif not offline and session in _ONLINE_ADAPTERS:
+        session.adapters.update(_ONLINE_ADAPTERS.pop(session))
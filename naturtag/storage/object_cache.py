@@ -0,0 +1,171 @@
+"""Bounded in-memory cache for model objects loaded from the local database or API"""
+
+from collections import OrderedDict, defaultdict
+from copy import copy
+from logging import getLogger
+from threading import Lock
+from time import time
+from typing import Any, Generic, Hashable, Iterable, Mapping, NamedTuple, Optional, TypeVar
+
+from naturtag.constants import OBJECT_CACHE_MAX_ITEMS, OBJECT_CACHE_MAX_SIZE
+
+T = TypeVar('T')
+CacheKey = tuple[Hashable, int, Optional[str]]  # (db_path, id, locale)
+
+logger = getLogger(__name__)
+
+
+class CacheItem(NamedTuple, Generic[T]):
+    obj: T
+    size: int
+    full: bool
+    fetched_at: float
+
+
+class ObjectCache(Generic[T]):
+    """Thread-safe LRU cache of model objects (like ``Taxon`` or ``Observation``), keyed by database,
+    ID, and locale. Size is limited by both number of items and approximate size, as the total
+    number of records including nested records like ancestors, children, and photos.
+
+    Each item is marked as either full or partial (i.e., with or without full taxonomy). A full item
+    can be used in place of a partial one, but not vice versa.
+
+    Each item also keeps the time its record was last fetched from the API, so callers can skip
+    stale items without looking up fetch times in the database.
+
+    Objects are stored and returned as shallow copies, so callers can replace their attributes (like
+    ``Taxon.ancestors``) without affecting the cache. Nested records are shared, and must not be
+    modified in place.
+
+    Args:
+        max_items: Max number of items to keep
+        max_size: Max total approximate size of all items
+    """
+
+    def __init__(
+        self, max_items: int = OBJECT_CACHE_MAX_ITEMS, max_size: int = OBJECT_CACHE_MAX_SIZE
+    ):
+        self.max_items = max_items
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items: OrderedDict[CacheKey, CacheItem[T]] = OrderedDict()
+        # All cached locales for each ID, for invalidation
+        self._keys_by_id: dict[tuple[Hashable, int], set[CacheKey]] = defaultdict(set)
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        """Cache usage stats, for tuning size limits"""
+        return {
+            'items': len(self._items),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 3),
+            'evictions': self.evictions,
+        }
+
+    def get_many(
+        self,
+        db_path: Hashable,
+        ids: Iterable[int],
+        locale: Optional[str] = None,
+        accept_partial: bool = False,
+        min_fetched_at: Optional[float] = None,
+    ) -> dict[int, T]:
+        """Get copies of any cached objects for the given IDs. If ``min_fetched_at`` is specified,
+        objects last fetched before then are treated as missing.
+        """
+        results = {}
+        ids = set(ids)
+        with self._lock:
+            for id in ids:
+                key = (db_path, id, locale)
+                item = self._items.get(key)
+                if (
+                    item is not None
+                    and (item.full or accept_partial)
+                    and (min_fetched_at is None or item.fetched_at >= min_fetched_at)
+                ):
+                    self._items.move_to_end(key)
+                    results[id] = copy(item.obj)
+            self.hits += len(results)
+            self.misses += len(ids) - len(results)
+        return results
+
+    def set_many(
+        self,
+        db_path: Hashable,
+        objects: Iterable[T],
+        locale: Optional[str] = None,
+        partial: bool = False,
+        fetched_at: Optional[Mapping[int, float]] = None,
+    ):
+        """Add or replace objects in the cache. Partial objects won't replace full ones.
+
+        Args:
+            fetched_at: Times each object was last fetched from the API, for objects loaded from
+                the database. Objects not included have an unknown fetch time. If not specified,
+                all objects are considered fetched now.
+        """
+        now = time()
+        with self._lock:
+            for obj in objects:
+                key = (db_path, obj.id, locale)  # type: ignore[attr-defined]
+                if (existing := self._items.get(key)) is not None:
+                    if partial and existing.full:
+                        continue
+                    self._remove(key)
+                size = _get_size(obj)
+                obj_fetched_at = now if fetched_at is None else fetched_at.get(key[1], 0)
+                self._items[key] = CacheItem(copy(obj), size, not partial, obj_fetched_at)
+                self._keys_by_id[key[:2]].add(key)
+                self.size += size
+            self._evict()
+
+    def invalidate(self, db_path: Hashable, ids: Iterable[int]):
+        """Remove objects by ID (for all locales)"""
+        with self._lock:
+            for id in ids:
+                for key in self._keys_by_id.pop((db_path, id), ()):
+                    self._remove(key, keep_id=True)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._keys_by_id.clear()
+            self.size = 0
+
+    def _evict(self):
+        """Remove least recently used items until within size limits"""
+        while self._items and (len(self._items) > self.max_items or self.size > self.max_size):
+            self._remove(next(iter(self._items)))
+            self.evictions += 1
+
+    def _remove(self, key: CacheKey, keep_id: bool = False):
+        self.size -= self._items.pop(key).size
+        if not keep_id and (keys := self._keys_by_id.get(key[:2])):
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_id[key[:2]]
+
+
+def _get_size(obj: Any) -> int:
+    """Get the approximate size of an object, as the total number of nested records"""
+    size = 1
+    for attr in ('ancestors', 'children', 'identifications', 'photos'):
+        size += len(getattr(obj, attr, None) or [])
+    if taxon := getattr(obj, 'taxon', None):
+        size += _get_size(taxon)
+    return size
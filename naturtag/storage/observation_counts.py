@@ -0,0 +1,148 @@
+"""Per-user and per-taxon observation counts, maintained by triggers on the observation table so
+they're always updated in the same transaction as the observations themselves
+"""
+
+import sqlite3
+from logging import getLogger
+from pathlib import Path
+from typing import Optional
+
+from naturtag.constants import DB_PATH
+from naturtag.storage.db import connect
+
+logger = getLogger().getChild(__name__)
+
+# Observations with no user are counted under user ID 0
+CREATE_OBSERVATION_COUNTS = """
+CREATE TABLE IF NOT EXISTS observation_count (
+    user_id INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS observation_count_insert AFTER INSERT ON observation
+BEGIN
+    INSERT INTO observation_count (user_id, count) VALUES (COALESCE(NEW.user_id, 0), 1)
+    ON CONFLICT (user_id) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS observation_count_delete AFTER DELETE ON observation
+BEGIN
+    UPDATE observation_count SET count = count - 1 WHERE user_id = COALESCE(OLD.user_id, 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS observation_count_update AFTER UPDATE OF user_id ON observation
+WHEN OLD.user_id IS NOT NEW.user_id
+BEGIN
+    UPDATE observation_count SET count = count - 1 WHERE user_id = COALESCE(OLD.user_id, 0);
+    INSERT INTO observation_count (user_id, count) VALUES (COALESCE(NEW.user_id, 0), 1)
+    ON CONFLICT (user_id) DO UPDATE SET count = count + 1;
+END;
+"""
+
+
+# Observations with no taxon aren't counted. Casual observations are counted separately, so they
+# can be optionally excluded.
+CREATE_TAXON_COUNTS = """
+CREATE TABLE IF NOT EXISTS taxon_observation_count (
+    user_id INTEGER NOT NULL,
+    taxon_id INTEGER NOT NULL,
+    casual INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, taxon_id, casual)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS taxon_observation_count_insert AFTER INSERT ON observation
+WHEN NEW.taxon_id IS NOT NULL
+BEGIN
+    INSERT INTO taxon_observation_count (user_id, taxon_id, casual, count)
+    VALUES (COALESCE(NEW.user_id, 0), NEW.taxon_id, NEW.quality_grade IS 'casual', 1)
+    ON CONFLICT (user_id, taxon_id, casual) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS taxon_observation_count_delete AFTER DELETE ON observation
+WHEN OLD.taxon_id IS NOT NULL
+BEGIN
+    UPDATE taxon_observation_count SET count = count - 1
+    WHERE user_id = COALESCE(OLD.user_id, 0) AND taxon_id = OLD.taxon_id
+        AND casual = (OLD.quality_grade IS 'casual');
+END;
+
+CREATE TRIGGER IF NOT EXISTS taxon_observation_count_update
+AFTER UPDATE OF user_id, taxon_id, quality_grade ON observation
+WHEN OLD.user_id IS NOT NEW.user_id OR OLD.taxon_id IS NOT NEW.taxon_id
+    OR (OLD.quality_grade IS 'casual') != (NEW.quality_grade IS 'casual')
+BEGIN
+    UPDATE taxon_observation_count SET count = count - 1
+    WHERE user_id = COALESCE(OLD.user_id, 0) AND taxon_id = OLD.taxon_id
+        AND casual = (OLD.quality_grade IS 'casual');
+    INSERT INTO taxon_observation_count (user_id, taxon_id, casual, count)
+    SELECT COALESCE(NEW.user_id, 0), NEW.taxon_id, NEW.quality_grade IS 'casual', 1
+    WHERE NEW.taxon_id IS NOT NULL
+    ON CONFLICT (user_id, taxon_id, casual) DO UPDATE SET count = count + 1;
+END;
+"""
+
+
+def create_observation_counts(db_path: Path = DB_PATH):
+    """Create or rebuild the observation count tables and triggers, including counts of any existing
+    observations. Requires the observation table to already exist.
+    """
+    with connect(db_path) as conn:
+        conn.executescript(
+            'BEGIN;'
+            'DROP TABLE IF EXISTS observation_count;'
+            'DROP TABLE IF EXISTS taxon_observation_count;'
+            f'{CREATE_OBSERVATION_COUNTS}'
+            f'{CREATE_TAXON_COUNTS}'
+            'INSERT INTO observation_count (user_id, count) '
+            'SELECT COALESCE(user_id, 0), COUNT(*) FROM observation GROUP BY 1;'
+            'INSERT INTO taxon_observation_count (user_id, taxon_id, casual, count) '
+            "SELECT COALESCE(user_id, 0), taxon_id, quality_grade IS 'casual', COUNT(*) "
+            'FROM observation WHERE taxon_id IS NOT NULL GROUP BY 1, 2, 3;'
+            'COMMIT;'
+        )
+
+
+def get_observation_count(db_path: Path = DB_PATH, username: Optional[str] = None) -> int:
+    """Get the number of observations in the local database, optionally for a single user"""
+    user_filter = 'WHERE user_id IN (SELECT id FROM user WHERE login = ?)' if username else ''
+    params = (username,) if username else ()
+    with connect(db_path) as conn:
+        try:
+            query = f'SELECT SUM(count) FROM observation_count {user_filter}'
+            return conn.execute(query, params).fetchone()[0] or 0
+        # If counts haven't been set up yet, count observations directly
+        except sqlite3.OperationalError:
+            logger.debug('Observation count table not found; counting observations')
+            query = f'SELECT COUNT(*) FROM observation {user_filter}'
+            return conn.execute(query, params).fetchone()[0]
+
+
+def get_taxon_observation_counts(
+    username: str, db_path: Path = DB_PATH, casual: bool = False
+) -> dict[int, int]:
+    """Get the number of observations of each taxon by a user in the local database, optionally
+    including casual observations. These are counts of observed taxa only, not rolled up to parent
+    taxa.
+    """
+    casual_filter = '' if casual else 'AND casual = 0'
+    with connect(db_path) as conn:
+        try:
+            rows = conn.execute(
+                'SELECT taxon_id, SUM(count) FROM taxon_observation_count '
+                f'WHERE user_id IN (SELECT id FROM user WHERE login = ?) {casual_filter} '
+                'GROUP BY taxon_id HAVING SUM(count) > 0',
+                (username,),
+            )
+            return dict(rows.fetchall())
+        # If counts haven't been set up yet, count observations directly
+        except sqlite3.OperationalError:
+            logger.debug('Taxon observation count table not found; counting observations')
+            casual_filter = '' if casual else "AND quality_grade IS NOT 'casual'"
+            rows = conn.execute(
+                'SELECT taxon_id, COUNT(*) FROM observation '
+                f'WHERE user_id IN (SELECT id FROM user WHERE login = ?) {casual_filter} '
+                'AND taxon_id IS NOT NULL GROUP BY taxon_id',
+                (username,),
+            )
+            return dict(rows.fetchall())
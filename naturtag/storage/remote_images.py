@@ -8,6 +8,8 @@ from pyinaturalist.converters import format_file_size
 from requests_cache import SQLiteDict
 
 from naturtag.constants import IMAGE_CACHE, PathOrStr
+from naturtag.storage.network import NetworkPolicy, OfflineError
+from naturtag.utils import check_cancelled
 
 if TYPE_CHECKING:
     from PySide6.QtGui import QImage, QPixmap
@@ -18,7 +20,10 @@ logger = getLogger(__name__)
 class ImageFetcher:
     """Fetches and caches remote images (mainly taxon and observation thumbnails)"""
 
-    def __init__(self, cache_path: Path = IMAGE_CACHE):
+    def __init__(
+        self, cache_path: Path = IMAGE_CACHE, network_policy: NetworkPolicy = NetworkPolicy.ONLINE
+    ):
+        self.network_policy = NetworkPolicy(network_policy)
         self.session = ClientSession(per_second=5, per_minute=400)
         # Use manual image cache instead of HTTP cache
         self.session.settings.disabled = True
@@ -37,6 +42,8 @@ class ImageFetcher:
             return self.image_cache[image_hash]
         except KeyError:
             pass
+        if self.network_policy == NetworkPolicy.OFFLINE:
+            raise OfflineError(f'Image not cached: {url}')
 
         data = self.session.get(url).content
         self.image_cache[image_hash] = data
@@ -46,9 +53,10 @@ class ImageFetcher:
         """Fetch and cache images at the given URLs, suppressing any errors.
 
         Intended for background preloading where individual failures should not
-        interrupt the overall process.
+        interrupt the overall process. Stops early if the current background task is cancelled.
         """
         for url in urls:
+            check_cancelled()
             try:
                 self.get_image(Photo(url=url), url=url)
             except Exception:
@@ -72,6 +72,26 @@ class Settings:
         default=True, doc='Search common names for only your selected locale'
     )
     username: str = doc_field(default='', doc='Your iNaturalist username')
+    taxonomy_index: bool = doc_field(
+        default=False, doc='Keep taxonomy in memory for faster browsing (uses more memory)'
+    )
+    observation_ttl: int = doc_field(
+        default=7,
+        converter=int,
+        doc='Number of days before saved observations are refreshed; 0 to never refresh',
+    )
+    taxon_ttl: int = doc_field(
+        default=30,
+        converter=int,
+        doc='Number of days before saved taxa are refreshed; 0 to never refresh',
+    )
+    network_policy: str = doc_field(
+        default='online',
+        doc='When to use the network: online, prefer-cache (use outdated local data), or offline',
+    )
+    parallel_sync: bool = doc_field(
+        default=False, doc='Use multiple concurrent requests for the first full observation sync'
+    )
 
     # Metadata
     common_names: bool = doc_field(default=True, doc='Include common names in taxonomy keywords')
@@ -1,22 +1,45 @@
 """Setup functions for creating and updating the SQLite database"""
 
+import hashlib
 import sqlite3
 import tarfile
 from logging import getLogger
 from pathlib import Path
-from tarfile import TarFile
-from tempfile import TemporaryDirectory
+from time import sleep
+from typing import Optional
 
 import requests
-from pyinaturalist_convert import create_tables, load_table
-from pyinaturalist_convert.fts import (
-    create_observation_fts_table,
-    create_taxon_fts_table,
-    vacuum_analyze,
-)
+from pyinaturalist_convert import create_tables
+from pyinaturalist_convert.fts import create_observation_fts_table, create_taxon_fts_table
+from requests.exceptions import ChunkedEncodingError
 
-from naturtag.constants import DB_PATH, PACKAGED_TAXON_DB, TAXON_DB_URL
+from naturtag.constants import (
+    DATA_DIR,
+    DB_PATH,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_RETRY_DELAY,
+    PACKAGED_TAXON_DB,
+    PACKAGED_TAXON_SQLITE,
+    TAXON_DB_CHECKSUM_URL,
+    TAXON_DB_URL,
+    TAXON_DELTA_PATTERN,
+)
 from naturtag.storage import AppState
+from naturtag.storage.db import connect
+from naturtag.storage.freshness import backfill_fetched
+from naturtag.storage.observation_counts import create_observation_counts
+from naturtag.storage.taxon_fts import FTS_TABLE, drop_fts_partitions, partition_taxon_fts
+from naturtag.storage.taxon_history import create_taxon_history
+from naturtag.storage.taxon_tree import build_taxon_tree
+from naturtag.storage.taxonomy_delta import TaxonomyDeltaError, apply_taxonomy_deltas
+from naturtag.storage.taxonomy_loader import (
+    ChecksumError,
+    LoadProgress,
+    ProgressCallback,
+    install_taxonomy_db,
+    load_taxonomy_archive,
+)
 
 logger = getLogger().getChild(__name__)
 
@@ -25,10 +48,19 @@ def setup(
     db_path: Path = DB_PATH,
     overwrite: bool = False,
     download: bool = False,
+    progress: Optional[ProgressCallback] = None,
+    languages: Optional[list[str]] = None,
 ) -> AppState:
     """Run any first-time setup steps, if needed:
+    * Enable write-ahead logging
     * Create database tables
-    * Extract packaged taxonomy data and load into SQLite
+    * Load packaged taxonomy data into SQLite
+    * Apply any packaged taxonomy updates
+    * Split taxon text search into per-language tables, if enabled
+    * Build taxon subtree index
+    * Initialize per-user and per-taxon observation counts
+    * Create taxon view history tables
+    * Record fetch times for any records saved before fetch times were tracked
 
     Note: taxonomy data is included with PyInstaller packages and platform-specific installers,
     but not with plain python package on PyPI (to keep package size small).
@@ -38,6 +70,9 @@ def setup(
         db_path: SQLite database path
         overwrite: Overwrite an existing taxon database, if it already exists
         download: Download taxon data (full text search + basic taxon details)
+        progress: Callback to receive progress while loading taxon data
+        languages: Only keep common names for these languages, in separate text search tables per
+            language. Once set, this applies to any taxon data loaded later.
     """
     db_path.parent.mkdir(parents=True, exist_ok=True)
     db_exists = db_path.is_file()  # Check before file is touched by AppState
@@ -47,31 +82,51 @@ def setup(
     app_state.check_version_change()
     if app_state.setup_complete and not overwrite:
         logger.debug('Database setup already done')
+        if languages is not None:
+            partition_taxon_fts(db_path, languages)
         return app_state
 
     logger.info('Running database setup')
     if overwrite:
         logger.info('Overwriting existing tables')
-        with sqlite3.connect(db_path) as conn:
+        with connect(db_path) as conn:
             conn.execute('DROP TABLE IF EXISTS observation')
             conn.execute('DROP TABLE IF EXISTS observation_fts')
             conn.execute('DROP TABLE IF EXISTS taxon')
             conn.execute('DROP TABLE IF EXISTS taxon_fts')
             conn.execute('DROP TABLE IF EXISTS photo')
             conn.execute('DROP TABLE IF EXISTS user')
+            conn.execute('DROP TABLE IF EXISTS taxon_tree')
+            conn.execute('DROP TABLE IF EXISTS record_fetched')
+            conn.execute('DROP TABLE IF EXISTS observation_count')
+            conn.execute('DROP TABLE IF EXISTS taxon_observation_count')
+            conn.execute('DROP TABLE IF EXISTS sync_checkpoint')
+            drop_fts_partitions(conn)
     if db_exists:
         logger.warning('Database already exists; attempting to update')
     else:
         logger.warning('Initializing database')
 
     # Create SQLite file with tables if they don't already exist
+    _enable_wal(db_path)
     create_tables(db_path)
-    create_taxon_fts_table(db_path)
+    # This replaces any existing table, so only create it if needed
+    if not _table_exists(db_path, FTS_TABLE):
+        create_taxon_fts_table(db_path)
     create_observation_fts_table(db_path)
+    _create_indexes(db_path)
+    create_observation_counts(db_path)
+    create_taxon_history(db_path)
+    # Before applying deltas, which may expire fetch times of updated taxa
+    backfill_fetched(db_path)
     if _taxon_table_populated(db_path) and not overwrite:
         logger.debug('Taxon table already populated, skipping load')
     else:
-        _load_taxon_db(db_path, download)
+        _load_taxon_db(db_path, download, progress)
+    _apply_taxon_deltas(db_path, progress)
+    partition_taxon_fts(db_path, languages)
+    # Rebuild even if taxa are already loaded, to include any added since the last update
+    build_taxon_tree(db_path)
 
     app_state.setup_complete = True
     app_state.last_obs_check = None
@@ -80,13 +135,42 @@ def setup(
     return app_state
 
 
+def _enable_wal(db_path: Path):
+    """Enable write-ahead logging, so the UI can read from the database while a sync is writing to
+    it. This is a persistent setting stored in the database file.
+    """
+    with connect(db_path) as conn:
+        journal_mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+    if journal_mode != 'wal':
+        logger.warning(f'Could not enable write-ahead logging; using journal mode: {journal_mode}')
+
+
+def _create_indexes(db_path: Path):
+    """Create any additional indexes not included in pyinaturalist_convert.create_tables()"""
+    with connect(db_path) as conn:
+        # For keyset pagination of user observations by creation date
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_observation_user_created_at '
+            'ON observation (user_id, created_at, id)'
+        )
+
+
+def _table_exists(db_path: Path, table: str) -> bool:
+    with connect(db_path) as conn:
+        return bool(
+            conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+        )
+
+
 def _taxon_table_populated(db_path: Path) -> bool:
     """Test whether the taxon table exists and contains at least one row.
     This guards against a case where taxonomy was loaded but setup otherwise didn't complete
     successfully, so setup_complete=False
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        with connect(db_path) as conn:
             count = conn.execute('SELECT COUNT(*) FROM taxon LIMIT 1').fetchone()[0]
             return count > 0
     except sqlite3.OperationalError:
@@ -97,22 +181,129 @@ def _taxon_table_populated(db_path: Path) -> bool:
 #   `nt setup db --download``. Not sure yet if this is a good idea to include.
 # TODO: Option to download full taxon db (all languages);
 #   can fetch from latest GitHub release artifacts?
-def _download_taxon_db():
+def _download_taxon_db(progress: Optional[ProgressCallback] = None):
+    """Download packaged taxon data. Data is written to a temporary file, which is moved into place
+    only after it's complete and matches the published checksum. Interrupted downloads are resumed
+    where they left off, either by retrying (with a backoff) or on the next call, as long as the
+    remote file hasn't changed since. If there is no published checksum, downloads are never
+    resumed, since the result couldn't be verified.
+    """
+    checksum = _get_taxon_db_checksum()
+    part_path = PACKAGED_TAXON_DB.with_name(f'{PACKAGED_TAXON_DB.name}.part')
     logger.info(f'Downloading {TAXON_DB_URL} to {PACKAGED_TAXON_DB}')
-    with requests.get(TAXON_DB_URL, stream=True, timeout=60) as r:
+
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        try:
+            _download_range(TAXON_DB_URL, part_path, progress, resume=checksum is not None)
+            break
+        except (requests.ConnectionError, requests.Timeout, ChunkedEncodingError) as exc:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            delay = DOWNLOAD_RETRY_DELAY * 2 ** (attempt - 1)
+            logger.warning(f'Download interrupted: {exc}; resuming in {delay}s')
+            sleep(delay)
+
+    validator_path = _get_validator_path(part_path)
+    if checksum and (actual := _sha256(part_path)) != checksum:
+        part_path.unlink()
+        validator_path.unlink(missing_ok=True)
+        raise ChecksumError(
+            f'Checksum mismatch for {TAXON_DB_URL}: expected {checksum}, got {actual}'
+        )
+    part_path.replace(PACKAGED_TAXON_DB)
+    validator_path.unlink(missing_ok=True)
+
+
+def _get_taxon_db_checksum() -> Optional[str]:
+    """Get the published SHA-256 checksum for packaged taxon data, if available"""
+    response = requests.get(TAXON_DB_CHECKSUM_URL, timeout=60)
+    if response.status_code == 404:
+        logger.warning('No published checksum for taxon data; download will not be verified')
+        return None
+    response.raise_for_status()
+    return response.text.split()[0].lower()
+
+
+def _download_range(
+    url: str,
+    part_path: Path,
+    progress: Optional[ProgressCallback] = None,
+    resume: bool = True,
+):
+    """Download a file, or the remainder of a partially downloaded file.
+
+    The remote file's ``ETag`` (or ``Last-Modified`` date) is saved alongside the partial file, and
+    sent as ``If-Range`` when resuming, so the server only sends the remainder if the file hasn't
+    changed. A partial file without a saved validator is discarded.
+    """
+    validator_path = _get_validator_path(part_path)
+    validator = validator_path.read_text() if resume and validator_path.is_file() else None
+    offset = part_path.stat().st_size if validator and part_path.is_file() else 0
+    headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if validator and offset else {}
+    with requests.get(url, headers=headers, stream=True, timeout=60) as r:
+        # Requested range is past the end of the file, so it's either complete or invalid (which
+        # will be caught by checksum verification)
+        if r.status_code == 416:
+            return
         r.raise_for_status()
-        with open(PACKAGED_TAXON_DB, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=65536):
+        if offset and r.status_code != 206:
+            logger.debug(
+                'Remote file has changed or server does not support resuming; starting over'
+            )
+            offset = 0
+        if not offset:
+            _save_validator(r, validator_path)
+
+        total_bytes = offset + int(r.headers.get('Content-Length', 0))
+        with open(part_path, 'ab' if offset else 'wb') as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                 f.write(chunk)
+                offset += len(chunk)
+                if progress:
+                    progress(LoadProgress(PACKAGED_TAXON_DB.name, 0, offset, total_bytes))
+
+
+def _get_validator_path(part_path: Path) -> Path:
+    return part_path.with_name(f'{part_path.name}.validator')
+
+
+def _save_validator(response: requests.Response, validator_path: Path):
+    """Save a response's strong ETag (or Last-Modified date), for resuming a download later"""
+    etag = response.headers.get('ETag')
+    if etag and etag.startswith('W/'):
+        etag = None
+    if validator := etag or response.headers.get('Last-Modified'):
+        validator_path.write_text(validator)
+    else:
+        validator_path.unlink(missing_ok=True)
 
 
-def _load_taxon_db(db_path: Path, download: bool = False):
-    """Load taxon tables from packaged data, if available.
+def _sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _load_taxon_db(
+    db_path: Path, download: bool = False, progress: Optional[ProgressCallback] = None
+):
+    """Load taxon tables from packaged data, if available. A prebuilt SQLite database is used if
+    present and valid; otherwise data is loaded from the CSV archive.
     Optionally download data if it doesn't exist locally.
     """
+    if PACKAGED_TAXON_SQLITE.is_file():
+        logger.info('Installing prebuilt taxon database')
+        try:
+            install_taxonomy_db(PACKAGED_TAXON_SQLITE, db_path, progress=progress)
+            return
+        except (ChecksumError, OSError, EOFError, sqlite3.DatabaseError) as exc:
+            logger.warning(f'Failed to install prebuilt taxon database: {exc}; using CSV archive')
+
     if not PACKAGED_TAXON_DB.is_file():
         if download:
-            _download_taxon_db()
+            _download_taxon_db(progress)
         else:
             logger.warning(
                 'Pre-packaged taxon FTS database does not exist; '
@@ -120,22 +311,21 @@ def _load_taxon_db(db_path: Path, download: bool = False):
             )
             return
 
-    with TemporaryDirectory() as tmp_dir_name:
-        logger.info('Loading packaged taxon data and text search index')
-        tmp_dir = Path(tmp_dir_name)
-        try:
-            with TarFile.open(PACKAGED_TAXON_DB) as tar:
-                tar.extractall(path=tmp_dir)
-        except (tarfile.TarError, OSError) as exc:
-            logger.warning(f'Failed to extract taxon database: {exc}; removing corrupt file')
-            PACKAGED_TAXON_DB.unlink(missing_ok=True)
-            raise
-
-        load_table(tmp_dir / 'taxon.csv', db_path, table_name='taxon', clear=True)
-        load_table(tmp_dir / 'taxon_fts.csv', db_path, table_name='taxon_fts', clear=True)
+    logger.info('Loading packaged taxon data and text search index')
+    try:
+        load_taxonomy_archive(PACKAGED_TAXON_DB, db_path, progress)
+    except (tarfile.TarError, OSError, EOFError) as exc:
+        logger.warning(f'Failed to extract taxon database: {exc}; removing corrupt file')
+        PACKAGED_TAXON_DB.unlink(missing_ok=True)
+        raise
 
-    # Indicate some columns are missing and need to be filled in from the API (mainly photo URLs)
-    with sqlite3.connect(db_path) as conn:
-        conn.execute('UPDATE taxon SET partial=1')
 
-    vacuum_analyze(['taxon', 'taxon_fts'], db_path)
+def _apply_taxon_deltas(db_path: Path, progress: Optional[ProgressCallback] = None):
+    """Apply any packaged taxonomy updates newer than the currently loaded taxonomy version"""
+    try:
+        if applied := apply_taxonomy_deltas(
+            sorted(DATA_DIR.glob(TAXON_DELTA_PATTERN)), db_path, progress
+        ):
+            logger.info(f'Updated taxonomy data to version {applied[-1]}')
+    except (TaxonomyDeltaError, tarfile.TarError, OSError, EOFError, sqlite3.DatabaseError) as exc:
+        logger.warning(f'Failed to apply taxonomy update: {exc}')
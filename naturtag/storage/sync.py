@@ -0,0 +1,111 @@
+"""Observation sync from the iNaturalist API to the local database, independent of the GUI"""
+
+from logging import getLogger
+from time import time
+from typing import Iterator, NamedTuple, Optional
+
+from pyinaturalist import Observation
+
+from naturtag.constants import N_DISPLAY_TAXON_THUMBNAILS
+from naturtag.storage.app_state import AppState
+from naturtag.storage.client import iNatDbClient
+from naturtag.storage.network import NetworkPolicy
+from naturtag.storage.remote_images import ImageFetcher
+from naturtag.storage.settings import Settings
+from naturtag.storage.setup import setup
+
+logger = getLogger(__name__)
+
+
+class SyncProgress(NamedTuple):
+    """Progress info for a single page of synced observations"""
+
+    page: int
+    page_size: int
+    total: int
+    elapsed: float
+
+
+def sync_observations(
+    settings: Optional[Settings] = None,
+    client: Optional[iNatDbClient] = None,
+    precache_thumbnails: Optional[bool] = None,
+) -> Iterator[SyncProgress]:
+    """Fetch all new and updated observations for the configured user, and save them to the local
+    database. Like the sync in the GUI, this resumes an interrupted sync if possible, and otherwise
+    fetches observations updated since the last successful sync.
+
+    Yields progress after each page is saved. The sync checkpoint is only updated if all pages
+    complete successfully.
+
+    Args:
+        settings: Settings to use for username, database path, etc.; defaults to the user's settings
+        client: Client to use; defaults to a new client based on ``settings``
+        precache_thumbnails: Also download and cache observation thumbnails; defaults to the
+            ``precache_thumbnails`` setting
+    """
+    settings = settings or Settings.read()
+    if not settings.username:
+        raise ValueError('No username configured')
+    if precache_thumbnails is None:
+        precache_thumbnails = settings.precache_thumbnails
+
+    state = setup(settings.db_path)
+    client = client or iNatDbClient.from_settings(settings)
+    img_fetcher = (
+        ImageFetcher(
+            cache_path=settings.image_cache_path,
+            network_policy=NetworkPolicy(settings.network_policy),
+        )
+        if precache_thumbnails
+        else None
+    )
+    logger.info(f'Starting observation sync for {settings.username}')
+
+    start = time()
+    total = 0
+    for page, observations in enumerate(get_sync_pages(client, settings, state), start=1):
+        if img_fetcher:
+            img_fetcher.precache_image(
+                [url for obs in observations for url in get_obs_image_urls(obs)]
+            )
+        total += len(observations)
+        yield SyncProgress(page, len(observations), total, round(time() - start, 2))
+
+    state.sync_resume_id = None
+    state.set_obs_checkpoint()
+    logger.info(f'Observation sync complete: {total} observations in {time() - start:.2f}s')
+
+
+def get_sync_pages(
+    client: iNatDbClient, settings: Settings, state: AppState
+) -> Iterator[list[Observation]]:
+    """Fetch all new/updated observations from the API, saving and yielding one page at a time"""
+    # A parallel sync is only worthwhile for a full sync, not for incremental updates
+    if settings.parallel_sync and state.last_obs_check is None:
+        yield from client.observations.search_user_parallel(username=settings.username)
+        return
+    yield from client.observations.search_user_paginated(
+        username=settings.username,
+        updated_since=state.last_obs_check,
+        id_above=state.sync_resume_id,
+    )
+
+
+def get_obs_image_urls(obs: Observation) -> list[str]:
+    """Return all thumbnail URLs to precache for a single observation.
+
+    Includes the observation default photo at medium size, all observation photos at square
+    size, the taxon default photo at medium size, and taxon grid photos at square size. Photos
+    without a URL are skipped.
+    """
+    urls: list[Optional[str]] = []
+    if obs.photos:
+        urls.append(obs.default_photo.url_size('medium'))
+        for photo in obs.photos:
+            urls.append(photo.url_size('square'))
+    if obs.taxon and obs.taxon.taxon_photos:
+        urls.append(obs.taxon.default_photo.url_size('medium'))
+        for photo in obs.taxon.taxon_photos[: N_DISPLAY_TAXON_THUMBNAILS + 1]:
+            urls.append(photo.url_size('square'))
+    return [url for url in urls if url]
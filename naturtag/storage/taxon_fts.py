@@ -0,0 +1,363 @@
+"""Taxon text search, optionally partitioned by language.
+
+Taxonomy data is always loaded into a single combined text search table (``taxon_fts``). It can then
+be split into one table per language, plus one for scientific names, with a small metadata table
+listing the installed languages. Only the selected languages are kept, and autocomplete searches
+only the partitions for the current locale.
+
+Languages remaining in the combined table are also listed in a separate table, updated whenever
+taxonomy data is loaded or partitioned, so available languages can be listed without a full scan.
+"""
+
+import re
+import sqlite3
+from collections import defaultdict
+from logging import getLogger
+from typing import Callable, Iterable, Optional
+
+from pyinaturalist import Taxon
+from pyinaturalist_convert.fts import TAXON_PREFIX_INDEXES
+
+from naturtag.constants import DB_PATH, TAXON_LOAD_BATCH_SIZE, PathOrStr
+from naturtag.storage.db import Connection, connect
+
+logger = getLogger().getChild(__name__)
+
+#: Combined text search table that taxonomy data is loaded into
+FTS_TABLE = 'taxon_fts'
+#: Installed language partitions
+LOCALE_TABLE = 'taxon_fts_locale'
+#: Languages with rows in the combined table
+LANGUAGE_TABLE = 'taxon_fts_language'
+#: Partition key for scientific names, which have no language code
+SCIENTIFIC_NAMES = ''
+FTS_COLUMNS = ['name', 'taxon_id', 'taxon_rank', 'count_rank', 'language_code']
+INVALID_FTS5_CHARS = re.compile(r'[^\w\s\-\'\.]')
+
+CREATE_LOCALE_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {LOCALE_TABLE} (
+    language_code TEXT PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    row_count INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+class TaxonAutocompleter:
+    """Taxon autocomplete search on scientific and common names. Same interface as
+    :py:class:`pyinaturalist_convert.fts.TaxonAutocompleter`, but searches only the relevant
+    language partitions, if the text search table has been partitioned.
+
+    Args:
+        db_path: Path to SQLite database
+        limit: Maximum number of results to return per query. Set to -1 to disable.
+    """
+
+    def __init__(self, db_path: PathOrStr = DB_PATH, limit: int = 10):
+        self.db_path = db_path
+        self.limit = limit
+
+    def search(self, q: str, language: Optional[str] = 'en') -> list[Taxon]:
+        """Search for taxa by scientific and/or common name.
+
+        Args:
+            q: Search query
+            language: Language code for common names, or ``None`` for all languages
+
+        Returns:
+            Taxon objects (with ID and name only)
+        """
+        if not q:
+            return []
+
+        with connect(self.db_path) as conn:
+            if not (tables := _get_search_tables(conn, language)):
+                return []
+            select = (
+                'SELECT name, taxon_id, taxon_rank, (rank - count_rank) AS combined_rank '
+                "FROM {} WHERE name MATCH :q || '*' {}"
+            )
+            # Language filter is only needed for the combined table
+            language_filter = ''
+            if language and tables == [FTS_TABLE]:
+                language_filter = 'AND (language_code IS NULL OR language_code = :language)'
+            query = ' UNION ALL '.join(select.format(t, language_filter) for t in tables)
+            query += ' ORDER BY combined_rank'
+            if self.limit > 1:
+                query += ' LIMIT :limit'
+            params = {'q': q, 'language': _normalize(language or ''), 'limit': self.limit}
+            rows = conn.execute(query, params).fetchall()
+
+        return [Taxon(id=int(row[1]), name=row[0], rank=row[2]) for row in rows]
+
+
+def search_taxa_local(
+    q: str,
+    db_path: PathOrStr = DB_PATH,
+    language: Optional[str] = 'en',
+    limit: int = 10,
+    priority: Optional[Callable[[int], int]] = None,
+) -> list[dict]:
+    """Search for taxa by name in the local database, with results in the same format as API taxon
+    autocomplete results.
+
+    Results are ranked by exact name matches first, then by ``priority`` (for example, how often the
+    user has viewed or observed each taxon), then by text search rank. Each result also includes
+    ``exact_match`` and ``priority`` values.
+
+    Args:
+        q: Search query
+        db_path: SQLite database path
+        language: Language code for common names, or ``None`` for all languages
+        limit: Maximum number of taxa to return
+        priority: Function that returns a priority for a taxon ID (higher is better)
+    """
+    q = INVALID_FTS5_CHARS.sub('', q).strip()
+    try:
+        # Get extra matches, since a taxon may match on more than one name
+        matches = TaxonAutocompleter(db_path, limit=limit * 5).search(q, language=language)
+    except sqlite3.OperationalError as e:
+        logger.warning(f'Local taxon search failed: {e}')
+        return []
+
+    results: dict[int, dict] = {}
+    for fts_rank, match in enumerate(matches):
+        exact = match.name.casefold() == q.casefold()
+        if match.id not in results:
+            results[match.id] = {
+                'id': match.id,
+                'name': match.name,
+                'rank': match.rank,
+                'preferred_common_name': None,
+                'iconic_taxon_id': None,
+                'matched_term': match.name,
+                'exact_match': exact,
+                'priority': priority(match.id) if priority else 0,
+                'fts_rank': fts_rank,
+            }
+        elif exact and not results[match.id]['exact_match']:
+            results[match.id].update(matched_term=match.name, exact_match=True)
+
+    _add_taxon_details(results, db_path)
+    ranked = sorted(
+        results.values(), key=lambda r: (not r['exact_match'], -r['priority'], r['fts_rank'])
+    )
+    return ranked[:limit]
+
+
+def partition_taxon_fts(
+    db_path: PathOrStr = DB_PATH,
+    languages: Optional[Iterable[str]] = None,
+    batch_size: int = TAXON_LOAD_BATCH_SIZE,
+) -> dict[str, int]:
+    """Move rows from the combined text search table into per-language partitions. Scientific names
+    are always kept; common names are kept only for the selected languages, and others are removed.
+
+    If partitions have already been created, newly loaded rows are added to them, and ``languages``
+    can be used to remove any languages that are no longer needed. Adding a language to existing
+    partitions requires reloading taxonomy data.
+
+    Args:
+        db_path: SQLite database path
+        languages: Language codes to keep. Defaults to the currently installed languages; if not
+            partitioned yet, nothing is done.
+
+    Returns:
+        Number of rows in each partition, by language code
+    """
+    with connect(db_path) as conn:
+        partitions = _get_partitions(conn)
+        if languages is None and not partitions:
+            _save_combined_languages(conn)
+            return {}
+
+        conn.execute(CREATE_LOCALE_TABLE)
+        if languages is None:
+            keep = set(partitions)
+        else:
+            keep = {_normalize(lang) for lang in languages} | {SCIENTIFIC_NAMES}
+            for key in [key for key in partitions if key not in keep]:
+                logger.info(f'Removing text search partition: {partitions[key][0]}')
+                _drop_partition(conn, partitions.pop(key)[1])
+
+        if n_rows := _move_rows(conn, partitions, keep, batch_size):
+            logger.info(f'Moved {n_rows} text search rows into {len(partitions)} partitions')
+            _reset_table(conn, FTS_TABLE)
+
+        counts = {}
+        for language_code, table in partitions.values():
+            if n_rows:
+                conn.execute(f"INSERT INTO {table}({table}) VALUES('optimize')")
+            counts[language_code] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            conn.execute(
+                f'UPDATE {LOCALE_TABLE} SET row_count = ? WHERE language_code = ?',
+                (counts[language_code], language_code),
+            )
+        _save_combined_languages(conn)
+    return counts
+
+
+def get_fts_tables(conn: Connection) -> list[str]:
+    """Get the combined text search table plus any language partitions"""
+    return [FTS_TABLE] + [table for _, table in _get_partitions(conn).values()]
+
+
+def get_fts_languages(db_path: PathOrStr = DB_PATH) -> list[str]:
+    """Get language codes of all common names available for text search"""
+    with connect(db_path) as conn:
+        languages = {language_code for language_code, _ in _get_partitions(conn).values()}
+        # Rows that haven't been partitioned (or all rows, if not partitioned)
+        if _table_exists(conn, LANGUAGE_TABLE):
+            rows = conn.execute(f'SELECT language_code FROM {LANGUAGE_TABLE}').fetchall()
+        # Fall back to a full scan for a database that hasn't been updated yet
+        elif not languages or conn.execute(f'SELECT 1 FROM {FTS_TABLE} LIMIT 1').fetchone():
+            rows = conn.execute(f'SELECT DISTINCT(language_code) FROM {FTS_TABLE}').fetchall()
+        else:
+            rows = []
+        languages |= {row[0] for row in rows}
+    return sorted(lang for lang in languages if lang)
+
+
+def reset_fts_partitions(conn: Connection):
+    """Remove all rows from language partitions, before reloading taxonomy data. Installed languages
+    are kept.
+    """
+    for _, table in _get_partitions(conn).values():
+        _reset_table(conn, table)
+    if _table_exists(conn, LOCALE_TABLE):
+        conn.execute(f'UPDATE {LOCALE_TABLE} SET row_count = 0')
+
+
+def drop_fts_partitions(conn: Connection):
+    """Remove all language partitions and the installed language list"""
+    for _, table in _get_partitions(conn).values():
+        _drop_partition(conn, table)
+    conn.execute(f'DROP TABLE IF EXISTS {LOCALE_TABLE}')
+    conn.execute(f'DROP TABLE IF EXISTS {LANGUAGE_TABLE}')
+
+
+def _save_combined_languages(conn: Connection):
+    """Update the list of languages in the combined table. This requires a full scan, so it's only
+    done after loading or partitioning, when the table has already been read.
+    """
+    if not _table_exists(conn, FTS_TABLE):
+        return
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {LANGUAGE_TABLE} (language_code TEXT PRIMARY KEY)')
+    conn.execute(f'DELETE FROM {LANGUAGE_TABLE}')
+    if conn.execute(f'SELECT 1 FROM {FTS_TABLE} LIMIT 1').fetchone():
+        conn.execute(
+            f'INSERT INTO {LANGUAGE_TABLE} (language_code) '
+            f'SELECT DISTINCT language_code FROM {FTS_TABLE} WHERE language_code IS NOT NULL'
+        )
+
+
+def _move_rows(
+    conn: Connection, partitions: dict[str, tuple[str, str]], keep: set[str], batch_size: int
+) -> int:
+    """Route each row in the combined table to its language partition, creating partitions as
+    needed, and return the number of rows read
+    """
+    n_rows = 0
+    cursor = conn.execute(f'SELECT {",".join(FTS_COLUMNS)} FROM {FTS_TABLE}')
+    while rows := cursor.fetchmany(batch_size):
+        by_language = defaultdict(list)
+        for row in rows:
+            if (key := _normalize(row[4] or '')) in keep:
+                by_language[key].append(row)
+        for key, language_rows in by_language.items():
+            if key not in partitions:
+                partitions[key] = _create_partition(conn, language_rows[0][4] or '')
+            conn.executemany(
+                f'INSERT INTO {partitions[key][1]} ({",".join(FTS_COLUMNS)}) '
+                f'VALUES ({",".join(["?"] * len(FTS_COLUMNS))})',
+                language_rows,
+            )
+        n_rows += len(rows)
+    return n_rows
+
+
+def _add_taxon_details(results: dict[int, dict], db_path: PathOrStr):
+    """Add scientific names, common names, and iconic taxa to search results from the taxon table"""
+    if not results:
+        return
+    placeholders = ','.join(['?'] * len(results))
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            'SELECT id, name, rank, preferred_common_name, iconic_taxon_id FROM taxon '
+            f'WHERE id IN ({placeholders})',
+            list(results),
+        ).fetchall()
+    for taxon_id, name, rank, common_name, iconic_taxon_id in rows:
+        results[taxon_id].update(
+            name=name,
+            rank=rank,
+            preferred_common_name=common_name,
+            iconic_taxon_id=iconic_taxon_id,
+        )
+
+
+def _get_search_tables(conn: Connection, language: Optional[str]) -> list[str]:
+    """Get the partitions to search for a language, or the combined table if not partitioned"""
+    partitions = _get_partitions(conn)
+    if not partitions:
+        return [FTS_TABLE]
+    if not language:
+        return [table for _, table in partitions.values()]
+    keys = {SCIENTIFIC_NAMES, _normalize(language)}
+    return [table for key, (_, table) in partitions.items() if key in keys]
+
+
+def _get_partitions(conn: Connection) -> dict[str, tuple[str, str]]:
+    """Get installed partitions, as ``{normalized language code: (language code, table name)}``"""
+    if not _table_exists(conn, LOCALE_TABLE):
+        return {}
+    rows = conn.execute(
+        f'SELECT language_code, table_name FROM {LOCALE_TABLE} ORDER BY language_code'
+    ).fetchall()
+    return {_normalize(language_code): (language_code, table) for language_code, table in rows}
+
+
+def _create_partition(conn: Connection, language_code: str) -> tuple[str, str]:
+    # Double underscore avoids conflicts with FTS5 shadow tables, like taxon_fts_data
+    suffix = re.sub(r'\W', '_', _normalize(language_code)) or 'sci'
+    table = f'{FTS_TABLE}__{suffix}'
+    prefix_idxs = ', '.join([f'prefix={i}' for i in TAXON_PREFIX_INDEXES])
+    logger.debug(f'Creating text search partition: {table}')
+    conn.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5('
+        'name, taxon_id, taxon_rank UNINDEXED, count_rank UNINDEXED, language_code UNINDEXED, '
+        f'{prefix_idxs})'
+    )
+    conn.execute(
+        f'INSERT OR REPLACE INTO {LOCALE_TABLE} (language_code, table_name) VALUES (?, ?)',
+        (language_code, table),
+    )
+    return language_code, table
+
+
+def _drop_partition(conn: Connection, table: str):
+    conn.execute(f'DROP TABLE IF EXISTS {table}')
+    conn.execute(f'DELETE FROM {LOCALE_TABLE} WHERE table_name = ?', (table,))
+
+
+def _reset_table(conn: Connection, table: str):
+    """Remove all rows from a text search table. Recreating the table is much faster than deleting
+    rows, which requires updating the index for each one.
+    """
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()[0]
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(sql)
+
+
+def _table_exists(conn: Connection, table: str) -> bool:
+    return bool(
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+    )
+
+
+def _normalize(language_code: str) -> str:
+    return language_code.lower().replace('-', '_')
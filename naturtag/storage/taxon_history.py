@@ -0,0 +1,128 @@
+"""Taxon view history, stored as an append-only table. Per-taxon view counts and most recent views
+are maintained by a trigger, so recent and frequent taxa can be read with indexed queries instead of
+loading the full history.
+"""
+
+import sqlite3
+from logging import getLogger
+from pathlib import Path
+from time import time
+from typing import Iterable
+
+from naturtag.constants import DB_PATH, MAX_DISPLAY_HISTORY
+from naturtag.storage.db import Connection, connect
+
+logger = getLogger().getChild(__name__)
+
+CREATE_TAXON_HISTORY = """
+CREATE TABLE IF NOT EXISTS taxon_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    taxon_id INTEGER NOT NULL,
+    viewed_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS taxon_view_count (
+    taxon_id INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0,
+    last_view_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS taxon_view_count_recent ON taxon_view_count (last_view_id DESC);
+CREATE INDEX IF NOT EXISTS taxon_view_count_frequent
+    ON taxon_view_count (count DESC, last_view_id DESC);
+
+CREATE TRIGGER IF NOT EXISTS taxon_view_count_insert AFTER INSERT ON taxon_history
+BEGIN
+    INSERT INTO taxon_view_count (taxon_id, count, last_view_id) VALUES (NEW.taxon_id, 1, NEW.id)
+    ON CONFLICT (taxon_id) DO UPDATE SET count = count + 1, last_view_id = NEW.id;
+END;
+"""
+
+
+def create_taxon_history(db_path: Path = DB_PATH):
+    """Create the taxon history tables and trigger, if they don't already exist"""
+    with connect(db_path) as conn:
+        conn.executescript(CREATE_TAXON_HISTORY)
+
+
+def add_view(taxon_id: int, db_path: Path = DB_PATH) -> int:
+    """Add a taxon to the view history, and return its updated view count"""
+    with connect(db_path) as conn:
+        try:
+            return _add_view(conn, taxon_id)
+        except sqlite3.OperationalError:
+            conn.executescript(CREATE_TAXON_HISTORY)
+            return _add_view(conn, taxon_id)
+
+
+def _add_view(conn: Connection, taxon_id: int) -> int:
+    conn.execute(
+        'INSERT INTO taxon_history (taxon_id, viewed_at) VALUES (?, ?)', (taxon_id, time())
+    )
+    return conn.execute(
+        'SELECT count FROM taxon_view_count WHERE taxon_id = ?', (taxon_id,)
+    ).fetchone()[0]
+
+
+def import_history(taxon_ids: Iterable[int], db_path: Path = DB_PATH):
+    """Import a list of previously viewed taxon IDs (oldest first), if there is no history saved
+    yet. This is for migrating history from older versions that stored it in :py:class:`.AppState`.
+    """
+    taxon_ids = list(taxon_ids)
+    with connect(db_path) as conn:
+        conn.executescript(CREATE_TAXON_HISTORY)
+        if not taxon_ids or conn.execute('SELECT 1 FROM taxon_history LIMIT 1').fetchone():
+            return
+        logger.info(f'Importing {len(taxon_ids)} taxon history entries')
+        # Original view times are unknown, so they all get the same timestamp
+        viewed_at = time()
+        conn.executemany(
+            'INSERT INTO taxon_history (taxon_id, viewed_at) VALUES (?, ?)',
+            [(taxon_id, viewed_at) for taxon_id in taxon_ids],
+        )
+
+
+def get_recent(limit: int = MAX_DISPLAY_HISTORY, db_path: Path = DB_PATH) -> list[int]:
+    """Get IDs of the most recently viewed unique taxa, most recent first"""
+    return list(
+        _query(
+            'SELECT taxon_id FROM taxon_view_count ORDER BY last_view_id DESC LIMIT ?',
+            (limit,),
+            db_path,
+        )
+    )
+
+
+def get_frequent(limit: int = MAX_DISPLAY_HISTORY, db_path: Path = DB_PATH) -> dict[int, int]:
+    """Get view counts of the most frequently viewed taxa, most frequent first"""
+    return dict(
+        _query(
+            'SELECT taxon_id, count FROM taxon_view_count '
+            'ORDER BY count DESC, last_view_id DESC LIMIT ?',
+            (limit,),
+            db_path,
+        )
+    )
+
+
+def get_view_count(taxon_id: int, db_path: Path = DB_PATH) -> int:
+    """Get the number of times a taxon has been viewed"""
+    rows = _query('SELECT count FROM taxon_view_count WHERE taxon_id = ?', (taxon_id,), db_path)
+    return next(iter(rows), 0)
+
+
+def get_history_count(db_path: Path = DB_PATH) -> int:
+    """Get the total number of taxon views"""
+    rows = _query('SELECT SUM(count) FROM taxon_view_count', (), db_path)
+    return next(iter(rows), None) or 0
+
+
+def _query(query: str, params: tuple, db_path: Path) -> list:
+    """Run a query and return a list of single values or (key, value) pairs, or an empty list if
+    the history tables haven't been created yet
+    """
+    try:
+        with connect(db_path) as conn:
+            rows = conn.execute(query, params).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    return [row[0] if len(row) == 1 else row for row in rows]
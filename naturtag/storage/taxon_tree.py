@@ -0,0 +1,148 @@
+"""Precomputed subtree index for the taxon table, for finding all descendants of a taxon with a
+single indexed range query.
+
+Each taxon is numbered in depth-first (pre-order) traversal order as ``lft``, and ``rgt`` is the
+highest number within its subtree (nested-set intervals). All descendants of a taxon then have
+``lft`` between its own ``lft`` and ``rgt``.
+
+Taxa added after the index was built (for example, from observation sync) can't be numbered
+without renumbering the rest of the tree, so until the next rebuild, they're added as untracked
+rows (``depth=-1`` and negative ``lft``/``rgt``). Descendants among untracked taxa are found with
+their ``parent_id`` and ``ancestor_ids`` instead.
+"""
+
+import sqlite3
+from collections import defaultdict
+from logging import getLogger
+from pathlib import Path
+from time import time
+from typing import Iterable
+
+from sqlalchemy import CompoundSelect, Select, column, literal, or_, select, table, text, union
+from sqlalchemy.orm import Session
+
+from naturtag.constants import DB_PATH
+from naturtag.storage.db import connect, get_session
+
+logger = getLogger().getChild(__name__)
+
+TaxonTree = table('taxon_tree', column('id'), column('lft'), column('rgt'), column('depth'))
+TaxonRows = table('taxon', column('id'), column('parent_id'), column('ancestor_ids'))
+
+CREATE_TABLE = (
+    'CREATE TABLE IF NOT EXISTS taxon_tree ('
+    'id INTEGER PRIMARY KEY, lft INTEGER NOT NULL, rgt INTEGER NOT NULL, depth INTEGER NOT NULL)'
+)
+CREATE_INDEX = 'CREATE INDEX IF NOT EXISTS idx_taxon_tree_lft_rgt ON taxon_tree (lft, rgt)'
+
+
+def build_taxon_tree(db_path: Path = DB_PATH) -> int:
+    """Create or rebuild the subtree index from the current contents of the taxon table
+
+    Returns:
+        Number of indexed taxa
+    """
+    start = time()
+    with connect(db_path) as conn:
+        try:
+            rows = conn.execute('SELECT id, parent_id FROM taxon ORDER BY id').fetchall()
+        except sqlite3.OperationalError as e:
+            logger.warning(f'Failed to build taxon tree: {e}')
+            return 0
+
+        conn.execute(CREATE_TABLE)
+        conn.execute(CREATE_INDEX)
+        conn.execute('DELETE FROM taxon_tree')
+        conn.executemany(
+            'INSERT INTO taxon_tree (id, lft, rgt, depth) VALUES (?, ?, ?, ?)',
+            _get_intervals(rows),
+        )
+
+    logger.info(f'Built taxon tree for {len(rows)} taxa in {time() - start:.2f}s')
+    return len(rows)
+
+
+def add_untracked_taxa(session: Session, taxon_ids: Iterable[int]):
+    """Add newly saved taxa to the subtree index as untracked rows, within an existing session.
+    They'll be numbered on the next full rebuild.
+    """
+    rows = [{'id': taxon_id, 'lft': -taxon_id} for taxon_id in taxon_ids]
+    if not rows:
+        return
+    session.execute(text(CREATE_TABLE))
+    session.execute(text(CREATE_INDEX))
+    session.execute(
+        text('INSERT OR IGNORE INTO taxon_tree (id, lft, rgt, depth) VALUES (:id, :lft, :lft, -1)'),
+        rows,
+    )
+
+
+def descendant_ids_stmt(taxon_id: int, include_self: bool = False) -> CompoundSelect:
+    """Get a SELECT statement for IDs of all descendants of a taxon, for use as a subquery"""
+    return union(*_descendants_stmts(taxon_id, include_self, TaxonTree.c.id))
+
+
+def get_descendant_ids(
+    taxon_id: int, db_path: Path = DB_PATH, include_self: bool = False
+) -> list[int]:
+    """Get IDs of all descendants of a taxon (at any depth), in tree order, followed by any
+    untracked descendants
+    """
+    stmt = union(*_descendants_stmts(taxon_id, include_self, TaxonTree.c.id, TaxonTree.c.lft))
+    with get_session(db_path) as session:
+        rows = session.execute(stmt).all()
+    return [row[0] for row in sorted(rows, key=lambda row: (row[1] < 0, row[1]))]
+
+
+def _descendants_stmts(taxon_id: int, include_self: bool, *columns) -> tuple[Select, Select]:
+    """Get SELECT statements for descendants in the numbered tree, and for untracked descendants"""
+    subtree = select(TaxonTree.c.lft, TaxonTree.c.rgt).where(TaxonTree.c.id == taxon_id).subquery()
+    tracked = select(*columns).join(subtree, TaxonTree.c.lft.between(subtree.c.lft, subtree.c.rgt))
+    untracked = (
+        select(*columns)
+        .join(TaxonRows, TaxonRows.c.id == TaxonTree.c.id)
+        .where(TaxonTree.c.lft < 0)
+        .where(
+            or_(
+                TaxonRows.c.parent_id == taxon_id,
+                (literal(',') + TaxonRows.c.ancestor_ids + ',').like(f'%,{taxon_id},%'),
+            )
+        )
+    )
+    if not include_self:
+        tracked = tracked.where(TaxonTree.c.id != taxon_id)
+    return tracked, untracked.where(TaxonTree.c.id != taxon_id)
+
+
+def _get_intervals(rows: list[tuple[int, int]]) -> list[list[int]]:
+    """Get nested-set intervals for each taxon, as ``[id, lft, rgt, depth]``. Taxa with a parent
+    that isn't in the table are treated as roots. Rows are expected to be sorted by ID.
+    """
+    taxon_ids = {taxon_id for taxon_id, _ in rows}
+    children: dict[int, list[int]] = defaultdict(list)
+    roots = []
+    for taxon_id, parent_id in rows:
+        if parent_id in taxon_ids and parent_id != taxon_id:
+            children[parent_id].append(taxon_id)
+        else:
+            roots.append(taxon_id)
+
+    # Depth-first traversal, numbering taxa in pre-order. Each parent also gets an exit marker
+    # (depth=-1) on the stack, to set its rgt value after all of its descendants are numbered.
+    intervals: list[list[int]] = []
+    stack = [(taxon_id, 0) for taxon_id in reversed(roots)]
+    while stack:
+        key, depth = stack.pop()
+        # Exit marker: key is the parent's lft
+        if depth < 0:
+            intervals[key][2] = len(intervals) - 1
+            continue
+        lft = len(intervals)
+        intervals.append([key, lft, lft, depth])
+        if child_ids := children.get(key):
+            stack.append((lft, -1))
+            stack.extend((child_id, depth + 1) for child_id in reversed(child_ids))
+
+    if len(intervals) < len(rows):
+        logger.warning(f'Skipped {len(rows) - len(intervals)} taxa with circular ancestry')
+    return intervals
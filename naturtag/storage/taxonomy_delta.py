@@ -0,0 +1,324 @@
+"""Incremental updates to packaged taxonomy data. Instead of reloading all taxa for each new taxonomy
+version, a delta archive contains only the changes from one version to the next:
+
+* ``manifest.json``: Source and target taxonomy versions (``from_version`` and ``to_version``)
+* ``taxon.csv``: Added and changed taxa
+* ``taxon_deprecated.csv``: IDs of taxa that were removed from the taxonomy
+* ``taxon_fts.csv``: All text search rows for added and changed taxa
+
+Files are applied in that order. Taxa that have been fully fetched from the API (``partial=0``) are
+kept as-is, but marked as stale so they'll be refreshed the next time they're used online. New text
+search rows are added to the combined text search table; if it's partitioned by language, they can
+then be moved with :py:func:`.partition_taxon_fts`.
+"""
+
+import csv
+import io
+import json
+import sqlite3
+import tarfile
+from contextlib import closing
+from itertools import islice
+from logging import getLogger
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import time
+from typing import Iterable, Optional
+
+from naturtag.constants import DB_PATH, TAXON_LOAD_BATCH_SIZE, PathOrStr
+from naturtag.storage.db import Connection, connect
+from naturtag.storage.taxon_fts import FTS_COLUMNS, FTS_TABLE, get_fts_tables
+from naturtag.storage.taxonomy_loader import (
+    MANIFEST_FILE,
+    LoadProgress,
+    ProgressCallback,
+    _decode_lines,
+    _get_columns,
+    get_taxonomy_version,
+    set_taxonomy_version,
+)
+
+logger = getLogger().getChild(__name__)
+
+TAXON_FILE = 'taxon.csv'
+DEPRECATED_FILE = 'taxon_deprecated.csv'
+FTS_FILE = 'taxon_fts.csv'
+DELTA_FILES = [MANIFEST_FILE, TAXON_FILE, DEPRECATED_FILE, FTS_FILE]
+
+#: Taxon columns included in packaged taxonomy data
+TAXON_COLUMNS = [
+    'id',
+    'ancestor_ids',
+    'child_ids',
+    'iconic_taxon_id',
+    'leaf_taxa_count',
+    'observations_count_rg',
+    'name',
+    'parent_id',
+    'preferred_common_name',
+    'rank',
+]
+
+
+class TaxonomyDeltaError(ValueError):
+    """A taxonomy delta is invalid or can't be applied to the current taxonomy version"""
+
+
+def read_delta_manifest(delta_path: PathOrStr) -> dict:
+    """Read the manifest from a delta archive, which must be the first file in the archive"""
+    with tarfile.open(delta_path, mode='r|*') as tar:
+        member = tar.next()
+        fileobj = tar.extractfile(member) if member else None
+        if not member or Path(member.name).name != MANIFEST_FILE or not fileobj:
+            raise TaxonomyDeltaError(f'{delta_path}: {MANIFEST_FILE} must be the first file')
+        manifest = json.load(fileobj)
+    if not manifest.get('from_version') or not manifest.get('to_version'):
+        raise TaxonomyDeltaError(f'{delta_path}: manifest must include from_version and to_version')
+    return manifest
+
+
+def apply_taxonomy_delta(
+    delta_path: PathOrStr,
+    db_path: PathOrStr = DB_PATH,
+    progress: Optional[ProgressCallback] = None,
+    batch_size: int = TAXON_LOAD_BATCH_SIZE,
+) -> dict[str, int]:
+    """Apply a single taxonomy delta in place, in a single transaction. The delta's
+    ``from_version`` must match the current taxonomy version.
+
+    Args:
+        delta_path: Path to a delta archive
+        db_path: SQLite database path
+        progress: Callback to receive progress after each batch of rows is applied
+        batch_size: Number of rows per batch
+
+    Returns:
+        Number of rows applied per file
+
+    Raises:
+        :py:exc:`TaxonomyDeltaError` if the delta is invalid or doesn't apply to the current version
+    """
+    start = time()
+    manifest = read_delta_manifest(delta_path)
+    current_version = get_taxonomy_version(db_path)
+    if manifest['from_version'] != current_version:
+        raise TaxonomyDeltaError(
+            f'{delta_path}: delta is for taxonomy version {manifest["from_version"]}; '
+            f'current version is {current_version}'
+        )
+
+    logger.info(f'Applying taxonomy delta {manifest["from_version"]} -> {manifest["to_version"]}')
+    counts = {}
+    with tarfile.open(delta_path, mode='r|*') as tar, connect(db_path) as conn:
+        taxon_columns = _get_columns(conn, 'main', 'taxon')
+        for member in tar:
+            name = Path(member.name).name
+            fileobj = tar.extractfile(member) if name in DELTA_FILES[1:] else None
+            if fileobj is None:
+                continue
+
+            reader = csv.reader(_decode_lines(fileobj))
+            header = next(reader)
+            n_rows = 0
+            while batch := list(islice(reader, batch_size)):
+                if name == TAXON_FILE:
+                    _upsert_taxa(conn, header, batch, taxon_columns)
+                elif name == DEPRECATED_FILE:
+                    _deprecate_taxa(conn, [int(row[0]) for row in batch], taxon_columns)
+                else:
+                    _insert_fts(conn, header, batch)
+                n_rows += len(batch)
+                if progress:
+                    progress(LoadProgress(name, n_rows, fileobj.tell(), member.size))
+            counts[name] = n_rows
+
+        set_taxonomy_version(conn, manifest['to_version'])
+
+    logger.info(f'Applied {counts} rows in {time() - start:.2f}s')
+    return counts
+
+
+def apply_taxonomy_deltas(
+    delta_paths: Iterable[PathOrStr],
+    db_path: PathOrStr = DB_PATH,
+    progress: Optional[ProgressCallback] = None,
+) -> list[str]:
+    """Apply any deltas that lead from the current taxonomy version to a newer version, in order.
+    Deltas that don't apply to the current version are skipped.
+
+    Returns:
+        Taxonomy versions that were applied
+    """
+    deltas = {}
+    for path in delta_paths:
+        try:
+            manifest = read_delta_manifest(path)
+        except (TaxonomyDeltaError, tarfile.TarError, OSError, ValueError) as exc:
+            logger.warning(f'Skipping invalid taxonomy delta: {exc}')
+            continue
+        deltas[manifest['from_version']] = path
+
+    applied: list[str] = []
+    version = get_taxonomy_version(db_path)
+    if deltas and version is None:
+        logger.warning('Taxonomy version unknown; reset the database to update taxonomy data')
+    while version in deltas:
+        apply_taxonomy_delta(deltas.pop(version), db_path, progress)
+        version = get_taxonomy_version(db_path)
+        applied.append(version)  # type: ignore
+    return applied
+
+
+def build_taxonomy_delta(
+    old_db: PathOrStr,
+    new_db: PathOrStr,
+    dest_path: PathOrStr,
+    from_version: str,
+    to_version: str,
+    min_observations: int = 0,
+    language: Optional[str] = None,
+) -> dict[str, int]:
+    """Build a delta archive with the changes between two taxonomy databases. Filters should match
+    the ones used to export the packaged taxonomy data.
+
+    Args:
+        old_db: Database with taxonomy data for ``from_version``
+        new_db: Database with taxonomy data for ``to_version``
+        dest_path: Path to write the delta archive (``.tar.gz``)
+        min_observations: Only include taxa with at least this many research-grade observations
+        language: Only include text search rows for this language code with ``count_rank > 1``
+
+    Returns:
+        Number of rows written per file
+    """
+    taxon_filter = f'observations_count_rg >= {int(min_observations)}'
+    fts_filter = 'language_code = :language AND count_rank > 1' if language else '1 = 1'
+    cols = ', '.join(TAXON_COLUMNS)
+    fts_cols = ', '.join(FTS_COLUMNS)
+    params = {'language': language}
+
+    with closing(sqlite3.connect(new_db)) as conn:
+        conn.execute('ATTACH DATABASE ? AS old', (str(old_db),))
+        # Taxa with any changed columns or text search rows
+        new_fts = f'SELECT {fts_cols} FROM main.{FTS_TABLE} WHERE {fts_filter}'
+        old_fts = f'SELECT {fts_cols} FROM old.{FTS_TABLE} WHERE {fts_filter}'
+        conn.execute(
+            'CREATE TEMP TABLE changed AS '
+            f'SELECT id FROM (SELECT {cols} FROM main.taxon WHERE {taxon_filter} '
+            f'  EXCEPT SELECT {cols} FROM old.taxon WHERE {taxon_filter}) '
+            f'UNION SELECT CAST(taxon_id AS INTEGER) FROM ({new_fts} EXCEPT {old_fts}) '
+            f'UNION SELECT CAST(taxon_id AS INTEGER) FROM ({old_fts} EXCEPT {new_fts})',
+            params,
+        )
+        files = {
+            TAXON_FILE: (
+                TAXON_COLUMNS,
+                conn.execute(
+                    f'SELECT {cols} FROM main.taxon WHERE {taxon_filter} '
+                    'AND id IN (SELECT id FROM temp.changed) ORDER BY id'
+                ),
+            ),
+            DEPRECATED_FILE: (
+                ['id'],
+                conn.execute(
+                    f'SELECT id FROM old.taxon WHERE {taxon_filter} '
+                    f'EXCEPT SELECT id FROM main.taxon WHERE {taxon_filter} ORDER BY id'
+                ),
+            ),
+            FTS_FILE: (
+                FTS_COLUMNS,
+                conn.execute(
+                    f'SELECT {fts_cols} FROM main.{FTS_TABLE} WHERE {fts_filter} '
+                    'AND CAST(taxon_id AS INTEGER) IN (SELECT id FROM temp.changed) '
+                    f'AND CAST(taxon_id AS INTEGER) IN (SELECT id FROM main.taxon '
+                    f'WHERE {taxon_filter})',
+                    params,
+                ),
+            ),
+        }
+
+        counts = {}
+        with TemporaryDirectory() as tmp_dir, tarfile.open(dest_path, 'w:gz') as tar:
+            manifest = {'from_version': from_version, 'to_version': to_version}
+            data = json.dumps(manifest).encode()
+            info = tarfile.TarInfo(MANIFEST_FILE)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+            # Each result set is written to a temp file first, since tar needs the file size
+            for name, (header, rows) in files.items():
+                csv_path = Path(tmp_dir) / name
+                with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(header)
+                    counts[name] = 0
+                    for row in rows:
+                        writer.writerow(['' if value is None else value for value in row])
+                        counts[name] += 1
+                tar.add(csv_path, arcname=name)
+
+    logger.info(f'Built taxonomy delta {from_version} -> {to_version}: {counts}')
+    return counts
+
+
+def _upsert_taxa(conn: Connection, header: list[str], rows: list[list[str]], columns: set[str]):
+    """Insert or update partial taxa. Full records are kept, but marked as stale."""
+    col_idxs = [i for i, col in enumerate(header) if col in columns and col != 'partial']
+    cols = [header[i] for i in col_idxs]
+    id_idx = header.index('id')
+    placeholders = ','.join(["NULLIF(?,'')"] * len(cols))
+    updates = ', '.join(f'{col} = excluded.{col}' for col in cols if col != 'id')
+    conn.executemany(
+        f'INSERT INTO taxon ({",".join(cols)}, partial) VALUES ({placeholders}, 1) '
+        f'ON CONFLICT (id) DO UPDATE SET {updates} WHERE taxon.partial = 1',
+        [[row[i] for i in col_idxs] for row in rows],
+    )
+    taxon_ids = [int(row[id_idx]) for row in rows]
+    _delete_fts(conn, taxon_ids)
+    _expire_taxa(conn, taxon_ids)
+
+
+def _deprecate_taxa(conn: Connection, taxon_ids: list[int], columns: set[str]):
+    """Mark taxa as inactive and remove them from text search. Rows are kept, since they may still
+    be referenced by observations.
+    """
+    if 'is_active' in columns:
+        conn.executemany('UPDATE taxon SET is_active = 0 WHERE id = ?', [(i,) for i in taxon_ids])
+    _delete_fts(conn, taxon_ids)
+    _expire_taxa(conn, taxon_ids)
+
+
+def _insert_fts(conn: Connection, header: list[str], rows: list[list[str]]):
+    cols = [col for col in header if col in FTS_COLUMNS]
+    col_idxs = [header.index(col) for col in cols]
+    conn.executemany(
+        f'INSERT INTO {FTS_TABLE} ({",".join(cols)}) VALUES ({",".join(["?"] * len(cols))})',
+        [[row[i] for i in col_idxs] for row in rows],
+    )
+
+
+def _delete_fts(conn: Connection, taxon_ids: list[int]):
+    """Delete all text search rows for the given taxa from the combined table and any language
+    partitions, using the text search index to find them
+    """
+    tables = get_fts_tables(conn)
+    # Limit query size to stay well under SQLite's expression depth limit
+    for i in range(0, len(taxon_ids), 500):
+        query = ' OR '.join(f'"{taxon_id}"' for taxon_id in taxon_ids[i : i + 500])
+        for table in tables:
+            conn.execute(
+                f'DELETE FROM {table} WHERE rowid IN '
+                f'(SELECT rowid FROM {table} WHERE {table} MATCH ?)',
+                (f'taxon_id : ({query})',),
+            )
+
+
+def _expire_taxa(conn: Connection, taxon_ids: list[int]):
+    """Remove fetch times for any full taxon records, so they'll be refreshed on next use"""
+    try:
+        conn.executemany(
+            "DELETE FROM record_fetched WHERE record_type = 'taxon' AND id = ?",
+            [(i,) for i in taxon_ids],
+        )
+    except sqlite3.OperationalError:
+        pass  # Table doesn't exist yet
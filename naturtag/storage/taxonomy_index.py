@@ -0,0 +1,190 @@
+"""Compact in-memory index of the taxonomy tree, for ancestor and child lookups without the database"""
+
+import sqlite3
+from bisect import bisect_left
+from logging import getLogger
+from pathlib import Path
+from time import time
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+from pyinaturalist import Taxon
+
+from naturtag.constants import DB_PATH
+from naturtag.storage.db import connect
+
+logger = getLogger(__name__)
+
+# Max depth of the taxonomy tree, to guard against cycles in malformed data
+MAX_DEPTH = 100
+
+
+class TaxonomyIndex:
+    """Array-backed index of basic taxon info and parent/child relationships.
+
+    Taxa are stored by position in a sorted array of IDs. Children are stored as a single array
+    of positions grouped by parent, with per-taxon offsets into it. Strings are stored as a single
+    UTF-8 buffer with offsets.
+
+    Args:
+        ids: Taxon IDs
+        parent_ids: Parent taxon IDs, or ``0`` for root taxa
+        ranks: Rank names
+        names: Scientific names
+        common_names: Preferred common names
+        iconic_taxon_ids: Iconic taxon IDs
+        observations_counts: Observation counts
+        leaf_taxa_counts: Leaf taxa counts
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[int],
+        parent_ids: Sequence[int],
+        ranks: Sequence[str],
+        names: Sequence[str],
+        common_names: Sequence[str],
+        iconic_taxon_ids: Sequence[int],
+        observations_counts: Sequence[int],
+        leaf_taxa_counts: Sequence[int],
+    ):
+        ids_arr = np.asarray(ids, dtype=np.int64)
+        # Rows from the db will already be sorted by ID
+        order: Optional[np.ndarray] = None
+        if np.any(ids_arr[1:] < ids_arr[:-1]):
+            order = np.argsort(ids_arr, kind='stable')
+
+        def _sorted(values: Sequence, dtype=np.int32) -> np.ndarray:
+            arr = np.asarray(values, dtype=dtype)
+            return arr if order is None else arr[order]
+
+        self.ids = _sorted(ids_arr, np.int64)
+        self.iconic_taxon_ids = _sorted(iconic_taxon_ids)
+        self.observations_counts = _sorted(observations_counts)
+        self.leaf_taxa_counts = _sorted(leaf_taxa_counts)
+        self.names = StringArray(_sorted(names, object))
+        self.common_names = StringArray(_sorted(common_names, object))
+
+        # Ranks are stored as codes into a small lookup table
+        self.rank_names, rank_codes = np.unique(_sorted(ranks, object), return_inverse=True)
+        self.rank_names = self.rank_names.tolist()
+        self.ranks = rank_codes.astype(np.uint8)
+
+        # Translate parent IDs into positions; -1 for root taxa and parents that aren't indexed
+        self.parents = self._get_positions(_sorted(parent_ids, np.int64))
+
+        # Group child positions by parent; positions are sorted by ID, so children are too
+        has_parent = self.parents >= 0
+        self.children = np.flatnonzero(has_parent)[
+            np.argsort(self.parents[has_parent], kind='stable')
+        ].astype(np.int32)
+        child_counts = np.bincount(self.parents[has_parent], minlength=len(self.ids))
+        self.child_offsets = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        np.cumsum(child_counts, out=self.child_offsets[1:])
+
+        # Memoryviews for fast scalar lookups; numpy is much slower for single-element access
+        self._ids_view = memoryview(self.ids)
+        self._parents_view = memoryview(self.parents)
+
+    @classmethod
+    def from_db(cls, db_path: Path = DB_PATH) -> 'TaxonomyIndex':
+        """Build an index from all taxa in the local database"""
+        start = time()
+        query = (
+            "SELECT id, COALESCE(parent_id, 0), COALESCE(rank, ''), COALESCE(name, ''), "
+            "COALESCE(preferred_common_name, ''), COALESCE(iconic_taxon_id, 0), "
+            'COALESCE(NULLIF(observations_count_rg, 0), observations_count, 0), '
+            'COALESCE(leaf_taxa_count, 0) '
+            'FROM taxon ORDER BY id'
+        )
+        try:
+            with connect(db_path) as conn:
+                rows = conn.execute(query).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f'Failed to load taxonomy index: {e}')
+            rows = []
+
+        columns = list(zip(*rows, strict=True)) if rows else [()] * 8
+        index = cls(*columns)
+        logger.info(f'Loaded taxonomy index with {len(index)} taxa in {time() - start:.2f}s')
+        return index
+
+    def __contains__(self, taxon_id: int) -> bool:
+        return self._get_position(taxon_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def ancestor_ids(self, taxon_id: int) -> list[int]:
+        """Get IDs of all ancestors of a taxon, starting from the root"""
+        if (pos := self._get_position(taxon_id)) is None:
+            return []
+
+        ancestors: list[int] = []
+        pos = self._parents_view[pos]
+        while pos >= 0 and len(ancestors) < MAX_DEPTH:
+            ancestors.append(self._ids_view[pos])
+            pos = self._parents_view[pos]
+        return ancestors[::-1]
+
+    def child_ids(self, taxon_id: int) -> list[int]:
+        """Get IDs of all immediate children of a taxon"""
+        if (pos := self._get_position(taxon_id)) is None:
+            return []
+        start, end = self.child_offsets[pos], self.child_offsets[pos + 1]
+        return self.ids[self.children[start:end]].tolist()
+
+    def get_taxon(self, taxon_id: int) -> Optional[Taxon]:
+        """Get a partial taxon record with basic info, if indexed"""
+        if (pos := self._get_position(taxon_id)) is None:
+            return None
+        parent_pos = self._parents_view[pos]
+        return Taxon(
+            id=taxon_id,
+            complete_species_count=int(self.leaf_taxa_counts[pos]),
+            iconic_taxon_id=int(self.iconic_taxon_ids[pos]),
+            name=self.names[pos],
+            observations_count=int(self.observations_counts[pos]),
+            parent_id=self._ids_view[parent_pos] if parent_pos >= 0 else None,
+            partial=True,
+            preferred_common_name=self.common_names[pos] or None,
+            rank=self.rank_names[self.ranks[pos]],
+        )
+
+    def get_taxa(self, taxon_ids: Iterable[int]) -> list[Taxon]:
+        """Get partial taxon records for any of the given IDs that are indexed"""
+        taxa = (self.get_taxon(taxon_id) for taxon_id in taxon_ids)
+        return [t for t in taxa if t is not None]
+
+    def _get_position(self, taxon_id: int) -> Optional[int]:
+        pos = bisect_left(self._ids_view, taxon_id)
+        return pos if pos < len(self.ids) and self._ids_view[pos] == taxon_id else None
+
+    def _get_positions(self, taxon_ids: np.ndarray) -> np.ndarray:
+        """Get positions for multiple taxon IDs; -1 for any that aren't indexed"""
+        if not len(self.ids):
+            return np.full(len(taxon_ids), -1, dtype=np.int64)
+        positions = np.searchsorted(self.ids, taxon_ids).clip(max=len(self.ids) - 1)
+        return np.where(self.ids[positions] == taxon_ids, positions, -1)
+
+
+class StringArray:
+    """Compact storage for a large number of strings, as a single UTF-8 buffer plus offsets"""
+
+    __slots__ = ('buffer', 'offsets')
+
+    def __init__(self, values: Iterable[str]):
+        # Join with a separator that won't appear in names, and use it to find offsets
+        values = [v or '' for v in values]
+        self.buffer = '\0'.join(values).encode()
+        separators = np.flatnonzero(np.frombuffer(self.buffer, dtype=np.uint8) == 0)
+        self.offsets = np.empty(len(values) + 1, dtype=np.int64)
+        self.offsets[0] = 0
+        self.offsets[1:-1] = separators + 1
+        self.offsets[-1] = len(self.buffer) + 1
+
+    def __getitem__(self, idx: int) -> str:
+        return self.buffer[self.offsets[idx] : self.offsets[idx + 1] - 1].decode()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
@@ -0,0 +1,383 @@
+"""Loaders for packaged taxonomy data. Data can be packaged in either of two formats:
+
+* A compressed archive of CSV files, which are streamed directly into SQLite without extracting them
+  to disk first
+* A compressed, prebuilt SQLite database with tables and text search index already built, which is
+  copied into the local database without any parsing or indexing
+"""
+
+import csv
+import gzip
+import hashlib
+import json
+import sqlite3
+import tarfile
+from contextlib import closing
+from itertools import islice
+from logging import getLogger
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import time
+from typing import IO, Callable, Iterator, NamedTuple, Optional
+
+from pyinaturalist_convert.db import DbTaxon, create_table
+from pyinaturalist_convert.fts import create_taxon_fts_table
+
+from naturtag.constants import DB_PATH, TAXON_LOAD_BATCH_SIZE, PathOrStr
+from naturtag.storage.db import Connection, close_db, connect, get_db
+from naturtag.storage.taxon_fts import FTS_TABLE, reset_fts_partitions
+
+logger = getLogger().getChild(__name__)
+
+#: Tables that can be loaded from a taxonomy archive, by CSV file name
+TAXONOMY_TABLES = {'taxon.csv': 'taxon', 'taxon_fts.csv': 'taxon_fts'}
+FTS_DEFAULT_AUTOMERGE = 4
+#: FTS5 shadow tables that store the text search index and content
+FTS_SHADOW_TABLES = [
+    f'{FTS_TABLE}_{suffix}' for suffix in ('data', 'idx', 'content', 'docsize', 'config')
+]
+CHUNK_SIZE = 1024 * 1024
+MANIFEST_FILE = 'manifest.json'
+
+
+class ChecksumError(ValueError):
+    """A prebuilt taxonomy database doesn't match its expected checksum"""
+
+
+class LoadProgress(NamedTuple):
+    """Progress info for loading a single table from a taxonomy archive"""
+
+    table: str
+    rows: int
+    bytes_read: int
+    total_bytes: int
+
+
+ProgressCallback = Callable[[LoadProgress], None]
+
+
+def load_taxonomy_archive(
+    archive_path: PathOrStr,
+    db_path: PathOrStr = DB_PATH,
+    progress: Optional[ProgressCallback] = None,
+    batch_size: int = TAXON_LOAD_BATCH_SIZE,
+) -> dict[str, int]:
+    """Load taxon and taxon text search tables from a compressed tar archive of CSV files, replacing
+    any existing rows. Taxa are loaded as partial records, since some columns (mainly photo URLs)
+    aren't included and need to be filled in from the API.
+
+    The whole load happens in a single transaction. Secondary indexes are dropped during the load
+    and rebuilt afterward, and the text search index is optimized once at the end.
+
+    If the archive contains a ``manifest.json`` file with a ``version``, it will be saved as the
+    taxonomy version, for applying later updates with :py:mod:`.taxonomy_delta`.
+
+    Args:
+        archive_path: Path to a tar archive (optionally compressed) containing ``taxon.csv`` and/or
+            ``taxon_fts.csv``
+        db_path: SQLite database path. Tables must already exist.
+        progress: Callback to receive progress after each batch of rows is inserted
+        batch_size: Number of rows per insert
+
+    Returns:
+        Number of rows loaded per table
+    """
+    start = time()
+    counts = {}
+    with tarfile.open(archive_path, mode='r|*') as tar, connect(db_path) as conn:
+        for table in TAXONOMY_TABLES.values():
+            conn.execute(f'DELETE FROM {table}')
+        reset_fts_partitions(conn)
+        index_sql = _drop_indexes(conn, 'taxon')
+        # Defer merging text search index segments until after loading
+        _set_fts_automerge(conn, 0)
+
+        version = None
+        for member in tar:
+            if Path(member.name).name == MANIFEST_FILE:
+                version = _read_manifest(tar, member).get('version')
+                continue
+            table = TAXONOMY_TABLES.get(Path(member.name).name)
+            fileobj = tar.extractfile(member) if table else None
+            if fileobj is None:
+                logger.debug(f'Skipping archive member: {member.name}')
+                continue
+            logger.info(f'Loading {member.name} ({member.size / 1024**2:.1f} MB) into {table}')
+            counts[table] = _load_csv(conn, fileobj, table, member.size, batch_size, progress)
+
+        logger.info('Building indexes')
+        for sql in index_sql:
+            conn.execute(sql)
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')")
+        _set_fts_automerge(conn, FTS_DEFAULT_AUTOMERGE)
+        conn.execute('ANALYZE taxon')
+        set_taxonomy_version(conn, version)
+
+    logger.info(f'Loaded {counts} rows in {time() - start:.2f}s')
+    return counts
+
+
+def build_taxonomy_db(
+    archive_path: PathOrStr,
+    dest_path: PathOrStr,
+    batch_size: int = TAXON_LOAD_BATCH_SIZE,
+) -> str:
+    """Build a prebuilt taxonomy database from an archive of CSV files. The result is a vacuumed,
+    gzip-compressed SQLite file containing only the taxon and taxon text search tables, plus a
+    ``.sha256`` checksum file for the uncompressed database.
+
+    Args:
+        archive_path: Path to a taxonomy CSV archive, as used by :py:func:`load_taxonomy_archive`
+        dest_path: Path to write the compressed database, for example ``taxonomy.db.gz``
+
+    Returns:
+        SHA-256 checksum of the uncompressed database
+    """
+    dest_path = Path(dest_path)
+    with TemporaryDirectory() as tmp_dir:
+        tmp_db = Path(tmp_dir) / 'taxonomy.db'
+        create_table(DbTaxon, tmp_db)
+        create_taxon_fts_table(tmp_db)
+        load_taxonomy_archive(archive_path, tmp_db, batch_size=batch_size)
+        close_db(tmp_db)
+
+        # Use a single file without a WAL, so it can be distributed as-is
+        with closing(sqlite3.connect(tmp_db)) as conn:
+            conn.execute('PRAGMA journal_mode = DELETE')
+            conn.execute('VACUUM')
+
+        logger.info(f'Compressing {tmp_db} to {dest_path}')
+        sha256 = hashlib.sha256()
+        with open(tmp_db, 'rb') as f_in, gzip.open(dest_path, 'wb', compresslevel=9) as f_out:
+            while chunk := f_in.read(CHUNK_SIZE):
+                sha256.update(chunk)
+                f_out.write(chunk)
+
+    checksum = sha256.hexdigest()
+    _checksum_path(dest_path).write_text(f'{checksum}  {tmp_db.name}\n')
+    return checksum
+
+
+def install_taxonomy_db(
+    prebuilt_path: PathOrStr,
+    db_path: PathOrStr = DB_PATH,
+    checksum: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> dict[str, int]:
+    """Install taxon and taxon text search tables from a prebuilt taxonomy database (see
+    :py:func:`build_taxonomy_db`), replacing any existing rows.
+
+    The database is decompressed next to ``db_path`` and verified against its checksum, and then
+    attached and copied in a single transaction. If the text search table definitions match, its
+    index is copied as-is instead of being rebuilt.
+
+    Args:
+        prebuilt_path: Path to a gzip-compressed SQLite database
+        db_path: SQLite database path. Tables must already exist.
+        checksum: Expected SHA-256 checksum of the uncompressed database; defaults to the contents
+            of the ``.sha256`` file next to ``prebuilt_path``
+        progress: Callback to receive progress while decompressing
+
+    Returns:
+        Number of rows loaded per table
+
+    Raises:
+        :py:exc:`ChecksumError` if the decompressed database doesn't match the expected checksum
+    """
+    start = time()
+    prebuilt_path, db_path = Path(prebuilt_path), Path(db_path)
+    checksum = checksum or _checksum_path(prebuilt_path).read_text().split()[0]
+    tmp_path = db_path.with_name(f'{db_path.name}.taxonomy.tmp')
+
+    try:
+        _decompress(prebuilt_path, tmp_path, checksum, progress)
+        with connect(db_path) as conn:
+            conn.execute('ATTACH DATABASE ? AS prebuilt', (str(tmp_path),))
+            try:
+                counts = _copy_tables(conn)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute('DETACH DATABASE prebuilt')
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    # FTS5 caches index structure per connection, which isn't updated by writes to shadow tables
+    get_db(db_path).dispose()
+    logger.info(f'Installed {counts} rows in {time() - start:.2f}s')
+    return counts
+
+
+def get_taxonomy_version(db_path: PathOrStr = DB_PATH) -> Optional[str]:
+    """Get the version of taxonomy data currently loaded, if known"""
+    try:
+        with connect(db_path) as conn:
+            row = conn.execute(
+                "SELECT value FROM taxonomy_metadata WHERE key = 'version'"
+            ).fetchone()
+    except sqlite3.OperationalError:
+        return None  # Table doesn't exist yet
+    return row[0] if row else None
+
+
+def set_taxonomy_version(conn: Connection, version: Optional[str]):
+    """Save the version of taxonomy data currently loaded, using an existing connection. If the
+    version is unknown, any previous version is removed.
+    """
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS taxonomy_metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+    )
+    if version:
+        conn.execute(
+            "INSERT OR REPLACE INTO taxonomy_metadata (key, value) VALUES ('version', ?)",
+            (version,),
+        )
+    else:
+        conn.execute("DELETE FROM taxonomy_metadata WHERE key = 'version'")
+
+
+def _read_manifest(tar: tarfile.TarFile, member: tarfile.TarInfo) -> dict:
+    fileobj = tar.extractfile(member)
+    return json.load(fileobj) if fileobj else {}
+
+
+def _checksum_path(path: Path) -> Path:
+    """Get the checksum file path for a compressed database, e.g. ``taxonomy.db.sha256``"""
+    return path.with_suffix('.sha256')
+
+
+def _decompress(
+    src_path: Path, dest_path: Path, checksum: str, progress: Optional[ProgressCallback]
+):
+    """Decompress a gzip file in chunks, and verify the checksum of the decompressed data"""
+    logger.info(f'Decompressing {src_path} ({src_path.stat().st_size / 1024**2:.1f} MB)')
+    sha256 = hashlib.sha256()
+    total_bytes = src_path.stat().st_size
+    with (
+        open(src_path, 'rb') as f_raw,
+        gzip.GzipFile(fileobj=f_raw) as f_in,
+        open(dest_path, 'wb') as f_out,
+    ):
+        while chunk := f_in.read(CHUNK_SIZE):
+            sha256.update(chunk)
+            f_out.write(chunk)
+            if progress:
+                progress(LoadProgress(src_path.name, 0, f_raw.tell(), total_bytes))
+
+    if sha256.hexdigest() != checksum.lower():
+        raise ChecksumError(
+            f'Checksum mismatch for {src_path}: expected {checksum}, got {sha256.hexdigest()}'
+        )
+
+
+def _copy_tables(conn: Connection) -> dict[str, int]:
+    """Copy taxonomy tables from an attached ``prebuilt`` database into the main database"""
+    for table in TAXONOMY_TABLES.values():
+        conn.execute(f'DELETE FROM main.{table}')
+    reset_fts_partitions(conn)
+    index_sql = _drop_indexes(conn, 'taxon')
+
+    # Taxa are always loaded as partial records
+    columns = _get_columns(conn, 'main', 'taxon') & _get_columns(conn, 'prebuilt', 'taxon')
+    cols = ','.join(sorted(columns - {'partial'}))
+    n_taxa = conn.execute(
+        f'INSERT INTO main.taxon ({cols}, partial) SELECT {cols}, 1 FROM prebuilt.taxon'
+    ).rowcount
+
+    # With identical table definitions, the index can be copied directly instead of rebuilt
+    if _get_table_sql(conn, 'main', FTS_TABLE) == _get_table_sql(conn, 'prebuilt', FTS_TABLE):
+        for table in FTS_SHADOW_TABLES:
+            if _get_table_sql(conn, 'main', table):
+                conn.execute(f'DELETE FROM main.{table}')
+                conn.execute(f'INSERT INTO main.{table} SELECT * FROM prebuilt.{table}')
+    else:
+        logger.info('Text search table definitions differ; rebuilding index')
+        columns = _get_columns(conn, 'main', FTS_TABLE) & _get_columns(conn, 'prebuilt', FTS_TABLE)
+        cols = ','.join(sorted(columns))
+        conn.execute(
+            f'INSERT INTO main.{FTS_TABLE} ({cols}) SELECT {cols} FROM prebuilt.{FTS_TABLE}'
+        )
+        conn.execute(f"INSERT INTO main.{FTS_TABLE}({FTS_TABLE}) VALUES('optimize')")
+    n_fts = conn.execute(f'SELECT COUNT(*) FROM main.{FTS_TABLE}').fetchone()[0]
+
+    for sql in index_sql:
+        conn.execute(sql)
+    conn.execute('ANALYZE main.taxon')
+
+    version = None
+    if _get_table_sql(conn, 'prebuilt', 'taxonomy_metadata'):
+        row = conn.execute(
+            "SELECT value FROM prebuilt.taxonomy_metadata WHERE key = 'version'"
+        ).fetchone()
+        version = row[0] if row else None
+    set_taxonomy_version(conn, version)
+    return {'taxon': n_taxa, FTS_TABLE: n_fts}
+
+
+def _get_columns(conn: Connection, schema: str, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')}
+
+
+def _get_table_sql(conn: Connection, schema: str, table: str) -> Optional[str]:
+    row = conn.execute(
+        f'SELECT sql FROM {schema}.sqlite_master WHERE type = ? AND name = ?', ('table', table)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _load_csv(
+    conn: Connection,
+    fileobj: IO[bytes],
+    table: str,
+    total_bytes: int,
+    batch_size: int,
+    progress: Optional[ProgressCallback] = None,
+) -> int:
+    """Insert rows from a CSV file object in batches, and return the number of rows inserted"""
+    reader = csv.reader(_decode_lines(fileobj))
+    header = next(reader)
+
+    # Only load columns that exist in the table; taxa are always loaded as partial records
+    table_columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    col_idxs = [i for i, col in enumerate(header) if col in table_columns and col != 'partial']
+    columns = [header[i] for i in col_idxs]
+    # Convert empty strings to null in SQL instead of python
+    placeholders = ["NULLIF(?,'')"] * len(columns)
+    if table == 'taxon':
+        columns.append('partial')
+        placeholders.append('1')
+    stmt = f'INSERT INTO {table} ({",".join(columns)}) VALUES ({",".join(placeholders)})'
+
+    n_rows = 0
+    while batch := [[row[i] for i in col_idxs] for row in islice(reader, batch_size)]:
+        conn.executemany(stmt, batch)
+        n_rows += len(batch)
+        if progress:
+            progress(LoadProgress(table, n_rows, fileobj.tell(), total_bytes))
+    return n_rows
+
+
+def _decode_lines(fileobj: IO[bytes]) -> Iterator[str]:
+    """Decode lines from a binary file. Files from a tar stream aren't seekable, so they can't be
+    wrapped with ``io.TextIOWrapper``.
+    """
+    for line in fileobj:
+        yield line.decode('utf-8')
+
+
+def _drop_indexes(conn: Connection, table: str) -> list[str]:
+    """Drop all secondary indexes on a table, and return the SQL to recreate them"""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+        'AND sql IS NOT NULL',
+        (table,),
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    return [sql for _, sql in indexes]
+
+
+def _set_fts_automerge(conn: Connection, value: int):
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES('automerge', {value})")
@@ -1,4 +1,11 @@
 # ruff: noqa: F401
+from naturtag.utils.cancellation import (
+    CancelToken,
+    TaskCancelled,
+    TaskTimeout,
+    check_cancelled,
+    get_cancel_token,
+)
 from naturtag.utils.click_help_colors import HelpColorsCommand, HelpColorsGroup
 from naturtag.utils.i18n import read_display_locales, read_locales
 from naturtag.utils.image_glob import get_valid_image_paths, is_raw_path
@@ -0,0 +1,85 @@
+"""Cooperative cancellation for long-running background tasks.
+
+A running thread can't be stopped from outside, so instead each task gets a
+:py:class:`CancelToken`, which long-running operations check between steps (for example, between
+pages, images, or API requests). The token for the current task is available from any function it
+calls via :py:func:`check_cancelled`, so intermediate code doesn't need to pass it along. Outside of
+a task (for example, from the CLI), checks never raise.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Event
+from time import monotonic
+from typing import Iterator, Optional
+
+
+class TaskCancelled(BaseException):
+    """Raised by a cancellation check if the current task has been cancelled.
+
+    Like :py:exc:`asyncio.CancelledError`, this is a ``BaseException`` so it isn't caught by code
+    that handles errors for individual items with ``except Exception``.
+    """
+
+
+class TaskTimeout(TimeoutError):
+    """Raised by a cancellation check if the current task has run longer than its timeout"""
+
+
+class CancelToken:
+    """Cancellation flag and optional timeout for a single task (thread-safe)
+
+    Args:
+        timeout: Max time the task may run, in seconds, starting from when it's activated
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.deadline: Optional[float] = None
+        self._event = Event()
+
+    def cancel(self):
+        """Request cancellation. The task will stop at its next cancellation check."""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def timed_out(self) -> bool:
+        return self.deadline is not None and monotonic() >= self.deadline
+
+    def check(self):
+        """Raise an error if the task has been cancelled or has timed out"""
+        if self.cancelled:
+            raise TaskCancelled()
+        if self.timed_out:
+            raise TaskTimeout(f'Task exceeded timeout of {self.timeout}s')
+
+    @contextmanager
+    def activate(self) -> Iterator['CancelToken']:
+        """Start the timeout (if any), and make this the current token for the calling thread"""
+        if self.timeout is not None:
+            self.deadline = monotonic() + self.timeout
+        reset_token = _current_token.set(self)
+        try:
+            yield self
+        finally:
+            _current_token.reset(reset_token)
+
+
+_current_token: ContextVar[Optional[CancelToken]] = ContextVar('cancel_token', default=None)
+
+
+def get_cancel_token() -> Optional[CancelToken]:
+    """Get the cancellation token for the task running in the current thread, if any"""
+    return _current_token.get()
+
+
+def check_cancelled():
+    """Raise an error if the task running in the current thread has been cancelled or has timed
+    out. No-op if not called from a task.
+    """
+    if token := _current_token.get():
+        token.check()
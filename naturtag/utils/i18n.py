@@ -1,7 +1,6 @@
 """Internationalization utilities"""
 
 import json
-import sqlite3
 from logging import getLogger
 
 from naturtag.constants import DB_PATH, LOCALES_PATH, PathOrStr
@@ -10,12 +9,12 @@ logger = getLogger(__name__)
 
 
 def get_locales(db_path: PathOrStr = DB_PATH) -> dict[str, str]:
-    """Get all locale codes represented in the FTS table and their localised names"""
+    """Get all locale codes represented in taxon text search and their localised names"""
     from babel import Locale, UnknownLocaleError
 
-    with sqlite3.connect(db_path) as conn:
-        results = conn.execute('SELECT DISTINCT(language_code) from taxon_fts').fetchall()
-        locales = sorted([r[0] for r in results if r[0]])
+    from naturtag.storage.taxon_fts import get_fts_languages
+
+    locales = get_fts_languages(db_path)
 
     locale_dict = {}
     for locale in locales:
@@ -24,7 +23,7 @@ def get_locales(db_path: PathOrStr = DB_PATH) -> dict[str, str]:
         except UnknownLocaleError as e:
             logger.warning(e)
 
-    locale_dict.pop('und')  # "Undefined"; seems to be a mix of languages
+    locale_dict.pop('und', None)  # "Undefined"; seems to be a mix of languages
     return locale_dict
 
 
@@ -10,6 +10,7 @@ from PIL.ImageQt import ImageQt
 from PySide6.QtGui import QImage
 
 from naturtag.constants import EXIF_ORIENTATION_ID, SIZE_DEFAULT, Dimensions, PathOrStr
+from naturtag.utils.cancellation import check_cancelled
 from naturtag.utils.image_glob import is_raw_path
 
 logger = getLogger().getChild(__name__)
@@ -34,9 +35,13 @@ def generate_thumbnail(
     """
     logger.debug(f'Thumbnails: Generating {target_size} thumbnail for {path}')
 
-    # Resize if necessary, or just copy the image to the cache if it's already thumbnail size
+    # Resize if necessary, or just copy the image to the cache if it's already thumbnail size.
+    # Check for cancellation between steps, since decoding large (especially RAW) images is slow.
+    check_cancelled()
     image = _get_orientated_image(path, default_flip=default_flip)
+    check_cancelled()
     image = _crop_square(image)
+    check_cancelled()
     if image.size[0] > target_size[0] or image.size[1] > target_size[1]:
         image.thumbnail(target_size)
     else:
@@ -1,14 +1,11 @@
-import re
 from logging import getLogger
 
-from pyinaturalist_convert import TaxonAutocompleter
 from PySide6.QtCore import QEvent, QStringListModel, Qt, QTimer, Signal, Slot
 from PySide6.QtWidgets import QCompleter, QLineEdit, QToolButton
 
+from naturtag.storage.taxon_fts import INVALID_FTS5_CHARS, TaxonAutocompleter
 from naturtag.widgets.style import fa_icon
 
-INVALID_FTS5_CHARS = re.compile(r'[^\w\s\-\'\.]')
-
 logger = getLogger(__name__)
 
 
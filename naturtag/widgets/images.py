@@ -13,7 +13,15 @@ from PySide6.QtGui import QBrush, QColor, QFont, QIcon, QPainter, QPixmap
 from PySide6.QtWidgets import QLabel, QLayout, QScrollArea, QSizePolicy, QWidget
 from shiboken6 import isValid
 
-from naturtag.constants import SIZE_ICON, SIZE_ICON_SM, SIZE_SM, IconDimensions, IntOrStr, PathOrStr
+from naturtag.constants import (
+    SIZE_ICON,
+    SIZE_ICON_SM,
+    SIZE_SM,
+    IconDimensions,
+    IntOrStr,
+    PathOrStr,
+    Resource,
+)
 from naturtag.utils import generate_preview, is_raw_path
 from naturtag.widgets import StylableWidget, VerticalLayout
 from naturtag.widgets.layouts import GridLayout, HorizontalLayout
@@ -55,6 +63,8 @@ def set_pixmap_async(
         app.img_fetcher.get_qimage,
         priority=priority,
         group='images',
+        resource=Resource.DISK if kwargs.get('path') else Resource.NETWORK,
+        key=_get_image_key(**kwargs),
         **kwargs,
     )
 
@@ -65,6 +75,17 @@ def set_pixmap_async(
     future.on_result.connect(_set_pixmap)
 
 
+def _get_image_key(
+    path: Optional[PathOrStr] = None,
+    photo: Optional[Photo] = None,
+    url: Optional[str] = None,
+    size: Optional[str] = None,
+) -> Optional[tuple]:
+    """Get a key to deduplicate image loading tasks, if the image source is known"""
+    source = str(path) if path else (url or (photo.url if photo else None))
+    return ('image', source, size) if source else None
+
+
 def set_pixmap(pixmap_label: QLabel, *args, **kwargs):
     """Fetch an image from either a local path or remote URL."""
     from naturtag.controllers import get_app
@@ -531,7 +552,9 @@ class ImageWindow(StylableWidget):
         from naturtag.controllers import get_app
 
         app = get_app()
-        future = app.threadpool.schedule(self._get_raw_preview, path=path)
+        future = app.threadpool.schedule(
+            self._get_raw_preview, path=path, resource=Resource.CPU, key=('raw_preview', path)
+        )
 
         def _apply(pixmap: QPixmap):
             if isValid(self.image) and self.selected_path == path:
@@ -1,5 +1,10 @@
 #!/usr/bin/env python
-# Download, convert, and aggregate taxonomy data from iNat DwC-A export
+# Download, convert, and aggregate taxonomy data from iNat DwC-A export.
+# With --prebuilt, instead build a prebuilt SQLite taxonomy db from the exported CSV archive.
+# With --delta, instead build an incremental update between two taxonomy versions.
+# (see export_taxa.sh)
+from argparse import ArgumentParser
+
 from pyinaturalist_convert import (
     aggregate_taxon_db,
     enable_logging,
@@ -7,7 +12,44 @@ from pyinaturalist_convert import (
     load_fts_taxa,
 )
 
+from naturtag.constants import DATA_DIR, PACKAGED_TAXON_DB, PACKAGED_TAXON_SQLITE
+from naturtag.storage.taxonomy_delta import build_taxonomy_delta
+from naturtag.storage.taxonomy_loader import build_taxonomy_db
+
+parser = ArgumentParser()
+parser.add_argument(
+    '--prebuilt',
+    action='store_true',
+    help=f'Build {PACKAGED_TAXON_SQLITE.name} from {PACKAGED_TAXON_DB.name}',
+)
+parser.add_argument(
+    '--delta',
+    nargs=4,
+    metavar=('OLD_DB', 'NEW_DB', 'FROM_VERSION', 'TO_VERSION'),
+    help='Build a taxonomy delta between two source databases',
+)
+parser.add_argument('--min-observations', type=int, default=20)
+parser.add_argument('--language', default='en')
+args = parser.parse_args()
 enable_logging('DEBUG')
-load_dwca_tables()
-df = aggregate_taxon_db()
-load_fts_taxa(languages='all')
+
+if args.prebuilt:
+    checksum = build_taxonomy_db(PACKAGED_TAXON_DB, PACKAGED_TAXON_SQLITE)
+    print(f'{PACKAGED_TAXON_SQLITE}: {checksum}')
+elif args.delta:
+    old_db, new_db, from_version, to_version = args.delta
+    dest_path = DATA_DIR / f'taxonomy-delta-{to_version}.tar.gz'
+    counts = build_taxonomy_delta(
+        old_db,
+        new_db,
+        dest_path,
+        from_version,
+        to_version,
+        min_observations=args.min_observations,
+        language=args.language,
+    )
+    print(f'{dest_path}: {counts}')
+else:
+    load_dwca_tables()
+    df = aggregate_taxon_db()
+    load_fts_taxa(languages='all')
@@ -26,4 +26,10 @@ else
   tar_target=.
 fi
 
+# Include prebuilt SQLite taxonomy db, if it has been built (see export_taxa.sh)
+PREBUILT_DB=$ROOT_DIR/assets/data/taxonomy.db.gz
+if [[ -f "$PREBUILT_DB" ]]; then
+  cp -v "$PREBUILT_DB" "${PREBUILT_DB%.gz}.sha256" "$ASSETS/"
+fi
+
 tar -C "$tar_dir" -czvf "${ROOT_DIR}/naturtag-${dist_name}.tar.gz" "$tar_target"
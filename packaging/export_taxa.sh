@@ -2,6 +2,8 @@
 # Export a SQLite taxon + FTS db in two versions:
 #   * A minimal English-only subset to include in application package
 #   * Full taxonomy data including common names for all languages
+# Set PREBUILT=1 to also build a prebuilt SQLite version of the minimal subset
+# Set PREV_DB and PREV_VERSION to also build an incremental update from a previous taxonomy version
 
 DATA_DIR=$HOME/.local/share/pyinaturalist/
 SRC_DB=$DATA_DIR/observations.db
@@ -11,6 +13,8 @@ MIN_ARCHIVE=assets/data/taxonomy.tar.gz
 MIN_OBSERVATIONS=20  # Only export taxa with at least this many RG observations
 FULL_DEST_DB=naturtag.db
 FULL_ARCHIVE=taxonomy_full.tar.gz
+TAXONOMY_VERSION=${TAXONOMY_VERSION:-$(date +%Y.%m)}
+MANIFEST=manifest.json
 
 # Minified taxonomy
 # ----------------------------------------
@@ -33,8 +37,23 @@ sqlite3 -header -csv $SRC_DB \
     > $TAXON_FTS_CSV
 
 echo 'Compressing...'
-tar -I 'gzip -9' -cvf $MIN_ARCHIVE $TAXON_CSV $TAXON_FTS_CSV
-rm -v $TAXON_CSV $TAXON_FTS_CSV
+echo "{\"version\": \"$TAXONOMY_VERSION\"}" > $MANIFEST
+tar -I 'gzip -9' -cvf $MIN_ARCHIVE $MANIFEST $TAXON_CSV $TAXON_FTS_CSV
+rm -v $MANIFEST $TAXON_CSV $TAXON_FTS_CSV
+# Published checksum, to verify downloads
+(cd "$(dirname $MIN_ARCHIVE)" && sha256sum "$(basename $MIN_ARCHIVE)" > "$(basename $MIN_ARCHIVE).sha256")
+
+if [[ "${PREBUILT:-0}" == 1 ]]; then
+    echo 'Building prebuilt SQLite db (minified)...'
+    python packaging/build_taxon_db.py --prebuilt
+fi
+
+if [[ -n "${PREV_DB:-}" ]]; then
+    echo "Building taxonomy delta ($PREV_VERSION -> $TAXONOMY_VERSION)..."
+    python packaging/build_taxon_db.py \
+        --delta "$PREV_DB" "$SRC_DB" "$PREV_VERSION" "$TAXONOMY_VERSION" \
+        --min-observations $MIN_OBSERVATIONS
+fi
 
 # Full taxonomy
 # ----------------------------------------
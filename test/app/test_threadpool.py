@@ -4,8 +4,11 @@ import threading
 from unittest.mock import MagicMock
 
 import pytest
+from PySide6.QtCore import QThread
 
-from naturtag.app.threadpool import PaginatedWorker, Worker
+from naturtag.app.threadpool import PaginatedWorker, QueuedTask, Worker
+from naturtag.constants import THREADPOOL_AGING_INTERVAL, Resource
+from naturtag.utils import CancelToken, TaskTimeout, check_cancelled
 
 
 def _make_paginator(pages):
@@ -289,6 +292,14 @@ def test_schedule__group_worker_removed_on_completion(thread_pool, qtbot):
     qtbot.waitUntil(lambda: len(thread_pool._group_workers['g1']) == 0, timeout=3000)
 
 
+def test_schedule_background(thread_pool, qtbot):
+    signals = thread_pool.schedule_background(lambda x: x * 2, x=21)
+    with qtbot.waitSignal(signals.on_result, timeout=3000) as blocker:
+        pass
+    assert blocker.args == [42]
+    assert thread_pool.progress.maximum() == 0
+
+
 def _pages():
     yield [1, 2]
     yield [3, 4]
@@ -382,3 +393,200 @@ def test_cancel__group_does_not_affect_other_groups(thread_pool):
 def test_cancel__nonexistent_group(thread_pool):
     # Should be a no-op, no error
     thread_pool.cancel(group='does_not_exist')
+
+
+def test_schedule__resource_limit(thread_pool, qtbot):
+    """Tasks over a resource limit should wait in a queue until a slot is free"""
+    thread_pool.resource_limits[Resource.NETWORK] = 1
+    blocker = threading.Event()
+    thread_pool.schedule(lambda: blocker.wait(timeout=5), resource=Resource.NETWORK)
+    signals = thread_pool.schedule(lambda: 'queued', resource=Resource.NETWORK)
+
+    assert len(thread_pool._resource_workers[Resource.NETWORK]) == 1
+    assert len(thread_pool._queued_tasks[Resource.NETWORK]) == 1
+
+    with qtbot.waitSignal(signals.on_result, timeout=3000) as blocker_result:
+        blocker.set()
+    assert blocker_result.args == ['queued']
+    assert not thread_pool._queued_tasks[Resource.NETWORK]
+
+
+def test_schedule__resource_priority(thread_pool):
+    """Queued tasks should start in priority order"""
+    thread_pool.resource_limits[Resource.DISK] = 1
+    blocker = threading.Event()
+    order = []
+    thread_pool.schedule(lambda: blocker.wait(timeout=5), resource=Resource.DISK)
+    thread_pool.schedule(lambda: order.append('low'), QThread.LowPriority, resource=Resource.DISK)
+    thread_pool.schedule(lambda: order.append('high'), QThread.HighPriority, resource=Resource.DISK)
+
+    blocker.set()
+    thread_pool.waitForDone(5000)
+    assert order == ['high', 'low']
+
+
+def test_queued_task__aging():
+    task = QueuedTask(MagicMock(), QThread.LowPriority.value, queued_at=0)
+    assert task.effective_priority(0) == QThread.LowPriority.value
+    aged = task.effective_priority(THREADPOOL_AGING_INTERVAL * 2)
+    assert aged == QThread.LowPriority.value + 2
+    assert task.effective_priority(THREADPOOL_AGING_INTERVAL * 100) == QThread.HighestPriority.value
+
+
+def test_schedule__dedupe(thread_pool):
+    """A task with the same key as a queued or running task should reuse the existing task"""
+    blocker = threading.Event()
+    callback = MagicMock(side_effect=lambda: blocker.wait(timeout=5))
+    signals_1 = thread_pool.schedule(callback, key=('taxon', 1))
+    signals_2 = thread_pool.schedule(callback, key=('taxon', 1))
+    signals_3 = thread_pool.schedule(callback, key=('taxon', 2))
+
+    assert signals_1 is signals_2
+    assert signals_1 is not signals_3
+    assert thread_pool.progress.maximum() == 2
+    blocker.set()
+    thread_pool.waitForDone(5000)
+    assert callback.call_count == 2
+
+    # Once finished, the same key should schedule a new task
+    assert thread_pool.schedule(callback, key=('taxon', 1)) is not signals_1
+
+
+def test_schedule__dedupe__different_groups(thread_pool, qtbot):
+    """Tasks with the same key in different groups should not be shared, so cancelling one group
+    doesn't drop results for the other
+    """
+    thread_pool.setMaxThreadCount(1)
+    blocker = threading.Event()
+    thread_pool.schedule(lambda: blocker.wait(timeout=5))
+    signals_1 = thread_pool.schedule(lambda: 'taxon', group='taxonomy', key=('taxon', 1))
+    signals_2 = thread_pool.schedule(lambda: 'taxon', key=('taxon', 1))
+    assert signals_1 is not signals_2
+
+    thread_pool.cancel(group='taxonomy')
+    with qtbot.waitSignal(signals_2.on_result, timeout=3000) as result:
+        blocker.set()
+    assert result.args == ['taxon']
+
+
+def test_cancel__group_queued_emits_on_finished(thread_pool):
+    """Cancelling a queued task should emit on_finished and release its worker reference"""
+    thread_pool.resource_limits[Resource.NETWORK] = 1
+    blocker = threading.Event()
+    thread_pool.schedule(lambda: blocker.wait(timeout=5), resource=Resource.NETWORK)
+    signals = thread_pool.schedule(lambda: 1, group='g', resource=Resource.NETWORK)
+    on_finished = MagicMock()
+    signals.on_finished.connect(on_finished)
+    assert len(thread_pool._live_workers) == 2
+
+    thread_pool.cancel(group='g')
+
+    on_finished.assert_called_once()
+    assert len(thread_pool._live_workers) == 1
+    blocker.set()
+
+
+def test_cancel__group_releases_resource(thread_pool):
+    """Cancelling queued tasks should remove them from resource queues and release their keys"""
+    thread_pool.resource_limits[Resource.NETWORK] = 1
+    blocker = threading.Event()
+    thread_pool.schedule(lambda: blocker.wait(timeout=5), resource=Resource.NETWORK)
+    thread_pool.schedule(lambda: 1, group='g', resource=Resource.NETWORK, key='k')
+
+    thread_pool.cancel(group='g')
+
+    assert not thread_pool._queued_tasks[Resource.NETWORK]
+    assert ('g', 'k') not in thread_pool._keyed_workers
+    blocker.set()
+
+
+def test_worker_run__cancel_token_passed():
+    def callback(cancel_token: CancelToken):
+        return cancel_token
+
+    worker = Worker(callback)
+    on_result = MagicMock()
+    worker.signals.on_result.connect(on_result)
+
+    worker.run()
+
+    on_result.assert_called_once_with(worker.token)
+
+
+def test_worker_run__cancelled_before_start():
+    callback = MagicMock()
+    worker = Worker(callback)
+    on_result = MagicMock()
+    on_error = MagicMock()
+    on_progress = MagicMock()
+    worker.signals.on_result.connect(on_result)
+    worker.signals.on_error.connect(on_error)
+    worker.signals.on_progress.connect(on_progress)
+
+    worker.cancel()
+    worker.run()
+
+    callback.assert_not_called()
+    on_result.assert_not_called()
+    on_error.assert_not_called()
+    on_progress.assert_called_once_with(1)
+
+
+def test_worker_run__timeout():
+    def callback():
+        worker.token.deadline = 0  # Simulate an expired deadline
+        check_cancelled()
+
+    worker = Worker(callback, timeout=1)
+    on_error = MagicMock()
+    worker.signals.on_error.connect(on_error)
+
+    worker.run()
+
+    assert isinstance(on_error.call_args.args[0], TaskTimeout)
+
+
+def test_paginated_worker_run__cancelled_between_pages():
+    worker = PaginatedWorker(_make_paginator([[1], [2], [3]]))
+    on_result = MagicMock(side_effect=lambda _: worker.cancel())
+    on_complete = MagicMock()
+    worker.signals.on_result.connect(on_result)
+    worker.signals.on_complete.connect(on_complete)
+
+    worker.run()
+
+    on_result.assert_called_once_with([1])
+    on_complete.assert_not_called()
+
+
+def test_cancel__group_running(thread_pool, qtbot):
+    """Cancelling a group should signal running tasks to stop at their next check"""
+    started = threading.Event()
+
+    def callback(cancel_token: CancelToken):
+        started.set()
+        while not cancel_token.cancelled:
+            QThread.msleep(10)
+        cancel_token.check()
+
+    signals = thread_pool.schedule(callback, group='g')
+    on_result = MagicMock()
+    signals.on_result.connect(on_result)
+    assert started.wait(timeout=3)
+
+    with qtbot.waitSignal(signals.on_finished, timeout=3000):
+        thread_pool.cancel(group='g')
+    on_result.assert_not_called()
+
+
+def test_schedule__key_not_reused_after_cancel(thread_pool):
+    thread_pool.setMaxThreadCount(1)
+    blocker = threading.Event()
+    thread_pool.schedule(lambda: blocker.wait(timeout=5))
+    signals_1 = thread_pool.schedule(lambda: 1, key='k')
+    thread_pool._keyed_workers[(None, 'k')].cancel()
+
+    signals_2 = thread_pool.schedule(lambda: 2, key='k')
+
+    assert signals_2 is not signals_1
+    blocker.set()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Microbenchmark for converting GPS coordinates one image at a time vs. in a single batch.
+
+Usage:
+    test/benchmark_gps.py [-n NUM_IMAGES] [-r REPEAT]
+"""
+
+import argparse
+from timeit import repeat
+
+import numpy as np
+
+from naturtag.metadata.gps import (
+    convert_coords_batch,
+    convert_dwc_coords,
+    convert_exif_coords,
+    convert_xmp_coords,
+    to_coords_batch,
+    to_exif_coords,
+    to_xmp_coords,
+)
+
+
+def make_metadata(n: int) -> tuple[list[tuple[float, float]], list[dict]]:
+    """Generate random coordinates, and metadata with a mix of EXIF-only and XMP-only tags"""
+    rng = np.random.default_rng(0)
+    coords = [
+        (float(lat), float(lon))
+        for lat, lon in zip(rng.uniform(-90, 90, n), rng.uniform(-180, 180, n), strict=True)
+    ]
+    metadata = [to_exif_coords(c) if i % 2 else to_xmp_coords(c) for i, c in enumerate(coords)]
+    return coords, metadata
+
+
+def convert_single(metadata: list[dict]):
+    return [
+        convert_dwc_coords(m) or convert_exif_coords(m) or convert_xmp_coords(m) for m in metadata
+    ]
+
+
+def to_tags_single(coords: list[tuple[float, float]]):
+    return [{**to_exif_coords(c, 10), **to_xmp_coords(c, 10)} for c in coords]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--num-images', type=int, default=50000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    coords, metadata = make_metadata(args.num_images)
+    accuracy = [10] * len(coords)
+    benchmarks = {
+        'Parse (single)': lambda: convert_single(metadata),
+        'Parse (batch)': lambda: convert_coords_batch(metadata),
+        'Format (single)': lambda: to_tags_single(coords),
+        'Format (batch)': lambda: to_coords_batch(coords, accuracy),
+    }
+
+    print(f'{args.num_images} images, best of {args.repeat}:')
+    for name, func in benchmarks.items():
+        elapsed = min(repeat(func, number=1, repeat=args.repeat))
+        per_image = elapsed / args.num_images * 1e6
+        print(f'  {name:<16} {elapsed * 1000:>9.1f} ms  ({per_image:.2f} µs/image)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Microbenchmark for parsing keyword-heavy image metadata, like that written by digiKam and
+Lightroom: flat keywords, taxonomy key-value pairs, and hierarchical keywords in multiple formats.
+
+Usage:
+    test/benchmark_keywords.py [-n NUM_IMAGES] [-r REPEAT]
+"""
+
+import argparse
+from timeit import repeat
+
+from naturtag.metadata import DerivedMetadata, KeywordMetadata
+
+TAXONOMY = [
+    ('kingdom', 'Animalia'),
+    ('phylum', 'Arthropoda'),
+    ('subphylum', 'Hexapoda'),
+    ('class', 'Insecta'),
+    ('subclass', 'Pterygota'),
+    ('order', 'Diptera'),
+    ('suborder', 'Brachycera'),
+    ('infraorder', 'Tabanomorpha'),
+    ('family', 'Rhagionidae'),
+    ('subfamily', 'Chrysopilinae'),
+    ('genus', 'Chrysopilus'),
+    ('species', 'Chrysopilus ornatus'),
+]
+COMMON_NAMES = ['Animals', 'Arthropods', 'Insects', 'Flies', 'Snipe Flies', 'Ornate Snipe Fly']
+EXTRA_KEYWORDS = [f'Keyword {i}' for i in range(20)]
+EVENT_CHAINS = [f'Events|2024|Trip {i}|Day {j}' for i in range(5) for j in range(4)]
+
+
+def make_metadata(idx: int) -> dict:
+    """Generate metadata with keywords in all formats that an image manager might write"""
+    kv_keywords = [f'taxonomy:{rank}={name}' for rank, name in TAXONOMY]
+    kv_keywords += [f'inat:taxon_id={idx}', f'inat:observation_id={idx * 10}']
+    names = [name for _, name in TAXONOMY]
+    hier_keywords = ['|'.join(names[: i + 1]) for i in range(len(names))]
+    hier_keywords += ['|'.join(COMMON_NAMES[: i + 1]) for i in range(len(COMMON_NAMES))]
+    hier_keywords += EVENT_CHAINS
+    flat_keywords = kv_keywords + COMMON_NAMES + EXTRA_KEYWORDS
+
+    return {
+        'Exif.Image.XPSubject': ','.join(flat_keywords),
+        'Iptc.Application2.Subject': flat_keywords,
+        'Xmp.dc.subject': [f'"{kw}"' if ' ' in kw else kw for kw in flat_keywords],
+        'Exif.Image.XPKeywords': ','.join(hier_keywords),
+        'Iptc.Application2.Keywords': hier_keywords,
+        'Xmp.lr.hierarchicalSubject': hier_keywords,
+        'Xmp.digiKam.TagsList': [kw.replace('|', '/') for kw in hier_keywords],
+    }
+
+
+def parse_derived(images: list[DerivedMetadata]):
+    """Parse keywords and get the lowest rank for each image, without any cached values"""
+    for image in images:
+        image._reset_derived_properties()
+    return [image.min_rank for image in images]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--num-images', type=int, default=2000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    all_metadata = [make_metadata(i) for i in range(args.num_images)]
+    images = []
+    for metadata in all_metadata:
+        image = DerivedMetadata()
+        image.exif = {k: v for k, v in metadata.items() if k.startswith('Exif.')}
+        image.iptc = {k: v for k, v in metadata.items() if k.startswith('Iptc.')}
+        image.xmp = {k: v for k, v in metadata.items() if k.startswith('Xmp.')}
+        images.append(image)
+
+    n_keywords = len(KeywordMetadata(all_metadata[0]).keywords)
+    benchmarks = {
+        'KeywordMetadata': lambda: [KeywordMetadata(m) for m in all_metadata],
+        'Keywords + rank': lambda: parse_derived(images),
+    }
+
+    print(f'{args.num_images} images ({n_keywords} unique keywords each), best of {args.repeat}:')
+    for name, func in benchmarks.items():
+        elapsed = min(repeat(func, number=1, repeat=args.repeat))
+        per_image = elapsed / args.num_images * 1e6
+        print(f'  {name:<16} {elapsed * 1000:>9.1f} ms  ({per_image:.1f} µs/image)')
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,8 @@ from PySide6.QtWidgets import QMenu, QWidget
 
 from naturtag.app.threadpool import ProgressBar, ThreadPool, WorkerSignals
 from naturtag.storage import Settings
+from naturtag.storage.db import close_all
+from naturtag.storage.network import NetworkPolicy
 
 prettyprinter.install_extras(exclude=['django'])
 
@@ -61,6 +63,15 @@ def _make_obs(**kwargs) -> Observation:
     return Observation(**defaults)
 
 
+def _make_db_client(db_path: Path, network_policy: NetworkPolicy = NetworkPolicy.ONLINE):
+    """Build a mock iNatDbClient, for testing controllers with a real database"""
+    return MagicMock(
+        db_path=db_path,
+        network_policy=network_policy,
+        offline=network_policy == NetworkPolicy.OFFLINE,
+    )
+
+
 def _make_schedule_side_effect(futures: list[WorkerSignals]):
     """Create a side_effect for threadpool.schedule that returns real WorkerSignals."""
 
@@ -90,6 +101,7 @@ def mock_app(qapp, tmp_path):
 
     qapp.client = MagicMock()
     qapp.client.observations.count_db.return_value = 0
+    qapp.client.offline = False
 
     qapp.state = MagicMock()
     qapp.state.window_size = (800, 600)
@@ -150,6 +162,13 @@ def _mock_set_pixmap(request):
         yield
 
 
+@pytest.fixture(autouse=True)
+def _close_db_connections():
+    """Close pooled connections to temporary test databases after each test"""
+    yield
+    close_all()
+
+
 @pytest.fixture
 def progress_bar(qtbot):
     bar = ProgressBar()
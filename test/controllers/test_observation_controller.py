@@ -1,12 +1,15 @@
 """Tests for ObservationController."""
 
+from datetime import date
 from unittest.mock import MagicMock, patch
 
 import pytest
 from pyinaturalist import Photo
 from PySide6.QtCore import QThread
 
+from naturtag.constants import Resource
 from naturtag.controllers.observation_controller import DbPageResult, ObservationController
+from naturtag.storage import ObservationCursor, ObservationFilters
 from test.conftest import THUMB_URL, _make_obs, _make_taxon
 
 
@@ -106,6 +109,77 @@ def test_update_pagination_buttons(
     assert controller.page_label.text() == label
 
 
+def test_search_panel__filters(controller, mock_app):
+    """Search panel inputs should be converted into search filters for the current user"""
+    search = controller.search
+    search.text_input.setText(' monarch ')
+    search.set_taxon_id(47224)
+    search.d1.set_date(date(2024, 6, 1))
+    search.place_input.setText('Oregon')
+    search.quality_grade.setCurrentText('research')
+
+    assert search.filters == ObservationFilters(
+        q='monarch',
+        username='testuser',
+        taxon_id=47224,
+        d1=date(2024, 6, 1),
+        place='Oregon',
+        quality_grade='research',
+    )
+
+    search.reset()
+    assert search.filters == ObservationFilters(username='testuser')
+
+
+def test_search_observations(controller, mock_app):
+    """A search should load results from the local DB, and paginate with keyset cursors"""
+    filters = ObservationFilters(q='monarch')
+    cursor = ObservationCursor('2024-01-01', 5)
+    mock_app.client.observations.search_db.return_value = ([_make_obs(id=1)], cursor)
+    controller.page = 3
+
+    controller.search.on_search.emit(filters)
+    assert controller.filters == filters
+    assert controller.page == 1
+    result = controller._get_search_page()
+    mock_app.client.observations.search_db.assert_called_once_with(filters, after=None)
+
+    controller.on_search_page_loaded(result)
+    assert controller._page_cursors[2] == cursor
+    assert controller.next_button.isEnabled()
+    assert controller.page_label.text() == 'Page 1'
+    assert 'Search Results' in controller.user_obs_group_box.box.title()
+
+    controller.next_page()
+    controller._get_search_page()
+    mock_app.client.observations.search_db.assert_called_with(filters, after=cursor)
+
+
+def test_search_observations__stale_results(controller, mock_app):
+    """Results from a previous search should be ignored"""
+    controller.search_observations(ObservationFilters(q='monarch'))
+    old_result = DbPageResult(
+        [_make_obs(id=1)], total_results=0, is_empty=False, filters=ObservationFilters(q='mon')
+    )
+
+    with patch.object(controller, 'display_user_observations') as mock_display:
+        controller.on_search_page_loaded(old_result)
+        controller.on_db_page_loaded(DbPageResult([], total_results=0, is_empty=True))
+    mock_display.assert_not_called()
+
+
+def test_search_observations__reset(controller, mock_app):
+    controller.search_observations(ObservationFilters(q='monarch'))
+    mock_app._futures.clear()
+
+    controller.search.reset()
+
+    assert controller.filters is None
+    mock_app.threadpool.schedule.assert_called_with(
+        controller._get_db_page, priority=QThread.NormalPriority
+    )
+
+
 def test_cold_start(controller, mock_app):
     """When DB count is 0: _is_cold_start=True, returns empty list, title shows 'loading...'."""
     mock_app.client.observations.count_db.return_value = 0
@@ -125,7 +199,10 @@ def test_cold_start(controller, mock_app):
 def test_warm_start(controller, mock_app):
     """When DB has data: _is_cold_start=False, loaded_pages=total_pages."""
     mock_app.client.observations.count_db.return_value = 75
-    mock_app.client.observations.search_user_db.return_value = [_make_obs(id=i) for i in range(50)]
+    mock_app.client.observations.search_user_db.return_value = (
+        [_make_obs(id=i) for i in range(50)],
+        None,
+    )
 
     result = controller._get_db_page()
 
@@ -149,15 +226,16 @@ def test_on_sync_page_received(controller, mock_app):
     assert controller.loaded_pages == 1
 
 
-def test_on_sync_page_received__persists_resume_id(controller, mock_app):
-    """After receiving a sync page, sync_resume_id is set to the max observation ID."""
+def test_on_sync_page_received__no_state_write(controller, mock_app):
+    """The resume checkpoint is saved with each page by the client, not by the controller"""
     controller.loaded_pages = 0
+    mock_app.state.sync_resume_id = 1
     observations = [_make_obs(id=5), _make_obs(id=20), _make_obs(id=12)]
 
     controller.on_sync_page_received(observations)
 
-    assert mock_app.state.sync_resume_id == 20
-    mock_app.state.write.assert_called()
+    assert mock_app.state.sync_resume_id == 1
+    mock_app.state.write.assert_not_called()
 
 
 def test_on_sync_page_received__cold_start_trigger(controller, mock_app):
@@ -278,6 +356,25 @@ def test_refresh(controller, mock_app):
     assert mock_app.threadpool.schedule_paginator.called
 
 
+def test_page_cursors(controller, mock_app):
+    """Each loaded page stores a cursor for the next page, which is used to load it"""
+    cursor = ObservationCursor('2024-01-01T00:00:00+00:00', 50)
+    mock_app.client.observations.count_db.return_value = 100
+    mock_app.client.observations.search_user_db.return_value = ([_make_obs(id=1)], cursor)
+
+    controller.on_db_page_loaded(controller._get_db_page())
+    assert controller._page_cursors == {2: cursor}
+    assert mock_app.client.observations.search_user_db.call_args.kwargs['after'] is None
+
+    controller.page = 2
+    controller._get_db_page()
+    assert mock_app.client.observations.search_user_db.call_args.kwargs['after'] == cursor
+
+    controller._sync_in_progress = False  # In case the startup sync has already been triggered
+    controller.refresh()
+    assert controller._page_cursors == {}
+
+
 def test_refresh__blocked_while_sync_in_progress(controller, mock_app):
     """Refresh is a no-op (with status message) when a sync is already running."""
     controller._sync_in_progress = True
@@ -360,6 +457,18 @@ def test_sync_observations__passes_resume_id(controller, mock_app):
     )
 
 
+def test_sync_observations__parallel(controller, mock_app):
+    """With parallel sync enabled, a full sync uses the parallel client method"""
+    mock_app.settings.parallel_sync = True
+    mock_app.state.last_obs_check = None
+    mock_app.client.observations.search_user_parallel.return_value = iter([])
+
+    list(controller._sync_observations())
+
+    mock_app.client.observations.search_user_parallel.assert_called_once_with(username='testuser')
+    mock_app.client.observations.search_user_paginated.assert_not_called()
+
+
 # Tests for thumbnail precacheing feature
 # ----------------------------------------
 
@@ -433,6 +542,7 @@ def test_start_precache_thumbnails__schedules_worker(controller, mock_app):
     mock_app.threadpool.schedule.assert_called_once_with(
         mock_app.threadpool.schedule.call_args[0][0],
         priority=QThread.LowPriority,
+        resource=Resource.NETWORK,
     )
 
 
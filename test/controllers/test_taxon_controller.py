@@ -144,6 +144,38 @@ def test_display_recent(taxon_tabs, mock_app):
     assert len(list(taxon_tabs.frequent.cards)) == 1
 
 
+def test_get_user_observed_taxa__local(taxon_tabs, mock_app):
+    """With synced observations, observed taxa should be counted from the local database"""
+    mock_app.client.observations.count_db.return_value = 10
+    mock_app.settings.casual_observations = True
+    tc = TaxonCount(id=10, name='Species A', rank='species', count=5)
+    mock_app.client.observations.species_counts_db.return_value = [tc]
+
+    with patch('naturtag.controllers.taxon_controller.get_app', return_value=mock_app):
+        assert taxon_tabs.get_user_observed_taxa() == [tc]
+    mock_app.client.observations.species_counts_db.assert_called_once_with(
+        'testuser', casual=True, locale='en'
+    )
+    mock_app.client.observations.species_counts.assert_not_called()
+
+
+def test_get_user_observed_taxa__api(taxon_tabs, mock_app):
+    """Without synced observations, observed taxa should be fetched from the API"""
+    mock_app.client.observations.count_db.return_value = 0
+    mock_app.settings.casual_observations = False
+    mock_app.client.observations.species_counts.return_value = [
+        TaxonCount(id=10, count=1),
+        TaxonCount(id=20, count=2),
+    ]
+
+    with patch('naturtag.controllers.taxon_controller.get_app', return_value=mock_app):
+        taxon_counts = taxon_tabs.get_user_observed_taxa()
+    assert [t.id for t in taxon_counts] == [20, 10]
+    mock_app.client.observations.species_counts.assert_called_once_with(
+        user_login='testuser', verifiable=True
+    )
+
+
 def test_display_observed(taxon_tabs, mock_app):
     """Populates observed tab, calls update_observed and write on AppState."""
     tc = TaxonCount(id=10, name='Species A', rank='species', count=5)
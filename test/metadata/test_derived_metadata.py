@@ -81,6 +81,16 @@ def test_empty_metadata():
     assert meta.has_coordinates is False
 
 
+def test_min_rank():
+    meta = DerivedMetadata(DEMO_IMAGE)
+    assert meta.min_rank == ('species', 'Chrysopilus ornatus')
+
+    meta = DerivedMetadata()
+    assert meta.min_rank is None
+    meta.update({'Xmp.dc.subject': ['taxonomy:kingdom=Animalia', 'taxonomy:genus=Chrysopilus']})
+    assert meta.min_rank == ('genus', 'Chrysopilus')
+
+
 def test_update__refreshes_derived_properties():
     meta = DerivedMetadata(DEMO_IMAGE)
     assert meta.taxon_id == 202860
@@ -146,3 +156,56 @@ def test_summary__no_taxon():
     meta._summary = None
     assert 'unknown taxon' in meta.summary
     assert 'Chrysopilus ornatus' not in meta.summary
+
+
+def test_combined__cached_and_patched_in_place():
+    meta = DerivedMetadata(DEMO_IMAGE)
+    combined = meta.combined
+    assert meta.combined is combined
+
+    meta.update({'Xmp.dwc.taxonID': '999999'})
+    assert meta.combined is combined
+    assert combined['Xmp.dwc.taxonID'] == '999999'
+    assert meta.simplified['xmp.dwc.taxonid'] == '999999'
+
+
+def test_update__only_resets_dependent_properties():
+    meta = DerivedMetadata(DEMO_IMAGE)
+    keyword_meta = meta.keyword_meta
+    coordinates = meta.coordinates
+    date = meta.date
+
+    # Unrelated tag: keywords, coordinates, and date are kept
+    meta.update({'Exif.Image.Artist': 'Me'})
+    assert meta.keyword_meta is keyword_meta
+    assert meta.coordinates is coordinates
+    assert meta.date == date
+
+    # Keyword tag: only keywords are reset
+    meta.update({'Xmp.dc.subject': ['New keyword']})
+    assert meta.keyword_meta is not keyword_meta
+    assert 'New keyword' in meta.keyword_meta.normal_keywords
+    assert meta.coordinates is coordinates
+
+    # GPS tag: only coordinates are reset
+    keyword_meta = meta.keyword_meta
+    meta.update({'Xmp.dwc.decimalLatitude': '1.0', 'Xmp.dwc.decimalLongitude': '2.0'})
+    assert meta.coordinates == (1.0, 2.0)
+    assert meta.keyword_meta is keyword_meta
+
+
+def test_merge__resets_derived_properties():
+    meta = DerivedMetadata()
+    assert meta.taxon_id is None
+    assert meta.date is None
+
+    meta.merge(DerivedMetadata(DEMO_IMAGE))
+    assert meta.taxon_id == 202860
+    assert '2020-06-06' in meta.date
+
+
+def test_slots():
+    meta = DerivedMetadata()
+    assert not hasattr(meta, '__dict__')
+    with pytest.raises(AttributeError):
+        meta.new_attribute = 'value'
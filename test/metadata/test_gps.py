@@ -1,11 +1,16 @@
+import numpy as np
 import pytest
 
 from naturtag.metadata.gps import (
+    convert_coords_batch,
     convert_dwc_coords,
     convert_exif_coords,
     convert_xmp_coords,
+    to_coords_batch,
     to_exif_coords,
+    to_exif_coords_batch,
     to_xmp_coords,
+    to_xmp_coords_batch,
 )
 
 DECIMAL_DEGREES = (37.76939, -122.48619)
@@ -90,3 +95,78 @@ def test_to_xmp_coords():
         'Xmp.exif.GPSLongitude': '122,29.171399999999267W',  # negative longitude = West
         'Xmp.exif.GPSHPositioningError': '50',
     }
+
+
+def test_convert_coords_batch():
+    """Batch conversion should match single conversions, in order of precedence"""
+    metadata = [
+        {
+            'Xmp.dwc.decimalLatitude': '37.76939',
+            'Xmp.dwc.decimalLongitude': '-122.48619',
+            'Xmp.exif.GPSLatitude': '1,0.0N',
+            'Xmp.exif.GPSLongitude': '1,0.0E',
+        },
+        {
+            'Exif.GPSInfo.GPSLatitude': '37/1 46/1 98399/10000',
+            'Exif.GPSInfo.GPSLatitudeRef': 'S',
+            'Exif.GPSInfo.GPSLongitude': '122/1 29/1 103199/10000',
+            'Exif.GPSInfo.GPSLongitudeRef': 'E',
+        },
+        {
+            'Xmp.exif.GPSLatitude': '37,46.1639999N',
+            'Xmp.exif.GPSLongitude': '122,29.1719999W',
+        },
+        {},
+    ]
+    coords = convert_coords_batch(metadata)
+
+    assert coords.shape == (4, 2)
+    assert tuple(coords[0]) == DECIMAL_DEGREES
+    assert _approx_equals(coords[1], (-37.76939, 122.48619))
+    assert _approx_equals(coords[2], DECIMAL_DEGREES)
+    assert np.isnan(coords[3]).all()
+
+
+@pytest.mark.parametrize(
+    'metadata',
+    [
+        {'Xmp.dwc.decimalLatitude': 'asdf', 'Xmp.dwc.decimalLongitude': '1.0'},
+        {'Exif.GPSInfo.GPSLatitude': 'asdf', 'Exif.GPSInfo.GPSLongitude': '1/1 2/1 3/1'},
+        {'Exif.GPSInfo.GPSLatitude': '1/1 2/a 3/1', 'Exif.GPSInfo.GPSLongitude': '1/1 2/1 3/1'},
+        {'Exif.GPSInfo.GPSLatitude': '1/0 2/1 3/1', 'Exif.GPSInfo.GPSLongitude': '1/1 2/1 3/1'},
+        {'Xmp.exif.GPSLatitude': 'asdf', 'Xmp.exif.GPSLongitude': '1,0.0E'},
+    ],
+)
+def test_convert_coords_batch__invalid(metadata):
+    """Invalid values should result in NaN, without affecting other rows"""
+    valid = {'Xmp.dwc.decimalLatitude': '1.0', 'Xmp.dwc.decimalLongitude': '2.0'}
+    coords = convert_coords_batch([metadata, valid])
+    assert np.isnan(coords[0]).all()
+    assert tuple(coords[1]) == (1.0, 2.0)
+
+
+def test_to_coords_batch():
+    """Batch conversion should exactly match single conversions"""
+    rng = np.random.default_rng(0)
+    coords = np.column_stack([rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)])
+    accuracy = [None, 50] * 250
+
+    exif = to_exif_coords_batch(coords, accuracy)
+    xmp = to_xmp_coords_batch(coords, accuracy)
+    for i, (lat, lon) in enumerate(coords):
+        assert exif[i] == to_exif_coords((float(lat), float(lon)), accuracy[i])
+        assert xmp[i] == to_xmp_coords((float(lat), float(lon)), accuracy[i])
+
+
+def test_to_coords_batch__accuracy_length_mismatch():
+    with pytest.raises(ValueError):
+        to_coords_batch([DECIMAL_DEGREES, DECIMAL_DEGREES], [50])
+
+
+def test_to_coords_batch__missing():
+    results = to_coords_batch([None, DECIMAL_DEGREES], [None, 50])
+    assert results[0] == {}
+    assert results[1] == {
+        **to_exif_coords(DECIMAL_DEGREES, 50),
+        **to_xmp_coords(DECIMAL_DEGREES, 50),
+    }
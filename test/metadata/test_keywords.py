@@ -66,6 +66,28 @@ def test_normal_keywords():
     assert kw.normal_keywords == ['Animals', 'Insects']
 
 
+def test_mixed_keywords():
+    """Each keyword should be classified into all applicable categories"""
+    kw = KeywordMetadata(
+        keywords=[
+            'Animals',
+            'taxonomy:genus=Chrysopilus',
+            'Animalia|Arthropoda',
+            'A|key=value',
+            'a=b=c',
+            'taxonomy:kingdom=Animalia',
+        ]
+    )
+    assert kw.kv_keywords == {
+        'taxonomy:kingdom': 'Animalia',
+        'taxonomy:genus': 'Chrysopilus',
+        'A|key': 'value',
+    }
+    assert list(kw.kv_keywords) == ['taxonomy:kingdom', 'taxonomy:genus', 'A|key']
+    assert kw.hier_keywords == ['Animalia', 'Animalia|Arthropoda', 'A', 'A|key=value']
+    assert kw.normal_keywords == ['Animals']
+
+
 def test_from_metadata():
     kw = KeywordMetadata(
         metadata={
@@ -104,6 +126,20 @@ def test_from_metadata__strips_quotes():
     assert kw.kv_keywords.get('taxonomy:species') == 'Chrysopilus ornatus'
 
 
+def test_from_metadata__deduplicates_across_formats():
+    """Keywords repeated across formats (quoted or unquoted) should only be included once"""
+    kw = KeywordMetadata(
+        metadata={
+            'Exif.Image.XPSubject': 'Animals, Ornate Snipe Fly',
+            'Iptc.Application2.Subject': ['Animals', 'Ornate Snipe Fly'],
+            'Xmp.dc.subject': ['Animals', '"Ornate Snipe Fly"'],
+            'Xmp.lr.hierarchicalSubject': ['Animalia|Arthropoda'],
+            'Xmp.digiKam.TagsList': ['Animalia/Arthropoda'],
+        }
+    )
+    assert sorted(kw.keywords) == ['Animalia|Arthropoda', 'Animals', 'Ornate Snipe Fly']
+
+
 def test_kv_keyword_list():
     kw = KeywordMetadata(keywords=['taxonomy:kingdom=Animalia', 'inat:taxon_id=123'])
     kv_list = kw.kv_keyword_list
@@ -1,9 +1,10 @@
 from datetime import datetime
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 from pyinaturalist import Observation, Taxon
 
+from naturtag.metadata import DerivedMetadata
 from naturtag.metadata.derived import (
     _get_common_keywords,
     _get_hierarchical_keywords,
@@ -11,7 +12,13 @@ from naturtag.metadata.derived import (
     _get_taxon_hierarchical_keywords,
     _get_taxonomy_keywords,
 )
-from naturtag.metadata.tagger import observation_to_metadata, tag_images
+from naturtag.metadata.tagger import (
+    _refresh_tags_batch,
+    observation_to_metadata,
+    observations_to_metadata,
+    tag_images,
+)
+from naturtag.storage import Settings
 
 KINGDOM = Taxon(id=1, name='Animalia', rank='kingdom', preferred_common_name='Animals')
 FAMILY = Taxon(id=3, name='Rhagionidae', rank='family', preferred_common_name='Snipe Flies')
@@ -166,6 +173,25 @@ def test_observation_to_metadata__taxon_only():
     assert meta.observation_id is None
 
 
+def test_observations_to_metadata():
+    """Bulk conversion should give the same coordinates as converting one observation at a time"""
+    observations = [
+        Observation(taxon=SPECIES, location=(41.199, -93.657), positional_accuracy=10),
+        Observation(taxon=SPECIES, location=None),
+        Observation(taxon=SPECIES, location=(-37.76939, 122.48619)),
+    ]
+    results = observations_to_metadata(observations)
+
+    assert len(results) == 3
+    for obs, meta in zip(observations, results, strict=False):
+        expected = observation_to_metadata(obs)
+        assert meta.taxon_id == 202860
+        assert meta.exif == expected.exif
+        assert meta.xmp == expected.xmp
+    assert results[0].coordinates == (41.199, -93.657)
+    assert results[1].has_coordinates is False
+
+
 def test_get_taxon_hierarchical_keywords__subspecies():
     keywords = _get_taxon_hierarchical_keywords(SUBSPECIES)
     assert any('Canis familiaris dingo' in k for k in keywords)
@@ -179,3 +205,21 @@ def test_tag_images__returns_list():
 
     assert isinstance(result, list)
     assert result == [sentinel]
+
+
+@patch('naturtag.metadata.tagger.DerivedMetadata.write')
+def test_refresh_tags_batch(mock_write):
+    """Images with existing IDs should be refreshed, and others skipped"""
+    tagged = observation_to_metadata(Observation(taxon=SPECIES))
+    untagged = DerivedMetadata()
+    observation = Observation(taxon=SPECIES, location=(41.199, -93.657))
+    client = MagicMock()
+    client.from_id.return_value = observation
+
+    results = _refresh_tags_batch([tagged, untagged], client, Settings(hierarchical=False))
+
+    client.from_id.assert_called_once_with(None, 202860)
+    assert results[0] is tagged
+    assert results[0].coordinates == (41.199, -93.657)
+    assert results[1] is None
+    mock_write.assert_called_once()
@@ -1,5 +1,6 @@
 """Tests for naturtag/storage/app_state.py"""
 
+import sqlite3
 from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
@@ -9,6 +10,7 @@ import pytest
 
 from naturtag.constants import MAX_DISPLAY_HISTORY, MAX_DISPLAY_OBSERVED
 from naturtag.storage.app_state import AppState, _top_unique_ids
+from naturtag.storage.taxon_history import get_recent
 
 
 @pytest.fixture
@@ -36,19 +38,35 @@ def test_top_unique_ids(ids, n, expected):
     assert _top_unique_ids(ids, n) == expected
 
 
-def test_app_state__frequent_initialized_from_history():
-    s = AppState(history=[1, 2, 1, 3, 1])
-    assert s.frequent == Counter({1: 3, 2: 1, 3: 1})
-
-
-def test_update_history__appends_and_counts(state):
+def test_update_history__appends_and_counts(state, db_path):
     state.update_history(10)
     state.update_history(20)
     state.update_history(10)
 
-    assert state.history == [10, 20, 10]
+    assert state.recent == [10, 20]
     assert state.frequent[10] == 2
     assert state.frequent[20] == 1
+    assert get_recent(db_path=db_path) == [10, 20]
+
+
+def test_update_history__frequent_bounded(state):
+    """Only the top frequent taxa should be kept in memory, but counts for others should still be
+    available
+    """
+    for taxon_id in range(MAX_DISPLAY_HISTORY):
+        state.update_history(taxon_id)
+        state.update_history(taxon_id)
+    state.update_history(999)
+
+    assert len(state.frequent) == MAX_DISPLAY_HISTORY
+    assert 999 not in state.frequent
+    assert state.view_count(999) == 1
+
+    # Enough views to move into the top frequent taxa
+    state.update_history(999)
+    state.update_history(999)
+    assert state.top_frequent[0] == 999
+    assert len(state.frequent) == MAX_DISPLAY_HISTORY
 
 
 def test_update_observed(state):
@@ -75,7 +93,7 @@ def test_view_count(state, history, taxon_id, expected):
     [
         (
             'top_history',
-            lambda s: setattr(s, 'history', list(range(MAX_DISPLAY_HISTORY + 10))),
+            lambda s: setattr(s, 'recent', list(range(MAX_DISPLAY_HISTORY + 10))),
         ),
         (
             'top_frequent',
@@ -98,14 +116,16 @@ def test_top_list(state, prop, setup):
 
 def test_top_history(state):
     # 1 viewed first, 2 viewed second, 1 viewed again → most recent unique order is [1, 2]
-    state.history = [1, 2, 1]
+    for taxon_id in [1, 2, 1]:
+        state.update_history(taxon_id)
     assert state.top_history == [1, 2]
 
 
-def test_top_frequent():
-    s = AppState(history=[1, 2, 1, 3, 1, 2])
-    assert s.top_frequent[0] == 1
-    assert s.top_frequent[1] == 2
+def test_top_frequent(state):
+    for taxon_id in [1, 2, 1, 3, 1, 2]:
+        state.update_history(taxon_id)
+    assert state.top_frequent[0] == 1
+    assert state.top_frequent[1] == 2
 
 
 @pytest.mark.parametrize(
@@ -127,8 +147,8 @@ def test_top_observed(state):
 
 
 def test_display_ids__combines_all_sources_as_set(state):
-    state.history = [1, 1, 2]
-    state.frequent = Counter(state.history)
+    state.recent = [2, 1]
+    state.frequent = Counter({1: 2, 2: 1})
     state.observed = {3: 1}
     state.starred = [4]
     assert state.display_ids == {1, 2, 3, 4}
@@ -165,41 +185,61 @@ def test_set_obs_checkpoint__sets_utc_time_and_writes(state):
 def test_read__db_missing(db_path):
     missing_db = db_path.parent / 'nonexistent.db'
     loaded = AppState.read(missing_db)
-    assert loaded.history == []
+    assert loaded.top_history == []
     assert loaded.setup_complete is False
     assert loaded.db_path == missing_db
 
 
 def test_write(state, db_path):
-    state.history = [1, 2]
+    state.starred = [1, 2]
     state.write()
 
-    state.history = [3, 4]
+    state.starred = [3, 4]
     state.write()
 
     loaded = AppState.read(db_path)
-    assert loaded.history == [3, 4]
+    assert loaded.starred == [3, 4]
 
 
 def test_read_write_round_trip(state):
-    state.history = [1, 2, 3]
+    for taxon_id in [1, 2, 3, 1]:
+        state.update_history(taxon_id)
     state.starred = [10, 20]
     state.observed = {5: 3}
     state.setup_complete = True
     state.write()
 
     loaded = AppState.read(state.db_path)
-    assert loaded.history == [1, 2, 3]
+    assert loaded.top_history == [1, 3, 2]
+    assert loaded.top_frequent[0] == 1
+    assert loaded.view_count(1) == 2
     assert loaded.starred == [10, 20]
     assert loaded.observed == {5: 3}
     assert loaded.setup_complete is True
 
 
+def test_read__legacy_history(state, db_path):
+    """History saved in the state JSON by older versions should be moved to the history table"""
+    state.write()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "UPDATE app_state SET content = json_set(content, '$.history', json('[1, 2, 1]'))"
+        )
+
+    loaded = AppState.read(db_path)
+    assert loaded.top_history == [1, 2]
+    assert loaded.view_count(1) == 2
+
+    # Migrated history shouldn't be imported again
+    loaded.write()
+    assert AppState.read(db_path).view_count(1) == 2
+
+
 def test_str(state):
-    state.history = [1, 2]
+    state.update_history(1)
+    state.update_history(2)
     state.starred = [3]
     state.observed = {4: 1}
-    state.frequent = Counter(state.history)
     result = str(state)
     assert 'History: 2' in result
     assert 'Starred: 1' in result
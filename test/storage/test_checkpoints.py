@@ -0,0 +1,48 @@
+"""Tests for naturtag/storage/checkpoints.py"""
+
+from naturtag.storage.app_state import AppState
+from naturtag.storage.checkpoints import (
+    SYNC_CHECKPOINT,
+    get_checkpoint,
+    get_checkpoints,
+    set_checkpoint,
+    set_checkpoints,
+)
+
+
+def test_get_checkpoint__missing_table(tmp_path):
+    assert get_checkpoint(db_path=tmp_path / 'naturtag.db') is None
+
+
+def test_set_checkpoint(tmp_path):
+    db_path = tmp_path / 'naturtag.db'
+    set_checkpoint(10, db_path=db_path)
+    set_checkpoint(20, db_path=db_path)
+    set_checkpoint(30, name='other', db_path=db_path)
+    assert get_checkpoint(db_path=db_path) == 20
+    assert get_checkpoint('other', db_path) == 30
+
+    set_checkpoint(None, db_path=db_path)
+    assert get_checkpoint(db_path=db_path) is None
+    assert get_checkpoint('other', db_path) == 30
+
+
+def test_get_checkpoints(tmp_path):
+    db_path = tmp_path / 'naturtag.db'
+    assert get_checkpoints('observations:', db_path) == {}
+    set_checkpoints({'observations:1-10': 0, 'observations:11-20': 15, 'other': 1}, db_path)
+    set_checkpoint(5, db_path=db_path)
+    assert get_checkpoints('observations:', db_path) == {
+        'observations:1-10': 0,
+        'observations:11-20': 15,
+    }
+
+
+def test_app_state_sync_resume_id(tmp_path):
+    """AppState.sync_resume_id should be stored as a checkpoint, not in the app state JSON"""
+    state = AppState.read(tmp_path / 'naturtag.db')
+    state.sync_resume_id = 42
+    state.write()
+
+    assert get_checkpoint(SYNC_CHECKPOINT, state.db_path) == 42
+    assert AppState.read(state.db_path).sync_resume_id == 42
@@ -1,11 +1,39 @@
 """Tests for naturtag/storage/client.py"""
 
-from unittest.mock import MagicMock
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+from threading import Event, Timer
+from unittest.mock import MagicMock, patch
 
 import pytest
-from pyinaturalist import Observation, Photo
+from pyinaturalist import Observation, Photo, Taxon, User
+from pyinaturalist.controllers import ObservationController, TaxonController
+from pyinaturalist_convert import create_observation_fts_table
+from pyinaturalist_convert.db import create_tables, save_observations, save_taxa
 
-from naturtag.storage.client import ObservationDbController
+from naturtag.storage.checkpoints import (
+    SYNC_CHECKPOINT,
+    get_checkpoint,
+    get_checkpoints,
+    set_checkpoints,
+)
+from naturtag.storage.client import (
+    OBSERVATION_CACHE,
+    TAXON_CACHE,
+    ObservationCursor,
+    ObservationDbController,
+    ObservationFilters,
+    SyncPartition,
+    TaxonDbController,
+    _get_db_taxa,
+)
+from naturtag.storage.freshness import save_fetched
+from naturtag.storage.network import NetworkPolicy
+from naturtag.storage.observation_counts import create_observation_counts
+from naturtag.storage.taxon_tree import build_taxon_tree
+from naturtag.utils import CancelToken, TaskCancelled
+from test.conftest import _make_db_client
 
 THUMB_URL = 'https://static.inaturalist.org/photos/10/square.jpg'
 
@@ -26,7 +54,8 @@ def test_search_user_db_paginated__yields_pages(obs_controller):
     """Yields each non-empty page in order."""
     page1 = _make_obs_page([1, 2, 3])
     page2 = _make_obs_page([4, 5, 6])
-    obs_controller.search_user_db = MagicMock(side_effect=[page1, page2, []])
+    cursor = ObservationCursor('2024-01-01T00:00:00+00:00', 3)
+    obs_controller.search_user_db = MagicMock(side_effect=[(page1, cursor), (page2, None)])
 
     pages = list(obs_controller.search_user_db_paginated(username='testuser'))
 
@@ -35,19 +64,444 @@ def test_search_user_db_paginated__yields_pages(obs_controller):
 
 def test_search_user_db_paginated__empty_db(obs_controller):
     """Yields nothing when the DB is empty."""
-    obs_controller.search_user_db = MagicMock(return_value=[])
+    obs_controller.search_user_db = MagicMock(return_value=([], None))
 
     pages = list(obs_controller.search_user_db_paginated(username='testuser'))
 
     assert pages == []
 
 
-def test_search_user_db_paginated__calls_each_page(obs_controller):
-    """Calls search_user_db with incrementing page numbers."""
-    obs_controller.search_user_db = MagicMock(side_effect=[_make_obs_page([1]), []])
+def test_search_user_db_paginated__calls_with_cursors(obs_controller):
+    """Calls search_user_db with the cursor from the previous page."""
+    cursor = ObservationCursor('2024-01-01T00:00:00+00:00', 1)
+    obs_controller.search_user_db = MagicMock(
+        side_effect=[(_make_obs_page([1]), cursor), ([], None)]
+    )
 
     list(obs_controller.search_user_db_paginated(username='testuser'))
 
     calls = obs_controller.search_user_db.call_args_list
-    assert calls[0].kwargs['page'] == 1
-    assert calls[1].kwargs['page'] == 2
+    assert calls[0].kwargs['after'] is None
+    assert calls[1].kwargs['after'] == cursor
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    db_path = tmp_path / 'naturtag.db'
+    create_tables(db_path)
+    create_observation_fts_table(db_path)
+    save_taxa([Taxon(id=1, name='Animalia'), Taxon(id=2, name='Arthropoda', parent_id=1)], db_path)
+    return db_path
+
+
+def test_taxon_from_ids__cached(db_path):
+    controller = TaxonDbController(_make_db_client(db_path))
+    with patch('naturtag.storage.client._get_db_taxa', wraps=_get_db_taxa) as mock_get_db_taxa:
+        assert controller.from_ids([2], accept_partial=True).one().name == 'Arthropoda'
+        assert controller.from_ids([2], accept_partial=True).one().name == 'Arthropoda'
+    assert mock_get_db_taxa.call_count == 1
+    assert TAXON_CACHE.get_many(db_path, [2], accept_partial=True)
+
+
+def test_taxon_from_ids__refresh(db_path):
+    controller = TaxonDbController(_make_db_client(db_path))
+    controller.from_ids([2], accept_partial=True)
+    with patch.object(TaxonController, 'from_ids') as mock_from_ids:
+        mock_from_ids.return_value.all.return_value = [Taxon(id=2, name='Updated', parent_id=1)]
+        assert controller.from_ids([2], refresh=True).one().name == 'Updated'
+
+    # Refreshed result replaces the cached copy, and the parent's cached copy is invalidated
+    assert TAXON_CACHE.get_many(db_path, [2])[2].name == 'Updated'
+    assert not TAXON_CACHE.get_many(db_path, [1], accept_partial=True)
+
+
+def test_taxon_from_ids__offline(db_path):
+    """In offline mode, partial taxa should be returned, and missing taxa skipped without any API
+    requests
+    """
+    save_taxa([Taxon(id=3, name='Insecta', parent_id=2, partial=True)], db_path)
+    controller = TaxonDbController(_make_db_client(db_path, NetworkPolicy.OFFLINE))
+    with patch.object(TaxonController, 'from_ids') as mock_from_ids:
+        taxa = controller.from_ids([3, 999], refresh=True).all()
+    mock_from_ids.assert_not_called()
+    assert [t.id for t in taxa] == [3]
+    assert taxa[0]._partial is True
+
+
+def test_taxon_from_ids__prefer_cache(db_path):
+    """In prefer-cache mode, refresh should be ignored, and only missing taxa fetched"""
+    controller = TaxonDbController(_make_db_client(db_path, NetworkPolicy.PREFER_CACHE))
+    controller.from_ids([2], accept_partial=True)
+    with patch.object(TaxonController, 'from_ids') as mock_from_ids:
+        assert (
+            controller.from_ids([2], refresh=True, accept_partial=True).one().name == 'Arthropoda'
+        )
+    mock_from_ids.assert_not_called()
+
+
+def test_observation_save__invalidates_cache(db_path):
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    OBSERVATION_CACHE.set_many(db_path, [Observation(id=1)])
+    TAXON_CACHE.set_many(db_path, [Taxon(id=1), Taxon(id=2)])
+    controller.save([Observation(id=1, taxon=Taxon(id=2, ancestor_ids=[1, 2]))])
+    assert not OBSERVATION_CACHE.get_many(db_path, [1])
+    assert not TAXON_CACHE.get_many(db_path, [1, 2])
+
+
+def test_observation_save__single_transaction(db_path):
+    """Observations, taxa, users, photos, text search index, fetch times, and the sync checkpoint
+    should all be saved together
+    """
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    obs = Observation(
+        id=10,
+        description='test obs',
+        taxon=Taxon(id=3, name='Insecta', parent_id=2),
+        user=User(id=1, login='me'),
+        photos=[Photo(id=1, url=THUMB_URL)],
+    )
+    controller.save([obs, Observation(id=5)], checkpoint=SYNC_CHECKPOINT)
+
+    with sqlite3.connect(db_path) as conn:
+        for table in ['observation', 'taxon', 'user', 'photo', 'record_fetched']:
+            assert conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] > 0
+        fts_ids = conn.execute('SELECT DISTINCT observation_id FROM observation_fts').fetchall()
+        assert fts_ids == [(10,)]
+    assert get_checkpoint(SYNC_CHECKPOINT, db_path) == 10
+
+
+def test_observation_save__rollback(db_path):
+    """If any part of a save fails, nothing should be saved"""
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    with (
+        patch('naturtag.storage.client.write_fetched', side_effect=RuntimeError),
+        pytest.raises(RuntimeError),
+    ):
+        controller.save([Observation(id=10, description='test obs')], checkpoint=SYNC_CHECKPOINT)
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM observation').fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM observation_fts').fetchone()[0] == 0
+    assert get_checkpoint(SYNC_CHECKPOINT, db_path) is None
+
+
+def test_observation_from_ids__stale(db_path):
+    """Without a scheduler, stale observations should be refreshed before returning"""
+    controller = ObservationDbController(
+        _make_db_client(db_path), taxon_controller=MagicMock(), ttl=timedelta(days=1)
+    )
+    save_observations([Observation(id=1, description='old')], db_path)
+    with patch.object(ObservationController, 'from_ids') as mock_from_ids:
+        mock_from_ids.return_value.all.return_value = [Observation(id=1, description='new')]
+        assert controller.from_ids([1]).one().description == 'new'
+        # Now fresh, so the saved copy should be used
+        assert controller.from_ids([1]).one().description == 'new'
+    mock_from_ids.assert_called_once_with({1})
+
+
+def test_observation_from_ids__stale_while_revalidate(db_path):
+    """With a scheduler, stale observations should be returned and refreshed in the background"""
+    controller = ObservationDbController(
+        _make_db_client(db_path), taxon_controller=MagicMock(), ttl=timedelta(days=1)
+    )
+    controller.freshness.scheduler = MagicMock()
+    save_observations([Observation(id=1, description='old')], db_path)
+    with patch.object(ObservationController, 'from_ids') as mock_from_ids:
+        assert controller.from_ids([1]).one().description == 'old'
+    mock_from_ids.assert_not_called()
+    controller.freshness.scheduler.assert_called_once_with(
+        controller.freshness._refresh, refresh=controller._refresh, ids=[1]
+    )
+
+
+def test_taxon_from_ids__cached_fresh(db_path):
+    """Fresh cached taxa should be used without looking up fetch times in the database"""
+    controller = TaxonDbController(_make_db_client(db_path), ttl=timedelta(days=1))
+    save_fetched('taxon', [1], db_path)
+    assert controller.from_ids([1]).one().name == 'Animalia'
+    with patch('naturtag.storage.freshness.get_fetched') as mock_get_fetched:
+        assert controller.from_ids([1]).one().name == 'Animalia'
+    mock_get_fetched.assert_not_called()
+
+
+def test_taxon_from_ids__cached_stale(db_path):
+    """Stale cached taxa should be revalidated from the database"""
+    controller = TaxonDbController(_make_db_client(db_path), ttl=timedelta(days=1))
+    controller.freshness.scheduler = MagicMock()
+    TAXON_CACHE.set_many(db_path, [Taxon(id=1, name='Cached')], fetched_at={1: 0})
+
+    assert controller.from_ids([1]).one().name == 'Animalia'
+    controller.freshness.scheduler.assert_called_once()
+
+
+@pytest.fixture
+def user_obs_db_path(db_path) -> Path:
+    """Observations for two users, with some duplicate and missing creation dates"""
+    user, other_user = User(id=1, login='me'), User(id=2, login='other')
+    created_dates = ['2024-01-03', '2024-01-02', '2024-01-02', '2024-01-01', None, None]
+    observations = [
+        Observation(id=i, user=user, created_at=created_at)
+        for i, created_at in enumerate(created_dates, start=1)
+    ]
+    observations.append(Observation(id=7, user=other_user, created_at='2024-01-04'))
+    save_observations(observations, db_path)
+    return db_path
+
+
+@pytest.mark.parametrize('limit', [1, 2, 4, 10])
+def test_search_user_db__keyset(user_obs_db_path, limit):
+    controller = ObservationDbController(
+        _make_db_client(user_obs_db_path), taxon_controller=MagicMock()
+    )
+    pages = list(controller.search_user_db_paginated(username='me', limit=limit))
+    obs_ids = [obs.id for page in pages for obs in page]
+    assert obs_ids == [1, 3, 2, 4, 6, 5]
+    assert all(len(page) <= limit for page in pages)
+
+
+def test_search_user_db__page_fallback(user_obs_db_path):
+    controller = ObservationDbController(
+        _make_db_client(user_obs_db_path), taxon_controller=MagicMock()
+    )
+    observations, cursor = controller.search_user_db(username='me', limit=2, page=2)
+    assert [obs.id for obs in observations] == [2, 4]
+
+    observations, _ = controller.search_user_db(username='me', limit=2, after=cursor)
+    assert [obs.id for obs in observations] == [6, 5]
+
+
+@pytest.fixture
+def search_obs_db_path(db_path) -> Path:
+    """Observations with text, dates, places, and quality grades to search"""
+    build_taxon_tree(db_path)
+    user, other_user = User(id=1, login='me'), User(id=2, login='other')
+    observations = [
+        Observation(
+            id=1,
+            user=user,
+            taxon=Taxon(id=2, name='Arthropoda', parent_id=1),
+            description='Monarch caterpillar on milkweed',
+            place_guess='Portland, OR',
+            observed_on='2024-06-15T10:00:00',
+            created_at='2024-06-16',
+            quality_grade='research',
+        ),
+        Observation(
+            id=2,
+            user=user,
+            taxon=Taxon(id=1, name='Animalia'),
+            description='Caterpillar-like larva',
+            place_guess='Seattle, WA',
+            observed_on='2024-07-01T08:00:00',
+            created_at='2024-07-02',
+            quality_grade='needs_id',
+        ),
+        Observation(
+            id=3,
+            user=other_user,
+            description='Monarch in Portland garden',
+            place_guess='Salem, OR',
+            observed_on='2024-06-20',
+            created_at='2024-06-21',
+            quality_grade='casual',
+        ),
+    ]
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    controller.save(observations)
+    return db_path
+
+
+@pytest.mark.parametrize(
+    'filters, expected_ids',
+    [
+        (ObservationFilters(), [2, 3, 1]),
+        (ObservationFilters(q='caterp'), [2, 1]),
+        (ObservationFilters(q='monarch milkweed'), [1]),
+        (ObservationFilters(q='larva "(*'), [2]),
+        (ObservationFilters(q='portland'), [3, 1]),
+        (ObservationFilters(place='portland'), [1]),
+        (ObservationFilters(username='me'), [2, 1]),
+        (ObservationFilters(taxon_id=1), [2, 1]),
+        (ObservationFilters(taxon_id=2), [1]),
+        (ObservationFilters(d1=date(2024, 6, 20)), [2, 3]),
+        (ObservationFilters(d2=date(2024, 6, 20)), [3, 1]),
+        (ObservationFilters(quality_grade='research'), [1]),
+        (ObservationFilters(q='monarch', username='me', place='OR'), [1]),
+    ],
+)
+def test_search_db(search_obs_db_path, filters, expected_ids):
+    controller = ObservationDbController(
+        _make_db_client(search_obs_db_path), taxon_controller=MagicMock()
+    )
+    observations, _ = controller.search_db(filters)
+    assert [obs.id for obs in observations] == expected_ids
+
+
+def test_search_db__keyset(search_obs_db_path):
+    controller = ObservationDbController(
+        _make_db_client(search_obs_db_path), taxon_controller=MagicMock()
+    )
+    filters = ObservationFilters(q='monarch')
+    observations, cursor = controller.search_db(filters, limit=1)
+    assert [obs.id for obs in observations] == [3]
+
+    observations, cursor = controller.search_db(filters, limit=1, after=cursor)
+    assert [obs.id for obs in observations] == [1]
+    observations, cursor = controller.search_db(filters, limit=1, after=cursor)
+    assert observations == [] and cursor is None
+
+
+def _fetch_partition_pages(id_above: int, id_below: int, **kwargs):
+    """Mock API results for a partition: every ID in the range, 2 per page"""
+    ids = list(range(id_above + 1, id_below))
+    for i in range(0, len(ids), 2):
+        yield [Observation(id=id) for id in ids[i : i + 2]]
+
+
+def test_get_sync_partitions(db_path):
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+
+    def search(order='asc', **kwargs):
+        query = MagicMock(total_results=1000)
+        query.limit.return_value = [Observation(id=101 if order == 'asc' else 1100)]
+        return query
+
+    with patch.object(ObservationController, 'search', side_effect=search):
+        partitions = controller._get_sync_partitions('me', None, n_partitions=8)
+
+    # Limited to 5 partitions by total results (1000 / 200 per page), covering all IDs
+    assert len(partitions) == 5
+    assert partitions[0].id_above == 100
+    assert partitions[-1].id_below > 1100
+    for prev, next in zip(partitions, partitions[1:], strict=False):
+        assert prev.id_below == next.id_above + 1
+
+    # Planned partitions should be saved, and reused on the next call
+    assert get_checkpoints(f'{SYNC_CHECKPOINT}:', db_path) == {
+        p.name: p.id_above for p in partitions
+    }
+    assert controller._get_sync_partitions('me', None, n_partitions=8) == partitions
+
+
+def test_search_user_parallel__resume(db_path):
+    """An interrupted parallel sync should fetch only the remaining IDs of unfinished partitions"""
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    set_checkpoints({f'{SYNC_CHECKPOINT}:1-10': 0, f'{SYNC_CHECKPOINT}:11-20': 15}, db_path)
+
+    with patch.object(controller, '_fetch_paginated', side_effect=_fetch_partition_pages):
+        pages = list(controller.search_user_parallel('me', workers=2))
+
+    obs_ids = sorted(obs.id for page in pages for obs in page)
+    assert obs_ids == list(range(1, 11)) + list(range(16, 21))
+    assert controller.count_db() == 15
+    assert get_checkpoints(f'{SYNC_CHECKPOINT}:', db_path) == {}
+
+
+def test_search_user_parallel__error(db_path):
+    """If a partition fails, the error should be raised, and unfinished partitions kept"""
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    set_checkpoints({f'{SYNC_CHECKPOINT}:1-10': 0}, db_path)
+
+    def fetch(**kwargs):
+        yield [Observation(id=1), Observation(id=2)]
+        raise RuntimeError('timeout')
+
+    with (
+        patch.object(controller, '_fetch_paginated', side_effect=fetch),
+        pytest.raises(RuntimeError),
+    ):
+        list(controller.search_user_parallel('me', workers=2))
+    assert get_checkpoints(f'{SYNC_CHECKPOINT}:', db_path) == {f'{SYNC_CHECKPOINT}:1-10': 2}
+    assert SyncPartition.from_checkpoint(f'{SYNC_CHECKPOINT}:1-10', 2) == SyncPartition(
+        f'{SYNC_CHECKPOINT}:1-10', 2, 11
+    )
+
+
+def test_search_user_parallel__cancelled(db_path):
+    """A cancelled sync should stop while waiting for the next page, without waiting for it"""
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    set_checkpoints({f'{SYNC_CHECKPOINT}:1-10': 0}, db_path)
+    blocker = Event()
+
+    def fetch(**kwargs):
+        yield [Observation(id=1)]
+        blocker.wait(timeout=5)
+        yield [Observation(id=2)]
+
+    pages = []
+    token = CancelToken()
+    with (
+        patch.object(controller, '_fetch_paginated', side_effect=fetch),
+        token.activate(),
+        pytest.raises(TaskCancelled),
+    ):
+        for page in controller.search_user_parallel('me', workers=1):
+            pages.append(page)
+            Timer(0.1, token.cancel).start()
+            Timer(1, blocker.set).start()
+    assert len(pages) == 1
+
+
+def test_species_counts_db(db_path):
+    """Taxa below species should be rolled up, and taxa above species with observed descendants
+    should be excluded
+    """
+    create_observation_counts(db_path)
+    user = User(id=1, login='me')
+    genus = Taxon(id=3, name='Genus', rank='genus', parent_id=2)
+    other_genus = Taxon(id=7, name='Other genus', rank='genus', parent_id=2)
+    species = Taxon(id=4, name='Genus species', rank='species', parent_id=3)
+    subspecies = Taxon(id=5, name='Genus species sub', rank='subspecies', parent_id=4)
+    form = Taxon(id=6, name='Genus species sub f', rank='form', parent_id=5)
+
+    taxon_ids = [4, 5, 6, 6, 3, 7, 7, 7]
+    observations = [
+        Observation(id=i, user=user, taxon=Taxon(id=taxon_id))
+        for i, taxon_id in enumerate(taxon_ids)
+    ]
+    observations.append(Observation(id=100, user=user, taxon=species, quality_grade='casual'))
+    save_observations(observations, db_path)
+    save_taxa([genus, other_genus, species, subspecies, form], db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            'UPDATE taxon SET ancestor_ids = ? WHERE id = ?',
+            [('1,2', 3), ('1,2', 7), ('1,2,3', 4), ('1,2,3,4', 5), ('1,2,3,4,5', 6)],
+        )
+
+    controller = ObservationDbController(
+        _make_db_client(db_path), taxon_controller=TaxonDbController(_make_db_client(db_path))
+    )
+    taxon_counts = controller.species_counts_db('me')
+    assert [(t.id, t.count) for t in taxon_counts] == [(4, 4), (7, 3)]
+    assert taxon_counts[0].name == 'Genus species'
+
+    taxon_counts = controller.species_counts_db('me', casual=True)
+    assert [(t.id, t.count) for t in taxon_counts] == [(4, 5), (7, 3)]
+    assert controller.species_counts_db('nonexistent') == []
+
+
+def test_species_counts_db__rolled_up_species(db_path):
+    """A species only observed below species level should still exclude its observed ancestors"""
+    create_observation_counts(db_path)
+    user = User(id=1, login='me')
+    genus = Taxon(id=10, name='Genus', rank='genus', parent_id=2)
+    species = Taxon(id=100, name='Genus species', rank='species', parent_id=10)
+    subspecies = Taxon(id=1000, name='Genus species sub', rank='subspecies', parent_id=100)
+
+    observations = [
+        Observation(id=i, user=user, taxon=Taxon(id=taxon_id))
+        for i, taxon_id in enumerate([1000, 1000, 10])
+    ]
+    save_observations(observations, db_path)
+    save_taxa([genus, species, subspecies], db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            'UPDATE taxon SET ancestor_ids = ? WHERE id = ?',
+            [('1,2', 10), ('1,2,10', 100), ('1,2,10,100', 1000)],
+        )
+
+    controller = ObservationDbController(
+        _make_db_client(db_path), taxon_controller=TaxonDbController(_make_db_client(db_path))
+    )
+    taxon_counts = controller.species_counts_db('me')
+    assert [(t.id, t.count) for t in taxon_counts] == [(100, 2)]
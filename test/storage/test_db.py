@@ -0,0 +1,91 @@
+"""Tests for naturtag/storage/db.py"""
+
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+
+from naturtag.constants import DB_CACHE_SIZE, DB_MMAP_SIZE
+from naturtag.storage.db import close_all, connect, get_db, get_session
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    return tmp_path / 'naturtag.db'
+
+
+def test_get_db__shared_per_path(db_path, tmp_path):
+    assert get_db(db_path) is get_db(str(db_path))
+    assert get_db(db_path) is not get_db(tmp_path / 'other.db')
+
+
+def test_connect__reuses_connections(db_path):
+    with connect(db_path) as conn:
+        first_conn = conn._conn
+    with connect(db_path) as conn:
+        assert conn._conn is first_conn
+    with get_session(db_path) as session:
+        assert session.connection().connection.dbapi_connection is first_conn
+
+
+def test_connect__pragmas(db_path):
+    with connect(db_path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] == -DB_CACHE_SIZE
+        assert conn.execute('PRAGMA mmap_size').fetchone()[0] == DB_MMAP_SIZE
+
+
+def test_connect__commit_and_rollback(db_path):
+    with connect(db_path) as conn:
+        conn.execute('CREATE TABLE test (id INTEGER PRIMARY KEY)')
+        conn.execute('INSERT INTO test VALUES (1)')
+    with pytest.raises(RuntimeError), connect(db_path) as conn:
+        conn.execute('INSERT INTO test VALUES (2)')
+        raise RuntimeError
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT id FROM test').fetchall() == [(1,)]
+
+
+def test_connect__threads(db_path):
+    """Each thread should get its own connection, and connections should be returned to the pool"""
+    with connect(db_path) as conn:
+        conn.execute('CREATE TABLE test (id INTEGER PRIMARY KEY)')
+
+    def insert(i: int):
+        with connect(db_path) as conn:
+            conn.execute('INSERT INTO test VALUES (?)', (i,))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(insert, range(100)))
+
+    with connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM test').fetchone()[0] == 100
+    assert get_db(db_path).engine.pool.checkedout() == 0
+
+
+def test_stats(db_path):
+    stats = get_db(db_path).stats
+    with connect(db_path) as conn:
+        conn.execute('CREATE TABLE test (id INTEGER PRIMARY KEY)')
+        conn.executemany('INSERT INTO test VALUES (?)', [(1,), (2,)])
+    with get_session(db_path) as session:
+        session.execute(text('SELECT * FROM test')).all()
+
+    assert stats.count == 3
+    assert stats.max_time >= stats.avg_time > 0
+    assert '3 queries' in str(stats)
+
+    stats.reset()
+    assert stats.count == 0
+
+
+def test_close_all(db_path):
+    manager = get_db(db_path)
+    with connect(db_path):
+        pass
+    close_all()
+    assert get_db(db_path) is not manager
@@ -0,0 +1,105 @@
+"""Tests for naturtag/storage/freshness.py"""
+
+from datetime import timedelta
+from time import time
+from unittest.mock import MagicMock
+
+import pytest
+from pyinaturalist_convert import create_tables
+
+from naturtag.storage.db import connect
+from naturtag.storage.freshness import (
+    FreshnessPolicy,
+    backfill_fetched,
+    get_fetched,
+    save_fetched,
+)
+
+TTL = timedelta(days=7)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = tmp_path / 'naturtag.db'
+    now = time()
+    save_fetched('observation', [1], db_path, fetched_at=now)
+    save_fetched('observation', [2], db_path, fetched_at=now - timedelta(days=8).total_seconds())
+    save_fetched('taxon', [3], db_path, fetched_at=now)
+    return db_path
+
+
+def test_get_fetched(db_path):
+    fetched = get_fetched('observation', [1, 2, 3], db_path)
+    assert sorted(fetched) == [1, 2]
+    assert get_fetched('taxon', [3], db_path)
+
+
+def test_get_fetched__no_table(tmp_path):
+    assert get_fetched('observation', [1], tmp_path / 'naturtag.db') == {}
+
+
+def test_get_stale_ids(db_path):
+    policy = FreshnessPolicy('observation', ttl=TTL)
+    # 3 is only tracked as a taxon, so its observation fetch time is unknown
+    assert policy.get_stale_ids([1, 2, 3], db_path) == {2, 3}
+
+
+def test_get_stale_ids__known_fetch_times(db_path):
+    """Known fetch times should be used instead of looking them up"""
+    policy = FreshnessPolicy('observation', ttl=TTL)
+    assert policy.get_stale_ids([1, 2], db_path, fetched={2: time()}) == {1}
+
+
+def test_get_stale_ids__no_ttl(db_path):
+    policy = FreshnessPolicy('observation')
+    assert policy.get_stale_ids([1, 2, 3], db_path) == set()
+
+
+def test_revalidate__no_scheduler(db_path):
+    policy = FreshnessPolicy('observation', ttl=TTL)
+    refresh = MagicMock()
+    assert policy.revalidate([1, 2], refresh, db_path) == {2}
+    refresh.assert_not_called()
+
+
+def test_revalidate__scheduler(db_path):
+    scheduler = MagicMock()
+    policy = FreshnessPolicy('observation', ttl=TTL, scheduler=scheduler)
+    refresh = MagicMock()
+    assert policy.revalidate([1, 2, 3], refresh, db_path) == set()
+
+    # Records already being refreshed shouldn't be scheduled again
+    assert policy.revalidate([2, 3], refresh, db_path) == set()
+    scheduler.assert_called_once_with(policy._refresh, refresh=refresh, ids=[2, 3])
+
+    # Once finished, they can be refreshed again
+    policy._refresh(refresh=refresh, ids=[2, 3])
+    refresh.assert_called_once_with([2, 3])
+    policy.revalidate([2], refresh, db_path)
+    assert scheduler.call_count == 2
+
+
+def test_backfill_fetched(tmp_path):
+    """Records in a database from before fetch times were tracked should be considered fresh"""
+    db_path = tmp_path / 'naturtag.db'
+    create_tables(db_path)
+    with connect(db_path) as conn:
+        conn.execute('INSERT INTO observation (id) VALUES (1)')
+        conn.executemany(
+            'INSERT INTO taxon (id, name, partial) VALUES (?, ?, ?)',
+            [(2, 'full', False), (3, 'partial', True)],
+        )
+
+    backfill_fetched(db_path)
+    assert FreshnessPolicy('observation', ttl=TTL).get_stale_ids([1], db_path) == set()
+    assert FreshnessPolicy('taxon', ttl=TTL).get_stale_ids([2, 3], db_path) == {3}
+
+
+def test_backfill_fetched__existing_table(db_path):
+    """Once fetch times are tracked, missing fetch times (like expired taxa) shouldn't be replaced"""
+    create_tables(db_path)
+    with connect(db_path) as conn:
+        conn.execute('INSERT INTO observation (id) VALUES (4)')
+
+    backfill_fetched(db_path)
+    assert 4 not in get_fetched('observation', [4], db_path)
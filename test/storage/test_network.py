@@ -0,0 +1,27 @@
+"""Tests for naturtag/storage/network.py"""
+
+import pytest
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from naturtag.storage.network import OfflineAdapter, OfflineError, set_session_offline
+
+
+def test_set_session_offline():
+    session = Session()
+    set_session_offline(session)
+    assert all(isinstance(a, OfflineAdapter) for a in session.adapters.values())
+    with pytest.raises(OfflineError):
+        session.get('https://api.inaturalist.org/v1/taxa/1')
+
+    # Setting offline twice shouldn't lose the original adapters
+    set_session_offline(session)
+    set_session_offline(session, offline=False)
+    assert all(isinstance(a, HTTPAdapter) for a in session.adapters.values())
+
+
+def test_set_session_offline__already_online():
+    session = Session()
+    adapters = dict(session.adapters)
+    set_session_offline(session, offline=False)
+    assert session.adapters == adapters
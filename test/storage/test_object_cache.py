@@ -0,0 +1,121 @@
+"""Tests for naturtag/storage/object_cache.py"""
+
+from pyinaturalist import Observation, Photo, Taxon
+
+from naturtag.storage.object_cache import ObjectCache, _get_size
+
+DB_PATH = 'naturtag.db'
+
+
+def _make_taxa(*ids: int) -> list[Taxon]:
+    return [Taxon(id=i, name=f'Taxon {i}') for i in ids]
+
+
+def test_get_many():
+    cache: ObjectCache[Taxon] = ObjectCache()
+    cache.set_many(DB_PATH, _make_taxa(1, 2))
+
+    results = cache.get_many(DB_PATH, [1, 2, 3])
+    assert sorted(results) == [1, 2]
+    assert results[1].name == 'Taxon 1'
+    assert cache.stats == {
+        'items': 2,
+        'size': 2,
+        'hits': 2,
+        'misses': 1,
+        'hit_rate': 0.667,
+        'evictions': 0,
+    }
+
+
+def test_get_many__by_locale_and_db():
+    cache: ObjectCache[Taxon] = ObjectCache()
+    cache.set_many(DB_PATH, _make_taxa(1), locale='fr')
+
+    assert cache.get_many(DB_PATH, [1], locale='fr')
+    assert not cache.get_many(DB_PATH, [1])
+    assert not cache.get_many('other.db', [1], locale='fr')
+
+
+def test_partial():
+    cache: ObjectCache[Taxon] = ObjectCache()
+    cache.set_many(DB_PATH, _make_taxa(1), partial=True)
+    assert not cache.get_many(DB_PATH, [1])
+    assert cache.get_many(DB_PATH, [1], accept_partial=True)
+
+    # A full item can replace a partial one, but not vice versa
+    cache.set_many(DB_PATH, [Taxon(id=1, name='full')])
+    cache.set_many(DB_PATH, [Taxon(id=1, name='partial')], partial=True)
+    assert cache.get_many(DB_PATH, [1])[1].name == 'full'
+    assert len(cache) == 1
+
+
+def test_get_many__min_fetched_at():
+    cache: ObjectCache[Taxon] = ObjectCache()
+    cache.set_many(DB_PATH, _make_taxa(1, 2), fetched_at={1: 100})
+    cache.set_many(DB_PATH, _make_taxa(3))
+
+    assert sorted(cache.get_many(DB_PATH, [1, 2, 3])) == [1, 2, 3]
+    # 2 has an unknown fetch time, and 3 was fetched when it was added
+    assert sorted(cache.get_many(DB_PATH, [1, 2, 3], min_fetched_at=50)) == [1, 3]
+    assert sorted(cache.get_many(DB_PATH, [1, 2, 3], min_fetched_at=200)) == [3]
+
+
+def test_evict__max_items():
+    cache: ObjectCache[Taxon] = ObjectCache(max_items=2)
+    cache.set_many(DB_PATH, _make_taxa(1, 2))
+    cache.get_many(DB_PATH, [1])  # Mark 1 as most recently used
+    cache.set_many(DB_PATH, _make_taxa(3))
+
+    assert sorted(cache.get_many(DB_PATH, [1, 2, 3])) == [1, 3]
+    assert cache.evictions == 1
+
+
+def test_evict__max_size():
+    cache: ObjectCache[Taxon] = ObjectCache(max_size=4)
+    cache.set_many(DB_PATH, _make_taxa(1, 2))
+    cache.set_many(DB_PATH, [Taxon(id=3, ancestors=_make_taxa(4, 5))])
+
+    assert sorted(cache.get_many(DB_PATH, [1, 2, 3])) == [2, 3]
+    assert cache.size == 4
+
+
+def test_invalidate():
+    cache: ObjectCache[Taxon] = ObjectCache()
+    cache.set_many(DB_PATH, _make_taxa(1, 2))
+    cache.set_many(DB_PATH, _make_taxa(1), locale='fr')
+    cache.invalidate(DB_PATH, [1, 1234])
+
+    assert not cache.get_many(DB_PATH, [1])
+    assert not cache.get_many(DB_PATH, [1], locale='fr')
+    assert cache.get_many(DB_PATH, [2])
+    assert cache.size == 1
+
+
+def test_clear():
+    cache: ObjectCache[Taxon] = ObjectCache()
+    cache.set_many(DB_PATH, _make_taxa(1, 2))
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_get_size():
+    taxon = Taxon(id=1, ancestors=_make_taxa(2, 3), children=_make_taxa(4))
+    obs = Observation(id=1, taxon=taxon, photos=[Photo(id=1), Photo(id=2)])
+    assert _get_size(taxon) == 4
+    assert _get_size(obs) == 7
+
+
+def test_get_many__copies():
+    """Replacing attributes of cached objects shouldn't affect the cache"""
+    cache: ObjectCache[Taxon] = ObjectCache()
+    taxa = _make_taxa(1)
+    cache.set_many(DB_PATH, taxa)
+    taxa[0].name = 'Modified'
+
+    result = cache.get_many(DB_PATH, [1])[1]
+    result.ancestors = _make_taxa(2)
+    result = cache.get_many(DB_PATH, [1])[1]
+    assert result.name == 'Taxon 1'
+    assert result.ancestors == []
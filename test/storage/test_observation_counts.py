@@ -0,0 +1,112 @@
+"""Tests for naturtag/storage/observation_counts.py"""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+from pyinaturalist import Observation, Taxon, User
+from pyinaturalist_convert.db import create_tables, save_observations
+
+from naturtag.storage.observation_counts import (
+    create_observation_counts,
+    get_observation_count,
+    get_taxon_observation_counts,
+)
+
+USER_1 = User(id=1, login='user_1')
+USER_2 = User(id=2, login='user_2')
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    db_path = tmp_path / 'naturtag.db'
+    create_tables(db_path)
+    return db_path
+
+
+def test_get_observation_count(db_path):
+    create_observation_counts(db_path)
+    save_observations(
+        [
+            Observation(id=1, user=USER_1),
+            Observation(id=2, user=USER_1),
+            Observation(id=3, user=USER_2),
+            Observation(id=4),
+        ],
+        db_path,
+    )
+    assert get_observation_count(db_path) == 4
+    assert get_observation_count(db_path, username='user_1') == 2
+    assert get_observation_count(db_path, username='user_2') == 1
+    assert get_observation_count(db_path, username='nonexistent') == 0
+
+
+def test_get_observation_count__updates(db_path):
+    """Re-saving observations shouldn't change counts, but changing users or deleting should"""
+    create_observation_counts(db_path)
+    save_observations([Observation(id=1, user=USER_1), Observation(id=2, user=USER_1)], db_path)
+    save_observations([Observation(id=1, user=USER_1)], db_path)
+    assert get_observation_count(db_path, username='user_1') == 2
+
+    save_observations([Observation(id=2, user=USER_2)], db_path)
+    assert get_observation_count(db_path, username='user_1') == 1
+    assert get_observation_count(db_path, username='user_2') == 1
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('DELETE FROM observation WHERE id = 1')
+    assert get_observation_count(db_path, username='user_1') == 0
+    assert get_observation_count(db_path) == 1
+
+
+def test_create_observation_counts__existing_observations(db_path):
+    save_observations([Observation(id=1, user=USER_1), Observation(id=2, user=USER_2)], db_path)
+    create_observation_counts(db_path)
+    create_observation_counts(db_path)  # Rebuilding should give the same counts
+    assert get_observation_count(db_path) == 2
+    assert get_observation_count(db_path, username='user_1') == 1
+
+
+def test_get_observation_count__no_count_table(db_path):
+    """Without the count table, observations should be counted directly"""
+    save_observations([Observation(id=1, user=USER_1), Observation(id=2, user=USER_2)], db_path)
+    assert get_observation_count(db_path) == 2
+    assert get_observation_count(db_path, username='user_1') == 1
+
+
+def test_get_taxon_observation_counts(db_path):
+    create_observation_counts(db_path)
+    save_observations(
+        [
+            Observation(id=1, user=USER_1, taxon=Taxon(id=10), quality_grade='research'),
+            Observation(id=2, user=USER_1, taxon=Taxon(id=10), quality_grade='needs_id'),
+            Observation(id=3, user=USER_1, taxon=Taxon(id=20), quality_grade='casual'),
+            Observation(id=4, user=USER_1),
+            Observation(id=5, user=USER_2, taxon=Taxon(id=10)),
+        ],
+        db_path,
+    )
+    assert get_taxon_observation_counts('user_1', db_path) == {10: 2}
+    assert get_taxon_observation_counts('user_1', db_path, casual=True) == {10: 2, 20: 1}
+
+    # Changing the taxon or quality grade of an observation should update counts
+    save_observations(
+        [Observation(id=2, user=USER_1, taxon=Taxon(id=20), quality_grade='casual')], db_path
+    )
+    assert get_taxon_observation_counts('user_1', db_path) == {10: 1}
+    assert get_taxon_observation_counts('user_1', db_path, casual=True) == {10: 1, 20: 2}
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('DELETE FROM observation WHERE id = 1')
+    assert get_taxon_observation_counts('user_1', db_path) == {}
+
+
+def test_get_taxon_observation_counts__no_count_table(db_path):
+    save_observations(
+        [
+            Observation(id=1, user=USER_1, taxon=Taxon(id=10)),
+            Observation(id=2, user=USER_1, taxon=Taxon(id=20), quality_grade='casual'),
+        ],
+        db_path,
+    )
+    assert get_taxon_observation_counts('user_1', db_path) == {10: 1}
+    assert get_taxon_observation_counts('user_1', db_path, casual=True) == {10: 1, 20: 1}
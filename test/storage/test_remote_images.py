@@ -3,10 +3,13 @@
 from unittest.mock import create_autospec, patch
 
 import pytest
+from pyinaturalist import Photo
 
-from naturtag.storage.remote_images import ImageFetcher
+from naturtag.storage.network import OfflineError
+from naturtag.storage.remote_images import ImageFetcher, get_url_hash
 
 THUMB_URL = 'https://static.inaturalist.org/photos/10/square.jpg'
+MEDIUM_URL = 'https://static.inaturalist.org/photos/10/medium.jpg'
 
 
 @pytest.fixture
@@ -42,3 +45,17 @@ def test_precache_image__suppresses_errors(fetcher):
     fetcher.precache_image([url1, url2])
 
     assert fetcher.get_image.call_count == 2
+
+
+def test_get_image__offline(tmp_path):
+    """In offline mode, cached images should be returned, and cache misses should fail without
+    sending a request
+    """
+    with patch('naturtag.storage.remote_images.ClientSession'):
+        fetcher = ImageFetcher(cache_path=tmp_path / 'images.db', network_policy='offline')
+    fetcher.image_cache[f'{get_url_hash(THUMB_URL)}.jpg'] = b'data'
+
+    assert fetcher.get_image(Photo(url=THUMB_URL), url=THUMB_URL) == b'data'
+    with pytest.raises(OfflineError):
+        fetcher.get_image(Photo(url=MEDIUM_URL), url=MEDIUM_URL)
+    fetcher.session.get.assert_not_called()
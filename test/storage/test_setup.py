@@ -1,15 +1,32 @@
 """Tests for naturtag/storage/setup.py"""
 
+import hashlib
+import os
 import sqlite3
 import tarfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from threading import Thread
+from typing import Optional
 from unittest.mock import MagicMock, call, patch
 
 import pytest
 import requests
-
-from naturtag.constants import TAXON_DB_URL
-from naturtag.storage.setup import _download_taxon_db, _load_taxon_db, _taxon_table_populated, setup
+from pyinaturalist_convert import create_tables
+from requests.exceptions import ChunkedEncodingError
+
+from naturtag.constants import DOWNLOAD_RETRIES, DOWNLOAD_RETRY_DELAY
+from naturtag.storage.setup import (
+    _apply_taxon_deltas,
+    _create_indexes,
+    _download_taxon_db,
+    _enable_wal,
+    _load_taxon_db,
+    _taxon_table_populated,
+    setup,
+)
+from naturtag.storage.taxonomy_delta import TaxonomyDeltaError
+from naturtag.storage.taxonomy_loader import ChecksumError, load_taxonomy_archive
 
 
 @pytest.fixture
@@ -32,6 +49,13 @@ def mock_setup_deps():
             'naturtag.storage.setup._taxon_table_populated', return_value=False
         ) as mock_populated,
         patch('naturtag.storage.setup.AppState') as mock_app_state_cls,
+        patch('naturtag.storage.setup.build_taxon_tree') as mock_build_taxon_tree,
+        patch('naturtag.storage.setup._create_indexes') as mock_create_indexes,
+        patch('naturtag.storage.setup.create_observation_counts') as mock_create_obs_counts,
+        patch('naturtag.storage.setup._apply_taxon_deltas') as mock_apply_deltas,
+        patch('naturtag.storage.setup.partition_taxon_fts') as mock_partition,
+        patch('naturtag.storage.setup.backfill_fetched') as mock_backfill,
+        patch('naturtag.storage.setup._table_exists', return_value=False),
     ):
         mock_app_state_cls.read.return_value = mock_state
         yield {
@@ -41,24 +65,29 @@ def mock_setup_deps():
             'create_obs_fts': mock_create_obs_fts,
             'load_taxon_db': mock_load_taxon_db,
             'taxon_table_populated': mock_populated,
+            'build_taxon_tree': mock_build_taxon_tree,
+            'create_indexes': mock_create_indexes,
+            'create_obs_counts': mock_create_obs_counts,
+            'apply_deltas': mock_apply_deltas,
+            'partition': mock_partition,
+            'backfill': mock_backfill,
         }
 
 
 @pytest.fixture
 def mock_load_taxon_db_deps():
     """Patch external dependencies shared by multiple _load_taxon_db() tests."""
-    mock_tar = MagicMock()
-    mock_conn = MagicMock()
-
     with (
-        patch('naturtag.storage.setup.load_table'),
-        patch('naturtag.storage.setup.vacuum_analyze'),
-        patch('naturtag.storage.setup.TarFile') as mock_tarfile_cls,
-        patch('naturtag.storage.setup.sqlite3.connect') as mock_connect,
+        patch('naturtag.storage.setup.load_taxonomy_archive') as mock_load_archive,
+        patch('naturtag.storage.setup.install_taxonomy_db') as mock_install,
+        patch('naturtag.storage.setup.PACKAGED_TAXON_SQLITE') as mock_prebuilt_db,
     ):
-        mock_tarfile_cls.open.return_value.__enter__.return_value = mock_tar
-        mock_connect.return_value.__enter__.return_value = mock_conn
-        yield {'tar': mock_tar, 'conn': mock_conn}
+        mock_prebuilt_db.is_file.return_value = False
+        yield {
+            'load_archive': mock_load_archive,
+            'install': mock_install,
+            'prebuilt_db': mock_prebuilt_db,
+        }
 
 
 def test_setup__creates_tables_on_first_run(mock_setup_deps, db_path):
@@ -67,7 +96,11 @@ def test_setup__creates_tables_on_first_run(mock_setup_deps, db_path):
     mock_setup_deps['create_tables'].assert_called_once_with(db_path)
     mock_setup_deps['create_taxon_fts'].assert_called_once_with(db_path)
     mock_setup_deps['create_obs_fts'].assert_called_once_with(db_path)
-    mock_setup_deps['load_taxon_db'].assert_called_once_with(db_path, False)
+    mock_setup_deps['load_taxon_db'].assert_called_once_with(db_path, False, None)
+    mock_setup_deps['build_taxon_tree'].assert_called_once_with(db_path)
+    mock_setup_deps['create_indexes'].assert_called_once_with(db_path)
+    mock_setup_deps['create_obs_counts'].assert_called_once_with(db_path)
+    mock_setup_deps['backfill'].assert_called_once_with(db_path)
 
     state = mock_setup_deps['state']
     assert state.setup_complete is True
@@ -90,7 +123,7 @@ def test_setup__overwrite_drops_correct_tables_and_recreates(mock_setup_deps, db
     mock_setup_deps['state'].setup_complete = True
     db_path.touch()
 
-    with patch('naturtag.storage.setup.sqlite3.connect') as mock_connect:
+    with patch('naturtag.storage.setup.connect') as mock_connect:
         mock_conn = MagicMock()
         mock_connect.return_value.__enter__.return_value = mock_conn
 
@@ -103,10 +136,32 @@ def test_setup__overwrite_drops_correct_tables_and_recreates(mock_setup_deps, db
         call('DROP TABLE IF EXISTS taxon_fts'),
         call('DROP TABLE IF EXISTS photo'),
         call('DROP TABLE IF EXISTS user'),
+        call('DROP TABLE IF EXISTS taxon_tree'),
     ]
     mock_conn.execute.assert_has_calls(expected_drops, any_order=False)
     mock_setup_deps['create_tables'].assert_called_once_with(db_path)
-    mock_setup_deps['load_taxon_db'].assert_called_once_with(db_path, False)
+    mock_setup_deps['load_taxon_db'].assert_called_once_with(db_path, False, None)
+
+
+def test_setup__keeps_existing_taxon_fts(mock_setup_deps, db_path):
+    """An existing text search table should not be replaced"""
+    with patch('naturtag.storage.setup._table_exists', return_value=True):
+        setup(db_path=db_path)
+    mock_setup_deps['create_taxon_fts'].assert_not_called()
+
+
+def test_setup__languages(mock_setup_deps, db_path):
+    setup(db_path=db_path, languages=['en'])
+    mock_setup_deps['partition'].assert_called_once_with(db_path, ['en'])
+
+
+def test_setup__languages_after_setup_complete(mock_setup_deps, db_path):
+    """Languages can be changed without running the rest of setup again"""
+    mock_setup_deps['state'].setup_complete = True
+    setup(db_path=db_path, languages=['en'])
+
+    mock_setup_deps['partition'].assert_called_once_with(db_path, ['en'])
+    mock_setup_deps['create_tables'].assert_not_called()
 
 
 def test_setup__creates_parent_dirs(mock_setup_deps, tmp_path):
@@ -121,7 +176,7 @@ def test_setup__creates_parent_dirs(mock_setup_deps, tmp_path):
 @pytest.mark.parametrize('download', [False, True])
 def test_setup__passes_download_flag_to_load(mock_setup_deps, db_path, download):
     setup(db_path=db_path, download=download)
-    mock_setup_deps['load_taxon_db'].assert_called_once_with(db_path, download)
+    mock_setup_deps['load_taxon_db'].assert_called_once_with(db_path, download, None)
 
 
 def test_setup__skips_load_if_taxon_table_populated(mock_setup_deps, db_path):
@@ -133,6 +188,8 @@ def test_setup__skips_load_if_taxon_table_populated(mock_setup_deps, db_path):
     setup(db_path=db_path)
 
     mock_setup_deps['load_taxon_db'].assert_not_called()
+    mock_setup_deps['apply_deltas'].assert_called_once_with(db_path, None)
+    mock_setup_deps['build_taxon_tree'].assert_called_once_with(db_path)
     assert mock_setup_deps['state'].setup_complete is True
 
 
@@ -145,7 +202,7 @@ def test_setup__skips_load_if_taxon_table_populated(mock_setup_deps, db_path):
 )
 def test_taxon_table_populated(tmp_path, rows, expected):
     db_path = tmp_path / 'naturtag.db'
-    with patch('naturtag.storage.setup.sqlite3.connect') as mock_connect:
+    with patch('naturtag.storage.setup.connect') as mock_connect:
         mock_conn = MagicMock()
         mock_conn.execute.return_value.fetchone.return_value = rows[0]
         mock_connect.return_value.__enter__.return_value = mock_conn
@@ -154,7 +211,7 @@ def test_taxon_table_populated(tmp_path, rows, expected):
 
 def test_taxon_table_populated__missing_table(tmp_path):
     db_path = tmp_path / 'naturtag.db'
-    with patch('naturtag.storage.setup.sqlite3.connect') as mock_connect:
+    with patch('naturtag.storage.setup.connect') as mock_connect:
         mock_conn = MagicMock()
         mock_conn.execute.side_effect = sqlite3.OperationalError('no such table: taxon')
         mock_connect.return_value.__enter__.return_value = mock_conn
@@ -185,58 +242,278 @@ def test_load_taxon_db__no_download(db_path, mock_load_taxon_db_deps):
 
 
 def test_load_taxon_db(db_path, mock_load_taxon_db_deps):
-    with (
-        patch('naturtag.storage.setup.PACKAGED_TAXON_DB') as mock_packaged_db,
-        patch('naturtag.storage.setup.load_table') as mock_load_table,
-        patch('naturtag.storage.setup.vacuum_analyze') as mock_vacuum,
-    ):
+    progress = MagicMock()
+    with patch('naturtag.storage.setup.PACKAGED_TAXON_DB') as mock_packaged_db:
         mock_packaged_db.is_file.return_value = True
+        _load_taxon_db(db_path, download=False, progress=progress)
+
+    mock_load_taxon_db_deps['load_archive'].assert_called_once_with(
+        mock_packaged_db, db_path, progress
+    )
+
 
+def test_load_taxon_db__prebuilt(db_path, mock_load_taxon_db_deps):
+    mock_load_taxon_db_deps['prebuilt_db'].is_file.return_value = True
+    _load_taxon_db(db_path, download=False)
+
+    mock_load_taxon_db_deps['install'].assert_called_once_with(
+        mock_load_taxon_db_deps['prebuilt_db'], db_path, progress=None
+    )
+    mock_load_taxon_db_deps['load_archive'].assert_not_called()
+
+
+def test_load_taxon_db__prebuilt_invalid(db_path, mock_load_taxon_db_deps):
+    """If the prebuilt db fails verification, fall back to loading from the CSV archive"""
+    mock_load_taxon_db_deps['prebuilt_db'].is_file.return_value = True
+    mock_load_taxon_db_deps['install'].side_effect = ChecksumError('Checksum mismatch')
+    with patch('naturtag.storage.setup.PACKAGED_TAXON_DB') as mock_packaged_db:
+        mock_packaged_db.is_file.return_value = True
         _load_taxon_db(db_path, download=False)
 
-    table_names = [c.kwargs.get('table_name') or c.args[2] for c in mock_load_table.call_args_list]
-    assert table_names == ['taxon', 'taxon_fts']
-    mock_vacuum.assert_called_once_with(['taxon', 'taxon_fts'], db_path)
+    mock_load_taxon_db_deps['load_archive'].assert_called_once_with(mock_packaged_db, db_path, None)
 
 
 def test_load_taxon_db__corrupt_tar(db_path, mock_load_taxon_db_deps, tmp_path):
     """A corrupt tar file is deleted so the next run with download=True can refetch it."""
     corrupt_tar = tmp_path / 'taxonomy.tar.gz'
-    corrupt_tar.touch()
-
-    with (
-        patch('naturtag.storage.setup.PACKAGED_TAXON_DB', corrupt_tar),
-        patch('naturtag.storage.setup.TarFile') as mock_tarfile_cls,
-    ):
-        mock_tarfile_cls.open.return_value.__enter__.side_effect = tarfile.TarError('bad file')
+    corrupt_tar.write_bytes(b'not a tar file')
 
+    mock_load_taxon_db_deps['load_archive'].side_effect = load_taxonomy_archive
+    with patch('naturtag.storage.setup.PACKAGED_TAXON_DB', corrupt_tar):
         with pytest.raises(tarfile.TarError):
             _load_taxon_db(db_path, download=False)
 
     assert not corrupt_tar.exists()
 
 
-def test_download_taxon_db(tmp_path, requests_mock):
-    dest = tmp_path / 'taxonomy.tar.gz'
-    content = b'x' * (1024 * 1024)
-    requests_mock.get(TAXON_DB_URL, content=content)
+def test_apply_taxon_deltas(db_path, tmp_path):
+    delta_path = tmp_path / 'taxonomy-delta-2024.06.tar.gz'
+    delta_path.touch()
+    with (
+        patch('naturtag.storage.setup.DATA_DIR', tmp_path),
+        patch('naturtag.storage.setup.apply_taxonomy_deltas') as mock_apply,
+    ):
+        _apply_taxon_deltas(db_path)
+    mock_apply.assert_called_once_with([delta_path], db_path, None)
 
-    with patch('naturtag.storage.setup.PACKAGED_TAXON_DB', dest):
-        _download_taxon_db()
 
-    assert dest.stat().st_size == len(content)
+def test_apply_taxon_deltas__error(db_path, tmp_path):
+    """A failed taxonomy update should not prevent setup from completing"""
+    with (
+        patch('naturtag.storage.setup.DATA_DIR', tmp_path),
+        patch(
+            'naturtag.storage.setup.apply_taxonomy_deltas',
+            side_effect=TaxonomyDeltaError('Version mismatch'),
+        ),
+    ):
+        _apply_taxon_deltas(db_path)
 
 
-def test_download_taxon_db__error(tmp_path):
-    mock_response = MagicMock()
-    mock_response.raise_for_status.side_effect = requests.HTTPError('404 Not Found')
+class TaxonDbHandler(BaseHTTPRequestHandler):
+    """Serves taxon data and checksum files, with optional support for (conditional) range requests
+    and interrupted responses
+    """
 
+    server: 'TaxonDbServer'
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        if self.path.endswith('.sha256'):
+            if self.server.checksum is None:
+                self.send_error(404)
+            else:
+                self._send(200, f'{self.server.checksum}  taxonomy.tar.gz\n'.encode())
+            return
+
+        if self.path != '/taxonomy.tar.gz':
+            self.send_error(404)
+            return
+        content, start = self.server.content, 0
+        if_range = self.headers.get('If-Range')
+        if (
+            (range_header := self.headers.get('Range'))
+            and self.server.support_range
+            and if_range in (None, self.server.etag)
+        ):
+            start = int(range_header.removeprefix('bytes=').rstrip('-'))
+            if start >= len(content):
+                self._send(416, b'')
+                return
+        body = content[start:]
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.server.etag)
+        self.end_headers()
+        # Optionally send only part of the file, then close the connection
+        if self.server.interrupt_count > 0:
+            self.server.interrupt_count -= 1
+            body = body[: len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TaxonDbServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), TaxonDbHandler)
+        self.content = os.urandom(512 * 1024)
+        self.checksum: Optional[str] = hashlib.sha256(self.content).hexdigest()
+        self.support_range = True
+        self.etag = '"v1"'
+        self.interrupt_count = 0
+        self.requests: list[tuple[str, Optional[str]]] = []
+        self.mock_sleep = MagicMock()
+
+
+@pytest.fixture
+def taxon_db_server(tmp_path):
+    """Local HTTP server for taxon data, with URL and destination paths patched to use it"""
+    server = TaxonDbServer()
+    thread = Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/taxonomy.tar.gz'
     with (
+        patch('naturtag.storage.setup.TAXON_DB_URL', url),
+        patch('naturtag.storage.setup.TAXON_DB_CHECKSUM_URL', f'{url}.sha256'),
         patch('naturtag.storage.setup.PACKAGED_TAXON_DB', tmp_path / 'taxonomy.tar.gz'),
-        patch('naturtag.storage.setup.requests.get') as mock_get,
-        patch('builtins.open', create=True),
+        patch('naturtag.storage.setup.sleep') as mock_sleep,
     ):
-        mock_get.return_value.__enter__.return_value = mock_response
+        server.mock_sleep = mock_sleep
+        yield server
+    server.shutdown()
+    server.server_close()
+
 
+def test_download_taxon_db(taxon_db_server, tmp_path):
+    progress = []
+    _download_taxon_db(progress.append)
+
+    dest = tmp_path / 'taxonomy.tar.gz'
+    assert dest.read_bytes() == taxon_db_server.content
+    assert not (tmp_path / 'taxonomy.tar.gz.part').exists()
+    assert not (tmp_path / 'taxonomy.tar.gz.part.validator').exists()
+    assert progress[-1].bytes_read == progress[-1].total_bytes == len(taxon_db_server.content)
+
+
+def test_download_taxon_db__resume(taxon_db_server, tmp_path):
+    """A partial download from a previous run should be resumed"""
+    (tmp_path / 'taxonomy.tar.gz.part').write_bytes(taxon_db_server.content[:1000])
+    (tmp_path / 'taxonomy.tar.gz.part.validator').write_text('"v1"')
+    _download_taxon_db()
+
+    assert (tmp_path / 'taxonomy.tar.gz').read_bytes() == taxon_db_server.content
+    assert taxon_db_server.requests[-1] == ('/taxonomy.tar.gz', 'bytes=1000-')
+
+
+def test_download_taxon_db__resume_changed(taxon_db_server, tmp_path):
+    """A partial download of an older version of the file should be discarded"""
+    (tmp_path / 'taxonomy.tar.gz.part').write_bytes(b'x' * 1000)
+    (tmp_path / 'taxonomy.tar.gz.part.validator').write_text('"v0"')
+    _download_taxon_db()
+
+    assert (tmp_path / 'taxonomy.tar.gz').read_bytes() == taxon_db_server.content
+
+
+def test_download_taxon_db__resume_no_validator(taxon_db_server, tmp_path):
+    """A partial download that can't be matched to the remote file should be discarded"""
+    (tmp_path / 'taxonomy.tar.gz.part').write_bytes(b'x' * 1000)
+    _download_taxon_db()
+
+    assert (tmp_path / 'taxonomy.tar.gz').read_bytes() == taxon_db_server.content
+    assert taxon_db_server.requests[-1] == ('/taxonomy.tar.gz', None)
+
+
+def test_download_taxon_db__retry(taxon_db_server, tmp_path):
+    """An interrupted download should be retried from where it left off"""
+    taxon_db_server.interrupt_count = 1
+    _download_taxon_db()
+
+    assert (tmp_path / 'taxonomy.tar.gz').read_bytes() == taxon_db_server.content
+    range_requests = [r[1] for r in taxon_db_server.requests if r[0] == '/taxonomy.tar.gz']
+    assert range_requests[0] is None
+    assert range_requests[1].startswith('bytes=')
+    taxon_db_server.mock_sleep.assert_called_once_with(DOWNLOAD_RETRY_DELAY)
+
+
+def test_download_taxon_db__retries_exceeded(taxon_db_server, tmp_path):
+    """After too many interruptions, the partial download should be kept for the next run"""
+    taxon_db_server.interrupt_count = DOWNLOAD_RETRIES
+    with pytest.raises(ChunkedEncodingError):
+        _download_taxon_db()
+
+    assert not (tmp_path / 'taxonomy.tar.gz').exists()
+    assert (tmp_path / 'taxonomy.tar.gz.part').stat().st_size > 0
+    # Delay should increase after each retry
+    assert taxon_db_server.mock_sleep.call_args_list == [
+        call(DOWNLOAD_RETRY_DELAY * 2**i) for i in range(DOWNLOAD_RETRIES - 1)
+    ]
+
+
+def test_download_taxon_db__range_not_supported(taxon_db_server, tmp_path):
+    """If the server doesn't support range requests, the download should start over"""
+    taxon_db_server.support_range = False
+    (tmp_path / 'taxonomy.tar.gz.part').write_bytes(b'x' * 1000)
+    (tmp_path / 'taxonomy.tar.gz.part.validator').write_text('"v1"')
+    _download_taxon_db()
+
+    assert (tmp_path / 'taxonomy.tar.gz').read_bytes() == taxon_db_server.content
+
+
+def test_download_taxon_db__checksum_mismatch(taxon_db_server, tmp_path):
+    taxon_db_server.checksum = '0' * 64
+    with pytest.raises(ChecksumError):
+        _download_taxon_db()
+
+    assert not (tmp_path / 'taxonomy.tar.gz').exists()
+    assert not (tmp_path / 'taxonomy.tar.gz.part').exists()
+
+
+def test_download_taxon_db__no_checksum(taxon_db_server, tmp_path):
+    """If no checksum is published, the download should still complete, without verification"""
+    taxon_db_server.checksum = None
+    _download_taxon_db()
+    assert (tmp_path / 'taxonomy.tar.gz').read_bytes() == taxon_db_server.content
+
+
+def test_download_taxon_db__no_checksum_no_resume(taxon_db_server, tmp_path):
+    """Without a checksum to verify the result, a partial download should not be resumed"""
+    taxon_db_server.checksum = None
+    (tmp_path / 'taxonomy.tar.gz.part').write_bytes(taxon_db_server.content[:1000])
+    (tmp_path / 'taxonomy.tar.gz.part.validator').write_text('"v1"')
+    _download_taxon_db()
+
+    assert (tmp_path / 'taxonomy.tar.gz').read_bytes() == taxon_db_server.content
+    assert taxon_db_server.requests[-1] == ('/taxonomy.tar.gz', None)
+
+
+def test_download_taxon_db__error(taxon_db_server, tmp_path):
+    url = f'http://127.0.0.1:{taxon_db_server.server_address[1]}/missing'
+    with patch('naturtag.storage.setup.TAXON_DB_URL', url):
         with pytest.raises(requests.HTTPError):
             _download_taxon_db()
+    assert not (tmp_path / 'taxonomy.tar.gz').exists()
+
+
+def test_create_indexes(db_path):
+    create_tables(db_path)
+    _create_indexes(db_path)
+    _create_indexes(db_path)  # Should be idempotent
+    with sqlite3.connect(db_path) as conn:
+        index_names = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")
+        }
+    assert 'ix_observation_user_created_at' in index_names
+
+
+def test_enable_wal(db_path):
+    _enable_wal(db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
@@ -0,0 +1,78 @@
+"""Tests for naturtag/storage/sync.py"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from pyinaturalist import Observation, Photo
+
+from naturtag.storage import AppState, Settings
+from naturtag.storage.sync import get_obs_image_urls, sync_observations
+
+THUMB_URL = 'https://static.inaturalist.org/photos/10/square.jpg'
+
+
+@pytest.fixture
+def settings(tmp_path) -> Settings:
+    return Settings(path=tmp_path / 'settings.yml', username='testuser')
+
+
+@pytest.fixture
+def state(settings) -> AppState:
+    state = AppState(last_obs_check=None)
+    state.db_path = settings.db_path
+    with patch('naturtag.storage.sync.setup', return_value=state):
+        yield state
+
+
+def test_sync_observations(settings, state):
+    state.sync_resume_id = 42
+    client = MagicMock()
+    client.observations.search_user_paginated.return_value = iter(
+        [[Observation(id=43), Observation(id=44)], [Observation(id=45)]]
+    )
+
+    progress = list(sync_observations(settings, client))
+
+    assert [(p.page, p.page_size, p.total) for p in progress] == [(1, 2, 2), (2, 1, 3)]
+    client.observations.search_user_paginated.assert_called_once_with(
+        username='testuser', updated_since=None, id_above=42
+    )
+    # After a complete sync, the next one should be incremental
+    assert state.sync_resume_id is None
+    assert state.last_obs_check is not None
+    assert AppState.read(settings.db_path).last_obs_check == state.last_obs_check
+
+
+def test_sync_observations__error(settings, state):
+    """If the sync fails, the checkpoint for the next incremental sync should not be updated"""
+    client = MagicMock()
+    client.observations.search_user_paginated.side_effect = RuntimeError('timeout')
+
+    with pytest.raises(RuntimeError):
+        list(sync_observations(settings, client))
+    assert state.last_obs_check is None
+
+
+@patch('naturtag.storage.sync.ImageFetcher')
+def test_sync_observations__precache_thumbnails(mock_fetcher_cls, settings, state):
+    client = MagicMock()
+    obs = Observation(id=1, photos=[Photo(id=1, url=THUMB_URL)])
+    client.observations.search_user_paginated.return_value = iter([[obs]])
+
+    list(sync_observations(settings, client, precache_thumbnails=True))
+
+    urls = mock_fetcher_cls.return_value.precache_image.call_args.args[0]
+    assert urls == [
+        Photo(url=THUMB_URL).url_size('medium'),
+        Photo(url=THUMB_URL).url_size('square'),
+    ]
+
+
+def test_sync_observations__no_username(tmp_path):
+    with pytest.raises(ValueError):
+        list(sync_observations(Settings(path=tmp_path / 'settings.yml')))
+
+
+def test_get_obs_image_urls__skip_missing():
+    obs = Observation(id=1, photos=[Photo(id=1), Photo(id=10, url=THUMB_URL)])
+    assert get_obs_image_urls(obs) == [THUMB_URL]
@@ -0,0 +1,196 @@
+"""Tests for naturtag/storage/taxon_fts.py"""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+from pyinaturalist_convert import create_tables
+from pyinaturalist_convert.fts import create_taxon_fts_table
+
+from naturtag.storage.taxon_fts import (
+    TaxonAutocompleter,
+    drop_fts_partitions,
+    get_fts_languages,
+    get_fts_tables,
+    partition_taxon_fts,
+    reset_fts_partitions,
+    search_taxa_local,
+)
+
+# name, taxon_id, taxon_rank, count_rank, language_code
+FTS_ROWS = [
+    ('Danaus plexippus', 1, 'species', 5, None),
+    ('Monarch', 1, 'species', 5, 'en'),
+    ('Monarque', 1, 'species', 5, 'fr'),
+    ('Danaus gilippus', 2, 'species', 3, None),
+    ('Queen', 2, 'species', 3, 'en'),
+    ('Monarca', 1, 'species', 5, 'zh-CN'),
+]
+
+
+def _insert_fts(db_path: Path, rows):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany('INSERT INTO taxon_fts VALUES (?, ?, ?, ?, ?)', rows)
+
+
+def _table_names(db_path: Path) -> set[str]:
+    with sqlite3.connect(db_path) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    db_path = tmp_path / 'naturtag.db'
+    create_taxon_fts_table(db_path)
+    _insert_fts(db_path, FTS_ROWS)
+    return db_path
+
+
+def test_partition_taxon_fts(db_path):
+    counts = partition_taxon_fts(db_path, ['en', 'ZH_cn'])
+    assert counts == {'': 2, 'en': 2, 'zh-CN': 1}
+
+    tables = _table_names(db_path)
+    assert {'taxon_fts__sci', 'taxon_fts__en', 'taxon_fts__zh_cn'} <= tables
+    assert 'taxon_fts__fr' not in tables
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM taxon_fts').fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM taxon_fts_locale').fetchone()[0] == 3
+        assert get_fts_tables(conn) == [
+            'taxon_fts',
+            'taxon_fts__sci',
+            'taxon_fts__en',
+            'taxon_fts__zh_cn',
+        ]
+    assert get_fts_languages(db_path) == ['en', 'zh-CN']
+
+
+def test_partition_taxon_fts__not_partitioned(db_path):
+    """Without any languages specified, an unpartitioned table should be left as-is"""
+    assert partition_taxon_fts(db_path) == {}
+    assert 'taxon_fts_locale' not in _table_names(db_path)
+    assert get_fts_languages(db_path) == ['en', 'fr', 'zh-CN']
+
+
+def test_get_fts_languages(db_path):
+    """Languages should be read from the language table instead of scanning the combined table,
+    once it's been created
+    """
+    assert get_fts_languages(db_path) == ['en', 'fr', 'zh-CN']  # Full scan
+    partition_taxon_fts(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('UPDATE taxon_fts SET language_code = NULL')
+    assert get_fts_languages(db_path) == ['en', 'fr', 'zh-CN']
+
+    # Updated on next load
+    partition_taxon_fts(db_path)
+    assert get_fts_languages(db_path) == []
+
+
+def test_partition_taxon_fts__new_rows(db_path):
+    """Rows loaded after partitioning (e.g., from a taxonomy update) should be moved into existing
+    partitions, and rows for other languages should be removed
+    """
+    partition_taxon_fts(db_path, ['en'])
+    _insert_fts(
+        db_path,
+        [('Danaus chrysippus', 3, 'species', 2, None), ('Plain tiger', 3, 'species', 2, 'en')],
+    )
+    _insert_fts(db_path, [('Petit monarque', 3, 'species', 2, 'fr')])
+
+    assert partition_taxon_fts(db_path) == {'': 3, 'en': 3}
+    assert get_fts_languages(db_path) == ['en']
+
+
+def test_partition_taxon_fts__remove_language(db_path):
+    partition_taxon_fts(db_path, ['en', 'fr'])
+    assert partition_taxon_fts(db_path, ['fr']) == {'': 2, 'fr': 1}
+    assert 'taxon_fts__en' not in _table_names(db_path)
+
+
+def test_reset_fts_partitions(db_path):
+    partition_taxon_fts(db_path, ['en'])
+    with sqlite3.connect(db_path) as conn:
+        reset_fts_partitions(conn)
+        assert conn.execute('SELECT COUNT(*) FROM taxon_fts__en').fetchone()[0] == 0
+        assert conn.execute('SELECT SUM(row_count) FROM taxon_fts_locale').fetchone()[0] == 0
+    # Installed languages are kept
+    _insert_fts(db_path, FTS_ROWS)
+    assert partition_taxon_fts(db_path) == {'': 2, 'en': 2}
+
+
+def test_drop_fts_partitions(db_path):
+    partition_taxon_fts(db_path, ['en'])
+    with sqlite3.connect(db_path) as conn:
+        drop_fts_partitions(conn)
+    assert not [t for t in _table_names(db_path) if t.startswith('taxon_fts__')]
+    assert 'taxon_fts_locale' not in _table_names(db_path)
+    assert 'taxon_fts_language' not in _table_names(db_path)
+
+
+@pytest.mark.parametrize('partitioned', [False, True])
+@pytest.mark.parametrize(
+    'q, language, expected_names',
+    [
+        ('mon', 'en', ['Monarch']),
+        ('mon', 'fr', ['Monarque']),
+        ('que', None, ['Queen']),
+        ('dan', 'en', ['Danaus plexippus', 'Danaus gilippus']),
+        ('', 'en', []),
+    ],
+)
+def test_taxon_autocompleter(db_path, partitioned, q, language, expected_names):
+    if partitioned:
+        partition_taxon_fts(db_path, ['en', 'fr'])
+    results = TaxonAutocompleter(db_path).search(q, language=language)
+    assert sorted(t.name for t in results) == sorted(expected_names)
+    assert all(isinstance(t.id, int) for t in results)
+
+
+def test_taxon_autocompleter__partition_not_installed(db_path):
+    """If there's no partition for the requested language, only scientific names are searched"""
+    partition_taxon_fts(db_path, ['en'])
+    results = TaxonAutocompleter(db_path).search('monarq', language='fr')
+    assert results == []
+    results = TaxonAutocompleter(db_path).search('danaus', language='fr')
+    assert {t.id for t in results} == {1, 2}
+
+
+@pytest.fixture
+def taxon_db_path(db_path) -> Path:
+    create_tables(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            'INSERT INTO taxon (id, name, rank, preferred_common_name, iconic_taxon_id) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [
+                (1, 'Danaus plexippus', 'species', 'Monarch', 47158),
+                (2, 'Danaus gilippus', 'species', 'Queen', 47158),
+            ],
+        )
+    return db_path
+
+
+def test_search_taxa_local(taxon_db_path):
+    results = search_taxa_local('danaus', taxon_db_path, language='en')
+    assert [r['id'] for r in results] == [1, 2]
+    assert results[0]['name'] == 'Danaus plexippus'
+    assert results[0]['preferred_common_name'] == 'Monarch'
+    assert results[0]['iconic_taxon_id'] == 47158
+    assert results[0]['exact_match'] is False
+
+
+def test_search_taxa_local__ranking(taxon_db_path):
+    """Exact matches should be ranked first, then taxa with a higher priority"""
+    results = search_taxa_local('Danaus gilippus', taxon_db_path)
+    assert [r['id'] for r in results] == [2]
+    assert results[0]['exact_match'] is True
+
+    results = search_taxa_local('danaus', taxon_db_path)
+    assert [r['id'] for r in results] == [1, 2]
+    results = search_taxa_local('danaus', taxon_db_path, priority=lambda i: {2: 3}.get(i, 0))
+    assert [r['id'] for r in results] == [2, 1]
+
+
+def test_search_taxa_local__no_tables(tmp_path):
+    assert search_taxa_local('danaus', tmp_path / 'empty.db') == []
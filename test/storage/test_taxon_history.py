@@ -0,0 +1,70 @@
+"""Tests for naturtag/storage/taxon_history.py"""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from naturtag.storage.taxon_history import (
+    add_view,
+    create_taxon_history,
+    get_frequent,
+    get_history_count,
+    get_recent,
+    get_view_count,
+    import_history,
+)
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    return tmp_path / 'naturtag.db'
+
+
+def test_add_view(db_path):
+    """Tables should be created on first use, and counts maintained on insert"""
+    assert add_view(1, db_path) == 1
+    assert add_view(2, db_path) == 1
+    assert add_view(1, db_path) == 2
+
+    assert get_recent(db_path=db_path) == [1, 2]
+    assert get_frequent(db_path=db_path) == {1: 2, 2: 1}
+    assert get_view_count(1, db_path) == 2
+    assert get_view_count(999, db_path) == 0
+    assert get_history_count(db_path) == 3
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM taxon_history').fetchone()[0] == 3
+
+
+def test_get_recent__limit(db_path):
+    for taxon_id in [1, 2, 3, 2]:
+        add_view(taxon_id, db_path)
+    assert get_recent(limit=2, db_path=db_path) == [2, 3]
+    assert list(get_frequent(limit=1, db_path=db_path)) == [2]
+
+
+def test_queries__no_tables(db_path):
+    assert get_recent(db_path=db_path) == []
+    assert get_frequent(db_path=db_path) == {}
+    assert get_view_count(1, db_path) == 0
+    assert get_history_count(db_path) == 0
+
+
+def test_import_history(db_path):
+    import_history([1, 2, 1], db_path)
+    assert get_frequent(db_path=db_path) == {1: 2, 2: 1}
+    assert get_recent(db_path=db_path) == [1, 2]
+
+    # Only imported into an empty history table
+    import_history([3], db_path)
+    assert get_view_count(3, db_path) == 0
+
+
+def test_frequent_uses_index(db_path):
+    create_taxon_history(db_path)
+    with sqlite3.connect(db_path) as conn:
+        plan = conn.execute(
+            'EXPLAIN QUERY PLAN SELECT taxon_id, count FROM taxon_view_count '
+            'ORDER BY count DESC, last_view_id DESC LIMIT 10'
+        ).fetchall()
+    assert 'taxon_view_count_frequent' in str(plan)
@@ -0,0 +1,125 @@
+"""Tests for naturtag/storage/taxon_tree.py"""
+
+import sqlite3
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from pyinaturalist import Observation, Taxon
+from pyinaturalist_convert.db import create_tables, save_observations, save_taxa
+from pyinaturalist_convert.fts import create_observation_fts_table
+
+from naturtag.storage.client import ObservationDbController, TaxonDbController
+from naturtag.storage.taxon_tree import _get_intervals, build_taxon_tree, get_descendant_ids
+from test.conftest import _make_db_client
+
+# id, parent_id
+TAXA = [
+    (1, None),  # Animalia
+    (2, 1),  # Arthropoda
+    (3, 2),  # Insecta
+    (4, 3),  # Diptera
+    (5, 3),  # Hymenoptera
+    (6, 4),  # Rhagionidae
+    (7, 1),  # Chordata
+    (8, 99),  # Parent not in db
+]
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    db_path = tmp_path / 'naturtag.db'
+    create_tables(db_path)
+    save_taxa([Taxon(id=taxon_id, parent_id=parent_id) for taxon_id, parent_id in TAXA], db_path)
+    build_taxon_tree(db_path)
+    return db_path
+
+
+@pytest.mark.parametrize(
+    'taxon_id, expected',
+    [
+        (1, [2, 3, 4, 6, 5, 7]),
+        (3, [4, 6, 5]),
+        (4, [6]),
+        (6, []),
+        (8, []),
+        (1234, []),
+    ],
+)
+def test_get_descendant_ids(db_path, taxon_id, expected):
+    assert get_descendant_ids(taxon_id, db_path) == expected
+
+
+def test_get_descendant_ids__include_self(db_path):
+    assert get_descendant_ids(4, db_path, include_self=True) == [4, 6]
+
+
+def test_build_taxon_tree__rebuild(db_path):
+    save_taxa([Taxon(id=9, parent_id=6)], db_path)
+    assert build_taxon_tree(db_path) == 9
+    assert get_descendant_ids(4, db_path) == [6, 9]
+
+
+def test_build_taxon_tree__no_taxon_table(tmp_path):
+    db_path = tmp_path / 'naturtag.db'
+    assert build_taxon_tree(db_path) == 0
+    with sqlite3.connect(db_path) as conn:
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+    assert tables == []
+
+
+def test_get_intervals():
+    intervals = _get_intervals([(1, None), (2, 1), (3, 2), (4, 1), (5, 5)])
+    assert intervals == [
+        [1, 0, 3, 0],
+        [2, 1, 2, 1],
+        [3, 2, 2, 2],
+        [4, 3, 3, 1],
+        [5, 4, 4, 0],
+    ]
+
+
+def test_taxon_controller__get_descendant_ids(db_path):
+    controller = TaxonDbController(_make_db_client(db_path))
+    assert controller.get_descendant_ids(3) == [4, 6, 5]
+
+
+def test_observation_controller__count_db__by_taxon(db_path):
+    save_observations(
+        [
+            Observation(id=1, taxon=Taxon(id=6, parent_id=4)),
+            Observation(id=2, taxon=Taxon(id=5, parent_id=3)),
+            Observation(id=3, taxon=Taxon(id=7, parent_id=1)),
+        ],
+        db_path,
+    )
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    assert controller.count_db() == 3
+    assert controller.count_db(taxon_id=3) == 2
+    assert controller.count_db(taxon_id=6) == 1
+    assert controller.count_db(taxon_id=8) == 0
+
+
+def test_observation_controller__count_db__new_taxa(db_path):
+    """Taxa saved after the tree was built should be counted under their ancestors"""
+    create_observation_fts_table(db_path)
+    controller = ObservationDbController(_make_db_client(db_path), taxon_controller=MagicMock())
+    new_taxon = Taxon(id=10, parent_id=4, ancestor_ids=[1, 2, 3, 4, 10])
+    controller.save([Observation(id=1, taxon=new_taxon)])
+
+    assert controller.count_db(taxon_id=3) == 1
+    assert controller.count_db(taxon_id=10) == 1
+    assert controller.count_db(taxon_id=5) == 0
+    assert get_descendant_ids(3, db_path) == [4, 6, 5, 10]
+
+    # Once rebuilt, new taxa should be numbered like any other
+    build_taxon_tree(db_path)
+    assert get_descendant_ids(3, db_path) == [4, 6, 10, 5]
+    assert controller.count_db(taxon_id=3) == 1
+
+
+def test_taxon_controller__save__new_taxa(db_path):
+    controller = TaxonDbController(_make_db_client(db_path))
+    controller._save([Taxon(id=11, parent_id=6), Taxon(id=12, parent_id=11)])
+    assert controller.get_descendant_ids(6) == [11]
+    assert controller.get_descendant_ids(11) == [12]
@@ -0,0 +1,181 @@
+"""Tests for naturtag/storage/taxonomy_delta.py"""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+from pyinaturalist_convert import create_tables
+from pyinaturalist_convert.fts import create_taxon_fts_table
+
+from naturtag.storage.freshness import get_fetched, save_fetched
+from naturtag.storage.taxon_fts import TaxonAutocompleter, partition_taxon_fts
+from naturtag.storage.taxonomy_delta import (
+    TaxonomyDeltaError,
+    apply_taxonomy_delta,
+    apply_taxonomy_deltas,
+    build_taxonomy_delta,
+    read_delta_manifest,
+)
+from naturtag.storage.taxonomy_loader import get_taxonomy_version, set_taxonomy_version
+
+# id, name, parent_id, preferred_common_name, rank, observations_count_rg
+V1_TAXA = [
+    (1, 'Animalia', None, 'Animals', 'kingdom', 100),
+    (2, 'Arthropoda', 1, 'Arthropods', 'phylum', 50),
+    (3, 'Insecta', 2, 'Insects', 'class', 10),
+    (4, 'Oldtaxa', 2, None, 'class', 5),
+]
+V2_TAXA = [
+    (1, 'Animalia', None, 'Animals', 'kingdom', 100),
+    (2, 'Arthropoda', 1, 'Joint-legged animals', 'phylum', 50),
+    (3, 'Insecta', 2, 'Insects', 'class', 11),
+    (5, 'Arachnida', 2, 'Arachnids', 'class', 8),
+]
+
+
+def _fts_rows(taxa):
+    rows = [(name, taxon_id, rank, count, '') for taxon_id, name, _, _, rank, count in taxa]
+    rows += [(common, taxon_id, rank, count, 'en') for taxon_id, _, _, common, rank, count in taxa]
+    return [row for row in rows if row[0]]
+
+
+def _make_source_db(path: Path, taxa) -> Path:
+    create_tables(path)
+    create_taxon_fts_table(path)
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            'INSERT INTO taxon (id, name, parent_id, preferred_common_name, rank, '
+            'observations_count_rg) VALUES (?, ?, ?, ?, ?, ?)',
+            taxa,
+        )
+        conn.executemany('INSERT INTO taxon_fts VALUES (?, ?, ?, ?, ?)', _fts_rows(taxa))
+    return path
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    """A local db with v1 taxonomy loaded, plus one full taxon record fetched from the API"""
+    db_path = tmp_path / 'naturtag.db'
+    _make_source_db(db_path, V1_TAXA)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('UPDATE taxon SET partial = 1')
+        conn.execute("UPDATE taxon SET partial = 0, photo_urls = 'photo.jpg' WHERE id = 2")
+        set_taxonomy_version(conn, 'v1')
+    save_fetched('taxon', [2], db_path)
+    return db_path
+
+
+@pytest.fixture
+def delta_path(tmp_path) -> Path:
+    old_db = _make_source_db(tmp_path / 'old.db', V1_TAXA)
+    new_db = _make_source_db(tmp_path / 'new.db', V2_TAXA)
+    delta_path = tmp_path / 'taxonomy-delta-v2.tar.gz'
+    build_taxonomy_delta(old_db, new_db, delta_path, 'v1', 'v2')
+    return delta_path
+
+
+def test_build_taxonomy_delta(tmp_path):
+    old_db = _make_source_db(tmp_path / 'old.db', V1_TAXA)
+    new_db = _make_source_db(tmp_path / 'new.db', V2_TAXA)
+    delta_path = tmp_path / 'delta.tar.gz'
+
+    counts = build_taxonomy_delta(old_db, new_db, delta_path, 'v1', 'v2')
+    # Changed: 2 (common name), 3 (count), 5 (added); deprecated: 4
+    assert counts == {'taxon.csv': 3, 'taxon_deprecated.csv': 1, 'taxon_fts.csv': 6}
+    assert read_delta_manifest(delta_path) == {'from_version': 'v1', 'to_version': 'v2'}
+
+
+def test_build_taxonomy_delta__filters(tmp_path):
+    old_db = _make_source_db(tmp_path / 'old.db', V1_TAXA)
+    new_db = _make_source_db(tmp_path / 'new.db', V2_TAXA)
+    delta_path = tmp_path / 'delta.tar.gz'
+
+    counts = build_taxonomy_delta(
+        old_db, new_db, delta_path, 'v1', 'v2', min_observations=10, language='en'
+    )
+    # Only taxa 2 and 3 are above the threshold; only common names have count_rank > 1
+    assert counts == {'taxon.csv': 2, 'taxon_deprecated.csv': 0, 'taxon_fts.csv': 2}
+
+
+def test_apply_taxonomy_delta(db_path, delta_path):
+    progress = []
+    counts = apply_taxonomy_delta(delta_path, db_path, progress=progress.append)
+    assert counts == {'taxon.csv': 3, 'taxon_deprecated.csv': 1, 'taxon_fts.csv': 6}
+    assert progress[-1].table == 'taxon_fts.csv'
+    assert get_taxonomy_version(db_path) == 'v2'
+
+    with sqlite3.connect(db_path) as conn:
+        taxa = {
+            row[0]: row[1:]
+            for row in conn.execute(
+                'SELECT id, preferred_common_name, observations_count_rg, partial, is_active, '
+                'photo_urls FROM taxon'
+            )
+        }
+
+        def search(q):
+            return sorted(
+                int(row[0])
+                for row in conn.execute(
+                    'SELECT taxon_id FROM taxon_fts WHERE taxon_fts MATCH ?', (f'name:{q}',)
+                )
+            )
+
+        assert search('arach*') == [5, 5]
+        assert search('oldtaxa') == []
+        assert search('insect*') == [3, 3]
+        assert search('arthropod*') == [2]
+        assert search('joint*') == [2]
+
+    # Added and changed partial taxa
+    assert taxa[5] == ('Arachnids', 8, 1, None, None)
+    assert taxa[3] == ('Insects', 11, 1, None, None)
+    # Full records are kept, but need to be refreshed
+    assert taxa[2] == ('Arthropods', 50, 0, None, 'photo.jpg')
+    assert get_fetched('taxon', [2], db_path) == {}
+    # Deprecated taxa are kept but inactive
+    assert taxa[4][3] == 0
+
+
+def test_apply_taxonomy_delta__version_mismatch(db_path, delta_path):
+    with sqlite3.connect(db_path) as conn:
+        set_taxonomy_version(conn, 'v0')
+
+    with pytest.raises(TaxonomyDeltaError):
+        apply_taxonomy_delta(delta_path, db_path)
+    assert get_taxonomy_version(db_path) == 'v0'
+
+
+def test_apply_taxonomy_deltas(db_path, delta_path, tmp_path):
+    """Deltas should be applied in version order, skipping any that don't apply"""
+    v2_db = _make_source_db(tmp_path / 'v2.db', V2_TAXA)
+    v3_db = _make_source_db(tmp_path / 'v3.db', V2_TAXA[:-1])
+    delta_path_2 = tmp_path / 'taxonomy-delta-v3.tar.gz'
+    build_taxonomy_delta(v2_db, v3_db, delta_path_2, 'v2', 'v3')
+    delta_path_3 = tmp_path / 'taxonomy-delta-v0.tar.gz'
+    build_taxonomy_delta(v2_db, v3_db, delta_path_3, 'v0', 'v1')
+    invalid_path = tmp_path / 'taxonomy-delta-invalid.tar.gz'
+    invalid_path.write_bytes(b'invalid')
+
+    applied = apply_taxonomy_deltas([delta_path_2, delta_path_3, invalid_path, delta_path], db_path)
+    assert applied == ['v2', 'v3']
+    assert get_taxonomy_version(db_path) == 'v3'
+    assert apply_taxonomy_deltas([delta_path, delta_path_2], db_path) == []
+
+
+def test_apply_taxonomy_deltas__unknown_version(db_path, delta_path):
+    with sqlite3.connect(db_path) as conn:
+        set_taxonomy_version(conn, None)
+    assert apply_taxonomy_deltas([delta_path], db_path) == []
+
+
+def test_apply_taxonomy_delta__partitioned(db_path, delta_path):
+    """Text search rows for changed taxa should be replaced in language partitions"""
+    partition_taxon_fts(db_path, ['en'])
+    apply_taxonomy_delta(delta_path, db_path)
+    partition_taxon_fts(db_path)
+
+    autocompleter = TaxonAutocompleter(db_path)
+    assert [t.id for t in autocompleter.search('joint', language='en')] == [2]
+    assert autocompleter.search('oldtaxa', language='en') == []
+    assert [t.name for t in autocompleter.search('arthropod', language='en')] == ['Arthropoda']
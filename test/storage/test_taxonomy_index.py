@@ -0,0 +1,176 @@
+"""Tests for naturtag/storage/taxonomy_index.py"""
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from pyinaturalist import Photo, Taxon
+from pyinaturalist_convert.db import create_tables, save_taxa
+
+from naturtag.storage.client import TaxonDbController
+from naturtag.storage.taxonomy_index import StringArray, TaxonomyIndex
+from test.conftest import _make_db_client
+
+PHOTO_URL = 'https://static.inaturalist.org/photos/1/medium.jpg'
+
+# Unsorted, with one parent (99) that isn't indexed
+TAXA = [
+    # id, parent_id, rank, name, common name
+    (3, 2, 'family', 'Rhagionidae', 'Snipe Flies'),
+    (1, 0, 'kingdom', 'Animalia', 'Animals'),
+    (2, 1, 'order', 'Diptera', ''),
+    (5, 3, 'genus', 'Symphoromyia', ''),
+    (4, 3, 'genus', 'Chrysopilus', ''),
+    (6, 4, 'species', 'Chrysopilus ornatus', 'Ornate Snipe Fly'),
+    (7, 99, 'species', 'Orphan', ''),
+]
+
+
+@pytest.fixture
+def index() -> TaxonomyIndex:
+    ids, parent_ids, ranks, names, common_names = zip(*TAXA, strict=True)
+    n = len(TAXA)
+    return TaxonomyIndex(ids, parent_ids, ranks, names, common_names, [47158] * n, ids, [0] * n)
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    db_path = tmp_path / 'naturtag.db'
+    create_tables(db_path)
+    save_taxa(
+        [
+            Taxon(
+                id=taxon_id,
+                parent_id=parent_id or None,
+                rank=rank,
+                name=name,
+                preferred_common_name=common_name or None,
+                default_photo=Photo(url=PHOTO_URL) if taxon_id == 6 else None,
+            )
+            for taxon_id, parent_id, rank, name, common_name in TAXA
+        ],
+        db_path,
+    )
+    return db_path
+
+
+def _make_db_taxon(taxon_id: int, ancestor_ids: list[int], child_ids: list[int]) -> Taxon:
+    """Make a taxon with only ancestor and child IDs, like a record loaded from the db"""
+    return Taxon(
+        id=taxon_id,
+        ancestors=[Taxon(id=i, partial=True) for i in ancestor_ids],
+        children=[Taxon(id=i, partial=True) for i in child_ids],
+    )
+
+
+def test_ancestor_ids(index):
+    assert index.ancestor_ids(6) == [1, 2, 3, 4]
+    assert index.ancestor_ids(1) == []
+    assert index.ancestor_ids(7) == []
+    assert index.ancestor_ids(1234) == []
+
+
+def test_child_ids(index):
+    assert index.child_ids(3) == [4, 5]
+    assert index.child_ids(1) == [2]
+    assert index.child_ids(6) == []
+    assert index.child_ids(1234) == []
+
+
+def test_get_taxon(index):
+    taxon = index.get_taxon(6)
+    assert taxon.id == 6
+    assert taxon.name == 'Chrysopilus ornatus'
+    assert taxon.rank == 'species'
+    assert taxon.preferred_common_name == 'Ornate Snipe Fly'
+    assert taxon.parent_id == 4
+    assert taxon.observations_count == 6
+    assert taxon._partial is True
+
+    assert index.get_taxon(2).preferred_common_name is None
+    assert index.get_taxon(1).parent_id is None
+    assert index.get_taxon(1234) is None
+
+
+def test_get_taxa__skips_missing(index):
+    assert [t.id for t in index.get_taxa([4, 1234, 2])] == [4, 2]
+
+
+def test_contains(index):
+    assert 6 in index
+    assert 99 not in index
+    assert len(index) == 7
+
+
+def test_from_db(db_path):
+    index = TaxonomyIndex.from_db(db_path)
+    assert len(index) == 7
+    assert index.ancestor_ids(6) == [1, 2, 3, 4]
+    assert index.get_taxon(3).preferred_common_name == 'Snipe Flies'
+
+
+def test_from_db__no_tables(tmp_path):
+    index = TaxonomyIndex.from_db(tmp_path / 'empty.db')
+    assert len(index) == 0
+    assert index.ancestor_ids(6) == []
+
+
+def test_string_array():
+    values = ['Animalia', '', 'Größe', 'Ornate Snipe Fly']
+    strings = StringArray(values)
+    assert [strings[i] for i in range(len(strings))] == values
+
+
+def test_taxon_controller__add_taxonomy_from_index(db_path):
+    client = _make_db_client(db_path)
+    controller = TaxonDbController(client, use_index=True)
+    controller.from_ids = MagicMock()
+
+    taxon = _make_db_taxon(3, ancestor_ids=[1, 2, 3], child_ids=[4, 5])
+    controller._add_taxonomy([taxon])
+
+    controller.from_ids.assert_not_called()
+    assert [t.name for t in taxon.ancestors] == ['Animalia', 'Diptera']
+    assert [t.name for t in taxon.children] == ['Chrysopilus', 'Symphoromyia']
+
+
+def test_taxon_controller__add_taxonomy_from_index__photos_and_missing_taxa(db_path):
+    client = _make_db_client(db_path)
+    controller = TaxonDbController(client, use_index=True)
+    controller.from_ids = MagicMock(return_value=[Taxon(id=1234, name='Not indexed')])
+
+    taxon = _make_db_taxon(4, ancestor_ids=[1, 2, 3, 4], child_ids=[6, 1234])
+    controller._add_taxonomy([taxon])
+
+    controller.from_ids.assert_called_once_with({1234}, accept_partial=True)
+    assert [t.id for t in taxon.children] == [6, 1234]
+    assert taxon.children[0].default_photo.url == PHOTO_URL
+
+
+def test_taxon_controller__index_disabled(db_path):
+    controller = TaxonDbController(_make_db_client(db_path))
+    assert controller.index is None
+
+
+def test_taxon_controller__save__invalidates_index(db_path):
+    """Taxa saved after the index was built should be read from the database instead"""
+    controller = TaxonDbController(_make_db_client(db_path), use_index=True)
+    assert controller._get_indexed([2])[2].name == 'Diptera'
+
+    controller._save([Taxon(id=2, parent_id=1, name='Updated', ancestor_ids=[1])])
+    assert controller._get_indexed([1, 2, 3]).keys() == {3}
+
+    api_taxon = Taxon(id=3, ancestors=[Taxon(id=1), Taxon(id=2)], ancestor_ids=[1, 2, 3])
+    controller._add_db_taxonomy([api_taxon])
+    assert [t.name for t in api_taxon.ancestors] == ['Animalia', 'Updated']
+
+
+def test_taxon_controller__invalidate_index__rebuild(db_path):
+    controller = TaxonDbController(_make_db_client(db_path), use_index=True)
+    index = controller.index
+    with patch('naturtag.storage.client.TAXONOMY_INDEX_MAX_STALE', 2):
+        controller.invalidate_index([1, 2])
+        assert controller.index is index
+        controller.invalidate_index([3])
+    assert controller.index is not index
+    assert not controller._index_stale_ids
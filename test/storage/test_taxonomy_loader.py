@@ -0,0 +1,216 @@
+"""Tests for naturtag/storage/taxonomy_loader.py"""
+
+import gzip
+import io
+import sqlite3
+import tarfile
+from pathlib import Path
+
+import pytest
+from pyinaturalist_convert import create_tables
+from pyinaturalist_convert.fts import create_taxon_fts_table
+
+from naturtag.storage.taxonomy_loader import (
+    ChecksumError,
+    build_taxonomy_db,
+    get_taxonomy_version,
+    install_taxonomy_db,
+    load_taxonomy_archive,
+)
+
+TAXON_CSV = (
+    'id,ancestor_ids,child_ids,iconic_taxon_id,leaf_taxa_count,observations_count_rg,name,'
+    'parent_id,preferred_common_name,rank\n'
+    '1,,2,1,2,100,Animalia,,Animals,kingdom\n'
+    '2,1,3,1,1,50,Arthropoda,1,Arthropods,phylum\n'
+    '3,"1,2",,1,0,10,Insecta,2,"Insects, etc.",class\n'
+)
+TAXON_FTS_CSV = (
+    'name,taxon_id,taxon_rank,count_rank,language_code\n'
+    'Animalia,1,kingdom,100,\n'
+    'Animals,1,kingdom,100,en\n'
+    'Insecta,3,class,10,\n'
+)
+
+
+def _make_archive(path: Path, files: dict[str, str]) -> Path:
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, content in files.items():
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    db_path = tmp_path / 'naturtag.db'
+    create_tables(db_path)
+    create_taxon_fts_table(db_path)
+    return db_path
+
+
+@pytest.fixture
+def archive_path(tmp_path) -> Path:
+    return _make_archive(
+        tmp_path / 'taxonomy.tar.gz',
+        {'README': 'ignored', 'taxon.csv': TAXON_CSV, 'taxon_fts.csv': TAXON_FTS_CSV},
+    )
+
+
+def test_load_taxonomy_archive(db_path, archive_path):
+    counts = load_taxonomy_archive(archive_path, db_path, batch_size=2)
+    assert counts == {'taxon': 3, 'taxon_fts': 3}
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            'SELECT id, ancestor_ids, parent_id, preferred_common_name, partial '
+            'FROM taxon ORDER BY id'
+        ).fetchall()
+        assert rows == [
+            (1, None, None, 'Animals', 1),
+            (2, '1', 1, 'Arthropods', 1),
+            (3, '1,2', 2, 'Insects, etc.', 1),
+        ]
+        matches = conn.execute(
+            "SELECT taxon_id FROM taxon_fts WHERE taxon_fts MATCH 'insect*'"
+        ).fetchall()
+        assert matches == [('3',)]
+        index_names = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'taxon'"
+            )
+        }
+        assert {'ix_taxon_parent_id', 'ix_taxon_name'} <= index_names
+
+
+def test_load_taxonomy_archive__replaces_existing(db_path, archive_path, tmp_path):
+    load_taxonomy_archive(archive_path, db_path)
+    new_archive = _make_archive(tmp_path / 'new.tar.gz', {'taxon.csv': TAXON_CSV.split('2,1,3')[0]})
+    assert load_taxonomy_archive(new_archive, db_path) == {'taxon': 1}
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM taxon').fetchone()[0] == 1
+        assert conn.execute('SELECT COUNT(*) FROM taxon_fts').fetchone()[0] == 0
+
+
+def test_load_taxonomy_archive__version(db_path, tmp_path):
+    archive_path = _make_archive(
+        tmp_path / 'taxonomy.tar.gz',
+        {'manifest.json': '{"version": "2024.06"}', 'taxon.csv': TAXON_CSV},
+    )
+    load_taxonomy_archive(archive_path, db_path)
+    assert get_taxonomy_version(db_path) == '2024.06'
+
+    # Data loaded from an archive without a version should replace the previous version
+    load_taxonomy_archive(_make_archive(tmp_path / 'v2.tar.gz', {'taxon.csv': TAXON_CSV}), db_path)
+    assert get_taxonomy_version(db_path) is None
+
+
+def test_load_taxonomy_archive__progress(db_path, archive_path):
+    progress = []
+    load_taxonomy_archive(archive_path, db_path, progress=progress.append, batch_size=2)
+
+    taxon_progress = [p for p in progress if p.table == 'taxon']
+    assert [p.rows for p in taxon_progress] == [2, 3]
+    assert taxon_progress[-1].bytes_read == taxon_progress[-1].total_bytes == len(TAXON_CSV)
+
+
+def test_load_taxonomy_archive__rollback(db_path, archive_path, tmp_path):
+    """If loading fails partway through, existing data should be kept"""
+    load_taxonomy_archive(archive_path, db_path)
+    bad_archive = _make_archive(
+        tmp_path / 'bad.tar.gz', {'taxon.csv': TAXON_CSV + '1,,,,,,Duplicate,,,\n'}
+    )
+    with pytest.raises(sqlite3.IntegrityError):
+        load_taxonomy_archive(bad_archive, db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM taxon').fetchone()[0] == 3
+        assert conn.execute('SELECT COUNT(*) FROM taxon_fts').fetchone()[0] == 3
+
+
+@pytest.fixture
+def prebuilt_path(archive_path, tmp_path) -> Path:
+    prebuilt_path = tmp_path / 'prebuilt' / 'taxonomy.db.gz'
+    prebuilt_path.parent.mkdir()
+    build_taxonomy_db(archive_path, prebuilt_path)
+    return prebuilt_path
+
+
+def test_build_taxonomy_db(prebuilt_path):
+    checksum = (prebuilt_path.parent / 'taxonomy.db.sha256').read_text().split()[0]
+    assert len(checksum) == 64
+
+    db_path = prebuilt_path.parent / 'taxonomy.db'
+    db_path.write_bytes(gzip.decompress(prebuilt_path.read_bytes()))
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+        tables = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        assert 'taxon' in tables and 'observation' not in tables
+        assert conn.execute('SELECT COUNT(*) FROM taxon_fts').fetchone()[0] == 3
+
+
+def test_install_taxonomy_db(db_path, prebuilt_path):
+    progress = []
+    counts = install_taxonomy_db(prebuilt_path, db_path, progress=progress.append)
+    assert counts == {'taxon': 3, 'taxon_fts': 3}
+    assert progress[-1].bytes_read == progress[-1].total_bytes
+    assert not list(db_path.parent.glob('*.tmp'))
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM taxon WHERE partial = 1').fetchone()[0] == 3
+        matches = conn.execute(
+            "SELECT name FROM taxon_fts WHERE taxon_fts MATCH 'anim*' ORDER BY name"
+        ).fetchall()
+        assert matches == [('Animalia',), ('Animals',)]
+        index_names = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'taxon'"
+            )
+        }
+        assert {'ix_taxon_parent_id', 'ix_taxon_name'} <= index_names
+
+
+def test_install_taxonomy_db__version(db_path, tmp_path):
+    archive_path = _make_archive(
+        tmp_path / 'taxonomy.tar.gz',
+        {'manifest.json': '{"version": "2024.06"}', 'taxon.csv': TAXON_CSV},
+    )
+    build_taxonomy_db(archive_path, tmp_path / 'taxonomy.db.gz')
+    install_taxonomy_db(tmp_path / 'taxonomy.db.gz', db_path)
+    assert get_taxonomy_version(db_path) == '2024.06'
+
+
+def test_install_taxonomy_db__rebuild_fts(db_path, prebuilt_path):
+    """If the text search table definitions differ, the index should be rebuilt from content"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('DROP TABLE taxon_fts')
+        conn.execute(
+            'CREATE VIRTUAL TABLE taxon_fts USING fts5(name, taxon_id, taxon_rank UNINDEXED, '
+            'count_rank UNINDEXED, language_code)'
+        )
+
+    assert install_taxonomy_db(prebuilt_path, db_path) == {'taxon': 3, 'taxon_fts': 3}
+    with sqlite3.connect(db_path) as conn:
+        matches = conn.execute("SELECT name FROM taxon_fts WHERE taxon_fts MATCH 'insecta'")
+        assert matches.fetchall() == [('Insecta',)]
+
+
+def test_install_taxonomy_db__checksum_mismatch(db_path, archive_path, prebuilt_path):
+    """If the checksum doesn't match, existing data should be kept"""
+    load_taxonomy_archive(archive_path, db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('DELETE FROM taxon WHERE id = 3')
+
+    with pytest.raises(ChecksumError):
+        install_taxonomy_db(prebuilt_path, db_path, checksum='0' * 64)
+
+    assert not list(db_path.parent.glob('*.tmp'))
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM taxon').fetchone()[0] == 2
@@ -1,13 +1,17 @@
-from unittest.mock import MagicMock, patch
+import json
+from unittest.mock import ANY, MagicMock, patch
 
 import pytest
 from click.testing import CliRunner
+from requests import ConnectionError
 
 from naturtag.cli import (
     main,
     print_all_metadata,
     search_taxa_by_name,
 )
+from naturtag.storage import Settings, SyncProgress
+from naturtag.storage.taxonomy_loader import LoadProgress
 
 SAMPLE_TAXON_RESULTS = [
     {
@@ -88,6 +92,7 @@ def test_tag__with_id_or_url(
         observation_id=expected_observation_id,
         taxon_id=expected_taxon_id,
         include_sidecars=True,
+        settings=ANY,
     )
     mock_setup.assert_called_once()
 
@@ -155,12 +160,13 @@ def test_tag__taxon_name_with_match(mock_search, mock_setup, mock_tag_images, ru
         main, ['tag', '-t', 'indigo bunting', 'image.jpg'], catch_exceptions=False
     )
     assert result.exit_code == 0
-    mock_search.assert_called_once_with('indigo bunting', verbose=0)
+    mock_search.assert_called_once_with('indigo bunting', verbose=0, settings=ANY)
     mock_tag_images.assert_called_once_with(
         ('image.jpg',),
         observation_id=None,
         taxon_id=12345,
         include_sidecars=True,
+        settings=ANY,
     )
 
 
@@ -182,7 +188,85 @@ def test_refresh(mock_setup, mock_refresh_tags, runner, flags, images, expected_
     result = runner.invoke(main, ['refresh', *flags, *images], catch_exceptions=False)
     assert result.exit_code == 0
     assert f'{len(images)} Images refreshed' in result.output
-    mock_refresh_tags.assert_called_once_with(tuple(images), recursive=expected_recursive)
+    mock_refresh_tags.assert_called_once_with(
+        tuple(images), recursive=expected_recursive, settings=ANY
+    )
+
+
+# -- sync command --
+
+
+@pytest.fixture
+def mock_sync_settings(tmp_path):
+    settings = Settings(path=tmp_path / 'settings.yml', username='testuser')
+    with patch('naturtag.cli.Settings.read', return_value=settings):
+        yield settings
+
+
+@patch('naturtag.cli.sync_observations')
+def test_sync(mock_sync, mock_sync_settings, runner):
+    mock_sync.return_value = iter([SyncProgress(1, 200, 200, 1.0), SyncProgress(2, 50, 250, 1.5)])
+    result = runner.invoke(main, ['sync', '-u', 'otheruser', '-t'], catch_exceptions=False)
+
+    assert result.exit_code == 0
+    assert 'Page 2: 50 observations' in result.output
+    assert '250 observations synced in 1.50s' in result.output
+    mock_sync.assert_called_once_with(mock_sync_settings, precache_thumbnails=True)
+    assert mock_sync_settings.username == 'otheruser'
+
+
+@patch('naturtag.cli.sync_observations')
+def test_sync__json(mock_sync, mock_sync_settings, runner):
+    mock_sync.return_value = iter([SyncProgress(1, 200, 200, 1.0)])
+    result = runner.invoke(main, ['sync', '--json'], catch_exceptions=False)
+
+    events = [json.loads(line) for line in result.output.splitlines()]
+    assert events == [
+        {'event': 'page', 'page': 1, 'page_size': 200, 'total': 200, 'elapsed': 1.0},
+        {'event': 'complete', 'total': 200, 'elapsed': 1.0},
+    ]
+    mock_sync.assert_called_once_with(mock_sync_settings, precache_thumbnails=None)
+
+
+@patch('naturtag.cli.sync_observations', side_effect=RuntimeError('timeout'))
+def test_sync__error(mock_sync, mock_sync_settings, runner):
+    result = runner.invoke(main, ['sync', '--json'], catch_exceptions=False)
+    assert result.exit_code == 1
+    assert json.loads(result.output) == {'event': 'error', 'message': 'timeout'}
+
+
+@patch('naturtag.cli.sleep', side_effect=[None, KeyboardInterrupt])
+@patch('naturtag.cli.sync_observations')
+def test_sync__watch(mock_sync, mock_sleep, mock_sync_settings, runner):
+    """In watch mode, errors should be reported, and the next sync should still run"""
+    mock_sync.side_effect = [RuntimeError('timeout'), iter([]), iter([])]
+    runner.invoke(main, ['sync', '-w', '-i', '5'])
+
+    assert mock_sync.call_count == 2
+    mock_sleep.assert_called_with(300)
+
+
+@patch('naturtag.cli.sync_observations')
+def test_sync__network_policy(mock_sync, mock_sync_settings, runner):
+    mock_sync.return_value = iter([])
+    runner.invoke(main, ['-n', 'offline', 'sync'], catch_exceptions=False)
+    assert mock_sync_settings.network_policy == 'offline'
+
+
+@patch('naturtag.cli.search_taxa_local', return_value=[])
+@patch('naturtag.cli.get_taxa_autocomplete')
+def test_tag__offline_name_search(mock_autocomplete, mock_local, mock_sync_settings, runner):
+    result = runner.invoke(main, ['--network', 'offline', 'tag', '-t', 'indigo bunting'])
+    assert 'No matches found' in result.output
+    mock_local.assert_called_once()
+    mock_autocomplete.assert_not_called()
+
+
+def test_sync__no_username(runner, tmp_path):
+    with patch('naturtag.cli.Settings.read', return_value=Settings(path=tmp_path / 's.yml')):
+        result = runner.invoke(main, ['sync'])
+    assert result.exit_code == 1
+    assert 'Specify a username' in result.output
 
 
 # -- setup db command --
@@ -191,10 +275,17 @@ def test_refresh(mock_setup, mock_refresh_tags, runner, flags, images, expected_
 @pytest.mark.parametrize(
     'flags, expected_kwargs',
     [
-        ([], {'overwrite': False, 'download': False}),
-        (['-f', '-d'], {'overwrite': True, 'download': True}),
+        ([], {'overwrite': False, 'download': False, 'progress': ANY, 'languages': None}),
+        (
+            ['-f', '-d'],
+            {'overwrite': True, 'download': True, 'progress': ANY, 'languages': None},
+        ),
+        (
+            ['-l', 'en', '-l', 'fr'],
+            {'overwrite': False, 'download': False, 'progress': ANY, 'languages': ['en', 'fr']},
+        ),
     ],
-    ids=['defaults', 'force-download'],
+    ids=['defaults', 'force-download', 'languages'],
 )
 @patch('naturtag.cli.setup')
 def test_setup_db(mock_setup, runner, flags, expected_kwargs):
@@ -203,6 +294,17 @@ def test_setup_db(mock_setup, runner, flags, expected_kwargs):
     mock_setup.assert_called_once_with(**expected_kwargs)
 
 
+@patch('naturtag.cli.setup')
+def test_setup_db__progress(mock_setup, runner):
+    def _setup(progress, **kwargs):
+        progress(LoadProgress('taxon', 100, 512, 1024))
+        progress(LoadProgress('taxon', 200, 1024, 1024))
+
+    mock_setup.side_effect = _setup
+    result = runner.invoke(main, ['setup', 'db'], catch_exceptions=False)
+    assert 'Loading taxon' in result.output
+
+
 # -- setup shell command --
 
 
@@ -238,16 +340,30 @@ def test_install_completion(runner, tmp_path, shell_name):
 # -- search_taxa_by_name --
 
 
+def _local_result(taxon_id: int, exact_match: bool = False, priority: int = 0) -> dict:
+    return {
+        **SAMPLE_TAXON_RESULTS[0],
+        'id': taxon_id,
+        'exact_match': exact_match,
+        'priority': priority,
+    }
+
+
+@pytest.fixture
+def search_settings(tmp_path):
+    return Settings(path=tmp_path / 'settings.yml')
+
+
 @patch('naturtag.cli.get_taxa_autocomplete')
-def test_search_taxa_by_name__no_results(mock_autocomplete):
+def test_search_taxa_by_name__no_results(mock_autocomplete, search_settings):
     mock_autocomplete.return_value = {'results': []}
-    assert search_taxa_by_name('nonexistent') is None
+    assert search_taxa_by_name('nonexistent', settings=search_settings) is None
 
 
 @patch('naturtag.cli.get_taxa_autocomplete')
-def test_search_taxa_by_name__single_result(mock_autocomplete):
+def test_search_taxa_by_name__single_result(mock_autocomplete, search_settings):
     mock_autocomplete.return_value = {'results': [{'id': 12345}]}
-    assert search_taxa_by_name('indigo bunting') == 12345
+    assert search_taxa_by_name('indigo bunting', settings=search_settings) == 12345
 
 
 @pytest.mark.parametrize(
@@ -256,7 +372,60 @@ def test_search_taxa_by_name__single_result(mock_autocomplete):
     ids=['first-choice', 'second-choice'],
 )
 @patch('naturtag.cli.get_taxa_autocomplete')
-def test_search_taxa_by_name__multiple_results(mock_autocomplete, choice, expected_id):
+def test_search_taxa_by_name__multiple_results(
+    mock_autocomplete, choice, expected_id, search_settings
+):
     mock_autocomplete.return_value = {'results': SAMPLE_TAXON_RESULTS}
     with patch('naturtag.cli.click.prompt', return_value=choice):
-        assert search_taxa_by_name('foo') == expected_id
+        assert search_taxa_by_name('foo', settings=search_settings) == expected_id
+
+
+@pytest.mark.parametrize(
+    'local_results, expected_id',
+    [
+        ([_local_result(1, exact_match=True), _local_result(2)], 1),
+        ([_local_result(1, exact_match=True), _local_result(2, exact_match=True, priority=3)], 2),
+        ([_local_result(3)], 3),
+    ],
+    ids=['single-exact-match', 'exact-match-with-history', 'single-result'],
+)
+@patch('naturtag.cli.get_taxa_autocomplete')
+def test_search_taxa_by_name__local_match(
+    mock_autocomplete, local_results, expected_id, search_settings
+):
+    with patch('naturtag.cli.search_taxa_local', return_value=local_results):
+        assert search_taxa_by_name('foo', settings=search_settings) == expected_id
+    mock_autocomplete.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    'network_policy, api_called',
+    [('online', True), ('prefer-cache', False), ('offline', False)],
+)
+@patch('naturtag.cli.get_taxa_autocomplete')
+def test_search_taxa_by_name__local_ambiguous(
+    mock_autocomplete, network_policy, api_called, search_settings
+):
+    """With multiple local matches, only online mode should check the API"""
+    mock_autocomplete.return_value = {'results': [{'id': 12345}]}
+    search_settings.network_policy = network_policy
+    local_results = [_local_result(1), _local_result(2)]
+
+    with (
+        patch('naturtag.cli.search_taxa_local', return_value=local_results),
+        patch('naturtag.cli.click.prompt', return_value='1'),
+    ):
+        taxon_id = search_taxa_by_name('foo', settings=search_settings)
+    assert taxon_id == (12345 if api_called else 2)
+    assert mock_autocomplete.called is api_called
+
+
+@patch('naturtag.cli.get_taxa_autocomplete', side_effect=ConnectionError)
+def test_search_taxa_by_name__api_error(mock_autocomplete, search_settings):
+    """If the API is unavailable, local results should be used"""
+    local_results = [_local_result(1), _local_result(2)]
+    with (
+        patch('naturtag.cli.search_taxa_local', return_value=local_results),
+        patch('naturtag.cli.click.prompt', return_value='0'),
+    ):
+        assert search_taxa_by_name('foo', settings=search_settings) == 1
@@ -0,0 +1,56 @@
+import pytest
+
+from naturtag.utils.cancellation import (
+    CancelToken,
+    TaskCancelled,
+    TaskTimeout,
+    check_cancelled,
+    get_cancel_token,
+)
+
+
+def test_cancel_token():
+    token = CancelToken()
+    token.check()
+    assert not token.cancelled
+
+    token.cancel()
+    assert token.cancelled
+    with pytest.raises(TaskCancelled):
+        token.check()
+
+
+def test_cancel_token__timeout():
+    token = CancelToken(timeout=60)
+    assert not token.timed_out  # Timeout doesn't start until activated
+
+    with token.activate():
+        assert not token.timed_out
+        token.deadline = 0
+        assert token.timed_out
+        with pytest.raises(TaskTimeout):
+            token.check()
+
+
+def test_cancel_token__not_caught_by_except_exception():
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(TaskCancelled):
+        try:
+            token.check()
+        except Exception:
+            pass
+
+
+def test_check_cancelled():
+    token = CancelToken()
+    with token.activate():
+        assert get_cancel_token() is token
+        check_cancelled()
+        token.cancel()
+        with pytest.raises(TaskCancelled):
+            check_cancelled()
+
+    # Outside of a task, checks are a no-op
+    assert get_cancel_token() is None
+    check_cancelled()